@@ -8,12 +8,15 @@ import json
 import logging
 import asyncio
 import uuid
-from typing import Dict, List, Optional, Any
+import hashlib
+import time
+from typing import AsyncIterator, BinaryIO, Dict, List, Optional, Any, Tuple, Union
 from datetime import datetime, timedelta
 from pathlib import Path
 import aiohttp
 import base64
-from collections import deque
+import io
+from collections import OrderedDict, deque
 
 try:
     import PyPDF2
@@ -29,6 +32,8 @@ except ImportError:
 
 from pydantic import BaseModel
 
+from perceptual_hash import max_distance_for_threshold, phash_image, phash_pdf_first_page, phash_to_hex, receipt_phash_index
+
 logger = logging.getLogger(__name__)
 
 # Memory configuration - große Gedächtnisgröße für jeden Agenten
@@ -48,9 +53,61 @@ OLLAMA_TIMEOUT = int(os.getenv('OLLAMA_TIMEOUT', '300'))  # 5 minutes default
 OLLAMA_MAX_RETRIES = int(os.getenv('OLLAMA_MAX_RETRIES', '3'))
 OLLAMA_RETRY_DELAY = float(os.getenv('OLLAMA_RETRY_DELAY', '2.0'))  # seconds
 
+# Gleichzeitige Anfragen je Modell. OLLAMA_MAX_CONCURRENCY gilt für alle Modelle,
+# OLLAMA_MODEL_CONCURRENCY überschreibt einzelne Modelle, z.B. "Qwen2.5:32B=2,llama3.2=6"
+OLLAMA_MAX_CONCURRENCY = int(os.getenv('OLLAMA_MAX_CONCURRENCY', '4'))
+OLLAMA_MODEL_CONCURRENCY = os.getenv('OLLAMA_MODEL_CONCURRENCY', '')
+# Timeout je Beleg in DocumentAgent.process (Sekunden, ab Erhalt des Modell-Slots)
+DOCUMENT_ANALYSIS_TIMEOUT = float(os.getenv('DOCUMENT_ANALYSIS_TIMEOUT', str(OLLAMA_TIMEOUT)))
+
+# LLM-Antwort-Cache: LRU im Prozess + persistente Stufe in MongoDB (TTL-Index)
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '512'))
+LLM_CACHE_TTL_SECONDS = int(os.getenv('LLM_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))  # 7 Tage
+
+# Erreichbarkeit des Ollama-Servers: Ergebnis wird so lange wiederverwendet und im Hintergrund erneuert (Sekunden)
+OLLAMA_HEALTH_CHECK_INTERVAL = float(os.getenv('OLLAMA_HEALTH_CHECK_INTERVAL', '60'))
+
 # Prompt directory
 PROMPTS_DIR = Path(__file__).parent / "prompts"
 
+# Dokumentquelle: Pfad oder bereits entschlüsselter Inhalt (bytes / file-like, z.B. BytesIO).
+# Entschlüsselte Belege werden so direkt an pdfplumber/PyPDF2 übergeben und nie auf die Platte geschrieben.
+DocumentSource = Union[str, Path, bytes, bytearray, BinaryIO]
+
+def _is_path_source(source: DocumentSource) -> bool:
+    return isinstance(source, (str, Path))
+
+def _document_stream(source: DocumentSource) -> Union[str, BinaryIO]:
+    """Pfad unverändert, bytes als neuer BytesIO, file-like an den Anfang zurückgespult"""
+    if _is_path_source(source):
+        return str(source)
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    source.seek(0)
+    return source
+
+def _document_bytes(source: DocumentSource) -> bytes:
+    if _is_path_source(source):
+        with open(source, 'rb') as f:
+            return f.read()
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    source.seek(0)
+    return source.read()
+
+def _document_label(source: DocumentSource) -> str:
+    """Bezeichnung für Logs und Tool-Ergebnisse (Pfad oder <in-memory>)"""
+    return str(source) if _is_path_source(source) else "<in-memory>"
+
+def _missing_document(source: DocumentSource) -> bool:
+    return _is_path_source(source) and not Path(source).exists()
+
+def _is_pdf_source(source: DocumentSource) -> bool:
+    if _is_path_source(source):
+        return str(source).lower().endswith('.pdf')
+    return _document_bytes(source)[:5] == b'%PDF-'
+
 class AgentMemoryEntry(BaseModel):
     """Einzelner Memory-Eintrag für einen Agenten"""
     entry_id: str
@@ -2507,19 +2564,20 @@ class PDFMetadataTool(AgentTool):
             parameters={
                 "pdf_path": {
                     "type": "string",
-                    "description": "Pfad zur PDF-Datei"
+                    "description": "Pfad zur PDF-Datei (intern auch bytes/BytesIO)"
                 }
             }
         )
     
-    async def execute(self, pdf_path: str) -> Dict[str, Any]:
+    async def execute(self, pdf_path: DocumentSource) -> Dict[str, Any]:
         """Extrahiere PDF-Metadaten"""
+        pdf_label = _document_label(pdf_path)
         try:
-            if not Path(pdf_path).exists():
+            if _missing_document(pdf_path):
                 return {
                     "success": False,
-                    "error": f"PDF nicht gefunden: {pdf_path}",
-                    "pdf_path": pdf_path
+                    "error": f"PDF nicht gefunden: {pdf_label}",
+                    "pdf_path": pdf_label
                 }
             
             metadata = {}
@@ -2527,21 +2585,20 @@ class PDFMetadataTool(AgentTool):
             # Versuche mit PyPDF2
             if HAS_PYPDF2:
                 try:
-                    with open(pdf_path, 'rb') as file:
-                        pdf_reader = PyPDF2.PdfReader(file)
-                        info = pdf_reader.metadata
-                        if info:
-                            metadata = {
-                                "title": info.get("/Title", ""),
-                                "author": info.get("/Author", ""),
-                                "subject": info.get("/Subject", ""),
-                                "creator": info.get("/Creator", ""),
-                                "producer": info.get("/Producer", ""),
-                                "creation_date": str(info.get("/CreationDate", "")),
-                                "modification_date": str(info.get("/ModDate", ""))
-                            }
-                        metadata["pages"] = len(pdf_reader.pages)
-                        metadata["encrypted"] = pdf_reader.is_encrypted
+                    pdf_reader = PyPDF2.PdfReader(_document_stream(pdf_path))
+                    info = pdf_reader.metadata
+                    if info:
+                        metadata = {
+                            "title": info.get("/Title", ""),
+                            "author": info.get("/Author", ""),
+                            "subject": info.get("/Subject", ""),
+                            "creator": info.get("/Creator", ""),
+                            "producer": info.get("/Producer", ""),
+                            "creation_date": str(info.get("/CreationDate", "")),
+                            "modification_date": str(info.get("/ModDate", ""))
+                        }
+                    metadata["pages"] = len(pdf_reader.pages)
+                    metadata["encrypted"] = pdf_reader.is_encrypted
                 except Exception as e:
                     logger.debug(f"PyPDF2 metadata extraction error: {e}")
             
@@ -2549,7 +2606,7 @@ class PDFMetadataTool(AgentTool):
             if HAS_PDFPLUMBER and not metadata.get("pages"):
                 try:
                     import pdfplumber
-                    with pdfplumber.open(pdf_path) as pdf:
+                    with pdfplumber.open(_document_stream(pdf_path)) as pdf:
                         metadata["pages"] = len(pdf.pages)
                         if pdf.metadata:
                             metadata.update({
@@ -2566,12 +2623,12 @@ class PDFMetadataTool(AgentTool):
                 return {
                     "success": False,
                     "error": "Konnte keine Metadaten extrahieren",
-                    "pdf_path": pdf_path
+                    "pdf_path": pdf_label
                 }
             
             return {
                 "success": True,
-                "pdf_path": pdf_path,
+                "pdf_path": pdf_label,
                 "metadata": metadata,
                 "source": "pypdf2" if HAS_PYPDF2 else "pdfplumber"
             }
@@ -2581,7 +2638,7 @@ class PDFMetadataTool(AgentTool):
             return {
                 "success": False,
                 "error": str(e),
-                "pdf_path": pdf_path
+                "pdf_path": pdf_label
             }
 
 class DuplicateDetectionTool(AgentTool):
@@ -2627,41 +2684,16 @@ class DuplicateDetectionTool(AgentTool):
             logger.error(f"Hash-Berechnung fehlgeschlagen: {e}")
             return ""
     
-    def _calculate_perceptual_hash(self, file_path: str) -> Optional[str]:
-        """Berechne Perceptual Hash für Bild-Ähnlichkeitsprüfung"""
+    def _calculate_perceptual_hash(self, file_path: str) -> Optional[int]:
+        """Berechne Perceptual Hash (64 Bit) für Bild-Ähnlichkeitsprüfung, bei PDFs von der ersten Seite"""
         try:
+            if str(file_path).lower().endswith('.pdf'):
+                return phash_pdf_first_page(file_path)
             from PIL import Image
-            import imagehash
-            
-            # Versuche Bild zu öffnen
-            try:
-                img = Image.open(file_path)
-                # Konvertiere zu RGB falls nötig
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                # Berechne Perceptual Hash
-                phash = imagehash.phash(img)
-                return str(phash)
-            except Exception:
-                # Kein Bild, versuche PDF
-                if file_path.lower().endswith('.pdf'):
-                    # Für PDFs extrahiere erste Seite als Bild
-                    try:
-                        if HAS_PDFPLUMBER:
-                            import pdfplumber
-                            from PIL import Image as PILImage
-                            import io
-                            
-                            with pdfplumber.open(file_path) as pdf:
-                                if len(pdf.pages) > 0:
-                                    # Konvertiere erste Seite zu Bild (vereinfacht)
-                                    # In Produktion würde man pdf2image verwenden
-                                    return None  # Für PDFs verwenden wir nur Hash
-                    except Exception:
-                        pass
-                return None
+            with Image.open(file_path) as img:
+                return phash_image(img)
         except ImportError:
-            logger.debug("imagehash nicht verfügbar, Perceptual Hash übersprungen")
+            logger.debug("PIL nicht verfügbar, Perceptual Hash übersprungen")
             return None
         except Exception as e:
             logger.debug(f"Perceptual Hash Berechnung fehlgeschlagen: {e}")
@@ -2683,31 +2715,20 @@ class DuplicateDetectionTool(AgentTool):
                 except ImportError:
                     return {"is_duplicate": False, "note": "Datenbank nicht verfügbar für Duplikats-Prüfung"}
             
-            # Suche in Receipts-Collection
-            receipts_collection = db.receipts
-            existing = await receipts_collection.find_one({"file_hash": file_hash})
+            # Eine indizierte Abfrage im Beleg-Register (Belege und unterschriebene Stundenzettel,
+            # wird beim Upload in server.py befüllt)
+            existing = await db.receipts.find_one({"file_hash": file_hash}, {"_id": 0})
             
             if existing:
                 return {
                     "is_duplicate": True,
                     "match_type": "hash",
-                    "existing_receipt_id": str(existing.get("_id", "")),
-                    "existing_report_id": str(existing.get("report_id", "")),
+                    "existing_receipt_id": existing.get("receipt_id"),
+                    "existing_report_id": existing.get("report_id") or existing.get("expense_id"),
+                    "existing_timesheet_id": existing.get("timesheet_id"),
                     "upload_date": str(existing.get("upload_date", ""))
                 }
             
-            # Suche in Timesheets-Collection (für unterschriebene Stundenzettel)
-            timesheets_collection = db.timesheets
-            existing_timesheet = await timesheets_collection.find_one({"signed_pdf_hash": file_hash})
-            
-            if existing_timesheet:
-                return {
-                    "is_duplicate": True,
-                    "match_type": "hash",
-                    "existing_timesheet_id": str(existing_timesheet.get("_id", "")),
-                    "upload_date": str(existing_timesheet.get("signed_pdf_upload_date", ""))
-                }
-            
             return {"is_duplicate": False}
             
         except Exception as e:
@@ -2768,19 +2789,29 @@ class DuplicateDetectionTool(AgentTool):
                 })
                 return result
             
-            # Prüfe Bild-Ähnlichkeit (falls aktiviert)
-            if check_similarity:
+            # Prüfe Bild-Ähnlichkeit (falls aktiviert): Hamming-Suche im pHash-Index des Beleg-Registers
+            if check_similarity and db is not None:
                 try:
                     phash = self._calculate_perceptual_hash(file_path)
-                    if phash:
-                        # Suche ähnliche Perceptual Hashes in Datenbank
-                        # (vereinfacht - in Produktion würde man Hamming-Distanz verwenden)
-                        result["perceptual_hash"] = phash
+                    if phash is not None:
+                        max_distance = max_distance_for_threshold(similarity_threshold)
+                        similar = [
+                            {"file_hash": key, "hamming_distance": distance, "similarity": round(1 - distance / 64, 3)}
+                            for key, distance in await receipt_phash_index(db).search(phash, max_distance)
+                            if key != file_hash
+                        ]
+                        result["perceptual_hash"] = phash_to_hex(phash)
+                        result["similar_receipts"] = similar
                         result["similarity_check"] = "completed"
+                        if similar:
+                            result["warning"] = "Sehr ähnlicher Beleg bereits vorhanden"
                 except Exception as e:
                     logger.debug(f"Ähnlichkeitsprüfung übersprungen: {e}")
                     result["similarity_check"] = "skipped"
-            
+            elif check_similarity:
+                # Ohne Datenbank kein Beleg-Register zum Vergleichen
+                result["similarity_check"] = "skipped"
+
             return result
             
         except Exception as e:
@@ -3587,7 +3618,7 @@ class SignatureDetectionTool(AgentTool):
             parameters={
                 "pdf_path": {
                     "type": "string",
-                    "description": "Pfad zur PDF-Datei"
+                    "description": "Pfad zur PDF-Datei (intern auch bytes/BytesIO)"
                 },
                 "check_digital": {
                     "type": "boolean",
@@ -3603,21 +3634,22 @@ class SignatureDetectionTool(AgentTool):
         )
     
     async def execute(self,
-                      pdf_path: str,
+                      pdf_path: DocumentSource,
                       check_digital: bool = True,
                       check_handwritten: bool = True) -> Dict[str, Any]:
         """Erkenne Signaturen in PDF"""
+        pdf_label = _document_label(pdf_path)
         try:
-            if not Path(pdf_path).exists():
+            if _missing_document(pdf_path):
                 return {
                     "success": False,
-                    "error": f"PDF nicht gefunden: {pdf_path}",
-                    "pdf_path": pdf_path
+                    "error": f"PDF nicht gefunden: {pdf_label}",
+                    "pdf_path": pdf_label
                 }
             
             result = {
                 "success": True,
-                "pdf_path": pdf_path,
+                "pdf_path": pdf_label,
                 "digital_signatures": [],
                 "signature_fields": [],
                 "handwritten_signatures": []
@@ -3626,27 +3658,26 @@ class SignatureDetectionTool(AgentTool):
             # Prüfe digitale Signaturen
             if check_digital and HAS_PYPDF2:
                 try:
-                    with open(pdf_path, 'rb') as file:
-                        pdf_reader = PyPDF2.PdfReader(file)
-                        
-                        # Prüfe auf Signatur-Felder
-                        if hasattr(pdf_reader, 'get_form_text_fields'):
-                            fields = pdf_reader.get_form_text_fields()
-                            for field_name, field_value in fields.items():
-                                if 'signature' in field_name.lower() or 'unterschrift' in field_name.lower():
-                                    result["signature_fields"].append({
-                                        "field_name": field_name,
-                                        "field_value": field_value
-                                    })
-                        
-                        # Prüfe auf digitale Signaturen (X.509)
-                        if hasattr(pdf_reader, 'get_signature_fields'):
-                            sig_fields = pdf_reader.get_signature_fields()
-                            for sig_field in sig_fields:
-                                result["digital_signatures"].append({
-                                    "field_name": sig_field.get('name', ''),
-                                    "signed": True
+                    pdf_reader = PyPDF2.PdfReader(_document_stream(pdf_path))
+                    
+                    # Prüfe auf Signatur-Felder
+                    if hasattr(pdf_reader, 'get_form_text_fields'):
+                        fields = pdf_reader.get_form_text_fields()
+                        for field_name, field_value in fields.items():
+                            if 'signature' in field_name.lower() or 'unterschrift' in field_name.lower():
+                                result["signature_fields"].append({
+                                    "field_name": field_name,
+                                    "field_value": field_value
                                 })
+                    
+                    # Prüfe auf digitale Signaturen (X.509)
+                    if hasattr(pdf_reader, 'get_signature_fields'):
+                        sig_fields = pdf_reader.get_signature_fields()
+                        for sig_field in sig_fields:
+                            result["digital_signatures"].append({
+                                "field_name": sig_field.get('name', ''),
+                                "signed": True
+                            })
                 except Exception as e:
                     logger.debug(f"Digitale Signatur-Prüfung fehlgeschlagen: {e}")
                     result["digital_signature_error"] = str(e)
@@ -3657,7 +3688,7 @@ class SignatureDetectionTool(AgentTool):
                 try:
                     if HAS_PDFPLUMBER:
                         import pdfplumber
-                        with pdfplumber.open(pdf_path) as pdf:
+                        with pdfplumber.open(_document_stream(pdf_path)) as pdf:
                             for page_num, page in enumerate(pdf.pages):
                                 text = page.extract_text()
                                 if text:
@@ -3695,7 +3726,7 @@ class SignatureDetectionTool(AgentTool):
             return {
                 "success": False,
                 "error": str(e),
-                "pdf_path": pdf_path
+                "pdf_path": pdf_label
             }
 
 class ExcelImportExportTool(AgentTool):
@@ -4190,15 +4221,12 @@ class HolidayAPITool(AgentTool):
             
             country_code = country_code.upper()
             
-            # Nutze lokale holidays-Bibliothek (bereits in requirements.txt)
+            # Nutze lokale holidays-Bibliothek über den gecachten Kalender-Service
+            # (DE/SN teilt sich den Cache mit den Urlaubs-Endpunkten)
             try:
-                import holidays
+                from holiday_calendar import country_holidays
                 
-                # Erstelle Feiertags-Objekt
-                if region:
-                    holiday_obj = holidays.country_holidays(country_code, years=year, subdiv=region)
-                else:
-                    holiday_obj = holidays.country_holidays(country_code, years=year)
+                holiday_obj = country_holidays(country_code, year, region)
                 
                 # Prüfe einzelnes Datum
                 if date:
@@ -4705,7 +4733,7 @@ class QRCodeReaderTool(AgentTool):
             parameters={
                 "file_path": {
                     "type": "string",
-                    "description": "Pfad zur Datei (PDF oder Bild)"
+                    "description": "Pfad zur Datei (PDF oder Bild, intern auch bytes/BytesIO)"
                 },
                 "extract_data": {
                     "type": "boolean",
@@ -4716,15 +4744,16 @@ class QRCodeReaderTool(AgentTool):
         )
     
     async def execute(self,
-                      file_path: str,
+                      file_path: DocumentSource,
                       extract_data: bool = True) -> Dict[str, Any]:
         """Erkenne QR-Codes in Datei"""
+        file_label = _document_label(file_path)
         try:
-            if not Path(file_path).exists():
+            if _missing_document(file_path):
                 return {
                     "success": False,
-                    "error": f"Datei nicht gefunden: {file_path}",
-                    "file_path": file_path
+                    "error": f"Datei nicht gefunden: {file_label}",
+                    "file_path": file_label
                 }
             
             try:
@@ -4741,12 +4770,12 @@ class QRCodeReaderTool(AgentTool):
             qr_codes = []
             
             # Prüfe ob PDF oder Bild
-            if file_path.lower().endswith('.pdf'):
+            if _is_pdf_source(file_path):
                 # PDF: Konvertiere Seiten zu Bildern
                 try:
                     if HAS_PDFPLUMBER:
                         import pdfplumber
-                        with pdfplumber.open(file_path) as pdf:
+                        with pdfplumber.open(_document_stream(file_path)) as pdf:
                             for page_num, page in enumerate(pdf.pages):
                                 # Konvertiere PDF-Seite zu Bild
                                 img = page.to_image(resolution=300)
@@ -4777,11 +4806,15 @@ class QRCodeReaderTool(AgentTool):
             else:
                 # Bild: Direkt verarbeiten
                 try:
-                    img = cv2.imread(file_path)
+                    if _is_path_source(file_path):
+                        img = cv2.imread(str(file_path))
+                    else:
+                        import numpy as np
+                        img = cv2.imdecode(np.frombuffer(_document_bytes(file_path), dtype=np.uint8), cv2.IMREAD_COLOR)
                     if img is None:
                         return {
                             "success": False,
-                            "error": f"Bild konnte nicht geladen werden: {file_path}"
+                            "error": f"Bild konnte nicht geladen werden: {file_label}"
                         }
                     
                     # Erkenne QR-Codes
@@ -4831,7 +4864,7 @@ class QRCodeReaderTool(AgentTool):
             
             return {
                 "success": True,
-                "file_path": file_path,
+                "file_path": file_label,
                 "qr_codes_found": len(qr_codes),
                 "qr_codes": qr_codes if not extract_data else extracted_data
             }
@@ -4841,7 +4874,7 @@ class QRCodeReaderTool(AgentTool):
             return {
                 "success": False,
                 "error": str(e),
-                "file_path": file_path
+                "file_path": file_label
             }
 
 class BarcodeReaderTool(AgentTool):
@@ -5846,6 +5879,191 @@ def get_tool_registry() -> AgentToolRegistry:
         _tool_registry = AgentToolRegistry()
     return _tool_registry
 
+class LLMResponseCache:
+    """Zweistufiger Cache für LLM-Antworten.
+
+    Schlüssel: SHA-256 über Modell, Optionen und alle Nachrichten (System- und User-Prompt).
+    Stufe 1 ist ein LRU im Prozess, Stufe 2 die Collection llm_response_cache mit TTL-Index
+    auf expires_at (überlebt Neustarts und wird von allen Workern geteilt). Gecacht werden nur
+    erfolgreiche Antworten. Treffer werden je Agent gezählt.
+
+    Document- und AccountingAgent schlüsseln mit dem Basis-System-Prompt ohne Gedächtnis-Kontext
+    (cache_system_prompt): Das Gedächtnis wächst mit jeder Analyse, ein Schlüssel darüber würde bei
+    erneuter Prüfung desselben Belegs praktisch nie treffen. Dafür kann ein Treffer bis zur TTL aus
+    einem älteren Gedächtnisstand stammen; wer das nicht will, setzt use_cache=False.
+    """
+
+    COLLECTION = "llm_response_cache"
+
+    def __init__(self, maxsize: int = LLM_CACHE_MAX_ENTRIES, ttl_seconds: int = LLM_CACHE_TTL_SECONDS,
+                 enabled: bool = LLM_CACHE_ENABLED):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.db = None
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def attach_db(self, db) -> None:
+        """Persistente Stufe aktivieren (TTL-Index wird in server.ensure_indexes angelegt)"""
+        self.db = db
+
+    @staticmethod
+    def make_key(model: str, options: Dict[str, Any], messages: List[Dict[str, str]]) -> str:
+        payload = json.dumps({"model": model, "options": options, "messages": messages},
+                             sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _count(self, agent: Optional[str], outcome: str) -> None:
+        counters = self._stats.setdefault(agent or "unknown", {"memory_hits": 0, "db_hits": 0, "misses": 0, "bypassed": 0})
+        counters[outcome] += 1
+
+    def bypass(self, agent: Optional[str]) -> None:
+        self._count(agent, "bypassed")
+
+    async def get(self, key: str, agent: Optional[str] = None) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] >= time.monotonic():
+                self._entries.move_to_end(key)
+                self._count(agent, "memory_hits")
+                return entry[1]
+            del self._entries[key]
+        if self.db is not None:
+            try:
+                doc = await self.db[self.COLLECTION].find_one(
+                    {"key": key, "expires_at": {"$gt": datetime.utcnow()}},
+                    {"_id": 0, "response": 1, "expires_at": 1}
+                )
+            except Exception as e:
+                logger.debug(f"LLM cache lookup failed: {e}")
+                doc = None
+            if doc:
+                remaining = (doc["expires_at"] - datetime.utcnow()).total_seconds()
+                self._remember(key, doc["response"], remaining)
+                self._count(agent, "db_hits")
+                return doc["response"]
+        self._count(agent, "misses")
+        return None
+
+    def _remember(self, key: str, response: str, ttl_seconds: float) -> None:
+        if self.maxsize <= 0 or ttl_seconds <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl_seconds, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def set(self, key: str, response: str, model: str, agent: Optional[str] = None) -> None:
+        self._remember(key, response, self.ttl_seconds)
+        if self.db is None:
+            return
+        now = datetime.utcnow()
+        try:
+            await self.db[self.COLLECTION].update_one(
+                {"key": key},
+                {"$set": {
+                    "key": key,
+                    "model": model,
+                    "agent": agent,
+                    "response": response,
+                    "created_at": now,
+                    "expires_at": now + timedelta(seconds=self.ttl_seconds),
+                }},
+                upsert=True
+            )
+        except Exception as e:
+            logger.debug(f"LLM cache write failed: {e}")
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        agents = {}
+        for agent, counters in self._stats.items():
+            hits = counters["memory_hits"] + counters["db_hits"]
+            total = hits + counters["misses"]
+            agents[agent] = {**counters, "hit_rate": round(hits / total, 4) if total else 0.0}
+        return {
+            "enabled": self.enabled,
+            "persistent": self.db is not None,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl_seconds,
+            "agents": agents,
+        }
+
+
+# Prozessweiter Cache, von allen OllamaLLM-Instanzen geteilt
+llm_response_cache = LLMResponseCache()
+
+
+def model_concurrency(model: str) -> int:
+    """Maximale Zahl gleichzeitiger Anfragen für ein Modell"""
+    for item in OLLAMA_MODEL_CONCURRENCY.split(","):
+        name, _, limit = item.rpartition("=")
+        if name.strip().lower() == model.lower() and limit.strip().isdigit():
+            return max(1, int(limit))
+    return max(1, OLLAMA_MAX_CONCURRENCY)
+
+
+_model_semaphores: Dict[str, Tuple[Any, asyncio.Semaphore]] = {}
+
+
+def get_model_semaphore(model: str) -> asyncio.Semaphore:
+    """Prozessweites Semaphore je Modell (alle OllamaLLM-Instanzen und Orchestratoren teilen es)"""
+    loop = asyncio.get_running_loop()
+    entry = _model_semaphores.get(model)
+    if entry is None or entry[0] is not loop:
+        entry = (loop, asyncio.Semaphore(model_concurrency(model)))
+        _model_semaphores[model] = entry
+    return entry[1]
+
+
+def create_ollama_session(timeout: float, limit: int = 10, limit_per_host: int = 5) -> aiohttp.ClientSession:
+    """aiohttp-Session mit Connection Pooling für Ollama"""
+    connector = aiohttp.TCPConnector(
+        limit=limit,  # Max connections
+        limit_per_host=limit_per_host,  # Max connections per host
+        ttl_dns_cache=300,  # DNS cache TTL
+        force_close=False,  # Reuse connections
+        enable_cleanup_closed=True
+    )
+    client_timeout = aiohttp.ClientTimeout(
+        total=timeout,
+        connect=10,  # Connection timeout
+        sock_read=timeout  # Read timeout
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=client_timeout)
+
+
+class OllamaSessionPool:
+    """Eine gemeinsame HTTP-Session je Ollama-Server für mehrere OllamaLLM-Instanzen
+    
+    Die Agenten eines Orchestrators sprechen denselben Server an; statt drei Connection-Pools (und drei
+    TLS/TCP-Handshakes je Anfragewelle) teilen sie sich einen. Die Parallelität je Modell begrenzen weiterhin
+    die Modell-Semaphoren.
+    """
+    
+    def __init__(self, limit: int = 30, limit_per_host: int = 15):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+    
+    async def get(self, base_url: str, timeout: float) -> aiohttp.ClientSession:
+        session = self._sessions.get(base_url)
+        if session is None or session.closed:
+            session = create_ollama_session(timeout, self.limit, self.limit_per_host)
+            self._sessions[base_url] = session
+        return session
+    
+    async def close(self):
+        for session in self._sessions.values():
+            if not session.closed:
+                await session.close()
+        self._sessions.clear()
+
+
 class OllamaLLM:
     """Wrapper for Ollama LLM API
     
@@ -5853,35 +6071,29 @@ class OllamaLLM:
     Handles network connectivity, timeouts, and retries for Proxmox deployment.
     """
     
-    def __init__(self, base_url: str = OLLAMA_BASE_URL, model: str = OLLAMA_MODEL):
+    def __init__(self, base_url: str = OLLAMA_BASE_URL, model: str = OLLAMA_MODEL,
+                 cache: Optional[LLMResponseCache] = None, sessions: Optional[OllamaSessionPool] = None):
         self.base_url = base_url.rstrip('/')
         self.model = model
         self.timeout = OLLAMA_TIMEOUT
         self.max_retries = OLLAMA_MAX_RETRIES
         self.retry_delay = OLLAMA_RETRY_DELAY
+        self.options = {
+            "temperature": 0.7,
+            "num_predict": 4096  # Max tokens
+        }
+        self.cache = cache or llm_response_cache
+        # Gemeinsame Sessions (z.B. im AgentOrchestrator); sonst eine eigene Session je Instanz
+        self.sessions = sessions
         self._session = None
         logger.info(f"OllamaLLM initialized: {self.base_url}, model={self.model}")
     
     async def _get_session(self):
         """Get or create aiohttp session with connection pooling"""
+        if self.sessions is not None:
+            return await self.sessions.get(self.base_url, self.timeout)
         if self._session is None or self._session.closed:
-            # Create session with connection pooling for better performance
-            connector = aiohttp.TCPConnector(
-                limit=10,  # Max connections
-                limit_per_host=5,  # Max connections per host
-                ttl_dns_cache=300,  # DNS cache TTL
-                force_close=False,  # Reuse connections
-                enable_cleanup_closed=True
-            )
-            timeout = aiohttp.ClientTimeout(
-                total=self.timeout,
-                connect=10,  # Connection timeout
-                sock_read=self.timeout  # Read timeout
-            )
-            self._session = aiohttp.ClientSession(
-                connector=connector,
-                timeout=timeout
-            )
+            self._session = create_ollama_session(self.timeout)
         return self._session
     
     async def health_check(self) -> bool:
@@ -5902,77 +6114,175 @@ class OllamaLLM:
             logger.warning(f"Ollama health check error: {e}")
             return False
     
-    async def chat(self, messages: List[Dict[str, str]], system_prompt: Optional[str] = None) -> str:
-        """Send chat messages to Ollama and get response with retry logic"""
+    async def chat(self, messages: List[Dict[str, str]], system_prompt: Optional[str] = None,
+                   use_cache: bool = True, agent: Optional[str] = None,
+                   cache_system_prompt: Optional[str] = None, timeout: Optional[float] = None) -> str:
+        """Send chat messages to Ollama and get response with retry logic
+        
+        use_cache=False umgeht den Antwort-Cache (z.B. für Dialoge). cache_system_prompt ersetzt den
+        System-Prompt im Cache-Schlüssel, damit wechselnder Gedächtnis-Kontext Treffer nicht verhindert
+        (Treffer können dann aus einem älteren Gedächtnisstand stammen, siehe LLMResponseCache).
+        timeout begrenzt die Anfrage samt Wiederholungen und läuft erst ab Erhalt des Modell-Slots
+        (Wartezeit hinter anderen Aufrufern zählt nicht); bei Überschreitung asyncio.TimeoutError.
+        """
         # Prepare messages with system prompt
         formatted_messages = []
         if system_prompt:
             formatted_messages.append({"role": "system", "content": system_prompt})
         formatted_messages.extend(messages)
         
+        cache_key = None
+        if self.cache.enabled and use_cache:
+            key_messages = list(messages)
+            key_system_prompt = cache_system_prompt if cache_system_prompt is not None else system_prompt
+            if key_system_prompt:
+                key_messages.insert(0, {"role": "system", "content": key_system_prompt})
+            cache_key = self.cache.make_key(self.model, self.options, key_messages)
+            cached = await self.cache.get(cache_key, agent)
+            if cached is not None:
+                return cached
+        else:
+            self.cache.bypass(agent)
+        
         last_error = None
-        for attempt in range(self.max_retries):
-            try:
-                session = await self._get_session()
-                async with session.post(
-                    f"{self.base_url}/api/chat",
-                    json={
-                        "model": self.model,
-                        "messages": formatted_messages,
-                        "stream": False,
-                        "options": {
-                            "temperature": 0.7,
-                            "num_predict": 4096  # Max tokens
+        # Begrenzte Parallelität je Modell
+        async with get_model_semaphore(self.model), asyncio.timeout(timeout):
+            for attempt in range(self.max_retries):
+                try:
+                    session = await self._get_session()
+                    async with session.post(
+                        f"{self.base_url}/api/chat",
+                        json={
+                            "model": self.model,
+                            "messages": formatted_messages,
+                            "stream": False,
+                            "options": self.options
                         }
-                    }
-                ) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        content = result.get("message", {}).get("content", "")
-                        if content:
-                            logger.debug(f"Ollama response received (attempt {attempt + 1})")
-                            return content
+                    ) as response:
+                        if response.status == 200:
+                            result = await response.json()
+                            content = result.get("message", {}).get("content", "")
+                            if content:
+                                logger.debug(f"Ollama response received (attempt {attempt + 1})")
+                                if cache_key:
+                                    await self.cache.set(cache_key, content, self.model, agent)
+                                return content
+                            else:
+                                logger.warning(f"Empty response from Ollama (attempt {attempt + 1})")
+                                last_error = "Empty response from LLM"
                         else:
-                            logger.warning(f"Empty response from Ollama (attempt {attempt + 1})")
-                            last_error = "Empty response from LLM"
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"Ollama API error: {response.status} - {error_text[:200]}")
-                        last_error = f"API error {response.status}"
+                            error_text = await response.text()
+                            logger.error(f"Ollama API error: {response.status} - {error_text[:200]}")
+                            last_error = f"API error {response.status}"
                         
-            except aiohttp.ClientConnectorError as e:
-                last_error = f"Connection error: {str(e)}"
-                logger.warning(f"Ollama connection error (attempt {attempt + 1}/{self.max_retries}): {e}")
-                if attempt < self.max_retries - 1:
-                    await asyncio.sleep(self.retry_delay * (attempt + 1))  # Exponential backoff
+                except aiohttp.ClientConnectorError as e:
+                    last_error = f"Connection error: {str(e)}"
+                    logger.warning(f"Ollama connection error (attempt {attempt + 1}/{self.max_retries}): {e}")
+                    if attempt < self.max_retries - 1:
+                        await asyncio.sleep(self.retry_delay * (attempt + 1))  # Exponential backoff
                     
-            except asyncio.TimeoutError:
-                last_error = "Request timeout"
-                logger.warning(f"Ollama timeout (attempt {attempt + 1}/{self.max_retries})")
-                if attempt < self.max_retries - 1:
-                    await asyncio.sleep(self.retry_delay * (attempt + 1))
+                except asyncio.TimeoutError:
+                    last_error = "Request timeout"
+                    logger.warning(f"Ollama timeout (attempt {attempt + 1}/{self.max_retries})")
+                    if attempt < self.max_retries - 1:
+                        await asyncio.sleep(self.retry_delay * (attempt + 1))
                     
-            except Exception as e:
-                last_error = f"Unexpected error: {str(e)}"
-                logger.error(f"Ollama error (attempt {attempt + 1}/{self.max_retries}): {e}")
-                if attempt < self.max_retries - 1:
-                    await asyncio.sleep(self.retry_delay * (attempt + 1))
+                except Exception as e:
+                    last_error = f"Unexpected error: {str(e)}"
+                    logger.error(f"Ollama error (attempt {attempt + 1}/{self.max_retries}): {e}")
+                    if attempt < self.max_retries - 1:
+                        await asyncio.sleep(self.retry_delay * (attempt + 1))
         
         # All retries failed
         error_msg = f"Fehler bei Kommunikation mit LLM nach {self.max_retries} Versuchen: {last_error}"
         logger.error(error_msg)
         return error_msg
     
+    async def chat_stream(self, messages: List[Dict[str, str]], system_prompt: Optional[str] = None,
+                          agent: Optional[str] = None) -> AsyncIterator[str]:
+        """Wie chat, liefert die Antwort aber stückweise, sobald Ollama Tokens erzeugt ("stream": True)
+        
+        Ollama sendet NDJSON (eine JSON-Zeile pro Token-Block, zuletzt "done": true). Wiederholt wird nur,
+        solange noch nichts ausgeliefert wurde; Streams werden nicht gecacht. Schlägt alles fehl, wird wie bei
+        chat die Fehlermeldung als Text geliefert.
+        """
+        formatted_messages = []
+        if system_prompt:
+            formatted_messages.append({"role": "system", "content": system_prompt})
+        formatted_messages.extend(messages)
+        self.cache.bypass(agent)
+        
+        last_error = None
+        async with get_model_semaphore(self.model):
+            for attempt in range(self.max_retries):
+                received = False
+                try:
+                    session = await self._get_session()
+                    async with session.post(
+                        f"{self.base_url}/api/chat",
+                        json={
+                            "model": self.model,
+                            "messages": formatted_messages,
+                            "stream": True,
+                            "options": self.options
+                        }
+                    ) as response:
+                        if response.status != 200:
+                            error_text = await response.text()
+                            logger.error(f"Ollama API error: {response.status} - {error_text[:200]}")
+                            last_error = f"API error {response.status}"
+                        else:
+                            async for line in response.content:
+                                line = line.strip()
+                                if not line:
+                                    continue
+                                chunk = json.loads(line)
+                                if chunk.get("error"):
+                                    raise RuntimeError(chunk["error"])
+                                content = chunk.get("message", {}).get("content", "")
+                                if content:
+                                    received = True
+                                    yield content
+                                if chunk.get("done"):
+                                    break
+                            if received:
+                                logger.debug(f"Ollama stream finished (attempt {attempt + 1})")
+                                return
+                            logger.warning(f"Empty response from Ollama (attempt {attempt + 1})")
+                            last_error = "Empty response from LLM"
+                
+                except (aiohttp.ClientConnectorError, asyncio.TimeoutError, aiohttp.ClientPayloadError,
+                        json.JSONDecodeError, RuntimeError) as e:
+                    if received:
+                        # Teilantwort ist schon beim Client, ein neuer Versuch würde sie doppeln
+                        logger.error(f"Ollama stream abgebrochen: {e}")
+                        yield f"\n\n[Antwort unvollständig: {e}]"
+                        return
+                    last_error = f"{type(e).__name__}: {e}"
+                    logger.warning(f"Ollama stream error (attempt {attempt + 1}/{self.max_retries}): {e}")
+                    if attempt < self.max_retries - 1:
+                        await asyncio.sleep(self.retry_delay * (attempt + 1))
+        
+        error_msg = f"Fehler bei Kommunikation mit LLM nach {self.max_retries} Versuchen: {last_error}"
+        logger.error(error_msg)
+        yield error_msg
+    
     async def close(self):
-        """Close the HTTP session"""
+        """Close the HTTP session (gemeinsame Sessions schließt der Besitzer des Pools)"""
         if self._session and not self._session.closed:
             await self._session.close()
             self._session = None
     
-    async def extract_json(self, prompt: str, system_prompt: Optional[str] = None) -> Optional[Dict]:
+    async def extract_json(self, prompt: str, system_prompt: Optional[str] = None,
+                           use_cache: bool = True, agent: Optional[str] = None,
+                           cache_system_prompt: Optional[str] = None,
+                           timeout: Optional[float] = None) -> Optional[Dict]:
         """Extract structured JSON from LLM response"""
         extraction_prompt = f"{prompt}\n\nAntworte NUR mit einem gültigen JSON-Objekt, keine zusätzlichen Erklärungen."
-        response = await self.chat([{"role": "user", "content": extraction_prompt}], system_prompt)
+        response = await self.chat(
+            [{"role": "user", "content": extraction_prompt}], system_prompt,
+            use_cache=use_cache, agent=agent, cache_system_prompt=cache_system_prompt, timeout=timeout
+        )
         
         # Try to extract JSON from response
         try:
@@ -6016,11 +6326,8 @@ Verfügbare Tools:
         """Initialisiere Memory"""
         await self.memory.initialize()
     
-    async def process(self, context: Dict[str, Any], user_message: Optional[str] = None) -> AgentResponse:
-        """Process user message or generate question based on context"""
-        report_issues = context.get("issues", [])
-        missing_info = context.get("missing_info", [])
-        
+    async def _system_prompt(self, report_issues: List[Any], missing_info: List[Any]) -> str:
+        """System-Prompt mit relevantem Gedächtnis-Kontext"""
         # Hole relevanten Memory-Kontext
         memory_context = await self.memory.get_context_for_prompt(
             max_tokens=1500,
@@ -6032,34 +6339,62 @@ Verfügbare Tools:
         if memory_context:
             system_prompt += f"\n\n=== Dein Gedächtnis (frühere Erfahrungen) ===\n{memory_context}\n"
             system_prompt += "\nNutze diese Informationen aus deinem Gedächtnis, um bessere Fragen zu stellen und den Benutzer besser zu verstehen."
-        
-        if user_message:
-            # Process user's answer
-            prompt = f"""Der Benutzer hat folgende Antwort gegeben: "{user_message}"
-Kontext: {json.dumps(context, indent=2, ensure_ascii=False)}
+        return system_prompt
+    
+    @staticmethod
+    def _answer_prompt(context: Dict[str, Any], user_message: str) -> str:
+        return f"""Der Benutzer hat folgende Antwort gegeben: "{user_message}"
+Kontext: {json.dumps(context, indent=2, ensure_ascii=False, default=str)}
             
 Bewerte die Antwort und gib an:
 - Ob die Information ausreichend ist
 - Ob weitere Fragen nötig sind
 - Eine Zusammenfassung der erhaltenen Informationen"""
-            
-            response_text = await self.llm.chat([
-                {"role": "user", "content": prompt}
-            ], system_prompt)
-            
-            # Speichere Konversation im Memory
-            await self.memory.add_conversation(
-                user_message=user_message,
-                agent_response=response_text,
-                context={"report_issues": report_issues, "missing_info": missing_info}
+    
+    async def _remember_answer(self, user_message: str, response_text: str,
+                               report_issues: List[Any], missing_info: List[Any]):
+        # Speichere Konversation im Memory
+        await self.memory.add_conversation(
+            user_message=user_message,
+            agent_response=response_text,
+            context={"report_issues": report_issues, "missing_info": missing_info}
+        )
+        
+        # Speichere Erkenntnis, falls neue Information
+        if len(missing_info) == 0:
+            await self.memory.add_insight(
+                f"Benutzer hat vollständige Informationen für Reisekostenabrechnung bereitgestellt: {user_message[:200]}",
+                source="user_conversation"
             )
+    
+    async def process_stream(self, context: Dict[str, Any], user_message: str) -> AsyncIterator[str]:
+        """Antwort auf eine Benutzernachricht stückweise liefern; Memory wird erst mit der vollständigen Antwort geschrieben"""
+        report_issues = context.get("issues", [])
+        missing_info = context.get("missing_info", [])
+        system_prompt = await self._system_prompt(report_issues, missing_info)
+        
+        parts = []
+        async for token in self.llm.chat_stream([
+            {"role": "user", "content": self._answer_prompt(context, user_message)}
+        ], system_prompt, agent=self.name):
+            parts.append(token)
+            yield token
+        
+        await self._remember_answer(user_message, "".join(parts), report_issues, missing_info)
+    
+    async def process(self, context: Dict[str, Any], user_message: Optional[str] = None) -> AgentResponse:
+        """Process user message or generate question based on context"""
+        report_issues = context.get("issues", [])
+        missing_info = context.get("missing_info", [])
+        system_prompt = await self._system_prompt(report_issues, missing_info)
+        
+        if user_message:
+            # Antworten des Benutzers sind Dialog: nicht cachen
+            response_text = await self.llm.chat([
+                {"role": "user", "content": self._answer_prompt(context, user_message)}
+            ], system_prompt, use_cache=False, agent=self.name)
             
-            # Speichere Erkenntnis, falls neue Information
-            if len(missing_info) == 0:
-                await self.memory.add_insight(
-                    f"Benutzer hat vollständige Informationen für Reisekostenabrechnung bereitgestellt: {user_message[:200]}",
-                    source="user_conversation"
-                )
+            await self._remember_answer(user_message, response_text, report_issues, missing_info)
             
             return AgentResponse(
                 agent_name=self.name,
@@ -6076,7 +6411,7 @@ Bewerte die Antwort und gib an:
 Formuliere eine klare, freundliche Frage an den Benutzer, um die fehlende Information zu erhalten."""
                 response_text = await self.llm.chat([
                     {"role": "user", "content": prompt}
-                ], system_prompt)
+                ], system_prompt, agent=self.name)
             else:
                 response_text = "Alle Informationen sind vollständig. Die Prüfung kann fortgesetzt werden."
             
@@ -6160,62 +6495,53 @@ Antworte präzise und strukturiert."""
             # Chat Agent might request document re-analysis
             pass
     
-    def extract_pdf_text(self, pdf_path: str, encryption=None) -> str:
+    def extract_pdf_text(self, pdf_source: DocumentSource, encryption=None) -> str:
         """
-        Extract text from PDF file
-        Handles encrypted files for DSGVO compliance
+        Extract text from PDF (Pfad, bytes oder file-like)
+        Handles encrypted files for DSGVO compliance: der entschlüsselte Inhalt geht
+        direkt als BytesIO an pdfplumber/PyPDF2, es wird keine Klartext-Datei geschrieben
         """
         extracted_text = ""
         
         try:
             # Check if file is encrypted and decrypt if needed
-            file_data = None
-            if encryption:
+            if encryption and _is_path_source(pdf_source):
                 try:
-                    # Try to decrypt first
-                    file_data = encryption.decrypt_file(Path(pdf_path))
-                    # Write decrypted data to temp file for processing
-                    temp_path = Path(pdf_path).with_suffix('.tmp.pdf')
-                    with open(temp_path, 'wb') as f:
-                        f.write(file_data)
-                    pdf_path = str(temp_path)
+                    pdf_source = encryption.decrypt_file(Path(pdf_source))
                 except Exception:
                     # File might not be encrypted, proceed normally
                     pass
             
             if HAS_PDFPLUMBER:
                 # Use pdfplumber (better for tables and structured data)
-                with pdfplumber.open(pdf_path) as pdf:
+                with pdfplumber.open(_document_stream(pdf_source)) as pdf:
                     for page in pdf.pages:
                         text = page.extract_text()
                         if text:
                             extracted_text += text + "\n"
             elif HAS_PYPDF2:
                 # Fallback to PyPDF2
-                with open(pdf_path, 'rb') as file:
-                    pdf_reader = PyPDF2.PdfReader(file)
-                    for page in pdf_reader.pages:
-                        text = page.extract_text()
-                        if text:
-                            extracted_text += text + "\n"
-            
-            # Clean up temp file if created
-            if file_data and Path(pdf_path).suffix == '.tmp.pdf':
-                try:
-                    Path(pdf_path).unlink()
-                except:
-                    pass
+                pdf_reader = PyPDF2.PdfReader(_document_stream(pdf_source))
+                for page in pdf_reader.pages:
+                    text = page.extract_text()
+                    if text:
+                        extracted_text += text + "\n"
                     
         except Exception as e:
-            logger.warning(f"Could not extract text from PDF {pdf_path}: {e}")
+            logger.warning(f"Could not extract text from PDF {_document_label(pdf_source)}: {e}")
         
         return extracted_text
     
-    async def analyze_document(self, receipt_path: str, filename: str, encryption=None) -> DocumentAnalysis:
-        """Analyze a PDF receipt document"""
+    async def analyze_document(self, receipt_source: DocumentSource, filename: str, encryption=None,
+                               timeout: Optional[float] = None) -> DocumentAnalysis:
+        """Analyze a PDF receipt document (Pfad oder bereits entschlüsselter Inhalt als bytes/BytesIO)
+        
+        timeout begrenzt den LLM-Aufruf ab Erhalt des Modell-Slots (asyncio.TimeoutError an den Aufrufer).
+        """
         try:
             # Extract text from PDF (handles encryption if needed)
-            pdf_text = self.extract_pdf_text(receipt_path, encryption)
+            # Im Thread, damit parallele Analysen die Event-Loop nicht blockieren
+            pdf_text = await asyncio.to_thread(self.extract_pdf_text, receipt_source, encryption)
             
             # Limit text length for LLM (first 5000 characters)
             pdf_text_limited = pdf_text[:5000] if pdf_text else "Kein Text extrahiert"
@@ -6278,7 +6604,11 @@ Antworte im JSON-Format mit folgenden Feldern:
   "confidence": 0.0-1.0
 }}"""
             
-            analysis_json = await self.llm.extract_json(prompt, system_prompt)
+            # Gleicher Belegtext -> gleiche Analyse: Gedächtnis-Kontext nicht in den Cache-Schlüssel
+            analysis_json = await self.llm.extract_json(
+                prompt, system_prompt, agent=self.name, cache_system_prompt=self.system_prompt_base,
+                timeout=timeout
+            )
             
             if not analysis_json:
                 # Fallback: Try to extract basic info from filename
@@ -6340,6 +6670,8 @@ Antworte im JSON-Format mit folgenden Feldern:
                 await self.memory.add_insight(insight, source="document_analysis")
             
             return analysis
+        except asyncio.TimeoutError:
+            raise
         except Exception as e:
             logger.error(f"Error analyzing document {filename}: {e}")
             return DocumentAnalysis(
@@ -6351,56 +6683,108 @@ Antworte im JSON-Format mit folgenden Feldern:
                 confidence=0.0
             )
     
-    async def process(self, receipts: List[Dict[str, Any]], encryption=None) -> List[DocumentAnalysis]:
+    async def process(self, receipts: List[Dict[str, Any]], encryption=None,
+                      max_concurrency: Optional[int] = None,
+                      timeout_seconds: Optional[float] = None,
+                      stats: Optional[Dict[str, Any]] = None) -> List[DocumentAnalysis]:
         """
         Process multiple receipts
         Supports encrypted files for DSGVO compliance
+        
+        Belege werden nebenläufig analysiert: höchstens max_concurrency gleichzeitig (Default: Limit
+        des Modells), jeder mit eigenem Timeout. Der Timeout läuft erst, wenn der Beleg einen Slot des
+        Modells hat; Wartezeit hinter anderen Aufrufern desselben Modells (z.B. parallele Prüfläufe)
+        führt so nicht zum Abbruch. Die Ergebnisse stehen in der Reihenfolge der Eingabe,
+        die Nachrichten auf dem Message-Bus gehen raus, sobald ein Beleg fertig ist.
+        
+        Laufzeiten des Aufrufs (Belege, Parallelität, Timeouts, Wand- und Summenzeit) landen in stats,
+        einem vom Aufrufer übergebenen Dict; der Agent selbst hält keinen Zustand je Lauf, weil mehrere
+        Prüfläufe denselben Agenten gleichzeitig nutzen.
         """
-        analyses = []
-        for receipt in receipts:
-            analysis = await self.analyze_document(
-                receipt.get("local_path", ""),
-                receipt.get("filename", ""),
-                encryption
-            )
-            
-            # EU-AI-Act: Log AI decision
-            try:
-                from compliance import AITransparency
-                ai_log = AITransparency.create_ai_decision_log(
-                    decision_type="document_analysis",
-                    agent_name=self.name,
-                    input_data={"filename": receipt.get("filename"), "path": receipt.get("local_path")},
-                    output_data=analysis.model_dump(),
-                    confidence=analysis.confidence,
-                    human_reviewed=False
-                )
-                # Store AI log in analysis metadata for transparency
-                if not hasattr(analysis, 'ai_decision_log'):
-                    analysis.ai_decision_log = ai_log
-            except Exception as e:
-                logger.warning(f"Could not create AI decision log: {e}")
-            analyses.append(analysis)
-            
-            # Notify other agents about analysis completion (if message bus available)
-            if self.message_bus:
-                self.message_bus.publish(self.name, "AccountingAgent", {
-                    "type": "document_analyzed",
-                    "receipt_id": receipt.get("id"),
-                    "analysis": analysis.model_dump()
-                })
-                
-                # If issues found, notify Chat Agent
-                if analysis.validation_issues or not all(analysis.completeness_check.values()):
-                    self.message_bus.publish(self.name, "ChatAgent", {
-                        "type": "document_issue",
-                        "receipt_id": receipt.get("id"),
-                        "filename": receipt.get("filename"),
-                        "issues": analysis.validation_issues,
-                        "completeness": analysis.completeness_check
-                    })
+        limit = max_concurrency or model_concurrency(self.llm.model)
+        timeout = timeout_seconds or DOCUMENT_ANALYSIS_TIMEOUT
+        semaphore = asyncio.Semaphore(limit)
+        analyses: List[Optional[DocumentAnalysis]] = [None] * len(receipts)
+        durations: List[float] = []
+        timeouts = 0
+        started = time.perf_counter()
         
+        async def analyze(index: int, receipt: Dict[str, Any]) -> None:
+            nonlocal timeouts
+            async with semaphore:
+                receipt_started = time.perf_counter()
+                try:
+                    analysis = await self.analyze_document(
+                        receipt.get("local_path", ""),
+                        receipt.get("filename", ""),
+                        encryption,
+                        timeout=timeout
+                    )
+                except asyncio.TimeoutError:
+                    timeouts += 1
+                    logger.warning(f"Dokumentenanalyse für {receipt.get('filename')} nach {timeout:.0f}s abgebrochen")
+                    analysis = DocumentAnalysis(
+                        document_type="unknown",
+                        language="de",
+                        extracted_data={},
+                        validation_issues=[f"Zeitüberschreitung bei Dokumentenanalyse nach {timeout:.0f}s"],
+                        completeness_check={},
+                        confidence=0.0
+                    )
+                durations.append(time.perf_counter() - receipt_started)
+            self._attach_ai_decision_log(receipt, analysis)
+            analyses[index] = analysis
+            self._publish_analysis(receipt, analysis)
+        
+        await asyncio.gather(*(analyze(index, receipt) for index, receipt in enumerate(receipts)))
+        
+        if stats is not None:
+            stats.update({
+                "receipts": len(receipts),
+                "concurrency": limit,
+                "timeouts": timeouts,
+                "wall_seconds": round(time.perf_counter() - started, 3),
+                "sequential_seconds": round(sum(durations), 3),  # Summe der Einzelanalysen
+            })
         return analyses
+    
+    def _attach_ai_decision_log(self, receipt: Dict[str, Any], analysis: DocumentAnalysis) -> None:
+        # EU-AI-Act: Log AI decision
+        try:
+            from compliance import AITransparency
+            ai_log = AITransparency.create_ai_decision_log(
+                decision_type="document_analysis",
+                agent_name=self.name,
+                input_data={"filename": receipt.get("filename"), "path": receipt.get("local_path")},
+                output_data=analysis.model_dump(),
+                confidence=analysis.confidence,
+                human_reviewed=False
+            )
+            # Store AI log in analysis metadata for transparency
+            if not hasattr(analysis, 'ai_decision_log'):
+                analysis.ai_decision_log = ai_log
+        except Exception as e:
+            logger.warning(f"Could not create AI decision log: {e}")
+    
+    def _publish_analysis(self, receipt: Dict[str, Any], analysis: DocumentAnalysis) -> None:
+        # Notify other agents about analysis completion (if message bus available)
+        if not self.message_bus:
+            return
+        self.message_bus.publish(self.name, "AccountingAgent", {
+            "type": "document_analyzed",
+            "receipt_id": receipt.get("id"),
+            "analysis": analysis.model_dump()
+        })
+        
+        # If issues found, notify Chat Agent
+        if analysis.validation_issues or not all(analysis.completeness_check.values()):
+            self.message_bus.publish(self.name, "ChatAgent", {
+                "type": "document_issue",
+                "receipt_id": receipt.get("id"),
+                "filename": receipt.get("filename"),
+                "issues": analysis.validation_issues,
+                "completeness": analysis.completeness_check
+            })
 
 class AccountingAgent:
     """Agent für Buchhaltung: Zuordnung, Verpflegungsmehraufwand, Spesensätze"""
@@ -6451,8 +6835,6 @@ Verfügbare Tools:
 - meal_allowance_lookup: Holt aktuelle Verpflegungsmehraufwand-Spesensätze
 - currency_exchange: Rechnet Fremdwährungen in EUR um
 - web_search: Sucht nach aktuellen Informationen"""
-<｜tool▁calls▁begin｜><｜tool▁call▁begin｜>
-read_file
         
         # Subscribe to messages from other agents
         if self.message_bus:
@@ -6598,7 +6980,9 @@ Finde den besten passenden Reiseeintrag basierend auf:
 
 Antworte mit JSON: {{"entry_date": "YYYY-MM-DD", "confidence": 0.0-1.0, "reason": "Warum dieser Eintrag passt"}}"""
                 
-                match_result = await self.llm.extract_json(prompt, system_prompt)
+                match_result = await self.llm.extract_json(
+                    prompt, system_prompt, agent=self.name, cache_system_prompt=self.system_prompt_base
+                )
                 if match_result and "entry_date" in match_result:
                     matching_entry = entries_by_date.get(match_result["entry_date"])
                     if matching_entry and match_result.get("confidence", 0.0) < 0.5:
@@ -6740,13 +7124,19 @@ Antworte mit JSON: {{"entry_date": "YYYY-MM-DD", "confidence": 0.0-1.0, "reason"
         return result
 
 class AgentOrchestrator:
-    """Orchestrates the agent network for expense report review"""
+    """Orchestrates the agent network for expense report review
+    
+    Als app-weite Instanz gedacht (siehe server.get_agent_orchestrator): start() lädt die Agent-Memories einmal,
+    die drei LLMs teilen sich einen Session-Pool, und der Health-Status wird gecacht und im Hintergrund erneuert.
+    """
     
-    def __init__(self, llm: Optional[OllamaLLM] = None, db=None):
+    def __init__(self, llm: Optional[OllamaLLM] = None, db=None,
+                 health_check_interval: float = OLLAMA_HEALTH_CHECK_INTERVAL):
         base_url = (llm.base_url if isinstance(llm, OllamaLLM) else OLLAMA_BASE_URL)
-        self.chat_llm = OllamaLLM(base_url=base_url, model=OLLAMA_MODEL_CHAT)
-        self.document_llm = OllamaLLM(base_url=base_url, model=OLLAMA_MODEL_DOCUMENT)
-        self.accounting_llm = OllamaLLM(base_url=base_url, model=OLLAMA_MODEL_ACCOUNTING)
+        self.sessions = OllamaSessionPool()
+        self.chat_llm = OllamaLLM(base_url=base_url, model=OLLAMA_MODEL_CHAT, sessions=self.sessions)
+        self.document_llm = OllamaLLM(base_url=base_url, model=OLLAMA_MODEL_DOCUMENT, sessions=self.sessions)
+        self.accounting_llm = OllamaLLM(base_url=base_url, model=OLLAMA_MODEL_ACCOUNTING, sessions=self.sessions)
         self._llms = {
             "ChatAgent": self.chat_llm,
             "DocumentAgent": self.document_llm,
@@ -6760,17 +7150,43 @@ class AgentOrchestrator:
         self.chat_agent = ChatAgent(self.chat_llm, db=db, tools=self.tools)
         self.document_agent = DocumentAgent(self.document_llm, self.message_bus, db=db, tools=self.tools)
         self.accounting_agent = AccountingAgent(self.accounting_llm, self.message_bus, db=db, tools=self.tools)
-        self._llm_health_checked = False
+        self.health_check_interval = health_check_interval
+        self._llm_health: Dict[str, bool] = {}
+        self._health_checked_at: Optional[float] = None
+        self._health_lock = asyncio.Lock()
+        self._health_task: Optional[asyncio.Task] = None
         self._memory_initialized = False
+        self._memory_lock = asyncio.Lock()
     
-    async def ensure_llm_available(self):
-        """Check LLM availability and warn if not reachable"""
-        if not self._llm_health_checked:
-            all_healthy = True
+    async def start(self):
+        """Memories laden, Erreichbarkeit prüfen und die periodische Prüfung starten"""
+        await self.initialize_memory()
+        await self.check_llm_health()
+        if self._health_task is None and self.health_check_interval > 0:
+            self._health_task = asyncio.create_task(self._health_loop())
+    
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            try:
+                await self.check_llm_health()
+            except Exception as e:
+                logger.warning(f"Ollama health check failed: {e}")
+    
+    async def check_llm_health(self) -> bool:
+        """Prüft jeden Ollama-Server einmal (/api/tags gilt für alle Modelle) und merkt sich das Ergebnis"""
+        async with self._health_lock:
+            by_url: Dict[str, bool] = {}
+            for agent_llm in self._llms.values():
+                if agent_llm.base_url not in by_url:
+                    by_url[agent_llm.base_url] = await agent_llm.health_check()
+            previous = dict(self._llm_health)
             for agent_name, agent_llm in self._llms.items():
-                is_healthy = await agent_llm.health_check()
+                is_healthy = by_url[agent_llm.base_url]
+                self._llm_health[agent_name] = is_healthy
+                if previous.get(agent_name) == is_healthy:
+                    continue  # nur Zustandswechsel loggen
                 if not is_healthy:
-                    all_healthy = False
                     logger.error(f"⚠️ Ollama LLM für {agent_name} nicht erreichbar: {agent_llm.base_url} (Modell: {agent_llm.model})")
                     logger.error("Bitte überprüfen Sie:")
                     logger.error("  1. Ollama läuft auf dem GMKTec-Server")
@@ -6779,18 +7195,39 @@ class AgentOrchestrator:
                     logger.error("  4. OLLAMA_BASE_URL und agentenspezifische Modelle sind korrekt konfiguriert")
                 else:
                     logger.info(f"✅ Ollama LLM erreichbar für {agent_name}: {agent_llm.base_url} (Modell: {agent_llm.model})")
-            self._llm_health_checked = True
-            return all_healthy
-        return True
+            self._health_checked_at = time.monotonic()
+            return all(self._llm_health.values())
+    
+    async def ensure_llm_available(self) -> bool:
+        """Check LLM availability and warn if not reachable (gecacht für health_check_interval Sekunden)"""
+        if self._health_checked_at is not None and (
+            self.health_check_interval <= 0
+            or time.monotonic() - self._health_checked_at < self.health_check_interval
+        ):
+            return all(self._llm_health.values())
+        return await self.check_llm_health()
+    
+    def health_status(self) -> Dict[str, Any]:
+        return {
+            "agents": {
+                name: {"healthy": self._llm_health.get(name), "base_url": agent_llm.base_url, "model": agent_llm.model}
+                for name, agent_llm in self._llms.items()
+            },
+            "checked_seconds_ago": (
+                round(time.monotonic() - self._health_checked_at, 1) if self._health_checked_at is not None else None
+            ),
+            "memory_initialized": self._memory_initialized,
+        }
     
     async def initialize_memory(self):
         """Initialisiere Memory für alle Agenten"""
-        if not self._memory_initialized:
-            await self.chat_agent.initialize()
-            await self.document_agent.initialize()
-            await self.accounting_agent.initialize()
-            self._memory_initialized = True
-            logger.info("Agent-Memory für alle Agenten initialisiert")
+        async with self._memory_lock:
+            if not self._memory_initialized:
+                await self.chat_agent.initialize()
+                await self.document_agent.initialize()
+                await self.accounting_agent.initialize()
+                self._memory_initialized = True
+                logger.info("Agent-Memory für alle Agenten initialisiert")
     
     def broadcast_message(self, from_agent: str, message: Dict[str, Any]):
         """Broadcast message to all agents via message bus"""
@@ -6802,8 +7239,16 @@ class AgentOrchestrator:
     
     async def close(self):
         """Clean up resources"""
+        if self._health_task:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
         for agent_llm in self._llms.values():
             await agent_llm.close()
+        await self.sessions.close()
         # Schließe alle Tools
         await self.tools.close()
     
@@ -6828,9 +7273,16 @@ class AgentOrchestrator:
         self.broadcast_message("Orchestrator", {
             "type": "status_update",
             "message": f"Starte Dokumentenanalyse für {len(receipts)} Belege",
-            "step": 1
+            "step": 1,
+            "report_id": report_id
         })
-        document_analyses = await self.document_agent.process(receipts)
+        document_stats: Dict[str, Any] = {}
+        document_analyses = await self.document_agent.process(receipts, stats=document_stats)
+        logger.info(
+            f"Dokumentenanalyse: {document_stats['receipts']} Belege in {document_stats['wall_seconds']:.1f}s "
+            f"(Summe der Einzelanalysen {document_stats['sequential_seconds']:.1f}s, "
+            f"parallel {document_stats['concurrency']}, Timeouts {document_stats['timeouts']})"
+        )
         
         # Notify other agents about document analyses
         self.send_message("DocumentAgent", "AccountingAgent", {
@@ -6851,7 +7303,8 @@ class AgentOrchestrator:
         self.broadcast_message("Orchestrator", {
             "type": "status_update",
             "message": "Starte Buchhaltungszuordnung",
-            "step": 2
+            "step": 2,
+            "report_id": report_id
         })
         accounting_result = await self.accounting_agent.process(report, document_analyses)
         
@@ -6866,6 +7319,12 @@ class AgentOrchestrator:
                 })
         
         # Step 3: Handle issues requiring clarification
+        self.broadcast_message("Orchestrator", {
+            "type": "status_update",
+            "message": f"Buchhaltungszuordnung abgeschlossen, {len(issues)} Probleme gefunden",
+            "step": 3,
+            "report_id": report_id
+        })
         if issues_needing_clarification or issues:
             logger.info("Step 3: Issues found, may need user clarification")
             # Notify Chat Agent about issues
@@ -6894,6 +7353,7 @@ Status: {'Benötigt Klärung' if (issues_needing_clarification or issues) else '
         # Notify all agents about completion
         self.broadcast_message("Orchestrator", {
             "type": "review_complete",
+            "report_id": report_id,
             "has_issues": bool(issues_needing_clarification or issues),
             "summary": review_summary
         })
@@ -6919,38 +7379,68 @@ Status: {'Benötigt Klärung' if (issues_needing_clarification or issues) else '
             "issues": issues,
             "accounting_result": accounting_result,
             "document_analyses": [a.model_dump() for a in document_analyses],
-            "requires_user_input": requires_input
+            "requires_user_input": requires_input,
+            "timings": {"document_analysis": document_stats}
         }
     
-    async def handle_user_message(self, report_id: str, user_message: str, db) -> AgentResponse:
-        """Handle user message in chat context"""
-        # Initialisiere Memory
-        await self.initialize_memory()
-        
+    async def _chat_context(self, report_id: str, db) -> Dict[str, Any]:
         report = await db.travel_expense_reports.find_one({"id": report_id})
         if not report:
             raise ValueError(f"Report {report_id} not found")
         
         # Get review context
-        context = {
+        return {
             "report": report,
             "issues": report.get("review_notes", "").split("\n") if report.get("review_notes") else [],
             "missing_info": []  # Would be extracted from review notes
         }
-        
-        # Process with Chat Agent
-        response = await self.chat_agent.process(context, user_message)
-        
-        # Save chat message
+    
+    async def _save_agent_message(self, report_id: str, message: str, db, message_id: Optional[str] = None):
         from server import ChatMessage
         chat_msg = ChatMessage(
             report_id=report_id,
             sender="agent",
-            message=response.message
+            message=message
         )
+        if message_id:
+            chat_msg.id = message_id
         chat_msg_dict = chat_msg.model_dump()
         chat_msg_dict["created_at"] = datetime.utcnow()
         await db.chat_messages.insert_one(chat_msg_dict)
+        return chat_msg
+    
+    async def handle_user_message(self, report_id: str, user_message: str, db) -> AgentResponse:
+        """Handle user message in chat context"""
+        # Initialisiere Memory
+        await self.initialize_memory()
+        
+        context = await self._chat_context(report_id, db)
+        
+        # Process with Chat Agent
+        response = await self.chat_agent.process(context, user_message)
+        
+        # Save chat message
+        await self._save_agent_message(report_id, response.message, db)
         
         return response
+    
+    async def stream_user_message(self, report_id: str, user_message: str, db,
+                                  message_id: Optional[str] = None) -> AsyncIterator[str]:
+        """Wie handle_user_message, liefert die Antwort aber Token für Token
+        
+        Die vollständige Antwort wird am Ende des Streams in chat_messages gespeichert (mit message_id, damit der
+        Aufrufer die ID schon vorher kennt). Bricht der Client ab, wird die bis dahin erzeugte Teilantwort gespeichert.
+        """
+        await self.initialize_memory()
+        context = await self._chat_context(report_id, db)
+        
+        parts = []
+        try:
+            async for token in self.chat_agent.process_stream(context, user_message):
+                parts.append(token)
+                yield token
+        finally:
+            if parts:
+                # shield: auch bei Abbruch (Client getrennt) noch speichern
+                await asyncio.shield(self._save_agent_message(report_id, "".join(parts), db, message_id))
 
@@ -0,0 +1,167 @@
+"""
+Inhaltsadressierter Blob-Speicher (z.B. für Bilder in Ankündigungen)
+Jede Datei wird unter ihrem SHA-256 abgelegt (<root>/<ab>/<cd>/<sha256>) und damit nur einmal
+gespeichert. Der Hash dient zugleich als starkes ETag; Inhalte sind unveränderlich und dürfen
+lange gecacht werden. Metadaten (Content-Type, Größe, Varianten) liegen in der Collection blobs.
+Welche Blobs noch gebraucht werden, weiß nur der Besitzer der Referenzen: er löscht über delete(),
+touched_at (letztes put) schützt dabei frisch hochgeladene, noch nicht referenzierte Inhalte.
+"""
+
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import re
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BLOB_COLLECTION = "blobs"
+THUMBNAIL_MAX_SIZE = (480, 480)
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+# Rastergrafiken, die ohne Gefahr vom API-Origin ausgeliefert werden können (kein SVG: enthält Skript)
+_IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+SAFE_IMAGE_TYPES = frozenset(content_type for _, content_type in _IMAGE_SIGNATURES) | {"image/webp"}
+
+
+def is_blob_id(value: str) -> bool:
+    return bool(value and _DIGEST_RE.match(value))
+
+
+def sniff_image_type(data: bytes) -> Optional[str]:
+    """Content-Type aus den ersten Bytes (PNG, JPEG, GIF, WebP); None für alles andere, auch SVG.
+    Der vom Client angegebene Typ wird nicht übernommen."""
+    for signature, content_type in _IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return content_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def make_thumbnail(data: bytes, max_size: Tuple[int, int] = THUMBNAIL_MAX_SIZE) -> Optional[Tuple[bytes, str]]:
+    """Verkleinerte Variante (JPEG, bei Transparenz PNG). None wenn Pillow fehlt oder das Bild nicht lesbar ist."""
+    try:
+        from PIL import Image
+    except ImportError:
+        logger.debug("Pillow nicht verfügbar, keine Vorschaubilder")
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.width <= max_size[0] and image.height <= max_size[1]:
+                return None  # schon klein genug, das Original wird ausgeliefert
+            image.thumbnail(max_size)
+            out = io.BytesIO()
+            if image.mode in ("RGBA", "LA", "P"):
+                image.save(out, format="PNG", optimize=True)
+                return out.getvalue(), "image/png"
+            image.convert("RGB").save(out, format="JPEG", quality=85, optimize=True)
+            return out.getvalue(), "image/jpeg"
+    except Exception as e:
+        logger.warning(f"Vorschaubild konnte nicht erzeugt werden: {e}")
+        return None
+
+
+class BlobStore:
+    """Dateien nach SHA-256 im Dateisystem, Metadaten in MongoDB"""
+
+    def __init__(self, db, root: Path):
+        self.db = db
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def collection(self):
+        return self.db[BLOB_COLLECTION]
+
+    def path(self, blob_id: str) -> Path:
+        if not is_blob_id(blob_id):
+            raise ValueError("Invalid blob id")
+        return self.root / blob_id[:2] / blob_id[2:4] / blob_id
+
+    def _write(self, blob_id: str, data: bytes) -> Path:
+        path = self.path(blob_id)
+        if path.exists():
+            return path  # gleicher Inhalt liegt schon vor
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_name, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_name)
+            except FileNotFoundError:
+                pass
+            raise
+        return path
+
+    async def put(self, data: bytes, content_type: str, filename: Optional[str] = None,
+                  **extra: Any) -> Dict[str, Any]:
+        """Speichert data (idempotent) und gibt die Metadaten zurück"""
+        blob_id = hashlib.sha256(data).hexdigest()
+        await asyncio.to_thread(self._write, blob_id, data)
+        meta = {
+            "id": blob_id,
+            "content_type": content_type,
+            "size": len(data),
+            "filename": filename,
+            **extra,
+        }
+        now = datetime.utcnow()
+        await self.collection.update_one(
+            {"id": blob_id},
+            {"$set": {**meta, "touched_at": now}, "$setOnInsert": {"created_at": now}},
+            upsert=True,
+        )
+        return meta
+
+    async def put_image(self, data: bytes, content_type: str, filename: Optional[str] = None) -> Dict[str, Any]:
+        """Bild speichern und eine Vorschau-Variante erzeugen; thumbnail_id zeigt auf die Variante (oder das Original)"""
+        original_id = hashlib.sha256(data).hexdigest()
+        thumbnail_id = original_id
+        thumbnail = await asyncio.to_thread(make_thumbnail, data)
+        if thumbnail:
+            thumbnail_data, thumbnail_type = thumbnail
+            thumbnail_id = (await self.put(thumbnail_data, thumbnail_type, filename, variant_of=original_id))["id"]
+        return await self.put(data, content_type, filename, thumbnail_id=thumbnail_id)
+
+    async def get_meta(self, blob_id: str) -> Optional[Dict[str, Any]]:
+        if not is_blob_id(blob_id):
+            return None
+        return await self.collection.find_one({"id": blob_id}, {"_id": 0})
+
+    async def delete(self, blob_id: str, untouched_since: Optional[datetime] = None) -> bool:
+        """Entfernt Metadaten und Datei. Mit untouched_since nur, wenn seitdem kein put() den Inhalt erneut
+        abgelegt hat (Blobs ohne touched_at zählen mit created_at). True, wenn gelöscht wurde."""
+        if not is_blob_id(blob_id):
+            return False
+        query: Dict[str, Any] = {"id": blob_id}
+        if untouched_since is not None:
+            query["$or"] = [
+                {"touched_at": {"$lt": untouched_since}},
+                {"touched_at": {"$exists": False}, "created_at": {"$lt": untouched_since}},
+            ]
+        result = await self.collection.delete_one(query)
+        if not result.deleted_count:
+            return False
+        await asyncio.to_thread(self._unlink, blob_id)
+        return True
+
+    def _unlink(self, blob_id: str) -> None:
+        try:
+            self.path(blob_id).unlink()
+        except FileNotFoundError:
+            pass
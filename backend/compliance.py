@@ -4,15 +4,31 @@ Sicherstellung der Datenschutz-Compliance für Reisekostenabrechnungen
 """
 
 import os
+import asyncio
 import logging
 import hashlib
-from typing import Dict, List, Optional, Any
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Awaitable, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Any, Tuple, Union
 from datetime import datetime, timedelta
 from pathlib import Path
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, MultiFernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 import base64
+from contextlib import contextmanager
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+try:
+    import fcntl  # Sperre zwischen Worker-Prozessen (gunicorn -w N); unter Windows nicht vorhanden
+except ImportError:
+    fcntl = None
 
 logger = logging.getLogger(__name__)
 
@@ -24,81 +40,639 @@ RETENTION_PERIOD_DRAFT_DAYS = 365
 # Genehmigte Abrechnungen: 10 Jahre
 RETENTION_PERIOD_APPROVED_DAYS = 10 * 365
 
+# Segmentiertes Dateiformat (AES-256-GCM)
+# Header: MAGIC | Version | Segmentgröße | Nonce-Präfix | Salt | Länge Key-ID | Key-ID
+# Danach Segmente fester Klartextgröße (das letzte ist kürzer), je Segment Chiffretext + 16 Byte Tag.
+# Nonce je Segment = Nonce-Präfix (7) | Segmentnummer (4) | Letztes-Segment-Flag (1), der Header ist AAD.
+# Ab Version 2 wird je Datei ein eigener Schlüssel per HKDF(Salt) aus dem Schlüssel der Key-ID abgeleitet,
+# damit sich die 56-Bit-Nonce-Präfixe nicht über alle Dateien eines Schlüssels einen Nonce-Raum teilen.
+# Version 1 (ohne Salt, Schlüssel direkt) und Altdateien (ganze Datei als Fernet-Token) werden transparent gelesen.
+SEGMENTED_MAGIC = b"\x89SZE"
+SEGMENTED_VERSION = 2
+SEGMENT_SIZE = 64 * 1024
+_TAG_SIZE = 16
+_NONCE_PREFIX_SIZE = 7
+_SALT_SIZE = 32
+_HEADER_PREFIX = struct.Struct(">4sB")
+_HEADER_FIELDS = {
+    1: struct.Struct(">I7sB"),
+    2: struct.Struct(">I7s32sB"),
+}
+
+
+class _SegmentedHeader:
+    """Geparster Header einer segmentierten Datei"""
+
+    def __init__(self, raw: bytes, segment_size: int, nonce_prefix: bytes, key_id: str, salt: Optional[bytes] = None):
+        self.raw = raw
+        self.segment_size = segment_size
+        self.nonce_prefix = nonce_prefix
+        self.key_id = key_id
+        self.salt = salt
+
+    @property
+    def size(self) -> int:
+        return len(self.raw)
+
+    @classmethod
+    def build(cls, key_id: str, segment_size: int = SEGMENT_SIZE) -> "_SegmentedHeader":
+        nonce_prefix = os.urandom(_NONCE_PREFIX_SIZE)
+        salt = os.urandom(_SALT_SIZE)
+        key_id_bytes = key_id.encode('ascii')
+        raw = (
+            _HEADER_PREFIX.pack(SEGMENTED_MAGIC, SEGMENTED_VERSION)
+            + _HEADER_FIELDS[SEGMENTED_VERSION].pack(segment_size, nonce_prefix, salt, len(key_id_bytes))
+            + key_id_bytes
+        )
+        return cls(raw, segment_size, nonce_prefix, key_id, salt)
+
+    @classmethod
+    def read(cls, f: BinaryIO) -> "_SegmentedHeader":
+        prefix = f.read(_HEADER_PREFIX.size)
+        if len(prefix) < _HEADER_PREFIX.size:
+            raise ValueError("Truncated encrypted file header")
+        magic, version = _HEADER_PREFIX.unpack(prefix)
+        if magic != SEGMENTED_MAGIC:
+            raise ValueError("Not a segmented encrypted file")
+        fields = _HEADER_FIELDS.get(version)
+        if fields is None:
+            raise ValueError(f"Unsupported encrypted file version {version}")
+        fixed = f.read(fields.size)
+        if len(fixed) < fields.size:
+            raise ValueError("Truncated encrypted file header")
+        if version == 1:
+            segment_size, nonce_prefix, key_id_len = fields.unpack(fixed)
+            salt = None
+        else:
+            segment_size, nonce_prefix, salt, key_id_len = fields.unpack(fixed)
+        if segment_size <= 0:
+            raise ValueError("Invalid encrypted file header")
+        key_id_bytes = f.read(key_id_len)
+        if len(key_id_bytes) < key_id_len:
+            raise ValueError("Truncated encrypted file header")
+        return cls(prefix + fixed + key_id_bytes, segment_size, nonce_prefix, key_id_bytes.decode('ascii'), salt)
+
+    def aead(self, key: "EncryptionKey") -> AESGCM:
+        """Dateischlüssel: ab Version 2 aus dem Salt abgeleitet, Version 1 direkt der Schlüssel der Key-ID"""
+        return key.aead if self.salt is None else key.file_aead(self.salt)
+
+    def nonce(self, index: int, last: bool) -> bytes:
+        return self.nonce_prefix + struct.pack(">I", index) + (b"\x01" if last else b"\x00")
+
+    def segment_count(self, file_size: int) -> int:
+        body = file_size - self.size
+        if body < _TAG_SIZE:
+            raise ValueError("Truncated encrypted file")
+        return -(-body // (self.segment_size + _TAG_SIZE))
+
+    def plaintext_size(self, file_size: int) -> int:
+        return file_size - self.size - self.segment_count(file_size) * _TAG_SIZE
+
+
+class EncryptedFileWriter:
+    """Schreibt Klartext blockweise als segmentierte Datei: temporäre Datei im Zielordner,
+    atomares Rename erst bei commit(). Es liegt nie mehr als ein Segment Klartext im Speicher."""
+
+    def __init__(self, encryption: "DataEncryption", dest_path: Path, verify: bool = True):
+        self.encryption = encryption
+        self.dest_path = Path(dest_path)
+        self.verify = verify
+        self.header = _SegmentedHeader.build(encryption.key_id)
+        self.aead = self.header.aead(encryption.keyring.primary)
+        self._buffer = bytearray()
+        self._index = 0
+        self.bytes_written = 0
+        fd, self._tmp_name = tempfile.mkstemp(dir=self.dest_path.parent, prefix=f".{self.dest_path.name}.", suffix=".part")
+        self._file = os.fdopen(fd, 'wb')
+        self._file.write(self.header.raw)
+
+    def _emit(self, plaintext: bytes, last: bool) -> None:
+        nonce = self.header.nonce(self._index, last)
+        ciphertext = self.aead.encrypt(nonce, plaintext, self.header.raw)
+        if self.verify and self.aead.decrypt(nonce, ciphertext, self.header.raw) != plaintext:
+            raise ValueError("Encryption verification failed")
+        self._file.write(ciphertext)
+        self._index += 1
+
+    def write(self, data: bytes) -> None:
+        self._buffer += data
+        self.bytes_written += len(data)
+        segment_size = self.header.segment_size
+        # Volle Segmente erst schreiben, wenn mehr folgt: das letzte Segment ist so nie leer
+        # (außer bei leerer Datei) und die Segmentanzahl folgt aus der Dateigröße
+        while len(self._buffer) > segment_size:
+            self._emit(bytes(self._buffer[:segment_size]), last=False)
+            del self._buffer[:segment_size]
+
+    def commit(self) -> int:
+        """Letztes Segment schreiben, fsync und atomar umbenennen. Gibt die Klartextgröße zurück."""
+        try:
+            self._emit(bytes(self._buffer), last=True)
+            self._buffer.clear()
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            os.replace(self._tmp_name, self.dest_path)
+        except BaseException:
+            self.abort()
+            raise
+        return self.bytes_written
+
+    def abort(self) -> None:
+        self._buffer.clear()
+        if not self._file.closed:
+            self._file.close()
+        try:
+            os.unlink(self._tmp_name)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> "EncryptedFileWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.abort()
+        elif not self._file.closed:
+            self.commit()
+
+
+class EncryptionKey:
+    """Abgeleitetes Schlüsselmaterial zu einem Geheimnis: Fernet (Altdateien/Bytes) und AES-256-GCM (Dateien)"""
+
+    def __init__(self, fernet_key: bytes):
+        self.fernet_key = fernet_key
+        self.cipher = Fernet(fernet_key)
+        # AES-256-GCM-Schlüssel für das segmentierte Dateiformat, aus demselben Schlüsselmaterial
+        # (Version 1 verschlüsselt direkt damit, ab Version 2 ist er Ausgangsmaterial der Dateischlüssel)
+        file_key = HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=None,
+            info=b'stundenzettel-file-aesgcm-v1',
+        ).derive(fernet_key)
+        self._file_key = file_key
+        self.aead = AESGCM(file_key)
+        self.key_id = hashlib.sha256(file_key).hexdigest()[:16]
+
+    def file_aead(self, salt: bytes) -> AESGCM:
+        """AES-256-GCM mit dem Schlüssel einer einzelnen Datei (HKDF mit dem Salt aus ihrem Header)"""
+        per_file_key = HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=salt,
+            info=b'stundenzettel-file-aesgcm-v2',
+        ).derive(self._file_key)
+        return AESGCM(per_file_key)
+
+
+@lru_cache(maxsize=32)
+def derive_encryption_key(secret: bytes) -> EncryptionKey:
+    """Leitet das Schlüsselmaterial einmal pro Geheimnis ab (PBKDF2 mit 100.000 Iterationen ist teuer)"""
+    fernet_key = secret
+    # Derive a proper Fernet key from the provided key
+    if len(fernet_key) != 44:  # Fernet keys are 44 bytes base64 encoded
+        kdf = PBKDF2HMAC(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=b'dsgvo_compliance_salt',  # In production, use random salt per file
+            iterations=100000,
+        )
+        fernet_key = base64.urlsafe_b64encode(kdf.derive(secret))
+    return EncryptionKey(fernet_key)
+
+
+class KeyRing:
+    """Prozessweiter Schlüsselring: ein aktiver Schlüssel zum Verschlüsseln, beliebig viele zum Entschlüsseln.
+
+    Schlüsselrotation: neues Geheimnis als ENCRYPTION_KEY setzen, das alte in ENCRYPTION_KEYS_PREVIOUS
+    (kommagetrennt) aufnehmen und den Re-Encrypt-Job laufen lassen; danach kann das alte entfernt werden.
+    """
+
+    def __init__(self, primary_secret: bytes, previous_secrets: Iterable[bytes] = ()):
+        self.primary = derive_encryption_key(primary_secret)
+        self._keys: Dict[str, EncryptionKey] = {self.primary.key_id: self.primary}
+        for secret in previous_secrets:
+            key = derive_encryption_key(secret)
+            self._keys.setdefault(key.key_id, key)
+        # Altdateien ohne Key-ID: alle Fernet-Schlüssel probieren, aktiver zuerst
+        self.multi_fernet = MultiFernet([key.cipher for key in self._keys.values()])
+
+    @property
+    def key_ids(self) -> List[str]:
+        return list(self._keys)
+
+    def get(self, key_id: str) -> EncryptionKey:
+        key = self._keys.get(key_id)
+        if key is None:
+            raise ValueError(f"File was encrypted with unknown key id {key_id}")
+        return key
+
+    @classmethod
+    def from_env(cls) -> "KeyRing":
+        env_key = os.getenv('ENCRYPTION_KEY')
+        if env_key:
+            primary = env_key.encode()
+        else:
+            logger.warning("ENCRYPTION_KEY not set - using temporary key (NOT SECURE FOR PRODUCTION)")
+            # Generate temporary key (only for development), einmal pro Prozess
+            primary = Fernet.generate_key()
+        previous = [k.strip().encode() for k in os.getenv('ENCRYPTION_KEYS_PREVIOUS', '').split(',') if k.strip()]
+        return cls(primary, previous)
+
+
+_default_keyring: Optional[KeyRing] = None
+_keyring_lock = threading.Lock()
+
+
+def get_keyring() -> KeyRing:
+    """Prozessweiter Schlüsselring aus der Umgebung (wird einmal aufgebaut)"""
+    global _default_keyring
+    if _default_keyring is None:
+        with _keyring_lock:
+            if _default_keyring is None:
+                _default_keyring = KeyRing.from_env()
+    return _default_keyring
+
+
 class DataEncryption:
     """Verschlüsselung für sensible Dokumente (DSGVO Art. 32)"""
     
-    def __init__(self, encryption_key: Optional[str] = None):
+    def __init__(self, encryption_key: Optional[str] = None, keyring: Optional[KeyRing] = None):
         """
         Initialize encryption with key from environment or generate new key
         WARNING: Encryption key must be stored securely and never committed to repository
+        
+        Ohne Argumente wird der prozessweite Schlüsselring verwendet (Ableitung nur einmal pro Key-ID).
         """
-        if encryption_key:
-            self.key = encryption_key.encode()
+        if keyring is not None:
+            self.keyring = keyring
+        elif encryption_key:
+            self.keyring = KeyRing(encryption_key.encode())
         else:
-            # Get key from environment or generate warning
-            env_key = os.getenv('ENCRYPTION_KEY')
-            if env_key:
-                self.key = env_key.encode()
-            else:
-                logger.warning("ENCRYPTION_KEY not set - using temporary key (NOT SECURE FOR PRODUCTION)")
-                # Generate temporary key (only for development)
-                self.key = Fernet.generate_key()
+            self.keyring = get_keyring()
         
-        # Derive a proper Fernet key from the provided key
-        if len(self.key) != 44:  # Fernet keys are 44 bytes base64 encoded
-            kdf = PBKDF2HMAC(
-                algorithm=hashes.SHA256(),
-                length=32,
-                salt=b'dsgvo_compliance_salt',  # In production, use random salt per file
-                iterations=100000,
-            )
-            key_material = kdf.derive(self.key)
-            self.key = base64.urlsafe_b64encode(key_material)
-        
-        self.cipher = Fernet(self.key)
+        self.key = self.keyring.primary.fernet_key
+        self.cipher = self.keyring.primary.cipher
+        self.aead = self.keyring.primary.aead
+        self.key_id = self.keyring.primary.key_id
+    
+    # Dateien
+    def open_writer(self, dest_path: Path, verify: bool = True) -> EncryptedFileWriter:
+        """Writer für blockweises Verschlüsseln nach dest_path (atomar bei commit)"""
+        return EncryptedFileWriter(self, dest_path, verify=verify)
+    
+    def encrypt_to_path(self, source: Union[bytes, BinaryIO], dest_path: Path) -> int:
+        """Verschlüsselt Daten aus dem Speicher oder einem Stream und schreibt den Chiffretext
+        einmalig und atomar nach dest_path (kein Klartext auf der Platte).
+
+        Jedes Segment wird vor dem Schreiben im Speicher gegen seinen Tag geprüft.
+        Gibt die Klartextgröße zurück.
+        """
+        with self.open_writer(Path(dest_path)) as writer:
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                view = memoryview(source)
+                for offset in range(0, len(view), SEGMENT_SIZE):
+                    writer.write(view[offset:offset + SEGMENT_SIZE])
+            else:
+                for chunk in iter(lambda: source.read(SEGMENT_SIZE), b""):
+                    writer.write(chunk)
+            return writer.commit()
     
     def encrypt_file(self, file_path: Path) -> bool:
         """Encrypt a file in place"""
         try:
             with open(file_path, 'rb') as f:
-                data = f.read()
-            
-            encrypted_data = self.cipher.encrypt(data)
-            
-            with open(file_path, 'wb') as f:
-                f.write(encrypted_data)
-            
+                self.encrypt_to_path(f, Path(file_path))
             return True
         except Exception as e:
             logger.error(f"Error encrypting file {file_path}: {e}")
             return False
     
+    def encrypt_stream(self, chunks: Iterable[bytes], segment_size: int = SEGMENT_SIZE) -> Iterator[bytes]:
+        """Generator: verschlüsselt einen Klartext-Strom ins segmentierte Format (Header + Segmente)"""
+        header = _SegmentedHeader.build(self.key_id, segment_size)
+        aead = header.aead(self.keyring.primary)
+        yield header.raw
+        buffer = bytearray()
+        index = 0
+        for chunk in chunks:
+            buffer += chunk
+            while len(buffer) > segment_size:
+                yield aead.encrypt(header.nonce(index, False), bytes(buffer[:segment_size]), header.raw)
+                del buffer[:segment_size]
+                index += 1
+        yield aead.encrypt(header.nonce(index, True), bytes(buffer), header.raw)
+    
+    @staticmethod
+    def is_legacy_file(file_path: Path) -> bool:
+        """True für Altdateien im Fernet-Format (ganze Datei ein Token)"""
+        with open(file_path, 'rb') as f:
+            return f.read(len(SEGMENTED_MAGIC)) != SEGMENTED_MAGIC
+    
+    def file_key_id(self, file_path: Path) -> Optional[str]:
+        """Key-ID aus dem Header, None bei Altdateien"""
+        with open(file_path, 'rb') as f:
+            if f.read(len(SEGMENTED_MAGIC)) != SEGMENTED_MAGIC:
+                return None
+            f.seek(0)
+            return _SegmentedHeader.read(f).key_id
+    
+    def _read_header(self, f: BinaryIO) -> Tuple[_SegmentedHeader, AESGCM]:
+        """Header lesen und den passenden Schlüssel aus dem Schlüsselring wählen"""
+        header = _SegmentedHeader.read(f)
+        return header, header.aead(self.keyring.get(header.key_id))
+    
+    def _decrypt_segment(self, f: BinaryIO, header: _SegmentedHeader, aead: AESGCM, index: int, count: int) -> bytes:
+        f.seek(header.size + index * (header.segment_size + _TAG_SIZE))
+        last = index == count - 1
+        ciphertext = f.read(header.segment_size + _TAG_SIZE)
+        return aead.decrypt(header.nonce(index, last), ciphertext, header.raw)
+    
+    def decrypt_stream(self, file_path: Path) -> Iterator[bytes]:
+        """Generator: liefert den Klartext segmentweise (Altdateien als ein Block)"""
+        if self.is_legacy_file(file_path):
+            with open(file_path, 'rb') as f:
+                yield self.keyring.multi_fernet.decrypt(f.read())
+            return
+        with open(file_path, 'rb') as f:
+            header, aead = self._read_header(f)
+            count = header.segment_count(os.fstat(f.fileno()).st_size)
+            for index in range(count):
+                yield self._decrypt_segment(f, header, aead, index, count)
+    
+    def decrypt_range(self, file_path: Path, start: int, length: int) -> bytes:
+        """Entschlüsselt nur die Segmente, die den Bytebereich [start, start + length) abdecken"""
+        if start < 0 or length < 0:
+            raise ValueError("Invalid byte range")
+        if self.is_legacy_file(file_path):
+            return self.decrypt_file(file_path)[start:start + length]
+        with open(file_path, 'rb') as f:
+            header, aead = self._read_header(f)
+            count = header.segment_count(os.fstat(f.fileno()).st_size)
+            end = start + length
+            first = start // header.segment_size
+            last = min(count - 1, max(first, (end - 1) // header.segment_size))
+            if length == 0 or first >= count:
+                return b""
+            data = b"".join(self._decrypt_segment(f, header, aead, index, count) for index in range(first, last + 1))
+            offset = start - first * header.segment_size
+            return data[offset:offset + length]
+    
+    def plaintext_size(self, file_path: Path) -> int:
+        if self.is_legacy_file(file_path):
+            return len(self.decrypt_file(file_path))
+        with open(file_path, 'rb') as f:
+            header = _SegmentedHeader.read(f)
+            return header.plaintext_size(os.fstat(f.fileno()).st_size)
+    
     def decrypt_file(self, file_path: Path) -> bytes:
         """Decrypt a file and return content"""
         try:
-            with open(file_path, 'rb') as f:
-                encrypted_data = f.read()
-            
-            decrypted_data = self.cipher.decrypt(encrypted_data)
-            return decrypted_data
+            return b"".join(self.decrypt_stream(file_path))
         except Exception as e:
             logger.error(f"Error decrypting file {file_path}: {e}")
             raise
     
+    def needs_reencryption(self, file_path: Path) -> bool:
+        """Altdatei (Fernet), Version 1 ohne Dateischlüssel oder mit einem anderen als dem aktiven Schlüssel verschlüsselt"""
+        with open(file_path, 'rb') as f:
+            if f.read(len(SEGMENTED_MAGIC)) != SEGMENTED_MAGIC:
+                return True
+            f.seek(0)
+            header = _SegmentedHeader.read(f)
+        return header.salt is None or header.key_id != self.key_id
+    
+    def migrate_file(self, file_path: Path) -> bool:
+        """Schreibt eine Fernet-Altdatei oder eine Datei mit altem Schlüssel mit dem aktiven Schlüssel
+        ins segmentierte Format um. False wenn nichts zu tun war."""
+        if not self.needs_reencryption(file_path):
+            return False
+        plaintext = self.decrypt_file(file_path)
+        self.encrypt_to_path(plaintext, Path(file_path))
+        return True
+    
+    # Bytes (z.B. für kleine Felder), weiterhin Fernet
     def encrypt_bytes(self, data: bytes) -> bytes:
         """Encrypt bytes data"""
         return self.cipher.encrypt(data)
     
     def decrypt_bytes(self, encrypted_data: bytes) -> bytes:
-        """Decrypt bytes data"""
-        return self.cipher.decrypt(encrypted_data)
+        """Decrypt bytes data (alle Schlüssel des Schlüsselrings)"""
+        return self.keyring.multi_fernet.decrypt(encrypted_data)
+
+
+class EncryptionMigrator:
+    """Gedrosselter Hintergrund-Job, der Dateien mit dem aktiven Schlüssel neu verschlüsselt:
+    Fernet-Altdateien ins segmentierte Format und nach einer Schlüsselrotation Dateien mit alter Key-ID.
+
+    Läuft im Thread-Pool mit Pause nach jeder umgeschriebenen Datei und höchstens max_bytes_per_second,
+    damit Uploads nicht ausgebremst werden.
+
+    Mit db koordinieren sich mehrere Worker-Prozesse über ein Dokument in encryption_migration: nur der
+    Inhaber der Lease läuft, und ein vollständiger Lauf wird für Key-ID und Dateiformat vermerkt. Spätere
+    Starts überspringen den Scan, bis der Schlüssel rotiert wird (oder run(force=True)).
+    """
+
+    STATE_ID = "receipts"
+
+    def __init__(self, encryption: DataEncryption, root: Path, pause_seconds: float = 0.2,
+                 max_bytes_per_second: Optional[int] = None, db=None, lease_seconds: float = 300.0):
+        self.encryption = encryption
+        self.root = Path(root)
+        self.pause_seconds = pause_seconds
+        self.max_bytes_per_second = max_bytes_per_second
+        self.db = db
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{os.getpid()}-{os.urandom(4).hex()}"
+        self.stats: Dict[str, Any] = {"scanned": 0, "migrated": 0, "failed": 0, "finished": False, "running": False}
+        self._stopping = False
+
+    @property
+    def collection(self):
+        return self.db.encryption_migration
+
+    def stop(self) -> None:
+        self._stopping = True
+
+    def _candidates(self) -> Iterator[Path]:
+        for path in self.root.rglob('*'):
+            # Temporäre Dateien laufender Uploads auslassen
+            if path.is_file() and not path.name.endswith('.part'):
+                yield path
+
+    @property
+    def running(self) -> bool:
+        return self.stats["running"]
+
+    async def state(self) -> Optional[Dict[str, Any]]:
+        """Gespeicherter Stand (letzter vollständiger Lauf, aktuelle Lease), None ohne db"""
+        if self.db is None:
+            return None
+        return await self.collection.find_one({"_id": self.STATE_ID}, {"_id": 0})
+
+    async def _is_finished(self) -> bool:
+        state = await self.state() or {}
+        return (state.get("finished_key_id") == self.encryption.key_id
+                and state.get("format_version") == SEGMENTED_VERSION)
+
+    async def _acquire_lease(self) -> bool:
+        """Lease auf den Lauf (abgelaufene Leases abgestürzter Worker werden übernommen)"""
+        if self.db is None:
+            return True
+        now = datetime.utcnow()
+        try:
+            await self.collection.update_one(
+                {"_id": self.STATE_ID, "$or": [{"lease_until": None}, {"lease_until": {"$lte": now}}]},
+                {"$set": {"worker_id": self.worker_id, "lease_until": now + timedelta(seconds=self.lease_seconds)}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # Dokument existiert mit gültiger Lease eines anderen Workers
+            return False
+        return True
+
+    async def _renew_lease(self) -> None:
+        await self.collection.update_one(
+            {"_id": self.STATE_ID, "worker_id": self.worker_id},
+            {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=self.lease_seconds)}},
+        )
+
+    async def _release_lease(self, finished: bool) -> None:
+        update: Dict[str, Any] = {"lease_until": None, "worker_id": None}
+        if finished:
+            update.update({
+                "finished_key_id": self.encryption.key_id,
+                "format_version": SEGMENTED_VERSION,
+                "finished_at": datetime.utcnow(),
+                "stats": {key: self.stats[key] for key in ("scanned", "migrated", "failed")},
+            })
+        await self.collection.update_one({"_id": self.STATE_ID, "worker_id": self.worker_id}, {"$set": update})
+
+    async def run(self, force: bool = False) -> Dict[str, Any]:
+        """Ein Lauf über alle Dateien. Ohne force entfällt er, wenn für den aktiven Schlüssel schon einer
+        vollständig war; läuft ein anderer Worker, wird nichts getan."""
+        if self.running:
+            return self.stats
+        self._stopping = False
+        self.stats = {"scanned": 0, "migrated": 0, "failed": 0, "finished": False, "running": True,
+                      "key_id": self.encryption.key_id}
+        try:
+            if self.db is not None and not force and await self._is_finished():
+                self.stats.update({"finished": True, "skipped": "already_finished"})
+                return self.stats
+            if not await self._acquire_lease():
+                self.stats["skipped"] = "running_elsewhere"
+                logger.info("Encryption migration: läuft bereits in einem anderen Worker")
+                return self.stats
+            try:
+                await self._migrate_all()
+            finally:
+                if self.db is not None:
+                    await asyncio.shield(self._release_lease(self.stats["finished"]))
+        finally:
+            self.stats["running"] = False
+        logger.info(f"Encryption migration: {self.stats}")
+        return self.stats
+
+    async def _migrate_all(self) -> None:
+        loop = asyncio.get_running_loop()
+        renew_at = loop.time() + self.lease_seconds / 3
+        paths = await asyncio.to_thread(lambda: list(self._candidates()))
+        for path in paths:
+            if self._stopping:
+                break
+            if self.db is not None and loop.time() >= renew_at:
+                await self._renew_lease()
+                renew_at = loop.time() + self.lease_seconds / 3
+            self.stats["scanned"] += 1
+            try:
+                migrated = await asyncio.to_thread(self.encryption.migrate_file, path)
+            except Exception as e:
+                # Nicht verschlüsselte oder fremde Dateien (z.B. Logs) werden übersprungen
+                self.stats["failed"] += 1
+                logger.debug(f"Re-encryption skipped for {path}: {e}")
+                continue
+            if migrated:
+                # Drosseln nur nach tatsächlich umgeschriebenen Dateien
+                self.stats["migrated"] += 1
+                pause = self.pause_seconds
+                if self.max_bytes_per_second:
+                    pause = max(pause, path.stat().st_size / self.max_bytes_per_second)
+                await asyncio.sleep(pause)
+        self.stats["finished"] = not self._stopping
+
+_AUDIT_INDEX_FIELDS = ("user_id", "action", "resource_type")
+
+
+class _AuditSegmentIndex:
+    """Sidecar-Index eines Audit-Segments: Byte-Offset/Länge je Eintrag plus Posting-Listen je Feld"""
+
+    def __init__(self):
+        self.entries: List[Tuple[int, int, str, str, str]] = []
+        self.end = 0  # bis hierhin ist das Segment indiziert
+        self.sidecar_end = 0  # bis hierhin ist der Sidecar-Index gelesen
+        self.postings: Dict[str, Dict[str, List[int]]] = {field: {} for field in _AUDIT_INDEX_FIELDS}
+
+    def add(self, offset: int, length: int, user_id: str, action: str, resource_type: str) -> None:
+        position = len(self.entries)
+        self.entries.append((offset, length, user_id, action, resource_type))
+        for field, value in zip(_AUDIT_INDEX_FIELDS, (user_id, action, resource_type)):
+            self.postings[field].setdefault(value, []).append(position)
+        self.end = max(self.end, offset + length)
+
+    def matches_newest_first(self, filters: Dict[str, str]) -> Iterator[Tuple[int, int]]:
+        """(offset, length) der passenden Einträge, neueste zuerst"""
+        if not filters:
+            for entry in reversed(self.entries):
+                yield entry[0], entry[1]
+            return
+        # Kürzeste Posting-Liste durchlaufen, die übrigen Felder am Eintrag prüfen
+        lists = [self.postings[field].get(value, []) for field, value in filters.items()]
+        positions = min(lists, key=len)
+        checks = [(2 + _AUDIT_INDEX_FIELDS.index(field), value) for field, value in filters.items()]
+        for position in reversed(positions):
+            entry = self.entries[position]
+            if all(entry[column] == value for column, value in checks):
+                yield entry[0], entry[1]
+
 
 class AuditLogger:
-    """Audit-Logging für DSGVO-Compliance (Art. 5 Abs. 2)"""
+    """Audit-Logging für DSGVO-Compliance (Art. 5 Abs. 2)
+
+    Append-only in zeitlich begrenzten Segmenten (logs/audit/audit-<Beginn>.log), je Segment ein
+    Sidecar-Index (.idx) nach user_id, action und resource_type. log_access puffert nur im Speicher,
+    ein Hintergrund-Thread schreibt gesammelt, damit Endpunkte nicht auf Datei-I/O warten.
+    Abgeschlossene Segmente werden schreibgeschützt; bestehende Einträge werden nie umgeschrieben.
+    Die bisherige Einzeldatei logs/audit.log wird als ältestes Segment weiter gelesen.
+
+    Mehrere Prozesse (gunicorn -w N) schreiben in dieselben Segmente: Schreiben und Nachindizieren
+    laufen unter einer Dateisperre (audit.lock), der Offset neuer Einträge ist das tatsächliche
+    Dateiende und der Index übernimmt zuerst die Sidecar-Zeilen der anderen Prozesse.
+
+    Indizes werden erst beim Zugriff geladen; get_logs geht die Segmente neueste zuerst durch und hört
+    nach limit Treffern auf. Im Speicher bleiben höchstens max_cached_indexes Indizes (LRU).
+    """
     
-    def __init__(self, log_file: Optional[Path] = None):
+    def __init__(self, log_file: Optional[Path] = None, segment_seconds: int = 86400,
+                 flush_interval_seconds: float = 0.5, max_buffer: int = 500, max_cached_indexes: int = 8):
         self.log_file = log_file or Path(__file__).parent / "logs" / "audit.log"
         self.log_file.parent.mkdir(parents=True, exist_ok=True)
+        self.segment_dir = self.log_file.parent / (self.log_file.stem or "audit")
+        self.segment_dir.mkdir(parents=True, exist_ok=True)
+        self.segment_seconds = max(1, int(segment_seconds))
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_buffer = max_buffer
+        
+        self._buffer: List[Dict[str, Any]] = []
+        self._buffer_lock = threading.Condition()
+        self._write_lock = threading.Lock()
+        self.max_cached_indexes = max(1, max_cached_indexes)
+        self._indexes: "OrderedDict[Path, _AuditSegmentIndex]" = OrderedDict()
+        self._lock_file = self.segment_dir / "audit.lock"
+        self._closed = False
+        self._writer = threading.Thread(target=self._run_writer, name="audit-log-writer", daemon=True)
+        self._writer.start()
     
     def log_access(self, action: str, user_id: str, resource_type: str, resource_id: str, 
                    details: Optional[Dict] = None):
@@ -112,117 +686,422 @@ class AuditLogger:
             "details": details or {}
         }
         
-        # Write to audit log file
-        try:
-            with open(self.log_file, 'a', encoding='utf-8') as f:
-                import json
-                f.write(json.dumps(log_entry, ensure_ascii=False) + '\n')
-        except Exception as e:
-            logger.error(f"Error writing to audit log: {e}")
+        with self._buffer_lock:
+            self._buffer.append(log_entry)
+            if len(self._buffer) >= self.max_buffer:
+                self._buffer_lock.notify()
+        if self._closed:
+            self.flush()
+    
+    # Schreiben
+    def _run_writer(self) -> None:
+        while True:
+            with self._buffer_lock:
+                if not self._buffer and not self._closed:
+                    self._buffer_lock.wait(self.flush_interval_seconds)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+    
+    def flush(self) -> None:
+        """Schreibt alle gepufferten Einträge (append-only) samt Sidecar-Index"""
+        with self._write_lock:
+            with self._buffer_lock:
+                entries, self._buffer = self._buffer, []
+            if not entries:
+                return
+            try:
+                self._append(entries)
+            except Exception as e:
+                logger.error(f"Error writing to audit log: {e}")
+    
+    def _segment_for(self, timestamp: str) -> Path:
+        moment = datetime.fromisoformat(timestamp)
+        epoch = int((moment - datetime(1970, 1, 1)).total_seconds())
+        start = datetime.utcfromtimestamp(epoch - epoch % self.segment_seconds)
+        return self.segment_dir / f"audit-{start:%Y%m%dT%H%M%S}.log"
+    
+    @contextmanager
+    def _segment_lock(self) -> Iterator[None]:
+        """Exklusive Sperre über alle Segmente, auch zwischen Prozessen (ohne fcntl nur im Prozess)"""
+        with open(self._lock_file, 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+    
+    def _append(self, entries: List[Dict[str, Any]]) -> None:
+        import json
+        with self._segment_lock():
+            # Das jüngste Segment auf der Platte ist das offene, egal welcher Prozess es angelegt hat
+            latest = max(self.segment_dir.glob("audit-*.log"), default=None)
+            groups: Dict[Path, List[Dict[str, Any]]] = {}
+            for entry in entries:
+                segment = self._segment_for(entry["timestamp"])
+                if latest is not None and segment < latest:
+                    segment = latest  # versiegelte Segmente werden nie wieder geöffnet
+                groups.setdefault(segment, []).append(entry)
+            for segment, group in sorted(groups.items()):
+                if latest is None or segment > latest:
+                    # Neues Segment: alle älteren versiegeln (auch nach einem Neustart offen gebliebene)
+                    for older in self.segment_dir.glob("audit-*.log"):
+                        if older < segment:
+                            self._seal(older)
+                    latest = segment
+                index = self._index_for(segment)
+                with open(segment, 'ab') as f:
+                    # Offset aus der Datei, nicht aus dem Index: andere Prozesse hängen ebenfalls an
+                    offset = f.seek(0, os.SEEK_END)
+                    data = bytearray()
+                    sidecar = []
+                    for entry in group:
+                        line = (json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8')
+                        fields = [str(entry.get(field) or "") for field in _AUDIT_INDEX_FIELDS]
+                        index.add(offset + len(data), len(line), *fields)
+                        sidecar.append(json.dumps([offset + len(data), len(line), *fields], ensure_ascii=False) + '\n')
+                        data += line
+                    # Erst die Daten, dann den Index: bei einem Absturz dazwischen wird der Index beim Laden ergänzt
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                with open(self._sidecar(segment), 'ab') as f:
+                    f.write(''.join(sidecar).encode('utf-8'))
+                    index.sidecar_end = f.tell()
+    
+    def _seal(self, segment: Path) -> None:
+        """Abgeschlossenes Segment und Index schreibschützen"""
+        for path in (segment, self._sidecar(segment)):
+            try:
+                if path.exists() and path.stat().st_mode & 0o222:
+                    os.chmod(path, 0o440)
+            except OSError as e:
+                logger.warning(f"Could not seal audit segment {path}: {e}")
+    
+    def close(self) -> None:
+        """Puffer leeren und Schreib-Thread beenden (beim Herunterfahren)"""
+        with self._buffer_lock:
+            self._closed = True
+            self._buffer_lock.notify()
+        self._writer.join(timeout=5)
+        self.flush()
+    
+    # Index
+    @staticmethod
+    def _sidecar(segment: Path) -> Path:
+        return segment.with_suffix(".idx")
     
+    def _segments(self) -> List[Path]:
+        """Alle Segmente, älteste zuerst (die Alt-Datei audit.log ist das älteste)"""
+        segments = sorted(self.segment_dir.glob("audit-*.log"))
+        if self.log_file.exists():
+            segments.insert(0, self.log_file)
+        return segments
+    
+    def _index_for(self, segment: Path) -> _AuditSegmentIndex:
+        """Index eines Segments auf dem Stand der Datei (Aufruf unter _segment_lock)"""
+        index = self._indexes.get(segment)
+        if index is None:
+            index = _AuditSegmentIndex()
+            self._indexes[segment] = index
+            while len(self._indexes) > self.max_cached_indexes:
+                self._indexes.popitem(last=False)
+        else:
+            self._indexes.move_to_end(segment)
+        self._refresh_index(segment, index)
+        return index
+    
+    def _refresh_index(self, segment: Path, index: _AuditSegmentIndex) -> None:
+        """Zuerst neue Sidecar-Zeilen übernehmen (auch die anderer Prozesse), dann den Rest des Segments
+        nachindizieren, der keine Sidecar-Zeile hat (Alt-Datei, Absturz zwischen Daten und Index)"""
+        import json
+        sidecar = self._sidecar(segment)
+        if sidecar.exists() and sidecar.stat().st_size > index.sidecar_end:
+            with open(sidecar, 'rb') as f:
+                f.seek(index.sidecar_end)
+                for raw in f:
+                    if not raw.endswith(b'\n'):
+                        break  # unvollständige letzte Zeile
+                    index.sidecar_end += len(raw)
+                    try:
+                        offset, length, user_id, action, resource_type = json.loads(raw)
+                    except (ValueError, TypeError):
+                        continue
+                    if offset >= index.end:
+                        index.add(offset, length, user_id, action, resource_type)
+        self._extend_index(segment, index)
+    
+    def _extend_index(self, segment: Path, index: _AuditSegmentIndex) -> None:
+        """Nicht indizierten Rest eines Segments nachindizieren und im Sidecar ergänzen"""
+        import json
+        if not segment.exists() or segment.stat().st_size <= index.end:
+            return
+        sidecar_lines = []
+        with open(segment, 'rb') as f:
+            f.seek(index.end)
+            offset = index.end
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    break  # unvollständige letzte Zeile
+                try:
+                    entry = json.loads(raw)
+                except ValueError:
+                    entry = None
+                if isinstance(entry, dict):
+                    fields = [str(entry.get(field) or "") for field in _AUDIT_INDEX_FIELDS]
+                    index.add(offset, len(raw), *fields)
+                    sidecar_lines.append(json.dumps([offset, len(raw), *fields], ensure_ascii=False) + '\n')
+                offset += len(raw)
+                index.end = offset
+        if sidecar_lines and os.access(segment.parent, os.W_OK):
+            try:
+                with open(self._sidecar(segment), 'ab') as f:
+                    f.write(''.join(sidecar_lines).encode('utf-8'))
+                    index.sidecar_end = f.tell()
+            except OSError as e:
+                logger.debug(f"Could not extend audit index for {segment}: {e}")
+    
+    # Lesen
     def get_logs(self, limit: int = 1000, user_id: Optional[str] = None, 
                   action: Optional[str] = None, resource_type: Optional[str] = None) -> List[Dict]:
-        """Read audit logs with optional filtering"""
+        """Read audit logs with optional filtering (neueste zuerst, bricht nach limit ab)"""
+        import json
         logs = []
+        if limit <= 0:
+            return logs
+        filters = {field: value for field, value in
+                   (("user_id", user_id), ("action", action), ("resource_type", resource_type)) if value}
         try:
-            if not self.log_file.exists():
-                return logs
-            
-            with open(self.log_file, 'r', encoding='utf-8') as f:
-                import json
-                for line in f:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    try:
-                        log_entry = json.loads(line)
-                        # Apply filters
-                        if user_id and log_entry.get("user_id") != user_id:
-                            continue
-                        if action and log_entry.get("action") != action:
-                            continue
-                        if resource_type and log_entry.get("resource_type") != resource_type:
+            self.flush()
+            with self._write_lock, self._segment_lock():
+                segments = self._segments()
+            for segment in reversed(segments):
+                # Index erst laden, wenn die neueren Segmente nicht für limit Treffer gereicht haben
+                with self._write_lock, self._segment_lock():
+                    index = self._index_for(segment)
+                with open(segment, 'rb') as f:
+                    for offset, length in index.matches_newest_first(filters):
+                        f.seek(offset)
+                        try:
+                            logs.append(json.loads(f.read(length)))
+                        except ValueError:
                             continue
-                        logs.append(log_entry)
-                    except json.JSONDecodeError:
-                        continue
-            
-            # Sort by timestamp descending (newest first)
-            logs.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
-            
-            # Limit results
-            return logs[:limit]
+                        if len(logs) >= limit:
+                            return logs
+            return logs
         except Exception as e:
             logger.error(f"Error reading audit log: {e}")
             return logs
 
+def retention_days_for_status(status: Optional[str]) -> int:
+    """Aufbewahrungsfrist je Status (Tage ab Erstellung)"""
+    if status == "approved":
+        return RETENTION_PERIOD_APPROVED_DAYS
+    if status in (None, "draft"):
+        return RETENTION_PERIOD_DRAFT_DAYS
+    return RETENTION_PERIOD_RECEIPTS_DAYS
+
+
+def compute_expires_at(status: Optional[str], created_at: Any) -> Optional[datetime]:
+    """Ablaufdatum der Dateien eines Dokuments; None wenn created_at fehlt oder unlesbar ist"""
+    if not created_at:
+        return None
+    if isinstance(created_at, str):
+        try:
+            created_at = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    return created_at.replace(tzinfo=None) + timedelta(days=retention_days_for_status(status))
+
+
+def _receipt_file_paths(doc: Dict[str, Any]) -> Iterator[str]:
+    for receipt in doc.get("receipts") or []:
+        for key in ("local_path", "exchange_proof_path"):
+            if receipt.get(key):
+                yield receipt[key]
+
+
+def _signed_pdf_file_paths(doc: Dict[str, Any]) -> Iterator[str]:
+    if doc.get("signed_pdf_path"):
+        yield doc["signed_pdf_path"]
+
+
+# Collections mit Dateien unter Aufbewahrungsfrist: (Projektion, Pfade eines Dokuments)
+RETENTION_TARGETS: Dict[str, Tuple[Dict[str, int], Callable[[Dict[str, Any]], Iterator[str]]]] = {
+    "travel_expense_reports": ({"receipts.local_path": 1, "receipts.exchange_proof_path": 1}, _receipt_file_paths),
+    "travel_expenses": ({"receipts.local_path": 1, "receipts.exchange_proof_path": 1}, _receipt_file_paths),
+    "timesheets": ({"signed_pdf_path": 1}, _signed_pdf_file_paths),
+}
+
+
 class RetentionManager:
-    """Verwaltung von Aufbewahrungsfristen (DSGVO Art. 5 Abs. 1 e)"""
+    """Verwaltung von Aufbewahrungsfristen (DSGVO Art. 5 Abs. 1 e)
+
+    Jedes Dokument trägt ein vorberechnetes, indiziertes expires_at (aus Status und created_at),
+    das bei Statuswechseln über refresh_expiry nachgeführt wird. Der Sweeper liest nur abgelaufene
+    Dokumente in Batches, löscht deren Dateien ohne sie zu entschlüsseln und setzt expires_at auf
+    None (retention_deleted_at hält den Zeitpunkt fest). Im Dry-Run wird nur berichtet.
+    """
     
-    def __init__(self, db):
+    def __init__(self, db, batch_size: int = 200, report_limit: int = 1000):
         self.db = db
+        self.batch_size = batch_size
+        self.report_limit = report_limit
+        self._hooks: List[Callable[[str, Dict[str, Any]], Awaitable[None]]] = []
+        self._sweep_lock = asyncio.Lock()
+    
+    def register_hook(self, hook: Callable[[str, Dict[str, Any]], Awaitable[None]]) -> None:
+        """Aktion nach dem Löschen der Dateien eines Dokuments (collection, Dokument)"""
+        self._hooks.append(hook)
+    
+    async def refresh_expiry(self, collection: str, doc_id: str) -> Optional[datetime]:
+        """expires_at nach einem Statuswechsel neu berechnen"""
+        doc = await self.db[collection].find_one(
+            {"id": doc_id, "retention_deleted_at": {"$exists": False}},
+            {"_id": 0, "status": 1, "created_at": 1}
+        )
+        if not doc:
+            return None
+        expires_at = compute_expires_at(doc.get("status"), doc.get("created_at"))
+        await self.db[collection].update_one({"id": doc_id}, {"$set": {"expires_at": expires_at}})
+        return expires_at
+    
+    async def backfill_expiry(self) -> Dict[str, int]:
+        """expires_at für Bestandsdokumente ohne das Feld setzen (gebündelte Updates)"""
+        counts: Dict[str, int] = {}
+        for collection in RETENTION_TARGETS:
+            updates = []
+            counts[collection] = 0
+            cursor = self.db[collection].find(
+                {"expires_at": {"$exists": False}},
+                {"_id": 1, "status": 1, "created_at": 1}
+            ).batch_size(self.batch_size)
+            async for doc in cursor:
+                updates.append(UpdateOne(
+                    {"_id": doc["_id"]},
+                    {"$set": {"expires_at": compute_expires_at(doc.get("status"), doc.get("created_at"))}}
+                ))
+                if len(updates) >= self.batch_size:
+                    await self.db[collection].bulk_write(updates, ordered=False)
+                    counts[collection] += len(updates)
+                    updates = []
+            if updates:
+                await self.db[collection].bulk_write(updates, ordered=False)
+                counts[collection] += len(updates)
+        if any(counts.values()):
+            logger.info(f"Retention: expires_at nachgetragen: {counts}")
+        return counts
+    
+    def _expired(self, collection: str, now: datetime):
+        projection, _ = RETENTION_TARGETS[collection]
+        return self.db[collection].find(
+            {"expires_at": {"$lte": now}},
+            {"_id": 1, "id": 1, "user_id": 1, "status": 1, "created_at": 1, "expires_at": 1, **projection}
+        ).sort("expires_at", 1).batch_size(self.batch_size)
     
     async def get_files_to_delete(self) -> List[Dict[str, Any]]:
-        """Get files that exceed retention period and should be deleted"""
-        files_to_delete = []
-        
-        # Get all expense reports
-        async for report in self.db.travel_expense_reports.find({}):
-            report_date = report.get("created_at")
-            if not report_date:
-                continue
-            
-            if isinstance(report_date, str):
-                report_date = datetime.fromisoformat(report_date.replace('Z', '+00:00'))
-            
-            days_old = (datetime.utcnow() - report_date.replace(tzinfo=None)).days
-            
-            # Determine retention period based on status
-            status = report.get("status", "draft")
-            if status == "approved":
-                retention_days = RETENTION_PERIOD_APPROVED_DAYS
-            elif status == "draft":
-                retention_days = RETENTION_PERIOD_DRAFT_DAYS
-            else:
-                retention_days = RETENTION_PERIOD_RECEIPTS_DAYS
-            
-            if days_old > retention_days:
-                # Mark receipts for deletion
-                receipts = report.get("receipts", [])
-                for receipt in receipts:
-                    files_to_delete.append({
-                        "report_id": report.get("id"),
-                        "receipt_id": receipt.get("id"),
-                        "local_path": receipt.get("local_path"),
-                        "reason": f"Retention period exceeded ({days_old} days old, max {retention_days} days)",
-                        "report_status": status
-                    })
-        
-        return files_to_delete
+        """Get files that exceed retention period and should be deleted (nur abgelaufene Dokumente, max. report_limit)"""
+        return (await self.sweep(dry_run=True))["files"]
     
-    async def delete_expired_files(self, encryption: Optional[DataEncryption] = None):
-        """Delete files that exceed retention period"""
-        files_to_delete = await self.get_files_to_delete()
-        deleted_count = 0
-        
-        for file_info in files_to_delete:
-            local_path = Path(file_info["local_path"])
-            if local_path.exists():
-                try:
-                    # Decrypt if encrypted
-                    if encryption:
-                        try:
-                            encryption.decrypt_file(local_path)
-                        except:
-                            pass  # File might not be encrypted
+    async def sweep(self, dry_run: bool = False) -> Dict[str, Any]:
+        """Löscht die Dateien aller abgelaufenen Dokumente. Mit dry_run=True nur ein Bericht."""
+        async with self._sweep_lock:
+            now = datetime.utcnow()
+            report: Dict[str, Any] = {
+                "dry_run": dry_run,
+                "started_at": now.isoformat(),
+                "documents": {},
+                "file_count": 0,
+                "deleted_files": 0,
+                "missing_files": 0,
+                "errors": 0,
+                "files": [],
+            }
+            for collection, (_, file_paths) in RETENTION_TARGETS.items():
+                report["documents"][collection] = 0
+                updates = []
+                async for doc in self._expired(collection, now):
+                    report["documents"][collection] += 1
+                    paths = list(file_paths(doc))
+                    for path in paths:
+                        report["file_count"] += 1
+                        if len(report["files"]) < self.report_limit:
+                            report["files"].append({
+                                "collection": collection,
+                                "document_id": doc.get("id"),
+                                "user_id": doc.get("user_id"),
+                                "status": doc.get("status"),
+                                "local_path": path,
+                                "expires_at": doc["expires_at"].isoformat(),
+                            })
+                    if dry_run:
+                        continue
                     
-                    local_path.unlink()
-                    deleted_count += 1
-                    logger.info(f"Deleted expired file: {local_path} - {file_info['reason']}")
-                except Exception as e:
-                    logger.error(f"Error deleting expired file {local_path}: {e}")
-        
-        return deleted_count
+                    failed = False
+                    for path in paths:
+                        result = await asyncio.to_thread(self._delete_file, Path(path))
+                        if result == "deleted":
+                            report["deleted_files"] += 1
+                        elif result == "missing":
+                            report["missing_files"] += 1
+                        else:
+                            report["errors"] += 1
+                            failed = True
+                    if failed:
+                        continue  # expires_at bleibt, nächster Lauf versucht es erneut
+                    updates.append(UpdateOne(
+                        {"_id": doc["_id"]},
+                        {"$set": {"expires_at": None, "retention_deleted_at": now}}
+                    ))
+                    for hook in self._hooks:
+                        try:
+                            await hook(collection, doc)
+                        except Exception as e:
+                            logger.warning(f"Retention: Aktion nach dem Löschen fehlgeschlagen ({collection}/{doc.get('id')}): {e}")
+                    if len(updates) >= self.batch_size:
+                        await self.db[collection].bulk_write(updates, ordered=False)
+                        updates = []
+                if updates:
+                    await self.db[collection].bulk_write(updates, ordered=False)
+            report["finished_at"] = datetime.utcnow().isoformat()
+            if not dry_run:
+                logger.info(
+                    f"Retention sweep: {report['deleted_files']} Dateien gelöscht, "
+                    f"{report['missing_files']} fehlten, {report['errors']} Fehler"
+                )
+            return report
+    
+    @staticmethod
+    def _delete_file(path: Path) -> str:
+        # Kein Entschlüsseln nötig: die Datei wird nur entfernt
+        try:
+            path.unlink()
+            return "deleted"
+        except FileNotFoundError:
+            return "missing"
+        except Exception as e:
+            logger.error(f"Error deleting expired file {path}: {e}")
+            return "error"
+    
+    async def delete_expired_files(self, encryption: Optional[DataEncryption] = None) -> int:
+        """Delete files that exceed retention period (encryption wird nicht mehr benötigt)"""
+        return (await self.sweep())["deleted_files"]
+    
+    async def run(self, interval_seconds: float) -> None:
+        """expires_at nachtragen und danach periodisch sweepen (interval_seconds <= 0: nur nachtragen)"""
+        try:
+            await self.backfill_expiry()
+        except Exception as e:
+            logger.error(f"Retention: Nachtragen von expires_at fehlgeschlagen: {e}")
+        while interval_seconds > 0:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Retention sweep failed: {e}")
+            await asyncio.sleep(interval_seconds)
 
 class AITransparency:
     """EU-AI-Act Compliance: Transparenz bei AI-Entscheidungen"""
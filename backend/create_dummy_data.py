@@ -117,7 +117,7 @@ async def create_dummy_data():
             # Update existing user with new password hash
             await db.users.update_one(
                 {"email": user["email"]},
-                {"$set": {"hashed_password": user["hashed_password"]}}
+                {"$set": {"hashed_password": user["hashed_password"]}, "$inc": {"version": 1}}
             )
             print(f"  🔄 User aktualisiert: {user['name']} ({user['email']}) - Passwort wurde aktualisiert")
     
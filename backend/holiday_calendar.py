@@ -0,0 +1,181 @@
+"""
+Feiertags- und Arbeitstagskalender
+Prozessweiter Kalender-Service für deutsche (bundesweite) und sächsische Feiertage:
+- Feiertage je Jahr werden einmal berechnet und gecacht
+- Arbeitstage (Mo-Fr ohne Feiertage) je Jahr als Bitmap mit Präfixsummen,
+  Werktage zwischen zwei Daten sind damit ein O(1)-Lookup je Jahr
+- Bulk-API (is_busday / busday_count) für Arrays von Daten
+"""
+
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, FrozenSet, Iterable, List, Mapping, Optional, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DateLike = Union[str, date, datetime]
+
+
+def _to_date(value: DateLike) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+@lru_cache(maxsize=256)
+def _country_holidays(country_code: str, year: int, subdiv: Optional[str]) -> Tuple[Tuple[date, str], ...]:
+    """Feiertage eines Landes/einer Region für ein Jahr (gecacht, Fehler werden nicht gecacht)"""
+    import holidays
+    if subdiv:
+        holiday_obj = holidays.country_holidays(country_code, years=year, subdiv=subdiv)
+    else:
+        holiday_obj = holidays.country_holidays(country_code, years=year)
+    return tuple(sorted(holiday_obj.items()))
+
+
+def country_holidays(country_code: str, year: int, subdiv: Optional[str] = None) -> Dict[date, str]:
+    """Feiertage (Datum -> Name) für beliebige Länder, z.B. für den HolidayAPITool"""
+    return dict(_country_holidays(country_code.upper(), year, subdiv.upper() if subdiv else None))
+
+
+class HolidayCalendar:
+    """Feiertage und Arbeitstage für Deutschland (bundesweit) und Sachsen"""
+
+    def __init__(self, country_code: str = "DE", subdivisions: Iterable[Optional[str]] = (None, "SN")):
+        self.country_code = country_code
+        self.subdivisions = tuple(subdivisions)
+        self._lock = threading.Lock()
+        self._holidays: Dict[int, Mapping[date, str]] = {}
+        self._busdays: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+
+    # Feiertage
+    def holiday_items(self, year: int) -> Mapping[date, str]:
+        """Feiertage eines Jahres (Datum -> Name), regionale Namen überschreiben bundesweite.
+
+        Liefert eine schreibgeschützte Sicht auf den Cache: Änderungen durch Aufrufer würden sonst
+        Feiertage und Arbeitstagstabellen aller späteren Aufrufe verfälschen.
+        """
+        cached = self._holidays.get(year)
+        if cached is not None:
+            return cached
+        merged: Dict[date, str] = {}
+        try:
+            for subdiv in self.subdivisions:
+                merged.update(_country_holidays(self.country_code, year, subdiv))
+        except Exception as e:
+            # Nicht cachen, damit ein späterer Aufruf es erneut versucht
+            logger.warning(f"Fehler beim Laden der Feiertage: {e}")
+            return MappingProxyType({})
+        view = MappingProxyType(merged)
+        with self._lock:
+            self._holidays[year] = view
+        return view
+
+    def holidays(self, year: int) -> FrozenSet[date]:
+        return frozenset(self.holiday_items(year))
+
+    def holidays_between(self, start: DateLike, end: DateLike) -> FrozenSet[date]:
+        start_d, end_d = _to_date(start), _to_date(end)
+        result = set()
+        for year in range(start_d.year, end_d.year + 1):
+            result.update(d for d in self.holiday_items(year) if start_d <= d <= end_d)
+        return frozenset(result)
+
+    def is_holiday(self, value: DateLike) -> bool:
+        try:
+            d = _to_date(value)
+        except Exception:
+            return False
+        return d in self.holiday_items(d.year)
+
+    # Arbeitstage
+    def _year_table(self, year: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Bitmap der Arbeitstage eines Jahres und Präfixsummen (prefix[i] = Arbeitstage vor Tag i)"""
+        table = self._busdays.get(year)
+        if table is not None:
+            return table
+        holidays = self.holiday_items(year)
+        first = np.datetime64(f"{year:04d}-01-01")
+        days = np.arange(first, np.datetime64(f"{year + 1:04d}-01-01"))
+        # 1970-01-01 war ein Donnerstag -> (Tage + 3) % 7 ergibt 0 = Montag
+        weekday = (days.astype(np.int64) + 3) % 7
+        mask = weekday < 5
+        for d in holidays:
+            mask[(np.datetime64(d) - first).astype(np.int64)] = False
+        prefix = np.concatenate(([0], np.cumsum(mask, dtype=np.int64)))
+        table = (mask, prefix)
+        if holidays:
+            # Ohne Feiertagsdaten (z.B. Bibliothek fehlt) nicht cachen
+            with self._lock:
+                self._busdays[year] = table
+        return table
+
+    def is_working_day(self, value: DateLike) -> bool:
+        d = _to_date(value)
+        mask, _ = self._year_table(d.year)
+        return bool(mask[d.timetuple().tm_yday - 1])
+
+    def count_working_days(self, start: DateLike, end: DateLike) -> int:
+        """Werktage (Mo-Fr ohne Feiertage) von start bis end, beide inklusive"""
+        start_d, end_d = _to_date(start), _to_date(end)
+        if start_d > end_d:
+            return 0
+        count = 0
+        for year in range(start_d.year, end_d.year + 1):
+            _, prefix = self._year_table(year)
+            first = start_d.timetuple().tm_yday - 1 if year == start_d.year else 0
+            last = end_d.timetuple().tm_yday if year == end_d.year else len(prefix) - 1
+            count += int(prefix[last] - prefix[first])
+        return count
+
+    def working_days_between(self, start: DateLike, end: DateLike) -> List[date]:
+        """Alle Werktage von start bis end (inklusive)"""
+        start_d, end_d = _to_date(start), _to_date(end)
+        result: List[date] = []
+        for year in range(start_d.year, end_d.year + 1):
+            mask, _ = self._year_table(year)
+            first = start_d.timetuple().tm_yday - 1 if year == start_d.year else 0
+            last = end_d.timetuple().tm_yday if year == end_d.year else len(mask)
+            base = date(year, 1, 1)
+            result.extend(base + timedelta(days=int(i)) for i in np.flatnonzero(mask[first:last]) + first)
+        return result
+
+    # Bulk-API
+    def _span(self, dates: np.ndarray) -> Tuple[np.datetime64, np.ndarray, np.ndarray]:
+        """Verbindet die Tabellen aller betroffenen Jahre zu einer durchgehenden Bitmap"""
+        years = dates.astype("datetime64[Y]").astype(np.int64) + 1970
+        first_year, last_year = int(years.min()), int(years.max())
+        masks = [self._year_table(year)[0] for year in range(first_year, last_year + 1)]
+        mask = np.concatenate(masks)
+        prefix = np.concatenate(([0], np.cumsum(mask, dtype=np.int64)))
+        return np.datetime64(f"{first_year:04d}-01-01"), mask, prefix
+
+    def is_busday(self, dates: Iterable[DateLike]) -> np.ndarray:
+        """Vektorisiert: ist jedes Datum ein Arbeitstag?"""
+        values = np.array([np.datetime64(_to_date(d)) for d in dates], dtype="datetime64[D]")
+        if values.size == 0:
+            return np.zeros(0, dtype=bool)
+        origin, mask, _ = self._span(values)
+        return mask[(values - origin).astype(np.int64)]
+
+    def busday_count(self, starts: Iterable[DateLike], ends: Iterable[DateLike]) -> np.ndarray:
+        """Vektorisiert: Arbeitstage je Paar (start, end), beide inklusive; 0 wenn start > end"""
+        start_values = np.array([np.datetime64(_to_date(d)) for d in starts], dtype="datetime64[D]")
+        end_values = np.array([np.datetime64(_to_date(d)) for d in ends], dtype="datetime64[D]")
+        if start_values.size == 0:
+            return np.zeros(0, dtype=np.int64)
+        origin, _, prefix = self._span(np.concatenate((start_values, end_values)))
+        first = (start_values - origin).astype(np.int64)
+        last = (end_values - origin).astype(np.int64) + 1
+        return np.where(last > first, prefix[np.maximum(last, first)] - prefix[first], 0)
+
+
+# Prozessweite Instanz (bundesweit + Sachsen)
+german_calendar = HolidayCalendar()
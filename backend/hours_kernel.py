@@ -0,0 +1,205 @@
+"""
+Spaltenbasierte Stundenberechnung für Zeiteinträge
+Wandelt einen Batch roher Eintrags-Dicts in NumPy-Arrays um und berechnet
+Arbeits-, PDF- und Fahrzeitstunden in einem vektorisierten Durchlauf.
+
+Die Semantik entspricht _entry_hours in server.py:
+- Arbeitszeit = max(0, Ende - Start - Pause), 0 wenn Start/Ende fehlen oder nicht parsebar sind
+- Fahrzeit zählt immer zur Gesamtzeit (wenn > 0), auf dem PDF nur mit include_travel_time
+- Abwesenheiten (urlaub, krankheit, feiertag) werden nur markiert, nicht bewertet
+- Einträge, die TimeEntry ablehnt, tragen keine Stunden bei (Regel: coerce_time_entry_values, dieselbe
+  wie in der Accounting-Aggregation); ihr Datum zählt weiter für den Monat
+"""
+
+import re
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+ABSENCE_TYPES = ("urlaub", "krankheit", "feiertag")
+_INVALID_MINUTES = -(1 << 40)
+
+# Struktur gespeicherter Einträge, wie TimeEntry sie im Lax-Modus von Pydantic annimmt (z.B. "30" oder 30.0
+# für break_minutes, "yes" oder 1 für include_travel_time)
+TIME_ENTRY_STRING_FIELDS = ("date", "start_time", "end_time", "tasks", "customer_project", "location")
+TIME_ENTRY_OPTIONAL_STRING_FIELDS = ("absence_type", "vehicle_id")
+LAX_TRUE_STRINGS = ("1", "on", "t", "true", "y", "yes")
+LAX_FALSE_STRINGS = ("0", "off", "f", "false", "n", "no")
+_LAX_INT_STRING = re.compile(r"[+-]?[0-9]+(?:_[0-9]+)*(?:\.0+)?")
+
+
+def _lax_int(value: Any) -> Optional[int]:
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else None
+    if isinstance(value, str) and _LAX_INT_STRING.fullmatch(value.strip()):
+        return int(value.strip().split(".")[0])
+    return None
+
+
+def _lax_bool(value: Any) -> Optional[bool]:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str):
+        lowered = value.lower()
+        if lowered in LAX_TRUE_STRINGS:
+            return True
+        if lowered in LAX_FALSE_STRINGS:
+            return False
+    return None
+
+
+def coerce_time_entry_values(entry: Any) -> Optional[Dict[str, Any]]:
+    """break_minutes, travel_time_minutes und include_travel_time so, wie TimeEntry(**entry) sie liefert;
+    None, wenn TimeEntry den gespeicherten Eintrag ablehnt"""
+    if not isinstance(entry, dict):
+        return None
+    if not all(isinstance(entry.get(field), str) for field in TIME_ENTRY_STRING_FIELDS):
+        return None
+    if not all(entry.get(field) is None or isinstance(entry[field], str) for field in TIME_ENTRY_OPTIONAL_STRING_FIELDS):
+        return None
+    values = {
+        "break_minutes": _lax_int(entry.get("break_minutes")),
+        "travel_time_minutes": _lax_int(entry["travel_time_minutes"]) if "travel_time_minutes" in entry else 0,
+        "include_travel_time": _lax_bool(entry["include_travel_time"]) if "include_travel_time" in entry else False,
+    }
+    return None if any(value is None for value in values.values()) else values
+
+
+@lru_cache(maxsize=4096)
+def _hhmm_to_minutes(value: str) -> int:
+    """"HH:MM" -> Minuten seit Mitternacht (Zeiten wiederholen sich stark, daher gecacht)"""
+    try:
+        h, m = map(int, value.split(":"))
+        return h * 60 + m
+    except Exception:
+        return _INVALID_MINUTES
+
+
+@lru_cache(maxsize=4096)
+def _date_to_month_key(value: str) -> str:
+    """"YYYY-MM-DD" -> "YYYY-MM", leerer String wenn kein gültiges Datum"""
+    try:
+        d = datetime.strptime(value, "%Y-%m-%d")
+        return f"{d.year:04d}-{d.month:02d}"
+    except Exception:
+        return ""
+
+
+def _as_row(entry: Any) -> Dict[str, Any]:
+    if isinstance(entry, dict):
+        return entry
+    return entry.model_dump() if hasattr(entry, "model_dump") else {}
+
+
+class EntryColumns:
+    """Spalten eines Batches von Zeiteinträgen"""
+
+    def __init__(self, entries: Iterable[Any]):
+        rows: List[Dict[str, Any]] = [_as_row(e) for e in entries]
+        n = len(rows)
+        self.size = n
+        self.dates: List[str] = [r.get("date") if isinstance(r.get("date"), str) else "" for r in rows]
+        self.month_keys = np.array([_date_to_month_key(d) for d in self.dates], dtype="U7")
+
+        # Ungültige Einträge: Datum zählt, Stunden, Fahrzeit und Abwesenheit nicht
+        values = [coerce_time_entry_values(r) for r in rows]
+        self.valid = np.fromiter((v is not None for v in values), dtype=bool, count=n)
+        values = [v or {"break_minutes": 0, "travel_time_minutes": 0, "include_travel_time": False} for v in values]
+
+        starts = [r.get("start_time") if v else "" for r, v in zip(rows, self.valid)]
+        ends = [r.get("end_time") if v else "" for r, v in zip(rows, self.valid)]
+        self.start_minutes = np.fromiter((_hhmm_to_minutes(s) if s else _INVALID_MINUTES for s in starts), dtype=np.int64, count=n)
+        self.end_minutes = np.fromiter((_hhmm_to_minutes(s) if s else _INVALID_MINUTES for s in ends), dtype=np.int64, count=n)
+        self.has_times = (self.start_minutes != _INVALID_MINUTES) & (self.end_minutes != _INVALID_MINUTES)
+
+        self.break_minutes = np.fromiter((v["break_minutes"] for v in values), dtype=np.int64, count=n)
+        self.travel_minutes = np.fromiter((v["travel_time_minutes"] for v in values), dtype=np.int64, count=n)
+        self.include_travel = np.fromiter((v["include_travel_time"] for v in values), dtype=bool, count=n)
+        self.absence = self.valid & np.fromiter((r.get("absence_type") in ABSENCE_TYPES for r in rows), dtype=bool, count=n)
+
+    def month_mask(self, year: int, month: int) -> np.ndarray:
+        return self.month_keys == f"{year:04d}-{month:02d}"
+
+
+def compute_hours(columns: EntryColumns) -> Dict[str, np.ndarray]:
+    """Berechnet je Eintrag (ohne Sonderbehandlung von Abwesenheiten, wie _entry_hours):
+    - worked_hours: Arbeitszeit ohne Fahrzeit
+    - total_hours: Arbeitszeit inkl. Fahrzeit
+    - hours_on_timesheets: Stunden auf dem PDF (Fahrzeit nur mit include_travel_time)
+    - travel_hours / travel_hours_on_timesheets
+    """
+    worked_minutes = np.where(
+        columns.has_times,
+        np.maximum(0, columns.end_minutes - columns.start_minutes - columns.break_minutes),
+        0
+    )
+    worked_hours = worked_minutes / 60.0
+    travel_hours = columns.travel_minutes / 60.0
+    positive_travel = np.where(columns.travel_minutes > 0, travel_hours, 0.0)
+    travel_on_timesheets = np.where(columns.include_travel & (columns.travel_minutes > 0), travel_hours, 0.0)
+    return {
+        "worked_hours": worked_hours,
+        "total_hours": worked_hours + positive_travel,
+        "hours_on_timesheets": worked_hours + travel_on_timesheets,
+        "travel_hours": travel_hours,
+        "travel_hours_on_timesheets": travel_on_timesheets,
+    }
+
+
+def grouped_month_contributions(
+    columns: EntryColumns,
+    groups: Optional[np.ndarray] = None,
+    hours: Optional[Dict[str, np.ndarray]] = None
+) -> Dict[Tuple[int, str], Dict[str, Any]]:
+    """Summiert die Stunden je (Gruppe, Monat), z.B. Gruppe = Index des Stundenzettels.
+
+    Einträge ohne gültiges Datum werden ignoriert. Abwesenheiten zählen nur als absence_days,
+    ihre Bewertung mit weekly_hours erfolgt beim Aufrufer.
+    """
+    if hours is None:
+        hours = compute_hours(columns)
+    if groups is None:
+        groups = np.zeros(columns.size, dtype=np.int64)
+    valid = columns.month_keys != ""
+    if not valid.any():
+        return {}
+
+    months, month_index = np.unique(columns.month_keys[valid], return_inverse=True)
+    composite = np.asarray(groups, dtype=np.int64)[valid] * len(months) + month_index
+    keys, inverse = np.unique(composite, return_inverse=True)
+    absence = columns.absence[valid]
+    present = ~absence
+
+    def _sum(values: np.ndarray) -> np.ndarray:
+        return np.bincount(inverse, weights=np.where(present, values[valid], 0.0), minlength=len(keys))
+
+    work_hours = _sum(hours["total_hours"])
+    hours_on_timesheets = _sum(hours["hours_on_timesheets"])
+    travel_hours = _sum(hours["travel_hours"])
+    travel_hours_on_timesheets = _sum(hours["travel_hours_on_timesheets"])
+    absence_days = np.bincount(inverse, weights=absence, minlength=len(keys))
+
+    contributions: Dict[Tuple[int, str], Dict[str, Any]] = {}
+    for i, key in enumerate(keys):
+        group, month = divmod(int(key), len(months))
+        contributions[(group, str(months[month]))] = {
+            "work_hours": float(work_hours[i]),
+            "absence_days": int(absence_days[i]),
+            "hours_on_timesheets": float(hours_on_timesheets[i]),
+            "travel_hours": float(travel_hours[i]),
+            "travel_hours_on_timesheets": float(travel_hours_on_timesheets[i]),
+        }
+    return contributions
+
+
+def month_contributions(columns: EntryColumns) -> Dict[str, Dict[str, Any]]:
+    """Summiert die Stunden je Monat (YYYY-MM) für einen einzelnen Batch"""
+    return {month: contrib for (_, month), contrib in grouped_month_contributions(columns).items()}
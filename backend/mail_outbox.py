@@ -0,0 +1,307 @@
+"""
+Mail-Outbox
+Endpunkte legen E-Mails nur noch in der Collection mail_outbox ab. Ein Hintergrund-Sender
+verschickt sie in Batches über eine wiederverwendete, authentifizierte SMTP-Verbindung,
+wiederholt fehlgeschlagene Zustellungen mit Backoff und hält den Zustellstatus am Dokument fest.
+
+Status: queued -> sending -> sent | failed (nach max_attempts)
+Versendete Einträge behalten nur die Metadaten und werden nach MAIL_OUTBOX_RETENTION_DAYS gelöscht,
+endgültig fehlgeschlagene ebenso nach MAIL_OUTBOX_FAILED_RETENTION_DAYS.
+Eine Mail wird erst direkt vor ihrem Versand reserviert; die Lease deckt damit nur eine Zustellung ab.
+"""
+
+import asyncio
+import logging
+import smtplib
+import uuid
+from datetime import datetime, timedelta
+from email import encoders
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from bson import Binary
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_COLLECTION = "mail_outbox"
+
+
+class MailOutbox:
+    """Persistente Mail-Warteschlange mit Hintergrund-Sender"""
+
+    def __init__(
+        self,
+        db,
+        smtp_factory: Callable[..., smtplib.SMTP] = smtplib.SMTP,
+        batch_size: int = 20,
+        max_attempts: int = 5,
+        base_backoff_seconds: float = 30.0,
+        max_backoff_seconds: float = 3600.0,
+        poll_interval_seconds: float = 5.0,
+        idle_timeout_seconds: float = 60.0,
+        lease_seconds: float = 300.0,
+        require_tls: bool = True,
+        smtp_timeout_seconds: float = 30.0,
+    ):
+        self.db = db
+        self.smtp_factory = smtp_factory
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_backoff_seconds = base_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self.idle_timeout_seconds = idle_timeout_seconds
+        self.lease_seconds = lease_seconds
+        self.require_tls = require_tls
+        self.smtp_timeout_seconds = smtp_timeout_seconds
+
+        self._hooks: Dict[str, Callable[[Dict[str, Any]], Awaitable[None]]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._smtp_config_key: Optional[Tuple] = None
+        self._last_used = 0.0
+        self.stats_counters = {"sent": 0, "retried": 0, "failed": 0, "connections": 0}
+
+    @property
+    def collection(self):
+        return self.db[OUTBOX_COLLECTION]
+
+    # Einreihen
+    def register_hook(self, name: str, hook: Callable[[Dict[str, Any]], Awaitable[None]]) -> None:
+        """Registriert eine Aktion, die nach erfolgreicher Zustellung ausgeführt wird (on_sent)"""
+        self._hooks[name] = hook
+
+    async def enqueue(
+        self,
+        to: List[str],
+        subject: str,
+        body: str,
+        cc: Optional[List[str]] = None,
+        attachments: Optional[List[Tuple[str, bytes]]] = None,
+        on_sent: Optional[Dict[str, Any]] = None,
+        context: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """Legt eine E-Mail in der Outbox ab und weckt den Sender. Gibt die Outbox-ID zurück."""
+        now = datetime.utcnow()
+        doc = {
+            "id": str(uuid.uuid4()),
+            "to": list(to),
+            "cc": list(cc or []),
+            "subject": subject,
+            "body": body,
+            "attachments": [
+                {"filename": filename, "content": Binary(content)}
+                for filename, content in (attachments or [])
+            ],
+            "on_sent": on_sent,
+            "context": context or {},
+            "status": "queued",
+            "attempts": 0,
+            "last_error": None,
+            "created_at": now,
+            "next_attempt_at": now,
+            "lease_until": None,
+            "sent_at": None,
+            "failed_at": None,
+        }
+        await self.collection.insert_one(doc)
+        self._wakeup.set()
+        return doc["id"]
+
+    async def get_status(self, outbox_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one(
+            {"id": outbox_id},
+            {"_id": 0, "attachments": 0, "body": 0}
+        )
+
+    async def status_counts(self) -> Dict[str, int]:
+        counts = {"queued": 0, "sending": 0, "sent": 0, "failed": 0}
+        async for row in self.collection.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+            counts[row["_id"]] = row["count"]
+        return counts
+
+    # Hintergrund-Sender
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self._stopping = True
+        self._wakeup.set()
+        if self._task:
+            try:
+                await asyncio.wait_for(self._task, timeout=self.smtp_timeout_seconds)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                self._task.cancel()
+            self._task = None
+        await asyncio.to_thread(self._close_connection)
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                processed = await self.process_once()
+            except Exception as e:
+                logger.error(f"Mail-Outbox: Fehler im Sender: {e}")
+                processed = 0
+            if processed:
+                continue
+            if self._smtp is not None and asyncio.get_running_loop().time() - self._last_used > self.idle_timeout_seconds:
+                await asyncio.to_thread(self._close_connection)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _claim_next(self) -> Optional[Dict[str, Any]]:
+        """Reserviert die nächste fällige Mail (auch abgelaufene Leases nach einem Absturz)"""
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {
+                "$or": [
+                    {"status": "queued", "next_attempt_at": {"$lte": now}},
+                    {"status": "sending", "lease_until": {"$lte": now}},
+                ]
+            },
+            {"$set": {"status": "sending", "lease_until": now + timedelta(seconds=self.lease_seconds)}},
+            sort=[("next_attempt_at", 1)],
+        )
+
+    async def process_once(self) -> int:
+        """Verschickt bis zu batch_size fällige Mails über eine Verbindung. Gibt die Anzahl bearbeiteter Mails zurück.
+
+        Jede Mail wird einzeln unmittelbar vor ihrem Versand reserviert: Langsame Zustellungen weiter vorn
+        lassen die Lease der übrigen nicht ablaufen, ein anderer Worker kann sie derweil übernehmen.
+        """
+        smtp_config: Optional[Dict[str, Any]] = None
+        processed = 0
+        while processed < self.batch_size:
+            doc = await self._claim_next()
+            if doc is None:
+                break
+            if processed == 0:
+                smtp_config = await self.db.smtp_config.find_one()
+            processed += 1
+            if not smtp_config:
+                await self._mark_failure(doc, "SMTP configuration not found")
+                continue
+            try:
+                await asyncio.to_thread(self._send_sync, smtp_config, doc)
+            except Exception as e:
+                # Verbindung nach Fehlern neu aufbauen
+                await asyncio.to_thread(self._close_connection)
+                await self._mark_failure(doc, str(e))
+                continue
+            await self._mark_sent(doc)
+        if processed:
+            self._last_used = asyncio.get_running_loop().time()
+        return processed
+
+    async def _mark_sent(self, doc: Dict[str, Any]) -> None:
+        await self.collection.update_one(
+            {"id": doc["id"]},
+            {
+                "$set": {"status": "sent", "sent_at": datetime.utcnow(), "lease_until": None, "last_error": None},
+                # Inhalt und Anhänge (Stundenzettel-PDFs) werden nach dem Versand nicht mehr gebraucht,
+                # zugestellte Einträge verfallen über den TTL-Index auf sent_at
+                "$unset": {"body": "", "attachments": ""},
+                "$inc": {"attempts": 1},
+            }
+        )
+        self.stats_counters["sent"] += 1
+        hook_spec = doc.get("on_sent") or {}
+        hook = self._hooks.get(hook_spec.get("hook", ""))
+        if hook:
+            try:
+                await hook(hook_spec)
+            except Exception as e:
+                logger.warning(f"Mail-Outbox: on_sent-Aktion {hook_spec.get('hook')} fehlgeschlagen: {e}")
+
+    async def _mark_failure(self, doc: Dict[str, Any], error: str) -> None:
+        attempts = doc.get("attempts", 0) + 1
+        update: Dict[str, Any] = {"attempts": attempts, "last_error": error, "lease_until": None}
+        if attempts >= self.max_attempts:
+            update["status"] = "failed"
+            update["failed_at"] = datetime.utcnow()
+            self.stats_counters["failed"] += 1
+            logger.error(f"Mail-Outbox: Zustellung endgültig fehlgeschlagen ({doc['id']}): {error}")
+            # Wie nach dem Versand: Inhalt und Anhänge verwerfen, der Eintrag verfällt über den TTL-Index auf failed_at
+            await self.collection.update_one(
+                {"id": doc["id"]}, {"$set": update, "$unset": {"body": "", "attachments": ""}}
+            )
+            return
+        else:
+            backoff = min(self.base_backoff_seconds * (2 ** (attempts - 1)), self.max_backoff_seconds)
+            update["status"] = "queued"
+            update["next_attempt_at"] = datetime.utcnow() + timedelta(seconds=backoff)
+            self.stats_counters["retried"] += 1
+            logger.warning(f"Mail-Outbox: Zustellung fehlgeschlagen ({doc['id']}), neuer Versuch in {backoff:.0f}s: {error}")
+        await self.collection.update_one({"id": doc["id"]}, {"$set": update})
+
+    # SMTP (läuft im Thread, smtplib ist blockierend)
+    def _connection(self, smtp_config: Dict[str, Any]) -> smtplib.SMTP:
+        config_key = (
+            smtp_config.get("smtp_server"),
+            smtp_config.get("smtp_port"),
+            smtp_config.get("smtp_username"),
+            smtp_config.get("smtp_password"),
+        )
+        if self._smtp is not None and config_key == self._smtp_config_key:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except smtplib.SMTPException:
+                pass
+            except OSError:
+                pass
+        self._close_connection()
+
+        server = self.smtp_factory(smtp_config["smtp_server"], smtp_config["smtp_port"], timeout=self.smtp_timeout_seconds)
+        server.ehlo()
+        if self.require_tls or server.has_extn("starttls"):
+            server.starttls()
+            server.ehlo()
+        if smtp_config.get("smtp_password"):
+            server.login(smtp_config["smtp_username"], smtp_config["smtp_password"])
+        self._smtp = server
+        self._smtp_config_key = config_key
+        self.stats_counters["connections"] += 1
+        return server
+
+    def _close_connection(self) -> None:
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+        self._smtp = None
+        self._smtp_config_key = None
+
+    def _send_sync(self, smtp_config: Dict[str, Any], doc: Dict[str, Any]) -> None:
+        msg = build_message(smtp_config["smtp_username"], doc)
+        recipients = list(doc.get("to", [])) + list(doc.get("cc", []))
+        server = self._connection(smtp_config)
+        server.sendmail(smtp_config["smtp_username"], recipients, msg.as_string().encode("utf-8"))
+
+
+def build_message(from_addr: str, doc: Dict[str, Any]) -> MIMEMultipart:
+    """Baut die MIME-Nachricht aus einem Outbox-Dokument (Format wie bisher in den Endpunkten)"""
+    msg = MIMEMultipart()
+    msg['From'] = from_addr
+    msg['To'] = ", ".join(doc.get("to", []))
+    if doc.get("cc"):
+        msg['Cc'] = ", ".join(doc["cc"])
+    msg['Subject'] = doc.get("subject", "")
+    msg.attach(MIMEText(doc.get("body", ""), 'plain', 'utf-8'))
+    for attachment in doc.get("attachments", []):
+        part = MIMEBase('application', 'octet-stream')
+        part.set_payload(bytes(attachment["content"]))
+        encoders.encode_base64(part)
+        part.add_header('Content-Disposition', f'attachment; filename={attachment["filename"]}')
+        msg.attach(part)
+    return msg
@@ -0,0 +1,212 @@
+"""
+Perceptual Hash (pHash) und Hamming-Index für die Ähnlichkeitssuche von Belegen
+- pHash (64 Bit) aus Bildern oder der ersten Seite eines PDFs, kompatibel zu imagehash.phash
+- Multi-Index-Hashing: der Hash wird in 4 Blöcke à 16 Bit geteilt. Liegen zwei Hashes höchstens
+  r Bits auseinander, stimmt mindestens ein Block bis auf r // 4 Bits überein (Schubfachprinzip).
+  Eine Suche prüft daher nur die Einträge, die in einem Block nahe genug liegen, statt alle.
+  Wären dafür mehr als MAX_PROBES Blockwerte abzufragen (ab r = 12), wird linear geprüft.
+- MongoHammingIndex hält die Blöcke als indiziertes Array-Feld in MongoDB
+  (alle Worker-Prozesse sehen denselben Bestand, Einträge verschwinden mit ihrem Dokument).
+"""
+
+import io
+import logging
+from itertools import combinations
+from math import comb
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+_HASH_SIZE = 8  # 8x8 niedrige Frequenzen
+_IMG_SIZE = 32  # DCT über 32x32 Graustufen (wie imagehash, highfreq_factor=4)
+# Höchstzahl abgefragter Blockwerte je Suche (Größe der $in-Liste), darüber wird linear geprüft
+MAX_PROBES = 1024
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    return np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+
+
+_DCT = _dct_matrix(_IMG_SIZE)
+
+
+def phash_image(image: Any) -> int:
+    """pHash eines PIL-Bildes als 64-Bit-Integer"""
+    from PIL import Image
+    resample = getattr(Image, "Resampling", Image).LANCZOS
+    pixels = np.asarray(image.convert("L").resize((_IMG_SIZE, _IMG_SIZE), resample), dtype=np.float64)
+    low = (_DCT @ pixels @ _DCT.T)[:_HASH_SIZE, :_HASH_SIZE]
+    bits = (low > np.median(low)).flatten()
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def phash_pdf_first_page(source: Any, resolution: int = 72) -> Optional[int]:
+    """Rendert die erste PDF-Seite (Pfad, bytes oder file-like) und berechnet ihren pHash"""
+    try:
+        import pdfplumber
+    except ImportError:
+        logger.debug("pdfplumber nicht verfügbar, pHash für PDF übersprungen")
+        return None
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    try:
+        with pdfplumber.open(source) as pdf:
+            if not pdf.pages:
+                return None
+            return phash_image(pdf.pages[0].to_image(resolution=resolution).original)
+    except Exception as e:
+        logger.debug(f"pHash der ersten PDF-Seite fehlgeschlagen: {e}")
+        return None
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def max_distance_for_threshold(similarity_threshold: float) -> int:
+    """Ähnlichkeit 0.0-1.0 -> maximale Hamming-Distanz (0.95 -> 3 von 64 Bits)"""
+    similarity_threshold = min(1.0, max(0.0, similarity_threshold))
+    return int((1.0 - similarity_threshold) * HASH_BITS + 1e-9)
+
+
+def phash_to_hex(value: int) -> str:
+    return f"{value:016x}"
+
+
+def phash_from_hex(value: str) -> int:
+    return int(value, 16)
+
+
+class _MultiIndexHashing:
+    """Aufteilung in Blöcke und Kandidaten-Blöcke nach dem Schubfachprinzip"""
+
+    def __init__(self, blocks: int = 4):
+        self.blocks = blocks
+        self.block_bits = HASH_BITS // blocks
+        self._mask = (1 << self.block_bits) - 1
+        self._flip_masks: Dict[int, List[int]] = {}
+
+    def _split(self, value: int) -> List[int]:
+        return [(value >> (i * self.block_bits)) & self._mask for i in range(self.blocks)]
+
+    def _masks(self, radius: int) -> List[int]:
+        """Alle Bitmasken eines Blocks mit höchstens radius gesetzten Bits"""
+        masks = self._flip_masks.get(radius)
+        if masks is None:
+            masks = [0]
+            for r in range(1, radius + 1):
+                for positions in combinations(range(self.block_bits), r):
+                    mask = 0
+                    for p in positions:
+                        mask |= 1 << p
+                    masks.append(mask)
+            self._flip_masks[radius] = masks
+        return masks
+
+    def _probe_count(self, max_distance: int) -> int:
+        """Anzahl der Blockwerte, die _probe_blocks für diesen Radius liefert"""
+        radius = min(max_distance // self.blocks, self.block_bits)
+        return self.blocks * sum(comb(self.block_bits, r) for r in range(radius + 1))
+
+    def _is_linear(self, max_distance: int) -> bool:
+        # Die Kandidatenliste wächst kombinatorisch mit dem Radius (16 Bit, r = 3: 697 Masken je Block)
+        return self._probe_count(max_distance) > MAX_PROBES
+
+    def _probe_blocks(self, value: int, max_distance: int) -> List[Tuple[int, int]]:
+        """(Blocknummer, Blockwert) aller Blöcke, in denen ein Treffer übereinstimmen kann"""
+        if self._is_linear(max_distance):
+            raise ValueError(f"Radius {max_distance} erfordert mehr als {MAX_PROBES} Blockwerte, linear prüfen")
+        masks = self._masks(max_distance // self.blocks)
+        return [(i, block ^ mask) for i, block in enumerate(self._split(value)) for mask in masks]
+
+    @staticmethod
+    def _rank(value: int, stored: Iterable[Tuple[str, int]], max_distance: int) -> List[Tuple[str, int]]:
+        results = []
+        for key, candidate in stored:
+            distance = hamming_distance(value, candidate)
+            if distance <= max_distance:
+                results.append((key, distance))
+        results.sort(key=lambda item: (item[1], item[0]))
+        return results
+
+
+class MongoHammingIndex(_MultiIndexHashing):
+    """Multi-Index-Hashing in einer MongoDB-Collection (Motor)
+
+    Jedes Dokument trägt den Hash als Hex-String (hash_field) und seine Blöcke als Array
+    (blocks_field), kodiert als (Blocknummer << block_bits) | Blockwert. Ein Multikey-Index auf
+    blocks_field macht die Kandidatensuche zu einer einzigen $in-Abfrage; die Kandidaten werden
+    danach exakt geprüft. Einträge werden über fields() am Dokument gesetzt und verschwinden,
+    wenn das Dokument gelöscht wird.
+    """
+
+    def __init__(
+        self,
+        collection: Any,
+        query: Optional[Dict[str, Any]] = None,
+        key_field: str = "file_hash",
+        hash_field: str = "phash",
+        blocks_field: str = "phash_blocks",
+        blocks: int = 4,
+    ):
+        super().__init__(blocks)
+        self.collection = collection
+        self.query = dict(query or {})
+        self.key_field = key_field
+        self.hash_field = hash_field
+        self.blocks_field = blocks_field
+
+    def block_keys(self, value: int) -> List[int]:
+        return [(i << self.block_bits) | block for i, block in enumerate(self._split(value))]
+
+    def fields(self, value: int) -> Dict[str, Any]:
+        """Felder für $set am Dokument, damit es in der Suche gefunden wird"""
+        return {self.hash_field: phash_to_hex(value), self.blocks_field: self.block_keys(value)}
+
+    async def search(self, value: int, max_distance: int) -> List[Tuple[str, int]]:
+        """Alle Dokumente mit Hamming-Distanz <= max_distance als (Schlüssel, Distanz), sortiert nach Distanz"""
+        query = dict(self.query)
+        if self._is_linear(max_distance):
+            query[self.hash_field] = {"$exists": True}
+        else:
+            probes = sorted({(i << self.block_bits) | block for i, block in self._probe_blocks(value, max_distance)})
+            query[self.blocks_field] = {"$in": probes}
+        stored = []
+        async for doc in self.collection.find(query, {"_id": 0, self.key_field: 1, self.hash_field: 1}):
+            if doc.get(self.hash_field):
+                stored.append((doc[self.key_field], phash_from_hex(doc[self.hash_field])))
+        return self._rank(value, stored, max_distance)
+
+    async def nearest(self, value: int, k: int = 5, max_distance: int = HASH_BITS) -> List[Tuple[str, int]]:
+        """k nächste Nachbarn, Radius wird schrittweise vergrößert"""
+        radius = 0
+        while True:
+            results = await self.search(value, radius)
+            if len(results) >= k or radius >= max_distance:
+                return results[:k]
+            radius = min(max_distance, radius + self.blocks)
+
+    async def backfill(self) -> int:
+        """Blöcke für Dokumente nachtragen, die nur den Hash haben (Bestand vor Einführung des Felds)"""
+        updated = 0
+        query = {**self.query, self.hash_field: {"$exists": True}, self.blocks_field: {"$exists": False}}
+        async for doc in self.collection.find(query, {"_id": 1, self.hash_field: 1}):
+            await self.collection.update_one(
+                {"_id": doc["_id"]},
+                {"$set": {self.blocks_field: self.block_keys(phash_from_hex(doc[self.hash_field]))}}
+            )
+            updated += 1
+        return updated
+
+
+def receipt_phash_index(db: Any) -> MongoHammingIndex:
+    """pHash-Index über das Beleg-Register (db.receipts, Schlüssel: SHA-256 des Belegs)"""
+    return MongoHammingIndex(db.receipts, query={"kind": "receipt"})
@@ -0,0 +1,135 @@
+"""
+Web-Push-Dispatcher
+Verschickt Web-Push-Nachrichten (VAPID) nebenläufig über einen begrenzten Thread-Pool,
+da pywebpush.webpush blockierend ist und sonst die Event-Loop anhält:
+- Fan-out an alle Subscriptions eines Users/einer Rolle parallel
+- Subscriptions, die mit 404/410 antworten, werden automatisch entfernt
+- Latenz-Metriken je Aufruf
+- Hintergrund-Versand, damit Endpunkte nicht auf die Zustellung warten
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Dict, List, Optional, Set
+
+from pywebpush import webpush, WebPushException
+
+logger = logging.getLogger(__name__)
+
+# Push-Dienste melden abgelaufene/abgemeldete Subscriptions mit diesen Status-Codes
+GONE_STATUS_CODES = (404, 410)
+
+
+class PushDispatcher:
+    """Nebenläufiger Web-Push-Versand mit Pruning und Metriken"""
+
+    def __init__(
+        self,
+        db,
+        vapid_public_key: str,
+        vapid_private_key: str,
+        vapid_claim_email: str,
+        max_workers: int = 8,
+        timeout_seconds: float = 10.0,
+        latency_window: int = 500,
+    ):
+        self.db = db
+        self.vapid_public_key = vapid_public_key
+        self.vapid_private_key = vapid_private_key
+        self.vapid_claim_email = vapid_claim_email
+        self.timeout_seconds = timeout_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="webpush")
+        self._background: Set[asyncio.Task] = set()
+        self._latencies_ms: deque = deque(maxlen=latency_window)
+        self.stats_counters = {"sent": 0, "failed": 0, "pruned": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.vapid_public_key and self.vapid_private_key)
+
+    def _send_sync(self, subscription: Dict[str, Any], data: str) -> None:
+        webpush(
+            subscription_info=subscription,
+            data=data,
+            vapid_private_key=self.vapid_private_key,
+            vapid_claims={"sub": f"mailto:{self.vapid_claim_email}"},
+            timeout=self.timeout_seconds,
+        )
+
+    async def send(self, subscription: Dict[str, Any], payload: Dict[str, Any]) -> bool:
+        """Verschickt eine Nachricht an eine Subscription. True bei Erfolg."""
+        if not self.enabled:
+            logger.warning("VAPID keys not configured - skipping web push")
+            return False
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            await loop.run_in_executor(self._executor, self._send_sync, subscription, json.dumps(payload))
+            self.stats_counters["sent"] += 1
+            return True
+        except WebPushException as e:
+            self.stats_counters["failed"] += 1
+            status_code = getattr(e.response, "status_code", None)
+            if status_code in GONE_STATUS_CODES:
+                await self.db.push_subscriptions.delete_one({"endpoint": subscription["endpoint"]})
+                self.stats_counters["pruned"] += 1
+                logger.info(f"WebPush: Subscription entfernt (HTTP {status_code})")
+            else:
+                logger.warning(f"WebPush failed: {e}")
+            return False
+        except Exception as e:
+            self.stats_counters["failed"] += 1
+            logger.warning(f"WebPush failed: {e}")
+            return False
+        finally:
+            self._latencies_ms.append((time.perf_counter() - started) * 1000.0)
+
+    async def fan_out(self, query: Dict[str, Any], payload: Dict[str, Any]) -> int:
+        """Sendet an alle passenden Subscriptions parallel. Gibt die Anzahl erfolgreicher Zustellungen zurück."""
+        if not self.enabled:
+            logger.warning("VAPID keys not configured - skipping web push")
+            return 0
+        subscriptions = await self.db.push_subscriptions.find(query, {"_id": 0, "endpoint": 1, "keys": 1}).to_list(None)
+        results = await asyncio.gather(*(
+            self.send({"endpoint": sub["endpoint"], "keys": sub["keys"]}, payload)
+            for sub in subscriptions
+        ))
+        return sum(1 for ok in results if ok)
+
+    def dispatch(self, coro: Awaitable[Any]) -> None:
+        """Startet einen Versand im Hintergrund (Endpunkt wartet nicht auf die Zustellung)"""
+        task = asyncio.ensure_future(coro)
+        self._background.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self._background.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.warning(f"WebPush background dispatch failed: {task.exception()}")
+
+    def stats(self) -> Dict[str, Any]:
+        latencies: List[float] = sorted(self._latencies_ms)
+        latency: Dict[str, Optional[float]] = {"avg_ms": None, "p50_ms": None, "p95_ms": None, "max_ms": None}
+        if latencies:
+            latency = {
+                "avg_ms": round(sum(latencies) / len(latencies), 1),
+                "p50_ms": round(latencies[len(latencies) // 2], 1),
+                "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 1),
+                "max_ms": round(latencies[-1], 1),
+            }
+        return {
+            **self.stats_counters,
+            "pending": len(self._background),
+            "samples": len(latencies),
+            "latency": latency,
+        }
+
+    async def close(self) -> None:
+        """Wartet auf laufende Hintergrund-Versände und beendet den Thread-Pool"""
+        if self._background:
+            await asyncio.wait(set(self._background), timeout=self.timeout_seconds)
+        self._executor.shutdown(wait=False)
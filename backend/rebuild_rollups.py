@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+Rebuild Monthly Rollups Script
+Berechnet die Collection monthly_user_rollups vollständig neu aus allen Stundenzetteln.
+Verwendung: python rebuild_rollups.py
+"""
+import asyncio
+import sys
+import os
+
+# Add parent directory to path to import server modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from server import rebuild_monthly_rollups
+
+async def main():
+    print("Berechne Monats-Rollups neu...")
+    count = await rebuild_monthly_rollups()
+    print(f"✓ {count} Rollup-Dokumente (User/Monat) geschrieben")
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+        print("\n✓ Done!")
+    except Exception as e:
+        print(f"\n✗ Error: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -57,7 +57,9 @@ async def reset_admin_user():
                     "name": DEFAULT_ADMIN_NAME,
                     "role": "admin",
                     "is_admin": True
-                }
+                },
+                # Laufende Server verwerfen ihren gecachten User daraufhin
+                "$inc": {"version": 1}
             }
         )
         print(f"✓ Admin user reset: {target_email} / {DEFAULT_ADMIN_PASSWORD}")
@@ -0,0 +1,298 @@
+"""
+Review-Warteschlange für die KI-Prüfung von Reisekostenabrechnungen
+submit_expense_report legt nur noch einen Job in der Collection review_jobs ab. Worker (im API-Prozess
+oder separat über review_worker.py) reservieren fällige Jobs per Lease, führen
+AgentOrchestrator.review_expense_report aus und wiederholen Fehlschläge mit Backoff. Die status_update-
+Broadcasts des Orchestrators werden als Fortschritt am Job festgehalten. Nach einem Neustart übernimmt ein
+Worker Jobs mit abgelaufener Lease.
+
+Status: queued -> running -> done | failed (nach max_attempts)
+Pro Abrechnung gibt es höchstens einen aktiven Job (queued/running); erneutes Einreichen liefert ihn zurück.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from pymongo import DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+REVIEW_JOBS_COLLECTION = "review_jobs"
+ACTIVE_STATUSES = ("queued", "running")
+PROGRESS_LOG_LIMIT = 50
+
+
+class ReviewQueue:
+    """Persistente Warteschlange für Report-Prüfungen mit begrenzter Parallelität"""
+
+    def __init__(
+        self,
+        db,
+        orchestrator_factory: Callable[[], Awaitable[Any]],
+        concurrency: int = 2,
+        max_attempts: int = 3,
+        base_backoff_seconds: float = 60.0,
+        max_backoff_seconds: float = 3600.0,
+        poll_interval_seconds: float = 5.0,
+        lease_seconds: float = 300.0,
+    ):
+        self.db = db
+        self.orchestrator_factory = orchestrator_factory
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.base_backoff_seconds = base_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+        self._wakeup = asyncio.Event()
+        self._tasks: list = []
+        self._stopping = False
+        self._running_jobs: Dict[str, str] = {}  # report_id -> job_id
+        self._subscribed: Set[int] = set()
+        self._pending_writes: Set[asyncio.Task] = set()
+        self.stats_counters = {"done": 0, "retried": 0, "failed": 0}
+
+    @property
+    def collection(self):
+        return self.db[REVIEW_JOBS_COLLECTION]
+
+    # Einreihen
+    async def enqueue(self, report_id: str, user_id: str, requeue_done: bool = True) -> Dict[str, Any]:
+        """Legt einen Prüf-Job an und weckt die Worker. Idempotent: Ist für den Report schon ein Job aktiv,
+        wird dieser zurückgegeben. Mit requeue_done=False gilt auch ein abgeschlossener Job als Ergebnis;
+        nur ein endgültig fehlgeschlagener (oder fehlender) Job wird dann neu eingereiht."""
+        existing = await self.latest_job(report_id)
+        if existing and (existing["status"] in ACTIVE_STATUSES or (existing["status"] == "done" and not requeue_done)):
+            return existing
+
+        now = datetime.utcnow()
+        doc = {
+            "id": str(uuid.uuid4()),
+            "report_id": report_id,
+            "user_id": user_id,
+            "status": "queued",
+            "active": True,  # partieller Unique-Index: höchstens ein aktiver Job je Report
+            "attempts": 0,
+            "last_error": None,
+            "created_at": now,
+            "next_attempt_at": now,
+            "lease_until": None,
+            "worker_id": None,
+            "started_at": None,
+            "finished_at": None,
+            "progress": {"step": 0, "message": "In Warteschlange", "updated_at": now},
+            "progress_log": [],
+            "result": None,
+        }
+        try:
+            await self.collection.insert_one(doc)
+        except DuplicateKeyError:
+            # Gleichzeitiges Einreichen: der andere Aufruf hat den aktiven Job angelegt
+            return await self.latest_job(report_id)
+        doc.pop("_id", None)
+        self._wakeup.set()
+        return doc
+
+    async def latest_job(self, report_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one(
+            {"report_id": report_id}, {"_id": 0}, sort=[("created_at", DESCENDING)]
+        )
+
+    async def status_counts(self) -> Dict[str, int]:
+        counts = {"queued": 0, "running": 0, "done": 0, "failed": 0}
+        async for row in self.collection.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+            counts[row["_id"]] = row["count"]
+        return counts
+
+    # Worker
+    def start(self) -> None:
+        """Startet concurrency Worker-Slots in der laufenden Event-Loop"""
+        if self._tasks:
+            return
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._run_slot()) for _ in range(max(1, self.concurrency))]
+        logger.info(f"Review-Queue: {len(self._tasks)} Worker gestartet ({self.worker_id})")
+
+    async def stop(self) -> None:
+        """Laufende Prüfungen abbrechen und ihre Jobs wieder freigeben (ein Worker übernimmt sie später neu)"""
+        self._stopping = True
+        self._wakeup.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._pending_writes:
+            await asyncio.gather(*self._pending_writes, return_exceptions=True)
+
+    async def run_forever(self) -> None:
+        """Für den separaten Worker-Prozess: start() und warten, bis abgebrochen wird"""
+        self.start()
+        try:
+            await asyncio.gather(*self._tasks)
+        finally:
+            await self.stop()
+
+    async def _run_slot(self) -> None:
+        while not self._stopping:
+            try:
+                job = await self._claim()
+            except Exception as e:
+                logger.error(f"Review-Queue: Fehler beim Reservieren: {e}")
+                job = None
+            if job:
+                await self._execute(job)
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _claim(self) -> Optional[Dict[str, Any]]:
+        """Reserviert einen fälligen Job (auch abgelaufene Leases nach einem Absturz)"""
+        now = datetime.utcnow()
+        job = await self.collection.find_one_and_update(
+            {
+                "$or": [
+                    {"status": "queued", "next_attempt_at": {"$lte": now}},
+                    {"status": "running", "lease_until": {"$lte": now}},
+                ]
+            },
+            {
+                "$set": {
+                    "status": "running",
+                    "lease_until": now + timedelta(seconds=self.lease_seconds),
+                    "worker_id": self.worker_id,
+                    "started_at": now,
+                },
+                # Versuch zählt schon beim Reservieren, damit ein Job, der den Worker abstürzen lässt,
+                # nicht endlos wiederholt wird
+                "$inc": {"attempts": 1},
+            },
+            sort=[("next_attempt_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if job:
+            job.pop("_id", None)
+        return job
+
+    async def _heartbeat(self, job_id: str) -> None:
+        """Verlängert die Lease, solange die Prüfung läuft (Reviews dauern oft länger als eine Lease)"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await self.collection.update_one(
+                    {"id": job_id, "worker_id": self.worker_id, "status": "running"},
+                    {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=self.lease_seconds)}},
+                )
+            except Exception as e:
+                logger.warning(f"Review-Queue: Lease für {job_id} konnte nicht verlängert werden: {e}")
+
+    async def _execute(self, job: Dict[str, Any]) -> None:
+        if job["attempts"] > self.max_attempts:
+            await self._mark_failure(job, job.get("last_error") or "Lease mehrfach abgelaufen", permanent=True)
+            return
+        heartbeat = asyncio.create_task(self._heartbeat(job["id"]))
+        self._running_jobs[job["report_id"]] = job["id"]
+        try:
+            orchestrator = await self.orchestrator_factory()
+            self._subscribe(orchestrator)
+            await orchestrator.ensure_llm_available()
+            result = await orchestrator.review_expense_report(job["report_id"], self.db)
+        except asyncio.CancelledError:
+            # Worker wird beendet: Job sofort freigeben, statt auf das Ende der Lease zu warten
+            await asyncio.shield(self._release(job))
+            raise
+        except ValueError as e:
+            # Report existiert nicht (mehr): Wiederholen hilft nicht
+            await self._mark_failure(job, str(e), permanent=True)
+        except Exception as e:
+            await self._mark_failure(job, f"{type(e).__name__}: {e}")
+        else:
+            await self._mark_done(job, result)
+        finally:
+            self._running_jobs.pop(job["report_id"], None)
+            heartbeat.cancel()
+
+    async def _release(self, job: Dict[str, Any]) -> None:
+        await self.collection.update_one(
+            {"id": job["id"], "worker_id": self.worker_id, "status": "running"},
+            {
+                "$set": {"status": "queued", "next_attempt_at": datetime.utcnow(), "lease_until": None, "worker_id": None},
+                "$inc": {"attempts": -1},
+            },
+        )
+
+    async def _mark_done(self, job: Dict[str, Any], result: Dict[str, Any]) -> None:
+        now = datetime.utcnow()
+        await self.collection.update_one(
+            {"id": job["id"], "worker_id": self.worker_id},
+            {"$set": {
+                "status": "done",
+                "active": False,
+                "lease_until": None,
+                "last_error": None,
+                "finished_at": now,
+                "progress": {"step": 4, "message": "Prüfung abgeschlossen", "updated_at": now},
+                "result": {
+                    "status": result.get("status"),
+                    "issues": len(result.get("issues", [])),
+                    "requires_user_input": result.get("requires_user_input", False),
+                    "timings": result.get("timings"),
+                },
+            }},
+        )
+        self.stats_counters["done"] += 1
+
+    async def _mark_failure(self, job: Dict[str, Any], error: str, permanent: bool = False) -> None:
+        attempts = job.get("attempts", 0)
+        update: Dict[str, Any] = {"last_error": error, "lease_until": None}
+        if permanent or attempts >= self.max_attempts:
+            update.update({"status": "failed", "active": False, "finished_at": datetime.utcnow()})
+            self.stats_counters["failed"] += 1
+            logger.error(f"Review-Queue: Prüfung von {job['report_id']} endgültig fehlgeschlagen: {error}")
+        else:
+            backoff = min(self.base_backoff_seconds * (2 ** (attempts - 1)), self.max_backoff_seconds)
+            update.update({"status": "queued", "next_attempt_at": datetime.utcnow() + timedelta(seconds=backoff)})
+            self.stats_counters["retried"] += 1
+            logger.warning(f"Review-Queue: Prüfung von {job['report_id']} fehlgeschlagen, neuer Versuch in {backoff:.0f}s: {error}")
+        await self.collection.update_one({"id": job["id"], "worker_id": self.worker_id}, {"$set": update})
+
+    # Fortschritt aus dem Message-Bus des Orchestrators
+    def _subscribe(self, orchestrator: Any) -> None:
+        if id(orchestrator) not in self._subscribed:
+            orchestrator.message_bus.subscribe("ReviewQueue", self._on_bus_message)
+            self._subscribed.add(id(orchestrator))
+
+    def _on_bus_message(self, message: Dict[str, Any]) -> None:
+        content = message.get("content") or {}
+        if content.get("type") != "status_update":
+            return
+        job_id = self._running_jobs.get(content.get("report_id"))
+        if not job_id:
+            return
+        # Callback des Message-Bus ist synchron: Schreiben als Task, Referenz halten bis zum Ende
+        task = asyncio.get_running_loop().create_task(self._record_progress(job_id, content))
+        self._pending_writes.add(task)
+        task.add_done_callback(self._pending_writes.discard)
+
+    async def _record_progress(self, job_id: str, content: Dict[str, Any]) -> None:
+        entry = {"step": content.get("step"), "message": content.get("message"), "updated_at": datetime.utcnow()}
+        try:
+            await self.collection.update_one(
+                {"id": job_id},
+                {
+                    "$set": {"progress": entry},
+                    "$push": {"progress_log": {"$each": [entry], "$slice": -PROGRESS_LOG_LIMIT}},
+                },
+            )
+        except Exception as e:
+            logger.debug(f"Review-Queue: Fortschritt konnte nicht gespeichert werden: {e}")
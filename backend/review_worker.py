@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Review-Worker
+Arbeitet die Review-Warteschlange (Collection review_jobs) in einem eigenen Prozess ab, getrennt vom API-Server.
+Im API-Prozess dann REVIEW_WORKER_IN_PROCESS=false setzen, sonst prüfen beide (was ebenfalls funktioniert,
+die Leases verhindern doppelte Bearbeitung).
+Verwendung: python review_worker.py [--concurrency N]
+"""
+import argparse
+import asyncio
+import os
+import signal
+import sys
+
+# Add parent directory to path to import server modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import server
+from server import db, review_queue
+
+async def main(concurrency: int):
+    from agents import llm_response_cache
+    llm_response_cache.attach_db(db)
+    review_queue.concurrency = concurrency
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass  # Windows: Abbruch über KeyboardInterrupt
+
+    review_queue.start()
+    print(f"Review-Worker läuft ({review_queue.worker_id}, {concurrency} parallel). Beenden mit Strg+C.")
+    try:
+        await stop.wait()
+    finally:
+        # Laufende Jobs werden wieder freigegeben und später neu gestartet
+        await review_queue.stop()
+        if server.agent_orchestrator is not None:
+            await server.agent_orchestrator.close()
+        server.client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Worker für die KI-Prüfung von Reisekostenabrechnungen")
+    parser.add_argument(
+        "--concurrency", type=int,
+        default=int(os.getenv("REVIEW_WORKER_CONCURRENCY", "2")),
+        help="Anzahl gleichzeitig geprüfter Abrechnungen (Default: REVIEW_WORKER_CONCURRENCY oder 2)"
+    )
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args.concurrency))
+        print("\n✓ Review-Worker beendet")
+    except KeyboardInterrupt:
+        print("\n✓ Review-Worker beendet")
+    except Exception as e:
+        print(f"\n✗ Error: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -3,29 +3,27 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response
+from starlette.responses import FileResponse, Response, StreamingResponse
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import os
+import asyncio
 os.environ.setdefault("PASSLIB_DISABLED_HASHES", "bcrypt")
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterable
 import uuid
 from datetime import datetime, timedelta
 import jwt
 import pyotp
 from passlib.context import CryptContext
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
 import io
-from reportlab.lib.pagesizes import A4
+from reportlab.lib.pagesizes import A4, landscape
 from reportlab.pdfgen import canvas
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -33,7 +31,10 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, Tabl
 from reportlab.lib.units import inch
 import json
 import re
-from pywebpush import webpush, WebPushException
+import time
+import hashlib
+from collections import OrderedDict
+import numpy as np
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -71,7 +72,18 @@ if LOCAL_RECEIPTS_PATH and not os.path.isabs(LOCAL_RECEIPTS_PATH):
     logging.warning(f"LOCAL_RECEIPTS_PATH was relative, converted to absolute: {LOCAL_RECEIPTS_PATH}")
 
 # Validate that storage path is local (not on webserver)
-from compliance import validate_local_storage_path, DataEncryption, AuditLogger, RetentionManager, AITransparency
+from compliance import validate_local_storage_path, DataEncryption, AuditLogger, RetentionManager, AITransparency, EncryptionMigrator, compute_expires_at
+from holiday_calendar import german_calendar
+from mail_outbox import MailOutbox
+from push_dispatcher import PushDispatcher
+from blob_store import SAFE_IMAGE_TYPES, BlobStore, sniff_image_type
+from review_queue import ReviewQueue
+from perceptual_hash import max_distance_for_threshold, phash_pdf_first_page, receipt_phash_index
+from upload_ingest import MAX_UPLOAD_BYTES, UPLOAD_CHUNK_SIZE, EmptyUpload, IngestedUpload, UploadTooLarge, ingest_upload
+from hours_kernel import (
+    ABSENCE_TYPES, LAX_FALSE_STRINGS, LAX_TRUE_STRINGS, TIME_ENTRY_OPTIONAL_STRING_FIELDS, TIME_ENTRY_STRING_FIELDS,
+    EntryColumns, compute_hours, grouped_month_contributions, month_contributions
+)
 is_valid, error_msg = validate_local_storage_path(LOCAL_RECEIPTS_PATH)
 if not is_valid:
     logging.error(f"INVALID STORAGE PATH: {error_msg}")
@@ -90,9 +102,161 @@ if LOCAL_RECEIPTS_PATH and not Path(LOCAL_RECEIPTS_PATH).exists():
         raise
 
 # Initialize compliance modules
-data_encryption = DataEncryption()  # Will use ENCRYPTION_KEY from env or warn
-audit_logger = AuditLogger()
-retention_manager = RetentionManager(db)
+data_encryption = DataEncryption()  # Prozessweiter Schlüsselring aus ENCRYPTION_KEY/ENCRYPTION_KEYS_PREVIOUS
+audit_logger = AuditLogger(
+    log_file=Path(os.environ["AUDIT_LOG_FILE"]) if os.getenv("AUDIT_LOG_FILE") else None,  # Default: backend/logs/audit.log
+    segment_seconds=int(os.getenv("AUDIT_LOG_SEGMENT_SECONDS", "86400")),
+    max_cached_indexes=int(os.getenv("AUDIT_LOG_CACHED_INDEXES", "8"))
+)
+retention_manager = RetentionManager(db, batch_size=int(os.getenv("RETENTION_SWEEP_BATCH_SIZE", "200")))
+# Hintergrund-Job: Fernet-Altdateien und Dateien mit rotiertem Schlüssel mit dem aktiven Schlüssel neu verschlüsseln
+# (einmal je Schlüssel und nur in einem Worker, Stand in der Collection encryption_migration)
+encryption_migrator = EncryptionMigrator(
+    data_encryption,
+    Path(LOCAL_RECEIPTS_PATH),
+    pause_seconds=float(os.getenv("ENCRYPTION_MIGRATION_PAUSE_SECONDS", "0.2")),
+    max_bytes_per_second=int(os.getenv("ENCRYPTION_MIGRATION_MAX_BYTES_PER_SECOND", "0")) or None,
+    db=db
+)
+
+# Bilder der Ankündigungen: inhaltsadressiert (SHA-256) mit Vorschau-Variante, Dokumente halten nur die ID
+announcement_images = BlobStore(
+    db,
+    Path(os.getenv("ANNOUNCEMENT_IMAGE_PATH", str(ROOT_DIR / "data" / "announcement_images")))
+)
+ANNOUNCEMENT_IMAGE_MAX_BYTES = 5 * 1024 * 1024
+# Hochgeladene, noch keiner Ankündigung zugeordnete Bilder bleiben so lange erhalten
+ANNOUNCEMENT_IMAGE_GRACE_SECONDS = int(os.getenv("ANNOUNCEMENT_IMAGE_GRACE_SECONDS", "86400"))
+
+# Mail-Outbox: Endpunkte reihen E-Mails nur ein, der Hintergrund-Sender verschickt sie
+mail_outbox = MailOutbox(
+    db,
+    batch_size=int(os.getenv("MAIL_OUTBOX_BATCH_SIZE", "20")),
+    max_attempts=int(os.getenv("MAIL_OUTBOX_MAX_ATTEMPTS", "5")),
+    require_tls=os.getenv("SMTP_REQUIRE_TLS", "true").lower() == "true"
+)
+
+async def ingest_encrypted_upload(
+    file: UploadFile,
+    dest_path: Path,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    too_large_detail: str = "File size must be less than 10MB",
+    empty_detail: str = "File is empty",
+    error_detail: str = "File encryption failed"
+) -> IngestedUpload:
+    """Streaming-Upload: blockweise lesen (Größenlimit + SHA-256 im selben Durchlauf),
+    verschlüsseln, im Speicher prüfen und einmalig atomar unter dest_path ablegen"""
+    try:
+        return await ingest_upload(file, dest_path, data_encryption, max_bytes=max_bytes)
+    except UploadTooLarge:
+        raise HTTPException(status_code=400, detail=too_large_detail)
+    except EmptyUpload:
+        raise HTTPException(status_code=400, detail=empty_detail)
+    except Exception as e:
+        logging.error(f"Encrypted upload to {dest_path} failed: {e}")
+        raise HTTPException(status_code=500, detail=error_detail)
+
+# Beleg-Register (content-addressed): SHA-256 des Klartexts -> Abrechnung/Beleg/User.
+# Eindeutiger Index auf (file_hash, kind): Eintragen und Duplikatsprüfung sind ein Schritt,
+# auch bei gleichzeitigen Uploads derselben Datei.
+async def register_upload_hash(
+    upload: IngestedUpload,
+    kind: str,
+    user_id: str,
+    filename: str,
+    **refs: Optional[str]
+) -> Optional[Dict[str, Any]]:
+    """Trägt den Upload ins Register ein. Gibt den bestehenden Eintrag zurück, falls die Datei schon bekannt ist."""
+    entry = {
+        "id": str(uuid.uuid4()),
+        "file_hash": upload.sha256,
+        "kind": kind,  # "receipt" | "signed_timesheet"
+        "user_id": user_id,
+        "report_id": refs.get("report_id"),
+        "expense_id": refs.get("expense_id"),
+        "receipt_id": refs.get("receipt_id"),
+        "timesheet_id": refs.get("timesheet_id"),
+        "filename": filename,
+        "local_path": str(upload.path),
+        "file_size": upload.size,
+        "upload_date": datetime.utcnow()
+    }
+    try:
+        await db.receipts.insert_one(entry)
+        return None
+    except DuplicateKeyError:
+        return await db.receipts.find_one({"file_hash": upload.sha256, "kind": kind}, {"_id": 0})
+
+RECEIPT_SIMILARITY_THRESHOLD = float(os.getenv("RECEIPT_SIMILARITY_THRESHOLD", "0.95"))
+
+async def index_receipt_phash(upload: IngestedUpload) -> List[Dict[str, Any]]:
+    """pHash der ersten Seite berechnen und mit seinen Blöcken am Register-Eintrag ablegen.
+    Die Hamming-Suche läuft in MongoDB, sieht also auch Uploads anderer Worker-Prozesse.
+    Gibt ähnliche, bereits bekannte Belege zurück (Hinweis, kein Upload-Abbruch)."""
+    def _compute() -> Optional[int]:
+        return phash_pdf_first_page(data_encryption.decrypt_file(upload.path))
+    try:
+        phash = await asyncio.to_thread(_compute)
+    except Exception as e:
+        logging.warning(f"pHash für {upload.path} fehlgeschlagen: {e}")
+        return []
+    if phash is None:
+        return []
+    phash_index = receipt_phash_index(db)
+    matches = await phash_index.search(phash, max_distance_for_threshold(RECEIPT_SIMILARITY_THRESHOLD))
+    await db.receipts.update_one(
+        {"file_hash": upload.sha256, "kind": "receipt"},
+        {"$set": phash_index.fields(phash)}
+    )
+    matches = [(key, distance) for key, distance in matches if key != upload.sha256]
+    if not matches:
+        return []
+    distances = dict(matches)
+    similar = await db.receipts.find(
+        {"file_hash": {"$in": list(distances)}, "kind": "receipt"},
+        {"_id": 0, "file_hash": 1, "receipt_id": 1, "report_id": 1, "expense_id": 1, "filename": 1, "upload_date": 1}
+    ).to_list(len(distances))
+    for entry in similar:
+        entry["hamming_distance"] = distances[entry["file_hash"]]
+    return sorted(similar, key=lambda entry: entry["hamming_distance"])
+
+async def backfill_receipt_phash_blocks():
+    """Register-Einträge mit pHash, aber ohne Blöcke (Bestand vor dem Mongo-Index) nachtragen"""
+    updated = await receipt_phash_index(db).backfill()
+    if updated:
+        logging.info(f"Receipt pHash blocks backfilled for {updated} entries")
+
+async def unregister_upload_hashes(query: Dict[str, Any]):
+    """Register-Einträge entfernen, z.B. beim Löschen eines Belegs (ihre pHashes verschwinden mit)"""
+    await db.receipts.delete_many(query)
+
+async def reject_duplicate_upload(upload: IngestedUpload, existing: Dict[str, Any], current_user: "User", detail: str):
+    """Verwirft einen bereits bekannten Upload (vor jeder LLM-Analyse) und antwortet mit 409"""
+    try:
+        upload.path.unlink()
+    except FileNotFoundError:
+        pass
+    audit_logger.log_access(
+        action="upload_rejected_duplicate",
+        user_id=current_user.id,
+        resource_type=existing.get("kind", "receipt"),
+        resource_id=existing.get("receipt_id") or existing.get("timesheet_id") or "",
+        details={"sha256": upload.sha256, "existing_report_id": existing.get("report_id"), "existing_expense_id": existing.get("expense_id")}
+    )
+    raise HTTPException(status_code=409, detail=detail)
+
+async def discard_failed_upload(upload: IngestedUpload, kind: str):
+    """Räumt einen registrierten Upload nach einem Fehler auf: verschlüsselte Datei und Register-Eintrag
+    (inkl. pHash). Sonst lehnt das Register den erneuten Upload derselben Datei mit 409 ab,
+    obwohl die Datei nicht mehr existiert."""
+    try:
+        upload.path.unlink()
+    except FileNotFoundError:
+        pass
+    try:
+        await unregister_upload_hashes({"file_hash": upload.sha256, "kind": kind})
+    except Exception as e:
+        logging.error(f"Register-Eintrag für {upload.sha256} ({kind}) konnte nicht entfernt werden: {e}")
 
 # Ollama configuration
 OLLAMA_BASE_URL = os.getenv('OLLAMA_BASE_URL', 'http://192.168.178.155:11434')
@@ -138,27 +302,22 @@ async def save_push_subscription(sub: Dict[str, Any]):
 async def delete_push_subscription(endpoint: str):
     await db.push_subscriptions.delete_one({"endpoint": endpoint})
 
-def send_web_push(subscription: Dict[str, Any], payload: Dict[str, Any]):
-    if not VAPID_PUBLIC_KEY or not VAPID_PRIVATE_KEY:
-        logging.warning("VAPID keys not configured - skipping web push")
-        return
-    try:
-        webpush(
-            subscription_info=subscription,
-            data=json.dumps(payload),
-            vapid_private_key=VAPID_PRIVATE_KEY,
-            vapid_claims={"sub": f"mailto:{VAPID_CLAIM_EMAIL}"}
-        )
-    except WebPushException as e:
-        logging.warning(f"WebPush failed: {e}")
+push_dispatcher = PushDispatcher(
+    db,
+    vapid_public_key=VAPID_PUBLIC_KEY,
+    vapid_private_key=VAPID_PRIVATE_KEY,
+    vapid_claim_email=VAPID_CLAIM_EMAIL,
+    max_workers=int(os.getenv("PUSH_MAX_WORKERS", "8"))
+)
+
+async def send_web_push(subscription: Dict[str, Any], payload: Dict[str, Any]) -> bool:
+    return await push_dispatcher.send(subscription, payload)
 
 async def notify_user(user_id: str, title: str, body: str, data: Optional[Dict[str, Any]] = None):
-    async for sub in db.push_subscriptions.find({"user_id": user_id}):
-        send_web_push({"endpoint": sub["endpoint"], "keys": sub["keys"]}, {"title": title, "body": body, "data": data or {}})
+    return await push_dispatcher.fan_out({"user_id": user_id}, {"title": title, "body": body, "data": data or {}})
 
 async def notify_role(role: str, title: str, body: str, data: Optional[Dict[str, Any]] = None):
-    async for sub in db.push_subscriptions.find({"role": role}):
-        send_web_push({"endpoint": sub["endpoint"], "keys": sub["keys"]}, {"title": title, "body": body, "data": data or {}})
+    return await push_dispatcher.fan_out({"role": role}, {"title": title, "body": body, "data": data or {}})
 
 @api_router.get("/push/public-key")
 async def get_push_public_key():
@@ -343,6 +502,7 @@ class WeeklyTimesheet(BaseModel):
     signed_pdf_path: Optional[str] = None  # Pfad zum hochgeladenen unterschriebenen PDF
     signed_pdf_verified: Optional[bool] = False  # Durch Dokumenten-Agent verifiziert
     signed_pdf_verification_notes: Optional[str] = None
+    pdf_sequence: Optional[int] = None  # Fortlaufende Nummer im PDF-Dateinamen (je User und Kalenderwoche)
 
 class SignedTimesheetUpload(BaseModel):
     """Model für hochgeladene unterschriebene Stundenzettel"""
@@ -363,6 +523,7 @@ class TravelExpenseReceipt(BaseModel):
     local_path: str  # Pfad auf lokalem Bürorechner
     uploaded_at: datetime = Field(default_factory=datetime.utcnow)
     file_size: int  # in Bytes
+    file_hash: Optional[str] = None  # SHA-256 des Klartexts (Beleg-Register)
     exchange_proof_path: Optional[str] = None  # Pfad zum Nachweis des Euro-Betrags (z.B. Kontoauszug) bei Fremdwährung
     exchange_proof_filename: Optional[str] = None  # Dateiname des Nachweises
 
@@ -502,7 +663,10 @@ class Announcement(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     title: str
     content: str  # HTML content
-    image_url: Optional[str] = None  # Base64 encoded image or URL
+    image_url: Optional[str] = None  # /api/announcements/images/<id> oder externe URL
+    image_thumbnail_url: Optional[str] = None
+    image_id: Optional[str] = None  # SHA-256 im Blob-Speicher
+    image_thumbnail_id: Optional[str] = None
     image_filename: Optional[str] = None
     active: bool = True
     created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -513,6 +677,7 @@ class AnnouncementCreate(BaseModel):
     title: str
     content: str
     image_url: Optional[str] = None
+    image_id: Optional[str] = None
     image_filename: Optional[str] = None
     active: bool = True
 
@@ -520,6 +685,7 @@ class AnnouncementUpdate(BaseModel):
     title: Optional[str] = None
     content: Optional[str] = None
     image_url: Optional[str] = None
+    image_id: Optional[str] = None
     image_filename: Optional[str] = None
     active: Optional[bool] = None
 
@@ -596,60 +762,17 @@ def _date_in_year_month(date_str: str, year: int, month: int) -> bool:
         return False
 
 def get_german_holidays(year: int) -> set:
-    """Holt deutsche (bundesweit) und sächsische Feiertage für ein Jahr"""
-    try:
-        import holidays
-        # Deutsche Feiertage (bundesweit)
-        de_holidays = holidays.Germany(years=year, prov=None)
-        # Sächsische Feiertage (Bundesland: SN = Sachsen)
-        sn_holidays = holidays.Germany(years=year, prov='SN')
-        # Kombiniere beide Sets
-        all_holidays = set(de_holidays.keys()) | set(sn_holidays.keys())
-        return all_holidays
-    except Exception as e:
-        logger.warning(f"Fehler beim Laden der Feiertage: {e}")
-        # Fallback: Manuelle Liste der wichtigsten Feiertage
-        fallback_holidays = set()
-        # Neujahr, Karfreitag, Ostermontag, Tag der Arbeit, Christi Himmelfahrt, Pfingstmontag, Tag der Deutschen Einheit, 1. Weihnachtstag, 2. Weihnachtstag
-        # Diese sind immer in Deutschland
-        # Für Sachsen: zusätzlich Reformationsfest (31.10) als Feiertag
-        # Vereinfacht: Wir verwenden nur die Feiertage, die in der holidays-Bibliothek sind
-        return fallback_holidays
+    """Holt deutsche (bundesweit) und sächsische Feiertage für ein Jahr (gecacht im Kalender-Service)"""
+    return german_calendar.holidays(year)
 
 def is_holiday(date_str: str) -> bool:
     """Prüft, ob ein Datum ein Feiertag ist (deutschlandweit oder Sachsen)"""
-    try:
-        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-        year = date_obj.year
-        holidays_set = get_german_holidays(year)
-        return date_obj.date() in holidays_set
-    except Exception:
-        return False
+    return german_calendar.is_holiday(date_str)
 
 def count_working_days(start_date: str, end_date: str) -> int:
     """Zählt Werktage (Mo-Fr) zwischen zwei Daten, Feiertage werden ausgeschlossen"""
     try:
-        start = datetime.strptime(start_date, "%Y-%m-%d")
-        end = datetime.strptime(end_date, "%Y-%m-%d")
-        if start > end:
-            return 0
-        
-        # Hole Feiertage für alle Jahre, die der Zeitraum abdeckt
-        years = set(range(start.year, end.year + 1))
-        all_holidays = set()
-        for year in years:
-            all_holidays.update(get_german_holidays(year))
-        
-        count = 0
-        current = start
-        while current <= end:
-            # 0 = Montag, 4 = Freitag
-            if current.weekday() < 5:
-                # Prüfe, ob es kein Feiertag ist
-                if current.date() not in all_holidays:
-                    count += 1
-            current += timedelta(days=1)
-        return count
+        return german_calendar.count_working_days(start_date, end_date)
     except Exception as e:
         logger.error(f"Fehler beim Zählen der Werktage: {e}")
         return 0
@@ -707,10 +830,7 @@ async def add_vacation_entries_to_timesheet(entries: List[TimeEntry], week_start
     # Hole Feiertage für die Woche
     week_start_dt = datetime.strptime(week_start, "%Y-%m-%d")
     week_end_dt = datetime.strptime(week_end, "%Y-%m-%d")
-    years = set(range(week_start_dt.year, week_end_dt.year + 1))
-    all_holidays = set()
-    for year in years:
-        all_holidays.update(get_german_holidays(year))
+    all_holidays = german_calendar.holidays_between(week_start_dt, week_end_dt)
     
     new_entries = []
     current = week_start_dt
@@ -836,43 +956,732 @@ def _entry_hours(entry: TimeEntry) -> float:
     # WICHTIG: Nur Anreise zum Arbeitsort zählt, nicht tägliche Fahrten Hotel-Kunde
     if entry.travel_time_minutes and entry.travel_time_minutes > 0:
         hours += entry.travel_time_minutes / 60.0
-    
+
     return hours
 
+# Monatliche Stunden-Rollups (monthly_user_rollups)
+# Ein Dokument pro (user_id, month). Jeder Stundenzettel legt seinen Beitrag unter
+# "timesheets.<timesheet_id>" ab, dadurch sind Updates idempotent ($set/$unset eines Schlüssels)
+# und die Statistik-Endpunkte lesen nur noch ein kleines Dokument pro User und Monat.
+def _month_key(year: int, month: int) -> str:
+    return f"{year:04d}-{month:02d}"
+
+def _timesheet_month_contributions(timesheet: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Berechnet den Beitrag eines Stundenzettels je Monat (YYYY-MM).
+
+    Abwesenheitstage werden nur gezählt (absence_days) und erst beim Lesen mit der
+    aktuellen Wochenstundenzahl des Users multipliziert.
+    """
+    counted = timesheet.get("status") == "approved" and bool(timesheet.get("signed_pdf_path"))
+    contributions = month_contributions(EntryColumns(timesheet.get("entries", [])))
+    for contrib in contributions.values():
+        contrib["counted"] = counted
+    return contributions
+
+async def refresh_timesheet_rollups(timesheet_id: str) -> None:
+    """Aktualisiert die Monats-Rollups nach einer Änderung eines Stundenzettels."""
+    timesheet = await db.timesheets.find_one({"id": timesheet_id})
+    if not timesheet:
+        await db.monthly_user_rollups.update_many(
+            {f"timesheets.{timesheet_id}": {"$exists": True}},
+            {"$unset": {f"timesheets.{timesheet_id}": ""}}
+        )
+        return
+
+    user_id = timesheet.get("user_id")
+    contributions = _timesheet_month_contributions(timesheet)
+    now = datetime.utcnow()
+    for month, contrib in contributions.items():
+        await db.monthly_user_rollups.update_one(
+            {"user_id": user_id, "month": month},
+            {
+                "$set": {
+                    f"timesheets.{timesheet_id}": contrib,
+                    "user_name": timesheet.get("user_name", ""),
+                    "updated_at": now
+                }
+            },
+            upsert=True
+        )
+    # Beitrag aus Monaten entfernen, die der Stundenzettel nicht mehr berührt (z.B. geänderte Woche)
+    await db.monthly_user_rollups.update_many(
+        {
+            f"timesheets.{timesheet_id}": {"$exists": True},
+            "$or": [{"user_id": {"$ne": user_id}}, {"month": {"$nin": list(contributions.keys())}}]
+        },
+        {"$unset": {f"timesheets.{timesheet_id}": ""}}
+    )
+
+async def rebuild_monthly_rollups() -> int:
+    """Berechnet alle Monats-Rollups neu aus den Stundenzetteln. Gibt die Anzahl der Rollup-Dokumente zurück."""
+    timesheets = await db.timesheets.find({}, {"_id": 0}).to_list(None)
+
+    # Alle Einträge in einem Batch berechnen, gruppiert nach Stundenzettel-Index
+    all_entries: List[Dict[str, Any]] = []
+    groups: List[int] = []
+    for index, timesheet in enumerate(timesheets):
+        entries = timesheet.get("entries", [])
+        all_entries.extend(entries)
+        groups.extend([index] * len(entries))
+    contributions = grouped_month_contributions(EntryColumns(all_entries), np.array(groups, dtype=np.int64))
+
+    rollups: Dict[tuple, Dict[str, Any]] = {}
+    now = datetime.utcnow()
+    for (index, month), contrib in contributions.items():
+        timesheet = timesheets[index]
+        user_id = timesheet.get("user_id")
+        contrib["counted"] = timesheet.get("status") == "approved" and bool(timesheet.get("signed_pdf_path"))
+        doc = rollups.setdefault((user_id, month), {
+            "user_id": user_id,
+            "month": month,
+            "user_name": timesheet.get("user_name", ""),
+            "timesheets": {},
+            "updated_at": now
+        })
+        doc["timesheets"][timesheet["id"]] = contrib
+
+    await db.monthly_user_rollups.delete_many({})
+    if rollups:
+        await db.monthly_user_rollups.insert_many(list(rollups.values()))
+    return len(rollups)
+
+async def load_monthly_rollups(year: int, month: int, user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Lädt die Rollups eines Monats und summiert die Beiträge je User.
+
+    Abwesenheitstage werden mit weekly_hours / 5 des Users bewertet, wie bisher in den Endpunkten.
+    """
+    query: Dict[str, Any] = {"month": _month_key(year, month)}
+    if user_id:
+        query["user_id"] = user_id
+    docs = await db.monthly_user_rollups.find(query).to_list(1000)
+
+    user_ids = [d["user_id"] for d in docs]
+    users = await db.users.find({"id": {"$in": user_ids}}, {"id": 1, "weekly_hours": 1}).to_list(1000)
+    weekly_hours_by_id = {u["id"]: u.get("weekly_hours", 40.0) for u in users}
+
+    totals: List[Dict[str, Any]] = []
+    for doc in docs:
+        if not doc.get("timesheets"):
+            continue
+        hours_per_day = weekly_hours_by_id.get(doc["user_id"], 40.0) / 5.0
+        total = {
+            "user_id": doc["user_id"],
+            "user_name": doc.get("user_name", ""),
+            "total_hours": 0.0,
+            "hours_on_timesheets": 0.0,
+            "travel_hours": 0.0,
+            "travel_hours_on_timesheets": 0.0,
+            "timesheets_count": 0
+        }
+        for contrib in (doc.get("timesheets") or {}).values():
+            total["timesheets_count"] += 1
+            if not contrib.get("counted"):
+                continue
+            total["total_hours"] += contrib.get("work_hours", 0.0) + contrib.get("absence_days", 0) * hours_per_day
+            total["hours_on_timesheets"] += contrib.get("hours_on_timesheets", 0.0)
+            total["travel_hours"] += contrib.get("travel_hours", 0.0)
+            total["travel_hours_on_timesheets"] += contrib.get("travel_hours_on_timesheets", 0.0)
+        totals.append(total)
+    return totals
+
+# Accounting-Monatsstatistik als MongoDB-Aggregation
+# Stunden werden serverseitig aus den HH:MM-Feldern berechnet, Python formt nur noch die Antwort.
+def _hhmm_minutes_expr(field: str) -> Dict[str, Any]:
+    """Aggregation-Ausdruck: "HH:MM" -> Minuten, null wenn nicht parsebar"""
+    def _part(index: int) -> Dict[str, Any]:
+        # int() in Python ignoriert umgebende Leerzeichen, $convert nicht
+        part = {"$trim": {"input": {"$arrayElemAt": ["$$parts", index]}}}
+        return {"$convert": {"input": part, "to": "int", "onError": None, "onNull": None}}
+
+    # Nicht-Strings (ungültige Einträge) ergeben null statt die Aggregation abzubrechen
+    as_string = {"$cond": [{"$eq": [{"$type": field}, "string"]}, field, ""]}
+    return {
+        "$let": {
+            "vars": {"parts": {"$split": [as_string, ":"]}},
+            "in": {
+                "$cond": [
+                    {"$eq": [{"$size": "$$parts"}, 2]},
+                    {"$add": [{"$multiply": [_part(0), 60]}, _part(1)]},
+                    None
+                ]
+            }
+        }
+    }
+
+# Was datetime.strptime(value, "%Y-%m-%d") annimmt (siehe _date_in_year_month): Monat und Tag auch
+# ohne führende Null, der Tag auch mit führendem Leerzeichen
+_STRPTIME_DATE_REGEX = r"^[0-9]{4}-(1[0-2]|0[1-9]|[1-9])-(3[01]|[12][0-9]|0[1-9]|[1-9]| [1-9])$"
+
+def _month_prefix_regex(year: int, month: int) -> str:
+    """Grober Vorfilter auf Datumsstrings eines Monats (mit und ohne führende Null)"""
+    return f"^{year:04d}-0?{month}-" if month < 10 else f"^{year:04d}-{month}-"
+
+def _date_in_month_expr(field: str, year: int, month: int) -> Dict[str, Any]:
+    """Aggregation-Ausdruck wie _date_in_year_month: gültiges Datum (kein 30.02.) im angegebenen Monat"""
+    as_string = {"$cond": [{"$eq": [{"$type": field}, "string"]}, field, ""]}
+    return {
+        "$let": {
+            "vars": {"value": as_string},
+            "in": {"$and": [
+                {"$regexMatch": {"input": "$$value", "regex": _STRPTIME_DATE_REGEX}},
+                {"$let": {
+                    "vars": {"parts": {"$map": {
+                        "input": {"$split": ["$$value", "-"]},
+                        "as": "part",
+                        "in": {"$toInt": {"$trim": {"input": "$$part"}}}
+                    }}},
+                    "in": {"$let": {
+                        "vars": {
+                            "y": {"$arrayElemAt": ["$$parts", 0]},
+                            "m": {"$arrayElemAt": ["$$parts", 1]},
+                            "d": {"$arrayElemAt": ["$$parts", 2]},
+                        },
+                        "in": {"$and": [
+                            {"$eq": ["$$y", year]},
+                            {"$eq": ["$$m", month]},
+                            # $dateFromParts rechnet z.B. den 30.02. in den März um
+                            {"$eq": [{"$dayOfMonth": {"$dateFromParts": {"year": "$$y", "month": "$$m", "day": "$$d"}}}, "$$d"]},
+                        ]}
+                    }}
+                }},
+            ]}
+        }
+    }
+
+# Struktur gespeicherter Einträge wie coerce_time_entry_values (hours_kernel), als Aggregation-Ausdrücke
+_LAX_INT_STRING_EXPR_REGEX = r"^([+-]?)([0-9]+(?:_[0-9]+)*)(?:\.0+)?$"
+
+def _lax_int_expr(field: str) -> Dict[str, Any]:
+    """Aggregation-Ausdruck wie hours_kernel._lax_int: ganze Zahl oder null"""
+    parsed = {"$regexFind": {"input": {"$trim": {"input": field}}, "regex": _LAX_INT_STRING_EXPR_REGEX}}
+    from_string = {"$let": {
+        "vars": {"found": parsed},
+        "in": {"$cond": [
+            {"$eq": ["$$found", None]},
+            None,
+            {"$multiply": [
+                {"$convert": {
+                    "input": {"$replaceAll": {"input": {"$arrayElemAt": ["$$found.captures", 1]}, "find": "_", "replacement": ""}},
+                    "to": "long", "onError": None, "onNull": None
+                }},
+                {"$cond": [{"$eq": [{"$arrayElemAt": ["$$found.captures", 0]}, "-"]}, -1, 1]}
+            ]}
+        ]}
+    }}
+    return {"$switch": {
+        "branches": [
+            {"case": {"$in": [{"$type": field}, ["int", "long"]]}, "then": field},
+            {"case": {"$eq": [{"$type": field}, "bool"]}, "then": {"$toInt": field}},
+            {"case": {"$eq": [{"$type": field}, "double"]}, "then": {"$cond": [
+                {"$eq": [{"$mod": [field, 1]}, 0]},
+                {"$convert": {"input": field, "to": "long", "onError": None}},
+                None
+            ]}},
+            {"case": {"$eq": [{"$type": field}, "string"]}, "then": from_string},
+        ],
+        "default": None
+    }}
+
+def _lax_bool_expr(field: str) -> Dict[str, Any]:
+    """Aggregation-Ausdruck wie hours_kernel._lax_bool: true/false oder null"""
+    return {"$switch": {
+        "branches": [
+            {"case": {"$eq": [{"$type": field}, "bool"]}, "then": field},
+            {"case": {"$in": [{"$type": field}, ["int", "long", "double"]]}, "then": {"$switch": {
+                "branches": [{"case": {"$eq": [field, 1]}, "then": True}, {"case": {"$eq": [field, 0]}, "then": False}],
+                "default": None
+            }}},
+            {"case": {"$eq": [{"$type": field}, "string"]}, "then": {"$switch": {
+                "branches": [
+                    {"case": {"$in": [{"$toLower": field}, list(LAX_TRUE_STRINGS)]}, "then": True},
+                    {"case": {"$in": [{"$toLower": field}, list(LAX_FALSE_STRINGS)]}, "then": False},
+                ],
+                "default": None
+            }}},
+        ],
+        "default": None
+    }}
+
+def _time_entry_values_expr(prefix: str) -> Dict[str, Any]:
+    """Aggregation-Ausdrücke wie coerce_time_entry_values für den Eintrag unter prefix (z.B. "$entries");
+    ungültige Werte sind null"""
+    travel, include = f"{prefix}.travel_time_minutes", f"{prefix}.include_travel_time"
+    return {
+        "break_minutes": _lax_int_expr(f"{prefix}.break_minutes"),
+        "travel_time_minutes": {"$cond": [{"$eq": [{"$type": travel}, "missing"]}, 0, _lax_int_expr(travel)]},
+        "include_travel_time": {"$cond": [{"$eq": [{"$type": include}, "missing"]}, False, _lax_bool_expr(include)]},
+    }
+
+def _valid_time_entry_expr(prefix: str, values: str) -> Dict[str, Any]:
+    """Aggregation-Ausdruck wie coerce_time_entry_values(...) is not None; values verweist auf das
+    Ergebnis von _time_entry_values_expr (z.B. "$entry_values")"""
+    return {"$and": [
+        *({"$eq": [{"$type": f"{prefix}.{field}"}, "string"]} for field in TIME_ENTRY_STRING_FIELDS),
+        *({"$in": [{"$type": f"{prefix}.{field}"}, ["missing", "null", "string"]]} for field in TIME_ENTRY_OPTIONAL_STRING_FIELDS),
+        *({"$ne": [f"{values}.{field}", None]} for field in ("break_minutes", "travel_time_minutes", "include_travel_time")),
+    ]}
+
+def build_accounting_stats_pipeline(year: int, month: int) -> List[Dict[str, Any]]:
+    """Aggregation über db.timesheets, die je User eine Zeile für die Accounting-Statistik liefert.
+
+    - Stundenzettel mit Einträgen im Monat: Stunden (nur freigegeben + unterschrieben) und Anzahl
+    - $unionWith timesheets: alle User mit Stundenzetteln erscheinen (ggf. mit 0 Stunden)
+    - $unionWith travel_expenses: freigegebene Reisekosten im Monat
+
+    Ergebnis wie compute_accounting_stats_reference: Datum wie datetime.strptime, Einträge, die TimeEntry
+    ablehnt, zählen den Stundenzettel, aber keine Stunden; ist weekly_hours gesetzt, aber keine Zahl, zählt
+    der User keine Stunden. Einzige Abweichung: Tragen die Stundenzettel eines Users verschiedene Namen
+    (Umbenennung), gilt der Name aus der neuesten Woche statt aus dem ersten Stundenzettel in
+    Speicherreihenfolge. Dafür liest der $unionWith über den Index user_week_start nur einen
+    Stundenzettel je User statt aller Stundenzettel.
+    """
+    in_month = {"$regex": _month_prefix_regex(year, month)}
+    zero_fields = {
+        "total_hours": {"$literal": 0.0},
+        "hours_on_timesheets": {"$literal": 0.0},
+        "travel_hours": {"$literal": 0.0},
+        "travel_hours_on_timesheets": {"$literal": 0.0},
+        "travel_kilometers": {"$literal": 0.0},
+        "travel_expenses": {"$literal": 0.0},
+        "timesheets_count": {"$literal": 0},
+    }
+
+    worked_minutes = {
+        "$cond": [
+            {"$or": [{"$eq": ["$$start", None]}, {"$eq": ["$$end", None]}]},
+            0,
+            {"$max": [0, {"$subtract": [{"$subtract": ["$$end", "$$start"]}, "$$break"]}]}
+        ]
+    }
+    travel_minutes = "$entry_values.travel_time_minutes"
+    travel_on_timesheet = {
+        "$cond": [
+            {"$and": ["$entry_values.include_travel_time", {"$gt": [travel_minutes, 0]}]},
+            {"$divide": [travel_minutes, 60.0]},
+            0.0
+        ]
+    }
+
+    return [
+        {"$match": {"entries.date": in_month}},
+        {"$project": {
+            "id": 1,
+            "user_id": 1,
+            "entries": 1,
+            "counted": {"$and": [
+                {"$eq": ["$status", "approved"]},
+                {"$ne": [{"$ifNull": ["$signed_pdf_path", ""]}, ""]}
+            ]}
+        }},
+        {"$unwind": "$entries"},
+        {"$match": {"$expr": _date_in_month_expr("$entries.date", year, month)}},
+        {"$addFields": {"entry_values": _time_entry_values_expr("$entries")}},
+        {"$addFields": {
+            # Einträge, die TimeEntry ablehnt, zählen den Stundenzettel mit, aber keine Stunden
+            "counted": {"$and": ["$counted", _valid_time_entry_expr("$entries", "$entry_values")]},
+            "is_absence": {"$in": ["$entries.absence_type", list(ABSENCE_TYPES)]},
+            "worked_hours": {
+                "$let": {
+                    "vars": {
+                        "start": _hhmm_minutes_expr("$entries.start_time"),
+                        "end": _hhmm_minutes_expr("$entries.end_time"),
+                        "break": {"$ifNull": ["$entry_values.break_minutes", 0]}
+                    },
+                    "in": {"$divide": [worked_minutes, 60.0]}
+                }
+            },
+            "travel_hours": {"$divide": [travel_minutes, 60.0]},
+            "travel_hours_total": {"$cond": [{"$gt": [travel_minutes, 0]}, {"$divide": [travel_minutes, 60.0]}, 0.0]},
+            "travel_hours_on_timesheets": travel_on_timesheet,
+        }},
+        {"$group": {
+            "_id": "$user_id",
+            "timesheet_ids": {"$addToSet": "$id"},
+            "absence_days": {"$sum": {"$cond": [{"$and": ["$counted", "$is_absence"]}, 1, 0]}},
+            "work_hours": {"$sum": {"$cond": [
+                {"$and": ["$counted", {"$not": ["$is_absence"]}]},
+                {"$add": ["$worked_hours", "$travel_hours_total"]}, 0.0
+            ]}},
+            "hours_on_timesheets": {"$sum": {"$cond": [
+                {"$and": ["$counted", {"$not": ["$is_absence"]}]},
+                {"$add": ["$worked_hours", "$travel_hours_on_timesheets"]}, 0.0
+            ]}},
+            "travel_hours": {"$sum": {"$cond": [
+                {"$and": ["$counted", {"$not": ["$is_absence"]}]}, "$travel_hours", 0.0
+            ]}},
+            "travel_hours_on_timesheets": {"$sum": {"$cond": [
+                {"$and": ["$counted", {"$not": ["$is_absence"]}]}, "$travel_hours_on_timesheets", 0.0
+            ]}},
+        }},
+        # Abwesenheitstage zählen mit weekly_hours / 5 des Users (Default 40). Ist weekly_hours gesetzt, aber
+        # keine Zahl, scheitert in der Referenz jeder Eintrag des Users an der Division: keine Stunden
+        {"$lookup": {"from": "users", "localField": "_id", "foreignField": "id", "as": "user"}},
+        {"$addFields": {"weekly_hours": {"$let": {
+            "vars": {"value": {"$first": "$user.weekly_hours"}},
+            "in": {"$switch": {
+                "branches": [
+                    {"case": {"$eq": [{"$type": "$$value"}, "missing"]}, "then": 40.0},
+                    {"case": {"$in": [{"$type": "$$value"}, ["int", "long", "double", "bool"]]},
+                     "then": {"$toDouble": "$$value"}},
+                ],
+                "default": None
+            }}
+        }}}},
+        {"$project": {
+            "total_hours": {"$cond": [
+                {"$eq": ["$weekly_hours", None]},
+                0.0,
+                {"$add": ["$work_hours", {"$multiply": ["$absence_days", {"$divide": ["$weekly_hours", 5.0]}]}]}
+            ]},
+            **{
+                field: {"$cond": [{"$eq": ["$weekly_hours", None]}, 0.0, f"${field}"]}
+                for field in ("hours_on_timesheets", "travel_hours", "travel_hours_on_timesheets")
+            },
+            "travel_kilometers": {"$literal": 0.0},
+            "travel_expenses": {"$literal": 0.0},
+            "timesheets_count": {"$size": "$timesheet_ids"},
+        }},
+        # Alle User mit Stundenzetteln (auch aus anderen Monaten) samt Namen aus dem Stundenzettel.
+        # Sortierung wie der Index user_week_start: $group mit nur $first liest einen Stundenzettel je User
+        {"$unionWith": {"coll": "timesheets", "pipeline": [
+            {"$sort": {"user_id": 1, "week_start": -1}},
+            {"$group": {"_id": "$user_id", "timesheet_user_name": {"$first": "$user_name"}}},
+            {"$addFields": zero_fields},
+        ]}},
+        # Freigegebene Reisekosten im Monat
+        {"$unionWith": {"coll": "travel_expenses", "pipeline": [
+            {"$match": {"status": "approved", "date": in_month}},
+            {"$match": {"$expr": _date_in_month_expr("$date", year, month)}},
+            {"$group": {
+                "_id": "$user_id",
+                "expense_user_name": {"$first": "$user_name"},
+                "travel_kilometers": {"$sum": {"$ifNull": ["$kilometers", 0.0]}},
+                "travel_expenses": {"$sum": {"$ifNull": ["$expenses", 0.0]}},
+            }},
+            {"$addFields": {k: v for k, v in zero_fields.items() if k not in ("travel_kilometers", "travel_expenses")}},
+        ]}},
+        {"$group": {
+            "_id": "$_id",
+            "timesheet_user_name": {"$max": "$timesheet_user_name"},
+            "expense_user_name": {"$max": "$expense_user_name"},
+            "total_hours": {"$sum": "$total_hours"},
+            "hours_on_timesheets": {"$sum": "$hours_on_timesheets"},
+            "travel_hours": {"$sum": "$travel_hours"},
+            "travel_hours_on_timesheets": {"$sum": "$travel_hours_on_timesheets"},
+            "travel_kilometers": {"$sum": "$travel_kilometers"},
+            "travel_expenses": {"$sum": "$travel_expenses"},
+            "timesheets_count": {"$sum": "$timesheets_count"},
+        }},
+        {"$project": {
+            "_id": 0,
+            "user_id": "$_id",
+            "user_name": {"$ifNull": ["$timesheet_user_name", "$expense_user_name", ""]},
+            "total_hours": 1,
+            "hours_on_timesheets": 1,
+            "travel_hours": 1,
+            "travel_hours_on_timesheets": 1,
+            "travel_kilometers": 1,
+            "travel_expenses": 1,
+            "timesheets_count": 1,
+        }},
+    ]
+
+def _accounting_stats_response(month: str, rows: List[Dict[str, Any]]) -> AccountingStatsResponse:
+    """Formt aggregierte Zeilen (eine pro User) in die API-Antwort: gerundet und nach Name sortiert"""
+    stats: List[AccountingMonthlyStat] = []
+    for row in rows:
+        stats.append(AccountingMonthlyStat(
+            user_id=row["user_id"],
+            user_name=row["user_name"],
+            month=month,
+            total_hours=round(row["total_hours"], 2),
+            hours_on_timesheets=round(row["hours_on_timesheets"], 2),
+            travel_hours=round(row["travel_hours"], 2),
+            travel_kilometers=round(row.get("travel_kilometers", 0.0), 2),
+            travel_expenses=round(row.get("travel_expenses", 0.0), 2),
+            travel_hours_on_timesheets=round(row["travel_hours_on_timesheets"], 2),
+            timesheets_count=row["timesheets_count"]
+        ))
+
+    # Sort by user_name
+    stats.sort(key=lambda s: s.user_name.lower())
+    return AccountingStatsResponse(month=month, stats=stats)
+
+async def aggregate_accounting_stats(year: int, month: int) -> List[Dict[str, Any]]:
+    pipeline = build_accounting_stats_pipeline(year, month)
+    return await db.timesheets.aggregate(pipeline).to_list(None)
+
+def compute_accounting_stats_reference(
+    timesheets: List[Dict[str, Any]],
+    travel_expenses: List[Dict[str, Any]],
+    users: List[Dict[str, Any]],
+    year: int,
+    month: int
+) -> List[Dict[str, Any]]:
+    """Referenzimplementierung in Python (bisherige Endpunkt-Logik), z.B. für Paritätstests der Aggregation"""
+    users_by_id = {u["id"]: u for u in users}
+    user_stats: Dict[str, Dict[str, Any]] = {}
+    timesheets_by_user: Dict[str, set] = {}
+
+    for t in timesheets:
+        user_id = t.get("user_id")
+        if user_id not in user_stats:
+            user_stats[user_id] = {
+                "user_name": t.get("user_name", ""),
+                "total_hours": 0.0,
+                "hours_on_timesheets": 0.0,
+                "travel_hours": 0.0,
+                "travel_hours_on_timesheets": 0.0,
+                "travel_kilometers": 0.0,
+                "travel_expenses": 0.0,
+            }
+            timesheets_by_user[user_id] = set()
+
+        monthly_total_hours = 0.0
+        monthly_hours_on_timesheets = 0.0
+        monthly_travel_hours = 0.0
+        monthly_travel_hours_on_timesheets = 0.0
+        has_entries_in_month = False
+
+        for e in t.get("entries", []):
+            try:
+                e_date = e.get("date") if isinstance(e, dict) else e.date
+                if not _date_in_year_month(e_date, year, month):
+                    continue
+                has_entries_in_month = True
+                te = TimeEntry(**(e if isinstance(e, dict) else e.model_dump()))
+                hours_per_day = users_by_id.get(user_id, {}).get("weekly_hours", 40.0) / 5.0
+
+                if te.absence_type and te.absence_type in ABSENCE_TYPES:
+                    monthly_total_hours += hours_per_day
+                    continue
+
+                monthly_total_hours += _entry_hours(te)
+                hours_on_timesheet = 0.0
+                if te.start_time and te.end_time:
+                    try:
+                        sh, sm = map(int, te.start_time.split(":"))
+                        eh, em = map(int, te.end_time.split(":"))
+                        worked = max(0, (eh * 60 + em) - (sh * 60 + sm) - int(te.break_minutes))
+                        hours_on_timesheet = max(0.0, worked / 60.0)
+                    except Exception:
+                        pass
+                travel_hours = (te.travel_time_minutes or 0) / 60.0
+                monthly_travel_hours += travel_hours
+                if te.include_travel_time and travel_hours > 0:
+                    hours_on_timesheet += travel_hours
+                    monthly_travel_hours_on_timesheets += travel_hours
+                monthly_hours_on_timesheets += hours_on_timesheet
+            except Exception:
+                continue
+
+        if has_entries_in_month:
+            timesheets_by_user[user_id].add(t.get("id"))
+
+        # Nur unterschriebene (hochgeladene) UND freigegebene Stundenzettel zählen
+        if t.get("status", "draft") == "approved" and t.get("signed_pdf_path") and has_entries_in_month:
+            user_stats[user_id]["total_hours"] += monthly_total_hours
+            user_stats[user_id]["hours_on_timesheets"] += monthly_hours_on_timesheets
+            user_stats[user_id]["travel_hours"] += monthly_travel_hours
+            user_stats[user_id]["travel_hours_on_timesheets"] += monthly_travel_hours_on_timesheets
+
+    for expense in travel_expenses:
+        if not _date_in_year_month(expense.get("date", ""), year, month):
+            continue
+        if expense.get("status", "draft") != "approved":
+            continue
+        user_id = expense.get("user_id")
+        if user_id not in user_stats:
+            user_stats[user_id] = {
+                "user_name": expense.get("user_name", ""),
+                "total_hours": 0.0,
+                "hours_on_timesheets": 0.0,
+                "travel_hours": 0.0,
+                "travel_hours_on_timesheets": 0.0,
+                "travel_kilometers": 0.0,
+                "travel_expenses": 0.0,
+            }
+            timesheets_by_user[user_id] = set()
+        user_stats[user_id]["travel_kilometers"] += expense.get("kilometers", 0.0)
+        user_stats[user_id]["travel_expenses"] += expense.get("expenses", 0.0)
+
+    return [
+        {"user_id": uid, **data, "timesheets_count": len(timesheets_by_user.get(uid, set()))}
+        for uid, data in user_stats.items()
+    ]
+
+async def allocate_pdf_sequence(user_id: str, week_start: str) -> int:
+    """Vergibt die nächste fortlaufende Nummer für (User, ISO-Jahr, ISO-Kalenderwoche) per atomarem $inc
+
+    Ein neuer Zähler beginnt bei der höchsten Nummer, die in der Woche schon vergeben sein kann: gespeicherte
+    pdf_sequence-Werte und Stundenzettel aus der Zeit vor dem Zähler (Nummer = Anzahl der Stundenzettel der
+    Woche). So entstehen keine doppelten Dateinamen.
+    """
+    week_date = datetime.strptime(week_start, "%Y-%m-%d")
+    iso_year, iso_week, weekday = week_date.isocalendar()
+    counter_id = f"{user_id}:{iso_year}:{iso_week:02d}"
+    if await db.pdf_sequences.find_one({"_id": counter_id}, {"_id": 1}) is None:
+        monday = week_date - timedelta(days=weekday - 1)
+        in_week = {
+            "user_id": user_id,
+            "week_start": {"$gte": monday.strftime("%Y-%m-%d"), "$lte": (monday + timedelta(days=6)).strftime("%Y-%m-%d")}
+        }
+        seed = 0
+        async for row in db.timesheets.aggregate([
+            {"$match": in_week},
+            {"$group": {"_id": None, "count": {"$sum": 1}, "max_sequence": {"$max": "$pdf_sequence"}}}
+        ]):
+            seed = max(row["count"], row.get("max_sequence") or 0)
+        # $max: ein parallel angelegter oder bereits weitergezählter Zähler wird nie zurückgesetzt
+        await db.pdf_sequences.update_one(
+            {"_id": counter_id},
+            {"$max": {"value": seed}, "$setOnInsert": {"user_id": user_id, "iso_year": iso_year, "iso_week": iso_week}},
+            upsert=True
+        )
+    counter = await db.pdf_sequences.find_one_and_update(
+        {"_id": counter_id},
+        {"$inc": {"value": 1}, "$setOnInsert": {"user_id": user_id, "iso_year": iso_year, "iso_week": iso_week}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["value"]
+
 async def generate_pdf_filename(timesheet: WeeklyTimesheet, user_name: str) -> str:
-    """Generate PDF filename: [Mitarbeiter_Name]_[Kalenderwoche]_[fortlaufende Nummer]"""
+    """Generate PDF filename: [Mitarbeiter_Name]_[Kalenderwoche]_[fortlaufende Nummer]
+
+    Die Nummer wird einmal pro Stundenzettel vergeben (pdf_sequence) und danach wiederverwendet.
+    """
     # Sanitize user name
     clean_name = sanitize_filename(user_name)
     
     # Get calendar week
     calendar_week = get_calendar_week(timesheet.week_start)
     
-    # Find sequential number for this user and calendar week
-    week_start_date = datetime.strptime(timesheet.week_start, "%Y-%m-%d")
-    year = week_start_date.year
-    
-    # Count existing timesheets for this user in the same calendar week
-    existing_timesheets = await db.timesheets.find({
-        "user_id": timesheet.user_id,
-        "created_at": {
-            "$gte": datetime(year, 1, 1),
-            "$lt": datetime(year + 1, 1, 1)
-        }
-    }).to_list(1000)
-    
-    # Filter by same calendar week
-    same_week_count = 0
-    for existing in existing_timesheets:
-        existing_week = get_calendar_week(existing["week_start"])
-        if existing_week == calendar_week:
-            same_week_count += 1
+    sequence = timesheet.pdf_sequence
+    if sequence is None:
+        # Ältere Stundenzettel ohne Nummer: jetzt vergeben und speichern
+        sequence = await allocate_pdf_sequence(timesheet.user_id, timesheet.week_start)
+        stored = await db.timesheets.find_one_and_update(
+            {"id": timesheet.id, "pdf_sequence": None},
+            {"$set": {"pdf_sequence": sequence}},
+            projection={"pdf_sequence": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if stored is None:
+            # Parallel bereits vergeben -> vorhandene Nummer verwenden
+            existing = await db.timesheets.find_one({"id": timesheet.id}, {"pdf_sequence": 1})
+            if existing and existing.get("pdf_sequence") is not None:
+                sequence = existing["pdf_sequence"]
+        timesheet.pdf_sequence = sequence
     
-    # Sequential number (current timesheet is included in count)
-    sequential_number = f"{same_week_count:03d}"
+    sequential_number = f"{sequence:03d}"
     
     filename = f"{clean_name}_{calendar_week}_{sequential_number}.pdf"
     return filename
 
+class UserCache:
+    """Begrenzter TTL/LRU-Cache für aufgelöste User (Schlüssel: JWT-Subject).
+
+    Einträge werden nach ttl_seconds verworfen und bei Änderungen am User explizit invalidiert.
+    Jede Änderung am User-Dokument erhöht dessen Feld version. Die anderen Worker-Prozesse
+    (gunicorn -w N) erfahren davon über sync(): Höchstens alle sync_seconds werden die Versionen
+    aller gecachten User mit einer Abfrage gelesen (Index email_version) und geänderte oder gelöschte
+    Einträge verworfen. Ein Treffer selbst kostet keinen Datenbankzugriff; Rollenänderungen,
+    Löschungen oder 2FA-Änderungen aus einem anderen Worker gelten nach spätestens sync_seconds.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl_seconds: float = 30.0, sync_seconds: float = 5.0):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.sync_seconds = sync_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._keys_by_user_id: Dict[str, str] = {}
+        self._last_sync = float("-inf")
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.syncs = 0
+
+    def get(self, key: str) -> Optional["User"]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        # Kopie zurückgeben, damit Endpunkte das gecachte Objekt nicht verändern
+        return entry[1].model_copy()
+
+    def set(self, key: str, user: "User", version: int = 0) -> None:
+        if self.maxsize <= 0 or self.ttl_seconds <= 0:
+            return
+        self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, user.model_copy(), version)
+        self._keys_by_user_id[user.id] = key
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+
+    async def sync(self, users, force: bool = False) -> None:
+        """Gleicht die gecachten Versionen mit der Datenbank ab (höchstens alle sync_seconds)"""
+        now = time.monotonic()
+        if not force and now - self._last_sync < self.sync_seconds:
+            return
+        # Vor dem await setzen: gleichzeitige Requests lösen keine weiteren Abfragen aus
+        self._last_sync = now
+        if not self._entries:
+            return
+        keys = list(self._entries)
+        self.syncs += 1
+        current = {
+            doc["email"]: doc.get("version") or 0
+            async for doc in users.find({"email": {"$in": keys}}, {"_id": 0, "email": 1, "version": 1})
+        }
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is not None and current.get(key) != entry[2]:
+                self._remove(key)
+                self.invalidations += 1
+
+    def invalidate(self, user_id: Optional[str] = None, email: Optional[str] = None) -> None:
+        """Entfernt einen User per ID und/oder E-Mail (Subject) aus dem Cache"""
+        if user_id and user_id in self._keys_by_user_id:
+            self._remove(self._keys_by_user_id[user_id])
+            self.invalidations += 1
+        if email and email in self._entries:
+            self._remove(email)
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._keys_by_user_id.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "invalidations": self.invalidations,
+            "syncs": self.syncs,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl_seconds,
+            "sync_seconds": self.sync_seconds
+        }
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None and self._keys_by_user_id.get(entry[1].id) == key:
+            del self._keys_by_user_id[entry[1].id]
+
+user_cache = UserCache(
+    maxsize=int(os.getenv("USER_CACHE_MAX_SIZE", "1024")),
+    ttl_seconds=float(os.getenv("USER_CACHE_TTL_SECONDS", "30")),
+    sync_seconds=float(os.getenv("USER_CACHE_SYNC_SECONDS", "5"))
+)
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
@@ -880,6 +1689,12 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         if email is None:
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
         
+        # Änderungen aus anderen Workern übernehmen (eine Abfrage je sync_seconds, nicht je Request)
+        await user_cache.sync(db.users)
+        cached_user = user_cache.get(email)
+        if cached_user is not None:
+            return cached_user
+        
         user = await db.users.find_one({"email": email})
         if user is None:
             raise HTTPException(status_code=401, detail="User not found")
@@ -891,7 +1706,9 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         # Set default weekly_hours if not present
         if "weekly_hours" not in user:
             user["weekly_hours"] = 40.0
-        return User(**user)
+        resolved_user = User(**user)
+        user_cache.set(email, resolved_user, user.get("version") or 0)
+        return resolved_user
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
 
@@ -906,63 +1723,246 @@ async def get_accounting_or_admin_user(current_user: User = Depends(get_current_
         raise HTTPException(status_code=403, detail="Admin or Accounting access required")
     return current_user
 
+# PDF-Layout: Farben, Styles und Tabellen-Styles werden einmal beim Laden des Moduls erstellt
+# (Flowables selbst tragen Layout-Zustand und werden pro Rendering neu erzeugt)
+PDF_TEMPLATE_VERSION = "timesheet-v1"
+PDF_PAGE_SIZE = landscape(A4)
+PDF_PAGE_WIDTH = PDF_PAGE_SIZE[0] - 40  # minus margins
+PDF_COMPANY_RED = colors.Color(233/255, 1/255, 24/255)  # #e90118
+PDF_LIGHT_GRAY = colors.Color(179/255, 179/255, 181/255)  # #b3b3b5
+PDF_DARK_GRAY = colors.Color(90/255, 90/255, 90/255)     # #5a5a5a
+
+def _build_pdf_styles() -> Dict[str, Any]:
+    styles = getSampleStyleSheet()
+    return {
+        "title": ParagraphStyle(
+            'Title',
+            parent=styles['Heading1'],
+            fontSize=20,
+            textColor=PDF_DARK_GRAY,
+            alignment=1,  # Center
+            spaceAfter=20
+        ),
+        "company": ParagraphStyle(
+            'CompanyInfo',
+            parent=styles['Normal'],
+            fontSize=8,
+            textColor=PDF_DARK_GRAY,
+            alignment=2,  # Right align
+        ),
+        "project": ParagraphStyle(
+            'ProjectInfo',
+            parent=styles['Normal'],
+            fontSize=10,
+            textColor=PDF_DARK_GRAY,
+        ),
+        "explanation": ParagraphStyle(
+            'Explanation',
+            parent=styles['Normal'],
+            fontSize=8,
+            textColor=PDF_DARK_GRAY,
+            alignment=0,  # Left align
+        ),
+        "date": ParagraphStyle(
+            'Date',
+            parent=styles['Normal'],
+            fontSize=9,
+            textColor=PDF_DARK_GRAY,
+            alignment=2,  # Right align
+        ),
+    }
+
+PDF_STYLES = _build_pdf_styles()
+PDF_COMPANY_INFO = """<b>Byte Commander</b><br/>
+    Tick Guard - Zeiterfassung & Reisekosten"""
+
+TIMESHEET_INFO_TABLE_STYLE = TableStyle([
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('TEXTCOLOR', (0, 0), (-1, -1), PDF_DARK_GRAY),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
+])
+
+TIMESHEET_MAIN_TABLE_STYLE = TableStyle([
+    # Header row
+    ('BACKGROUND', (0, 0), (-1, 0), PDF_LIGHT_GRAY),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+    ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+    
+    # Data rows
+    ('FONTNAME', (0, 1), (-1, -2), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -2), 9),
+    ('ALIGN', (0, 1), (-1, -2), 'CENTER'),
+    ('ALIGN', (4, 1), (4, -2), 'LEFT'),  # Description column left-aligned
+    
+    # Total row
+    ('BACKGROUND', (0, -1), (-1, -1), PDF_LIGHT_GRAY),
+    ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, -1), (-1, -1), 10),
+    ('ALIGN', (0, -1), (-1, -1), 'CENTER'),
+    
+    # All cells
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 5),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 5),
+    ('TOPPADDING', (0, 0), (-1, -1), 8),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+])
+
+TIMESHEET_SIGNATURE_TABLE_STYLE = TableStyle([
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('TEXTCOLOR', (0, 0), (-1, -1), PDF_DARK_GRAY),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('TOPPADDING', (0, 0), (-1, -1), 10),
+])
+
+TIMESHEET_TABLE_HEADERS = ["Datum", "Startzeit", "Endzeit", "Pause", "Beschreibung", "Arbeitszeit"]
+TIMESHEET_DAY_NAMES = ["Montag", "Dienstag", "Mittwoch", "Donnerstag", "Freitag", "Samstag", "Sonntag"]
+TIMESHEET_ABSENCE_LABELS = {
+    "urlaub": "Urlaub",
+    "krankheit": "Krankheit",
+    "feiertag": "Feiertag"
+}
+
+class PdfRenderCache:
+    """LRU-Cache für gerenderte PDFs mit optionalem Festplatten-Tier.
+
+    Schlüssel ist ein stabiler Hash über den gerenderten Inhalt und die Template-Version,
+    ein geänderter Stundenzettel bekommt also automatisch einen neuen Schlüssel.
+    Die Stundenzettel enthalten personenbezogene Daten: auf der Platte liegen sie nur verschlüsselt
+    (DSGVO Art. 32, wie die Belege), unverschlüsselte Dateien älterer Versionen werden beim Start gelöscht.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 64 * 1024 * 1024, disk_dir: Optional[str] = None,
+                 encryption: Optional[DataEncryption] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.encryption = encryption
+        if self.disk_dir:
+            if encryption is None:
+                raise ValueError("PDF cache disk tier requires encryption")
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            for plaintext in self.disk_dir.glob("*.pdf"):
+                plaintext.unlink(missing_ok=True)
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(content: Dict[str, Any], template_version: str = PDF_TEMPLATE_VERSION) -> str:
+        payload = json.dumps({"template": template_version, "content": content}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        pdf_bytes = self._entries.get(key)
+        if pdf_bytes is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return pdf_bytes
+        if self.disk_dir:
+            path = self._disk_path(key)
+            pdf_bytes = None
+            if path.is_file():
+                try:
+                    pdf_bytes = self.encryption.decrypt_file(path)
+                except Exception as e:
+                    # Beschädigt oder mit einem inzwischen entfernten Schlüssel verschlüsselt: neu rendern
+                    logger.warning(f"PDF-Cache: {path} nicht lesbar, wird verworfen: {e}")
+                    path.unlink(missing_ok=True)
+            if pdf_bytes is not None:
+                self.disk_hits += 1
+                self._store(key, pdf_bytes)
+                return pdf_bytes
+        self.misses += 1
+        return None
+
+    def put(self, key: str, pdf_bytes: bytes) -> None:
+        self._store(key, pdf_bytes)
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                # Atomar über eine temporäre Datei im selben Ordner, Klartext erreicht die Platte nie
+                self.encryption.encrypt_to_path(pdf_bytes, path)
+            except OSError as e:
+                logger.warning(f"PDF-Cache: Schreiben nach {path} fehlgeschlagen: {e}")
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / f"{key}.pdf.enc"
+
+    def _store(self, key: str, pdf_bytes: bytes) -> None:
+        if len(pdf_bytes) > self.max_bytes or self.max_entries <= 0:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous)
+        self._entries[key] = pdf_bytes
+        self._bytes += len(pdf_bytes)
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.disk_hits) / total, 4) if total else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "disk_dir": str(self.disk_dir) if self.disk_dir else None
+        }
+
+pdf_render_cache = PdfRenderCache(
+    max_entries=int(os.getenv("PDF_CACHE_MAX_ENTRIES", "256")),
+    max_bytes=int(os.getenv("PDF_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    disk_dir=os.getenv("PDF_CACHE_DIR") or None,
+    encryption=data_encryption
+)
+
+def _timesheet_render_content(timesheet: WeeklyTimesheet) -> Dict[str, Any]:
+    """Alle Felder, die im Stundenzettel-PDF erscheinen (Status o.ä. ändern das PDF nicht)"""
+    return {
+        "week_start": timesheet.week_start,
+        "user_name": timesheet.user_name,
+        "created_at": timesheet.created_at.strftime('%d.%m.%Y'),
+        "entries": [entry.model_dump() for entry in timesheet.entries],
+    }
+
 def generate_timesheet_pdf(timesheet: WeeklyTimesheet) -> bytes:
+    """Generate single-page PDF for weekly timesheet (cached by content hash and template version)"""
+    key = PdfRenderCache.make_key(_timesheet_render_content(timesheet))
+    pdf_bytes = pdf_render_cache.get(key)
+    if pdf_bytes is None:
+        pdf_bytes = _render_timesheet_pdf(timesheet)
+        pdf_render_cache.put(key, pdf_bytes)
+    return pdf_bytes
+
+def _render_timesheet_pdf(timesheet: WeeklyTimesheet) -> bytes:
     """Generate single-page PDF for weekly timesheet in landscape format matching company template"""
     buffer = io.BytesIO()
     # Use landscape orientation (A4 rotated)  
-    from reportlab.lib.pagesizes import A4, landscape
-    doc = SimpleDocTemplate(buffer, pagesize=landscape(A4), rightMargin=20, leftMargin=20, topMargin=20, bottomMargin=20)
-    
-    # Company colors
-    company_red = colors.Color(233/255, 1/255, 24/255)  # #e90118
-    light_gray = colors.Color(179/255, 179/255, 181/255)  # #b3b3b5
-    dark_gray = colors.Color(90/255, 90/255, 90/255)     # #5a5a5a
+    doc = SimpleDocTemplate(buffer, pagesize=PDF_PAGE_SIZE, rightMargin=20, leftMargin=20, topMargin=20, bottomMargin=20)
     
     story = []
-    
-    # Page width for layout calculations
-    page_width = landscape(A4)[0] - 40  # minus margins
-    
-    from reportlab.platypus import Paragraph
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    styles = getSampleStyleSheet()
-    
-    # Title style
-    title_style = ParagraphStyle(
-        'Title',
-        parent=styles['Heading1'],
-        fontSize=20,
-        textColor=dark_gray,
-        alignment=1,  # Center
-        spaceAfter=20
-    )
+    page_width = PDF_PAGE_WIDTH
     
     # Add title
-    story.append(Paragraph("<b>STUNDENZETTEL</b>", title_style))
+    story.append(Paragraph("<b>STUNDENZETTEL</b>", PDF_STYLES["title"]))
     
     # Add company header info in top right
-    company_style = ParagraphStyle(
-        'CompanyInfo',
-        parent=styles['Normal'],
-        fontSize=8,
-        textColor=dark_gray,
-        alignment=2,  # Right align
-    )
-    
-    company_info = f"""<b>Byte Commander</b><br/>
-    Tick Guard - Zeiterfassung & Reisekosten"""
-    
-    story.append(Paragraph(company_info, company_style))
+    story.append(Paragraph(PDF_COMPANY_INFO, PDF_STYLES["company"]))
     story.append(Spacer(1, 10))
     
-    # Project and Customer info row
-    project_style = ParagraphStyle(
-        'ProjectInfo',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=dark_gray,
-    )
-    
     # Extract project info from first entry if available
     project_info = ""
     customer_info = ""
@@ -973,29 +1973,18 @@ def generate_timesheet_pdf(timesheet: WeeklyTimesheet) -> bytes:
     project_customer_table = Table([
         [f"Projekt: {project_info}", f"Kunde: {customer_info}"]
     ], colWidths=[page_width*0.5, page_width*0.5])
-    
-    project_customer_table.setStyle(TableStyle([
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('TEXTCOLOR', (0, 0), (-1, -1), dark_gray),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
-    ]))
+    project_customer_table.setStyle(TIMESHEET_INFO_TABLE_STYLE)
     
     story.append(project_customer_table)
     story.append(Spacer(1, 10))
     
     # Main timesheet table according to template
-    table_headers = ["Datum", "Startzeit", "Endzeit", "Pause", "Beschreibung", "Arbeitszeit"]
-    table_data = [table_headers]
-    
-    # Days of the week in German
-    day_names = ["Montag", "Dienstag", "Mittwoch", "Donnerstag", "Freitag", "Samstag", "Sonntag"]
+    table_data = [list(TIMESHEET_TABLE_HEADERS)]
     
     # Calculate total hours
     total_hours = 0
     
     # Get week dates
-    from datetime import datetime, timedelta
     week_start_date = datetime.strptime(timesheet.week_start, "%Y-%m-%d")
     
     # Build table rows for each day
@@ -1004,7 +1993,7 @@ def generate_timesheet_pdf(timesheet: WeeklyTimesheet) -> bytes:
     for i in range(7):  # Monday to Sunday
         current_date = week_start_date + timedelta(days=i)
         date_str = current_date.strftime("%Y-%m-%d")
-        display_date = day_names[i]  # Use German day names
+        display_date = TIMESHEET_DAY_NAMES[i]  # Use German day names
         
         row = [display_date, "", "", "", "", ""]  # Default empty row
         
@@ -1012,15 +2001,9 @@ def generate_timesheet_pdf(timesheet: WeeklyTimesheet) -> bytes:
             entry = entries_by_date[date_str]
             
             # Check for absence type (Urlaub, Krankheit, Feiertag)
-            absence_labels = {
-                "urlaub": "Urlaub",
-                "krankheit": "Krankheit",
-                "feiertag": "Feiertag"
-            }
-            
-            if entry.absence_type and entry.absence_type in absence_labels:
+            if entry.absence_type and entry.absence_type in TIMESHEET_ABSENCE_LABELS:
                 # Show absence type in description
-                row[4] = absence_labels[entry.absence_type]
+                row[4] = TIMESHEET_ABSENCE_LABELS[entry.absence_type]
                 if entry.tasks:
                     row[4] += f" - {entry.tasks}"
                 # No times shown for absence days
@@ -1071,35 +2054,7 @@ def generate_timesheet_pdf(timesheet: WeeklyTimesheet) -> bytes:
     col_widths = [page_width*0.15, page_width*0.15, page_width*0.15, page_width*0.1, page_width*0.3, page_width*0.15]
     main_table = Table(table_data, colWidths=col_widths)
     
-    # Style the table according to template
-    main_table.setStyle(TableStyle([
-        # Header row
-        ('BACKGROUND', (0, 0), (-1, 0), light_gray),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-        
-        # Data rows
-        ('FONTNAME', (0, 1), (-1, -2), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -2), 9),
-        ('ALIGN', (0, 1), (-1, -2), 'CENTER'),
-        ('ALIGN', (4, 1), (4, -2), 'LEFT'),  # Description column left-aligned
-        
-        # Total row
-        ('BACKGROUND', (0, -1), (-1, -1), light_gray),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, -1), (-1, -1), 10),
-        ('ALIGN', (0, -1), (-1, -1), 'CENTER'),
-        
-        # All cells
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 5),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 5),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-    ]))
+    main_table.setStyle(TIMESHEET_MAIN_TABLE_STYLE)
     
     story.append(main_table)
     story.append(Spacer(1, 20))
@@ -1110,13 +2065,7 @@ def generate_timesheet_pdf(timesheet: WeeklyTimesheet) -> bytes:
         [f"Mitarbeiter: {timesheet.user_name}", "Unterschrift Mitarbeiter: ______________________"]
     ], colWidths=[page_width*0.5, page_width*0.5])
     
-    signature_table.setStyle(TableStyle([
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('TEXTCOLOR', (0, 0), (-1, -1), dark_gray),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('TOPPADDING', (0, 0), (-1, -1), 10),
-    ]))
+    signature_table.setStyle(TIMESHEET_SIGNATURE_TABLE_STYLE)
     
     story.append(signature_table)
     
@@ -1127,51 +2076,23 @@ def generate_timesheet_pdf(timesheet: WeeklyTimesheet) -> bytes:
 def generate_accounting_report_pdf(stats_response: AccountingStatsResponse) -> bytes:
     """Generate PDF report for accounting with detailed monthly statistics"""
     buffer = io.BytesIO()
-    from reportlab.lib.pagesizes import A4, landscape
-    doc = SimpleDocTemplate(buffer, pagesize=landscape(A4), rightMargin=20, leftMargin=20, topMargin=20, bottomMargin=20)
+    doc = SimpleDocTemplate(buffer, pagesize=PDF_PAGE_SIZE, rightMargin=20, leftMargin=20, topMargin=20, bottomMargin=20)
     
     # Company colors
-    company_red = colors.Color(233/255, 1/255, 24/255)  # #e90118
-    light_gray = colors.Color(179/255, 179/255, 181/255)  # #b3b3b5
-    dark_gray = colors.Color(90/255, 90/255, 90/255)     # #5a5a5a
+    light_gray = PDF_LIGHT_GRAY
     
     story = []
     
     # Page width for layout calculations
-    page_width = landscape(A4)[0] - 40  # minus margins
-    
-    from reportlab.platypus import Paragraph
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    styles = getSampleStyleSheet()
-    
-    # Title style
-    title_style = ParagraphStyle(
-        'Title',
-        parent=styles['Heading1'],
-        fontSize=20,
-        textColor=dark_gray,
-        alignment=1,  # Center
-        spaceAfter=20
-    )
+    page_width = PDF_PAGE_WIDTH
     
     # Add title
     month_date = datetime.strptime(f"{stats_response.month}-01", "%Y-%m-%d")
     month_name = month_date.strftime("%B %Y")
-    story.append(Paragraph(f"<b>BUCHHALTUNGSBERICHT - {month_name}</b>", title_style))
+    story.append(Paragraph(f"<b>BUCHHALTUNGSBERICHT - {month_name}</b>", PDF_STYLES["title"]))
     
     # Add company header info
-    company_style = ParagraphStyle(
-        'CompanyInfo',
-        parent=styles['Normal'],
-        fontSize=8,
-        textColor=dark_gray,
-        alignment=2,  # Right align
-    )
-    
-    company_info = f"""<b>Byte Commander</b><br/>
-    Tick Guard - Zeiterfassung & Reisekosten"""
-    
-    story.append(Paragraph(company_info, company_style))
+    story.append(Paragraph(PDF_COMPANY_INFO, PDF_STYLES["company"]))
     story.append(Spacer(1, 20))
     
     # Main statistics table
@@ -1275,14 +2196,6 @@ def generate_accounting_report_pdf(stats_response: AccountingStatsResponse) -> b
     story.append(Spacer(1, 20))
     
     # Add explanation
-    explanation_style = ParagraphStyle(
-        'Explanation',
-        parent=styles['Normal'],
-        fontSize=8,
-        textColor=dark_gray,
-        alignment=0,  # Left align
-    )
-    
     explanation = """
     <b>Erklärung:</b><br/>
     • <b>Monatsgesamtstunden:</b> Alle Stunden inkl. Fahrzeit (wie in Datenbank gespeichert)<br/>
@@ -1293,19 +2206,11 @@ def generate_accounting_report_pdf(stats_response: AccountingStatsResponse) -> b
     • <b>Reisekosten:</b> Gesamte Reisekosten in Euro (Spesen, Bahntickets, etc.)
     """
     
-    story.append(Paragraph(explanation, explanation_style))
+    story.append(Paragraph(explanation, PDF_STYLES["explanation"]))
     story.append(Spacer(1, 20))
     
     # Add date
-    date_style = ParagraphStyle(
-        'Date',
-        parent=styles['Normal'],
-        fontSize=9,
-        textColor=dark_gray,
-        alignment=2,  # Right align
-    )
-    
-    story.append(Paragraph(f"Erstellt am: {datetime.now().strftime('%d.%m.%Y %H:%M Uhr')}", date_style))
+    story.append(Paragraph(f"Erstellt am: {datetime.now().strftime('%d.%m.%Y %H:%M Uhr')}", PDF_STYLES["date"]))
     
     doc.build(story)
     buffer.seek(0)
@@ -1371,7 +2276,8 @@ async def login(request: Request, user_login: UserLogin):
         if not totp.verify(user_login.otp, valid_window=1):
             raise HTTPException(status_code=401, detail="Invalid 2FA code")
         # Auto-enable 2FA if secret exists and code is valid
-        await db.users.update_one({"id": user["id"]}, {"$set": {"two_fa_enabled": True}})
+        await db.users.update_one({"id": user["id"]}, {"$set": {"two_fa_enabled": True}, "$inc": {"version": 1}})
+        user_cache.invalidate(user_id=user["id"], email=user["email"])
     else:
         # Normal 2FA verification
         totp = pyotp.TOTP(user["two_fa_secret"])
@@ -1476,7 +2382,8 @@ async def update_user(user_id: str, user_update: UserUpdate, current_user: User
         update_data["is_admin"] = user_update.is_admin
     
     if update_data:
-        await db.users.update_one({"id": user_id}, {"$set": update_data})
+        await db.users.update_one({"id": user_id}, {"$set": update_data, "$inc": {"version": 1}})
+        user_cache.invalidate(user_id=user_id, email=user.get("email"))
     
     return {"message": "User updated successfully"}
 
@@ -1504,7 +2411,9 @@ async def delete_user(user_id: str, current_user: User = Depends(get_admin_user)
     
     # Delete user and their timesheets
     await db.users.delete_one({"id": user_id})
+    user_cache.invalidate(user_id=user_id, email=user.get("email"))
     await db.timesheets.delete_many({"user_id": user_id})
+    await db.monthly_user_rollups.delete_many({"user_id": user_id})
     
     return {"message": "User and associated timesheets deleted successfully"}
 
@@ -1798,8 +2707,9 @@ async def change_password(password_change: PasswordChange, current_user: User =
     new_hashed_password = get_password_hash(password_change.new_password)
     await db.users.update_one(
         {"id": current_user.id}, 
-        {"$set": {"hashed_password": new_hashed_password}}
+        {"$set": {"hashed_password": new_hashed_password}, "$inc": {"version": 1}}
     )
+    user_cache.invalidate(user_id=current_user.id, email=current_user.email)
     
     return {"message": "Password changed successfully"}
 
@@ -1847,7 +2757,8 @@ async def setup_two_fa(current_user: User = Depends(get_current_user)):
     else:
         # Generate new secret if none exists
         secret = pyotp.random_base32()
-        await db.users.update_one({"id": current_user.id}, {"$set": {"two_fa_secret": secret}})
+        await db.users.update_one({"id": current_user.id}, {"$set": {"two_fa_secret": secret}, "$inc": {"version": 1}})
+        user_cache.invalidate(user_id=current_user.id, email=current_user.email)
     
     issuer = COMPANY_INFO["name"]
     otpauth_uri = pyotp.totp.TOTP(secret).provisioning_uri(name=current_user.email, issuer_name=issuer)
@@ -1873,7 +2784,7 @@ async def initial_setup_2fa(payload: TwoFAVerify):
         # Generate secret if not exists
         if not user.get("two_fa_secret"):
             secret = pyotp.random_base32()
-            await db.users.update_one({"id": user["id"]}, {"$set": {"two_fa_secret": secret}})
+            await db.users.update_one({"id": user["id"]}, {"$set": {"two_fa_secret": secret}, "$inc": {"version": 1}})
             user["two_fa_secret"] = secret
         
         # Verify the OTP code
@@ -1882,7 +2793,8 @@ async def initial_setup_2fa(payload: TwoFAVerify):
             raise HTTPException(status_code=401, detail="Invalid 2FA code")
         
         # Enable 2FA and issue access token
-        await db.users.update_one({"id": user["id"]}, {"$set": {"two_fa_enabled": True}})
+        await db.users.update_one({"id": user["id"]}, {"$set": {"two_fa_enabled": True}, "$inc": {"version": 1}})
+        user_cache.invalidate(user_id=user["id"], email=user["email"])
         
         # Return QR code URI for user to scan
         issuer = COMPANY_INFO["name"]
@@ -1927,7 +2839,7 @@ async def get_setup_qr(setup_token: str):
         # Generate secret if not exists
         if not user.get("two_fa_secret"):
             secret = pyotp.random_base32()
-            await db.users.update_one({"id": user["id"]}, {"$set": {"two_fa_secret": secret}})
+            await db.users.update_one({"id": user["id"]}, {"$set": {"two_fa_secret": secret}, "$inc": {"version": 1}})
             user["two_fa_secret"] = secret
         
         issuer = COMPANY_INFO["name"]
@@ -1948,13 +2860,15 @@ async def enable_two_fa(verification: TwoFAVerify, current_user: User = Depends(
     totp = pyotp.TOTP(user["two_fa_secret"])
     if not totp.verify(verification.otp, valid_window=1):
         raise HTTPException(status_code=401, detail="Invalid 2FA code")
-    await db.users.update_one({"id": current_user.id}, {"$set": {"two_fa_enabled": True}})
+    await db.users.update_one({"id": current_user.id}, {"$set": {"two_fa_enabled": True}, "$inc": {"version": 1}})
+    user_cache.invalidate(user_id=current_user.id, email=current_user.email)
     return {"message": "2FA enabled"}
 
 @api_router.post("/auth/2fa/disable")
 async def disable_two_fa(current_user: User = Depends(get_admin_user)):
     """Disable 2FA - only allowed for admins (2FA is mandatory for all users)"""
-    await db.users.update_one({"id": current_user.id}, {"$set": {"two_fa_enabled": False, "two_fa_secret": None}})
+    await db.users.update_one({"id": current_user.id}, {"$set": {"two_fa_enabled": False, "two_fa_secret": None}, "$inc": {"version": 1}})
+    user_cache.invalidate(user_id=current_user.id, email=current_user.email)
     return {"message": "2FA disabled (admin only)"}
 
 # Stats: total sent hours per user per month (YYYY-MM)
@@ -1967,59 +2881,14 @@ async def get_monthly_stats(month: str, current_user: User = Depends(get_current
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid month format. Use YYYY-MM")
 
-    # Query only sent or approved timesheets for stats (but only approved count as working hours)
-    query = {"status": {"$in": ["sent", "approved"]}}
-    if not current_user.can_view_all_data():
-        query["user_id"] = current_user.id
-
-    ts = await db.timesheets.find(query).to_list(5000)
-    
-    # Get all users to access weekly_hours
-    all_users = await db.users.find({}).to_list(1000)
-    users_by_id = {u["id"]: u for u in all_users}
-
-    # Aggregate hours per user für den Monat – NUR unterschriebene (hochgeladene) und freigegebene Stundenzettel zählen
+    # Stunden aus den Monats-Rollups – NUR unterschriebene (hochgeladene) und freigegebene Stundenzettel zählen
     # (Anforderung: Stunden werden ausschließlich anhand vom Kunden unterzeichneter und hochgeladener PDFs erfasst)
-    user_totals: Dict[str, Dict[str, Any]] = {}
-    for t in ts:
-        user_id = t.get("user_id")
-        user_name = t.get("user_name", "")
-        entries = t.get("entries", [])
-        timesheet_status = t.get("status", "draft")
-        # Nur zählen, wenn unterschriebener Stundenzettel vorhanden ist
-        if not t.get("signed_pdf_path"):
-            continue
-        
-        # Only count approved timesheets as working hours
-        if timesheet_status != "approved":
-            continue
-            
-        user = users_by_id.get(user_id, {})
-        weekly_hours = user.get("weekly_hours", 40.0)
-        hours_per_day = weekly_hours / 5.0  # Calculate hours per working day (assuming 5-day week)
-        
-        monthly_hours = 0.0
-        for e in entries:
-            try:
-                # Works with dict entries or already validated
-                e_date = e.get("date") if isinstance(e, dict) else e.date
-                if _date_in_year_month(e_date, year, mon):
-                    entry_obj = e if isinstance(e, dict) else e.model_dump()
-                    te = TimeEntry(**entry_obj)
-                    
-                    # Check for absence (Urlaub, Krankheit, Feiertag) - add hours per day
-                    if te.absence_type and te.absence_type in ["urlaub", "krankheit", "feiertag"]:
-                        monthly_hours += hours_per_day
-                    else:
-                        # Regular working hours (always includes travel time for approved timesheets)
-                        monthly_hours += _entry_hours(te)
-            except Exception:
-                continue
-        if monthly_hours <= 0:
-            continue
-        if user_id not in user_totals:
-            user_totals[user_id] = {"user_name": user_name, "total_hours": 0.0}
-        user_totals[user_id]["total_hours"] += monthly_hours
+    rollups = await load_monthly_rollups(year, mon, None if current_user.can_view_all_data() else current_user.id)
+    user_totals: Dict[str, Dict[str, Any]] = {
+        r["user_id"]: {"user_name": r["user_name"], "total_hours": r["total_hours"]}
+        for r in rollups
+        if r["total_hours"] > 0
+    }
 
     stats: List[MonthlyUserStat] = []
     for uid, data in user_totals.items():
@@ -2043,49 +2912,12 @@ async def get_monthly_rank(month: str, current_user: User = Depends(get_current_
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid month format. Use YYYY-MM")
 
-    # All sent or approved timesheets
-    ts = await db.timesheets.find({"status": {"$in": ["sent", "approved"]}}).to_list(5000)
-
-    # Get all users to access weekly_hours
-    all_users = await db.users.find({}).to_list(1000)
-    users_by_id = {u["id"]: u for u in all_users}
-    
-    # Aggregate totals per user – nur unterschriebene (hochgeladene) und freigegebene Stundenzettel zählen
-    totals: Dict[str, float] = {}
-    names: Dict[str, str] = {}
-    for t in ts:
-        timesheet_status = t.get("status", "draft")
-        # Nur zählen, wenn unterschriebener Stundenzettel vorhanden ist
-        if not t.get("signed_pdf_path"):
-            continue
-        # Only count approved timesheets
-        if timesheet_status != "approved":
-            continue
-            
-        uid = t.get("user_id")
-        names[uid] = t.get("user_name", names.get(uid, ""))
-        entries = t.get("entries", [])
-        user = users_by_id.get(uid, {})
-        weekly_hours = user.get("weekly_hours", 40.0)
-        hours_per_day = weekly_hours / 5.0
-        
-        hours = 0.0
-        for e in entries:
-            try:
-                e_date = e.get("date") if isinstance(e, dict) else e.date
-                if _date_in_year_month(e_date, year, mon):
-                    entry_obj = e if isinstance(e, dict) else e.model_dump()
-                    te = TimeEntry(**entry_obj)
-                    
-                    # Check for absence - add hours per day
-                    if te.absence_type and te.absence_type in ["urlaub", "krankheit", "feiertag"]:
-                        hours += hours_per_day
-                    else:
-                        hours += _entry_hours(te)
-            except Exception:
-                continue
-        if hours > 0:
-            totals[uid] = totals.get(uid, 0.0) + hours
+    # Totals per user aus den Monats-Rollups – nur unterschriebene (hochgeladene) und freigegebene Stundenzettel zählen
+    totals: Dict[str, float] = {
+        r["user_id"]: r["total_hours"]
+        for r in await load_monthly_rollups(year, mon)
+        if r["total_hours"] > 0
+    }
 
     # Ensure current user present (with 0 if none)
     seen_users = set(totals.keys())
@@ -2119,161 +2951,9 @@ async def get_accounting_monthly_stats(month: str, current_user: User = Depends(
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid month format. Use YYYY-MM")
 
-    # Get all timesheets (all statuses for accounting view)
-    ts = await db.timesheets.find({}).to_list(5000)
-    
-    # Get all travel expenses for the month
-    travel_expenses = []
-    async for expense in db.travel_expenses.find({}):
-        exp_date = expense.get("date", "")
-        if _date_in_year_month(exp_date, year, mon):
-            travel_expenses.append(expense)
-    
-    # Get all users to access weekly_hours for absence calculation
-    all_users = await db.users.find({}).to_list(1000)
-    users_by_id = {u["id"]: u for u in all_users}
-
-    # Aggregate detailed statistics per user
-    user_stats: Dict[str, Dict[str, Any]] = {}
-    timesheets_by_user: Dict[str, set] = {}  # Track unique timesheets per user
-    
-    for t in ts:
-        user_id = t.get("user_id")
-        user_name = t.get("user_name", "")
-        entries = t.get("entries", [])
-        timesheet_id = t.get("id")
-        
-        # Initialize user stats if needed
-        if user_id not in user_stats:
-            user_stats[user_id] = {
-                "user_name": user_name,
-                "total_hours": 0.0,
-                "hours_on_timesheets": 0.0,
-                "travel_hours": 0.0,
-                "travel_hours_on_timesheets": 0.0,
-                "travel_kilometers": 0.0,
-                "travel_expenses": 0.0,
-                "timesheets_count": 0
-            }
-            timesheets_by_user[user_id] = set()
-        
-        monthly_total_hours = 0.0  # Alle Stunden inkl. Fahrzeit (DB)
-        monthly_hours_on_timesheets = 0.0  # Stunden die auf PDF erscheinen
-        monthly_travel_hours = 0.0  # Gesamte Fahrzeit
-        monthly_travel_hours_on_timesheets = 0.0  # Fahrzeit die auf PDF erscheint
-        has_entries_in_month = False
-        
-        for e in entries:
-            try:
-                e_date = e.get("date") if isinstance(e, dict) else e.date
-                if _date_in_year_month(e_date, year, mon):
-                    has_entries_in_month = True
-                    entry_obj = e if isinstance(e, dict) else e.model_dump()
-                    te = TimeEntry(**entry_obj)
-                    
-                    user = users_by_id.get(user_id, {})
-                    weekly_hours = user.get("weekly_hours", 40.0)
-                    hours_per_day = weekly_hours / 5.0  # Hours per working day
-                    
-                    # Check for absence (Urlaub, Krankheit, Feiertag)
-                    if te.absence_type and te.absence_type in ["urlaub", "krankheit", "feiertag"]:
-                        # Absence days count as full working day hours (only for approved timesheets)
-                        absence_hours = hours_per_day
-                        monthly_total_hours += absence_hours
-                        monthly_hours_on_timesheets += 0.0  # Absence doesn't appear as hours on timesheet
-                    else:
-                        # Calculate all hours (always includes travel time for DB)
-                        total_entry_hours = _entry_hours(te)
-                        monthly_total_hours += total_entry_hours
-                        
-                        # Calculate hours that appear on timesheet (only if include_travel_time=True)
-                        hours_on_timesheet = 0.0
-                        if te.start_time and te.end_time:
-                            try:
-                                sh, sm = map(int, te.start_time.split(":"))
-                                eh, em = map(int, te.end_time.split(":"))
-                                start = sh * 60 + sm
-                                end = eh * 60 + em
-                                worked = max(0, end - start - int(te.break_minutes))
-                                hours_on_timesheet = max(0.0, worked / 60.0)
-                            except Exception:
-                                pass
-                        
-                        # Add travel time to timesheet hours only if checkbox is checked
-                        travel_hours = (te.travel_time_minutes or 0) / 60.0
-                        monthly_travel_hours += travel_hours
-                        
-                        if te.include_travel_time and travel_hours > 0:
-                            hours_on_timesheet += travel_hours
-                            monthly_travel_hours_on_timesheets += travel_hours
-                        
-                        monthly_hours_on_timesheets += hours_on_timesheet
-                    
-            except Exception:
-                continue
-        
-        # Track this timesheet if it has entries in the month
-        if has_entries_in_month:
-            timesheets_by_user[user_id].add(timesheet_id)
-        
-        # Add hours to user stats – nur unterschriebene (hochgeladene) UND freigegebene Stundenzettel zählen
-        timesheet_status = t.get("status", "draft")
-        if (
-            timesheet_status == "approved"
-            and t.get("signed_pdf_path")
-            and (monthly_total_hours > 0 or has_entries_in_month)
-        ):
-            user_stats[user_id]["total_hours"] += monthly_total_hours
-            user_stats[user_id]["hours_on_timesheets"] += monthly_hours_on_timesheets
-            user_stats[user_id]["travel_hours"] += monthly_travel_hours
-            user_stats[user_id]["travel_hours_on_timesheets"] += monthly_travel_hours_on_timesheets
-    
-    # Aggregate travel expenses per user for the month
-    for expense in travel_expenses:
-        user_id = expense.get("user_id")
-        expense_status = expense.get("status", "draft")
-        
-        # Only count approved expenses
-        if expense_status == "approved":
-            if user_id not in user_stats:
-                # Initialize if user has expenses but no timesheets
-                user_name = expense.get("user_name", "")
-                user_stats[user_id] = {
-                    "user_name": user_name,
-                    "total_hours": 0.0,
-                    "hours_on_timesheets": 0.0,
-                    "travel_hours": 0.0,
-                    "travel_hours_on_timesheets": 0.0,
-                    "travel_kilometers": 0.0,
-                    "travel_expenses": 0.0,
-                    "timesheets_count": 0
-                }
-            
-            user_stats[user_id]["travel_kilometers"] += expense.get("kilometers", 0.0)
-            user_stats[user_id]["travel_expenses"] += expense.get("expenses", 0.0)
-    
-    # Set timesheets count from tracked sets
-    for user_id in user_stats:
-        user_stats[user_id]["timesheets_count"] = len(timesheets_by_user.get(user_id, set()))
-
-    stats: List[AccountingMonthlyStat] = []
-    for uid, data in user_stats.items():
-        stats.append(AccountingMonthlyStat(
-            user_id=uid,
-            user_name=data["user_name"],
-            month=month,
-            total_hours=round(data["total_hours"], 2),
-            hours_on_timesheets=round(data["hours_on_timesheets"], 2),
-            travel_hours=round(data["travel_hours"], 2),
-            travel_kilometers=round(data.get("travel_kilometers", 0.0), 2),
-            travel_expenses=round(data.get("travel_expenses", 0.0), 2),
-            travel_hours_on_timesheets=round(data["travel_hours_on_timesheets"], 2),
-            timesheets_count=data["timesheets_count"]
-        ))
-
-    # Sort by user_name
-    stats.sort(key=lambda s: s.user_name.lower())
-    return AccountingStatsResponse(month=month, stats=stats)
+    # Aggregation läuft komplett in MongoDB (Stundenzettel des Monats + Reisekosten per Datumsbereich)
+    rows = await aggregate_accounting_stats(year, mon)
+    return _accounting_stats_response(month, rows)
 
 @api_router.get("/accounting/timesheets-list")
 async def get_accounting_timesheets_list(
@@ -2368,6 +3048,8 @@ async def approve_timesheet(timesheet_id: str, current_user: User = Depends(get_
         {"id": timesheet_id},
         {"$set": {"status": "approved"}}
     )
+    await refresh_timesheet_rollups(timesheet_id)
+    await retention_manager.refresh_expiry("timesheets", timesheet_id)
     
     return {
         "message": "Timesheet approved successfully (Ausnahmefall)",
@@ -2391,6 +3073,8 @@ async def reject_timesheet(timesheet_id: str, current_user: User = Depends(get_a
         {"id": timesheet_id},
         {"$set": {"status": "sent"}}
     )
+    await refresh_timesheet_rollups(timesheet_id)
+    await retention_manager.refresh_expiry("timesheets", timesheet_id)
     
     return {"message": "Timesheet rejected successfully"}
 
@@ -2483,10 +3167,14 @@ async def create_timesheet(timesheet_create: WeeklyTimesheetCreate, current_user
         week_start=timesheet_create.week_start,
         week_end=week_end.strftime("%Y-%m-%d"),
         week_vehicle_id=selected_week_vehicle_id,
-        entries=processed_entries
+        entries=processed_entries,
+        pdf_sequence=await allocate_pdf_sequence(current_user.id, timesheet_create.week_start)
     )
     
-    await db.timesheets.insert_one(timesheet.dict())
+    timesheet_dict = timesheet.dict()
+    timesheet_dict["expires_at"] = compute_expires_at(timesheet.status, timesheet.created_at)
+    await db.timesheets.insert_one(timesheet_dict)
+    await refresh_timesheet_rollups(timesheet.id)
     return timesheet
 
 @api_router.get("/timesheets", response_model=List[WeeklyTimesheet])
@@ -2540,6 +3228,10 @@ async def update_timesheet(timesheet_id: str, timesheet_update: TimesheetUpdate,
         week_end = week_start + timedelta(days=6)
         update_data["week_start"] = timesheet_update.week_start
         update_data["week_end"] = week_end.strftime("%Y-%m-%d")
+        # Neue Kalenderwoche -> neue fortlaufende Nummer beim nächsten PDF
+        previous_week = datetime.strptime(timesheet["week_start"], "%Y-%m-%d").isocalendar()[:2]
+        if week_start.isocalendar()[:2] != previous_week:
+            update_data["pdf_sequence"] = None
     
     vehicle_cache: Dict[str, Dict[str, Any]] = {}
     week_vehicle_id = timesheet.get("week_vehicle_id")
@@ -2596,6 +3288,7 @@ async def update_timesheet(timesheet_id: str, timesheet_update: TimesheetUpdate,
     
     if update_data:
         await db.timesheets.update_one({"id": timesheet_id}, {"$set": update_data})
+        await refresh_timesheet_rollups(timesheet_id)
     
     updated_timesheet = await db.timesheets.find_one({"id": timesheet_id})
     if not updated_timesheet:
@@ -2624,6 +3317,8 @@ async def delete_timesheet(timesheet_id: str, current_user: User = Depends(get_c
     
     # Delete timesheet
     await db.timesheets.delete_one({"id": timesheet_id})
+    await unregister_upload_hashes({"timesheet_id": timesheet_id})
+    await refresh_timesheet_rollups(timesheet_id)
     
     return {"message": "Timesheet deleted successfully"}
 
@@ -2713,17 +3408,10 @@ async def download_and_email_timesheet(
     # Generate new filename format
     filename = await generate_pdf_filename(timesheet_obj, timesheet_obj.user_name)
     
-    # Send email copy to admin (if SMTP configured)
+    # Send email copy to admin (if SMTP configured) - wird nur in die Outbox gelegt
     try:
         smtp_config = await db.smtp_config.find_one()
         if smtp_config:
-            # Send email with PDF attachment
-            msg = MIMEMultipart()
-            msg['From'] = smtp_config["smtp_username"]
-            msg['To'] = current_user.email
-            msg['Cc'] = smtp_config["admin_email"]
-            msg['Subject'] = f"Stundenzettel Download - {timesheet_obj.user_name} - {get_calendar_week(timesheet_obj.week_start)}"
-            
             body = f"""
             Hallo {current_user.name},
             
@@ -2736,38 +3424,19 @@ async def download_and_email_timesheet(
             {COMPANY_INFO["name"]}
             """
             
-            msg.attach(MIMEText(body, 'plain', 'utf-8'))
-            
-            # Attach PDF with new filename
-            part = MIMEBase('application', 'octet-stream')
-            part.set_payload(pdf_bytes)
-            encoders.encode_base64(part)
-            part.add_header(
-                'Content-Disposition',
-                f'attachment; filename={filename}'
-            )
-            msg.attach(part)
-            
-            # Send email
-            server = smtplib.SMTP(smtp_config["smtp_server"], smtp_config["smtp_port"])
-            server.starttls()
-            server.login(smtp_config["smtp_username"], smtp_config["smtp_password"])
-            
-            recipients = [current_user.email, smtp_config["admin_email"]]
-            text = msg.as_string()
-            server.sendmail(smtp_config["smtp_username"], recipients, text.encode('utf-8'))
-            server.quit()
-            
-            print(f"Email sent successfully to {recipients}")
-            
-            # Update timesheet status to "sent" after successful email
-            await db.timesheets.update_one(
-                {"id": timesheet_id},
-                {"$set": {"status": "sent"}}
+            # Status "sent" wird nach erfolgreicher Zustellung gesetzt (on_sent)
+            await mail_outbox.enqueue(
+                to=[current_user.email],
+                cc=[smtp_config["admin_email"]],
+                subject=f"Stundenzettel Download - {timesheet_obj.user_name} - {get_calendar_week(timesheet_obj.week_start)}",
+                body=body,
+                attachments=[(filename, pdf_bytes)],
+                on_sent={"hook": "timesheet_sent", "timesheet_id": timesheet_id},
+                context={"type": "timesheet_download", "timesheet_id": timesheet_id}
             )
     
     except Exception as e:
-        print(f"Email sending failed (continuing with download): {str(e)}")
+        logger.warning(f"Email enqueue failed (continuing with download): {str(e)}")
         # Continue with download even if email fails
     
     # Return PDF for download with new filename
@@ -2805,15 +3474,7 @@ async def send_timesheet_email(timesheet_id: str, current_user: User = Depends(g
     timesheet_obj = WeeklyTimesheet(**timesheet)
     pdf_bytes = generate_timesheet_pdf(timesheet_obj)
     
-    # Send email
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = smtp_config["smtp_username"]
-        msg['To'] = current_user.email
-        msg['Cc'] = smtp_config["admin_email"]
-        msg['Subject'] = f"Stundenzettel - {timesheet_obj.user_name} - Woche {timesheet_obj.week_start}"
-        
-        body = f"""
+    body = f"""
         Hallo {timesheet_obj.user_name},
         
         anbei finden Sie Ihren Stundenzettel für die Woche vom {timesheet_obj.week_start} bis {timesheet_obj.week_end}.
@@ -2821,46 +3482,28 @@ async def send_timesheet_email(timesheet_id: str, current_user: User = Depends(g
         Mit freundlichen Grüßen
         {COMPANY_INFO["name"]}
         """
-        
-        msg.attach(MIMEText(body, 'plain', 'utf-8'))
-        
-        # Attach PDF with new filename
-        filename = await generate_pdf_filename(timesheet_obj, timesheet_obj.user_name)
-        part = MIMEBase('application', 'octet-stream')
-        part.set_payload(pdf_bytes)
-        encoders.encode_base64(part)
-        part.add_header(
-            'Content-Disposition',
-            f'attachment; filename={filename}'
-        )
-        msg.attach(part)
-        
-        # Send email
-        server = smtplib.SMTP(smtp_config["smtp_server"], smtp_config["smtp_port"])
-        server.starttls()
-        server.login(smtp_config["smtp_username"], smtp_config["smtp_password"])
-        
-        recipients = [current_user.email, smtp_config["admin_email"]]
-        text = msg.as_string()
-        server.sendmail(smtp_config["smtp_username"], recipients, text.encode('utf-8'))
-        server.quit()
-        
-        # Update timesheet status to "sent" regardless of email success
-        # (User initiated send action, so we mark it as sent)
-        await db.timesheets.update_one(
-            {"id": timesheet_id},
-            {"$set": {"status": "sent"}}
-        )
-        
-        return {"message": "Email sent successfully"}
+    filename = await generate_pdf_filename(timesheet_obj, timesheet_obj.user_name)
     
-    except Exception as e:
-        # Even if email fails, mark as sent since user initiated the action
-        await db.timesheets.update_one(
-            {"id": timesheet_id},
-            {"$set": {"status": "sent"}}
-        )
-        raise HTTPException(status_code=500, detail=f"Failed to send email: {str(e)}")
+    # E-Mail in die Outbox legen, der Hintergrund-Sender stellt sie zu
+    outbox_id = await mail_outbox.enqueue(
+        to=[current_user.email],
+        cc=[smtp_config["admin_email"]],
+        subject=f"Stundenzettel - {timesheet_obj.user_name} - Woche {timesheet_obj.week_start}",
+        body=body,
+        attachments=[(filename, pdf_bytes)],
+        context={"type": "timesheet_email", "timesheet_id": timesheet_id}
+    )
+    
+    # Update timesheet status to "sent" regardless of email success
+    # (User initiated send action, so we mark it as sent)
+    await db.timesheets.update_one(
+        {"id": timesheet_id},
+        {"$set": {"status": "sent"}}
+    )
+    await refresh_timesheet_rollups(timesheet_id)
+    await retention_manager.refresh_expiry("timesheets", timesheet_id)
+    
+    return {"message": "Email queued for delivery", "outbox_id": outbox_id}
 
 @limiter.limit("10/hour")  # Max 10 Uploads pro Stunde
 @api_router.post("/timesheets/{timesheet_id}/upload-signed")
@@ -2892,15 +3535,6 @@ async def upload_signed_timesheet(
     if not file.filename or not file.filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Nur PDF-Dateien sind erlaubt")
     
-    # Read file contents
-    contents = await file.read()
-    if len(contents) == 0:
-        raise HTTPException(status_code=400, detail="Datei ist leer")
-    
-    # Validate file size (max 10MB)
-    if len(contents) > 10 * 1024 * 1024:
-        raise HTTPException(status_code=400, detail="Datei zu groß (max 10MB)")
-    
     # Create safe filename
     safe_filename = "".join(c for c in file.filename if c.isalnum() or c in (' ', '-', '_', '.')).strip()
     if not safe_filename:
@@ -2921,30 +3555,33 @@ async def upload_signed_timesheet(
     filename = f"{timesheet_id}_signed_{timestamp}_{safe_filename}"
     local_file_path = timesheet_folder_path / filename
     
+    # Streaming-Upload, verschlüsselt gespeichert (DSGVO Art. 32, max 10MB)
+    upload = await ingest_encrypted_upload(
+        file, local_file_path,
+        too_large_detail="Datei zu groß (max 10MB)",
+        empty_detail="Datei ist leer",
+        error_detail="Verschlüsselung fehlgeschlagen"
+    )
+    
+    # Duplikatsprüfung über das Beleg-Register, bevor der Dokumenten-Agent Zeit investiert
+    existing = await register_upload_hash(
+        upload, "signed_timesheet", current_user.id, file.filename, timesheet_id=timesheet_id
+    )
+    if existing:
+        await reject_duplicate_upload(
+            upload, existing, current_user,
+            f"Diese Datei wurde bereits hochgeladen (Stundenzettel {existing.get('timesheet_id')})"
+        )
+    
     try:
-        # Save file to local storage (DSGVO-compliant)
-        with open(local_file_path, 'wb') as f:
-            f.write(contents)
-        
-        # DSGVO Art. 32: Encrypt sensitive data
-        data_encryption.encrypt_file(local_file_path)
-        
-        # Verify file is encrypted
-        try:
-            data_encryption.decrypt_file(local_file_path)
-        except Exception as e:
-            logging.error(f"File encryption verification failed: {e}")
-            local_file_path.unlink()
-            raise HTTPException(status_code=500, detail="Verschlüsselung fehlgeschlagen")
-        
         # Verifiziere unterschriebenes PDF mit Dokumenten-Agent (Heuristik basierend auf PDF-Text)
         # Wenn Agent Unterschrift verifiziert, wird automatisch als Arbeitszeit gutgeschrieben (approved)
         try:
-            from agents import DocumentAgent, OllamaLLM
-            llm = OllamaLLM()
-            doc_agent = DocumentAgent(llm)
+            doc_agent = (await get_agent_orchestrator()).document_agent
             # Extrahiere Text (mit Entschlüsselung)
-            pdf_text = doc_agent.extract_pdf_text(str(local_file_path), encryption=data_encryption)
+            pdf_text = await asyncio.to_thread(
+                doc_agent.extract_pdf_text, str(local_file_path), encryption=data_encryption
+            )
             import re as _re
             verified = False
             notes = ""
@@ -2976,6 +3613,8 @@ async def upload_signed_timesheet(
                 }
             }
         )
+        await refresh_timesheet_rollups(timesheet_id)
+        await retention_manager.refresh_expiry("timesheets", timesheet_id)
         
         # Audit log
         audit_logger.log_access(
@@ -2986,16 +3625,13 @@ async def upload_signed_timesheet(
             details={"filename": safe_filename, "local_path": str(local_file_path), "encrypted": True}
         )
 
-        # Push-Benachrichtigung an Buchhaltung
-        try:
-            await notify_role(
-                role="accounting",
-                title="Unterschriebener Stundenzettel hochgeladen",
-                body=f"{timesheet.get('user_name', 'User')} Woche {timesheet.get('week_start', '')}",
-                data={"type": "timesheet_signed_upload", "timesheet_id": timesheet_id}
-            )
-        except Exception as e:
-            logging.warning(f"Push notify (timesheet upload) failed: {e}")
+        # Push-Benachrichtigung an Buchhaltung (im Hintergrund, Antwort wartet nicht auf die Zustellung)
+        push_dispatcher.dispatch(notify_role(
+            role="accounting",
+            title="Unterschriebener Stundenzettel hochgeladen",
+            body=f"{timesheet.get('user_name', 'User')} Woche {timesheet.get('week_start', '')}",
+            data={"type": "timesheet_signed_upload", "timesheet_id": timesheet_id}
+        ))
         
         # Get all accounting users
         accounting_users = await db.users.find({"role": "accounting"}).to_list(100)
@@ -3008,13 +3644,10 @@ async def upload_signed_timesheet(
                 week_info = f"KW {get_calendar_week(timesheet_obj.week_start)} ({timesheet_obj.week_start} - {timesheet_obj.week_end})"
                 
                 # Prepare email
-                msg = MIMEMultipart()
                 if verified:
                     subject = f"Stundenzettel automatisch genehmigt - {timesheet_obj.user_name} - {week_info}"
                 else:
                     subject = f"Unterschriebener Stundenzettel - Manuelle Prüfung erforderlich - {timesheet_obj.user_name} - {week_info}"
-                msg['From'] = smtp_config["smtp_username"]
-                msg['Subject'] = subject
                 
                 if verified:
                     body = f"""Hallo,
@@ -3049,22 +3682,19 @@ Mit freundlichen Grüßen
 {COMPANY_INFO["name"]}
                 """
                 
-                msg.attach(MIMEText(body, 'plain', 'utf-8'))
-                
-                # Send to all accounting users
+                # Send to all accounting users (über die Outbox)
                 recipients = [user["email"] for user in accounting_users]
-                msg['To'] = ", ".join(recipients)
-                
-                server = smtplib.SMTP(smtp_config["smtp_server"], smtp_config["smtp_port"])
-                server.starttls()
-                server.login(smtp_config["smtp_username"], smtp_config["smtp_password"])
-                server.sendmail(smtp_config["smtp_username"], recipients, msg.as_string().encode('utf-8'))
-                server.quit()
+                await mail_outbox.enqueue(
+                    to=recipients,
+                    subject=subject,
+                    body=body,
+                    context={"type": "timesheet_signed_upload", "timesheet_id": timesheet_id}
+                )
                 
-                logging.info(f"Email sent to accounting users: {recipients}")
+                logging.info(f"Email queued for accounting users: {recipients}")
                 
             except Exception as e:
-                logging.error(f"Failed to send email to accounting users: {e}")
+                logging.error(f"Failed to queue email to accounting users: {e}")
                 # Don't fail the upload if email fails
         
         return {
@@ -3074,8 +3704,7 @@ Mit freundlichen Grüßen
         }
         
     except Exception as e:
-        if local_file_path.exists():
-            local_file_path.unlink()
+        await discard_failed_upload(upload, "signed_timesheet")
         logging.error(f"Failed to upload signed timesheet: {e}")
         raise HTTPException(status_code=500, detail=f"Upload fehlgeschlagen: {str(e)}")
 
@@ -3100,15 +3729,216 @@ async def get_smtp_config(current_user: User = Depends(get_admin_user)):
     config_safe = {k: v for k, v in config.items() if k not in ["smtp_password", "_id"]}
     return config_safe
 
+# MongoDB-Indizes (deklarativ, werden beim Start idempotent angelegt)
+# Format: collection -> Liste von (Name, Schlüssel, Optionen)
+INDEX_SPECS: Dict[str, List[tuple]] = {
+    "users": [
+        ("id_unique", [("id", ASCENDING)], {"unique": True}),
+        ("email", [("email", ASCENDING)], {}),
+        # Versionsprüfung des User-Caches je Request
+        ("email_version", [("email", ASCENDING), ("version", ASCENDING)], {}),
+        ("role", [("role", ASCENDING)], {}),
+    ],
+    "timesheets": [
+        ("id_unique", [("id", ASCENDING)], {"unique": True}),
+        ("user_week_start", [("user_id", ASCENDING), ("week_start", DESCENDING)], {}),
+        ("status_week_start", [("status", ASCENDING), ("week_start", DESCENDING)], {}),
+        ("user_status", [("user_id", ASCENDING), ("status", ASCENDING)], {}),
+        ("entries_date", [("entries.date", ASCENDING)], {}),
+        ("expires_at", [("expires_at", ASCENDING)], {}),
+    ],
+    "monthly_user_rollups": [
+        ("user_month_unique", [("user_id", ASCENDING), ("month", ASCENDING)], {"unique": True}),
+        ("month", [("month", ASCENDING)], {}),
+    ],
+    "travel_expenses": [
+        ("id_unique", [("id", ASCENDING)], {"unique": True}),
+        ("user_date", [("user_id", ASCENDING), ("date", ASCENDING)], {}),
+        ("status_date", [("status", ASCENDING), ("date", ASCENDING)], {}),
+        ("expires_at", [("expires_at", ASCENDING)], {}),
+    ],
+    "travel_expense_reports": [
+        ("id_unique", [("id", ASCENDING)], {"unique": True}),
+        ("user_month", [("user_id", ASCENDING), ("month", ASCENDING)], {}),
+        ("month_created", [("month", ASCENDING), ("created_at", DESCENDING)], {}),
+        ("expires_at", [("expires_at", ASCENDING)], {}),
+    ],
+    "chat_messages": [
+        ("report_created", [("report_id", ASCENDING), ("created_at", ASCENDING)], {}),
+    ],
+    "agent_memory": [
+        ("agent_timestamp", [("agent_name", ASCENDING), ("timestamp", DESCENDING)], {}),
+        ("agent_type_timestamp", [("agent_name", ASCENDING), ("entry_type", ASCENDING), ("timestamp", DESCENDING)], {}),
+    ],
+    "push_subscriptions": [
+        ("endpoint", [("endpoint", ASCENDING)], {}),
+        ("user_id", [("user_id", ASCENDING)], {}),
+        ("role", [("role", ASCENDING)], {}),
+    ],
+    "vacation_requests": [
+        ("id_unique", [("id", ASCENDING)], {"unique": True}),
+        ("user_year_status", [("user_id", ASCENDING), ("year", ASCENDING), ("status", ASCENDING)], {}),
+        ("status_created", [("status", ASCENDING), ("created_at", DESCENDING)], {}),
+    ],
+    "vacation_balances": [
+        ("user_year", [("user_id", ASCENDING), ("year", ASCENDING)], {}),
+    ],
+    "receipts": [
+        ("hash_kind_unique", [("file_hash", ASCENDING), ("kind", ASCENDING)], {"unique": True}),
+        ("receipt_id", [("receipt_id", ASCENDING)], {}),
+        ("report_id", [("report_id", ASCENDING)], {}),
+        ("expense_id", [("expense_id", ASCENDING)], {}),
+        ("timesheet_id", [("timesheet_id", ASCENDING)], {}),
+        ("phash", [("phash", ASCENDING)], {"sparse": True}),
+        ("phash_blocks", [("phash_blocks", ASCENDING)], {"sparse": True}),
+    ],
+    "blobs": [
+        ("id_unique", [("id", ASCENDING)], {"unique": True}),
+    ],
+    "llm_response_cache": [
+        ("key_unique", [("key", ASCENDING)], {"unique": True}),
+        ("expires_at_ttl", [("expires_at", ASCENDING)], {"expireAfterSeconds": 0}),
+    ],
+    "mail_outbox": [
+        ("id_unique", [("id", ASCENDING)], {"unique": True}),
+        ("status_next_attempt", [("status", ASCENDING), ("next_attempt_at", ASCENDING)], {}),
+        # Nur versendete Einträge haben sent_at, nur endgültig fehlgeschlagene failed_at
+        ("sent_at_ttl", [("sent_at", ASCENDING)],
+         {"expireAfterSeconds": int(float(os.getenv("MAIL_OUTBOX_RETENTION_DAYS", "30")) * 86400)}),
+        ("failed_at_ttl", [("failed_at", ASCENDING)],
+         {"expireAfterSeconds": int(float(os.getenv("MAIL_OUTBOX_FAILED_RETENTION_DAYS", "90")) * 86400)}),
+    ],
+    "review_jobs": [
+        ("id_unique", [("id", ASCENDING)], {"unique": True}),
+        # Höchstens ein aktiver (queued/running) Job je Report: macht erneutes Einreichen idempotent
+        ("report_active_unique", [("report_id", ASCENDING)],
+         {"unique": True, "partialFilterExpression": {"active": True}}),
+        ("report_created", [("report_id", ASCENDING), ("created_at", DESCENDING)], {}),
+        ("status_next_attempt", [("status", ASCENDING), ("next_attempt_at", ASCENDING)], {}),
+    ],
+}
+
+async def ensure_indexes() -> Dict[str, List[str]]:
+    """Legt alle Indizes aus INDEX_SPECS an. Bereits vorhandene Indizes sind ein No-Op.
+
+    Fehler (z.B. Duplikate bei unique oder ein gleichnamiger Index mit anderen Optionen)
+    werden geloggt und verhindern den Start nicht.
+    """
+    created: Dict[str, List[str]] = {}
+    for collection, specs in INDEX_SPECS.items():
+        for name, keys, options in specs:
+            try:
+                await db[collection].create_index(keys, name=name, **options)
+                created.setdefault(collection, []).append(name)
+            except Exception as e:
+                logger.warning(f"Index {collection}.{name} konnte nicht angelegt werden: {e}")
+    return created
+
+# App-weiter Agenten-Orchestrator: Memories einmal geladen, gemeinsamer Session-Pool zu Ollama,
+# gecachter und periodisch erneuerter Health-Status. Wird beim Start aufgebaut und beim Shutdown geschlossen.
+agent_orchestrator = None
+_agent_orchestrator_lock = asyncio.Lock()
+
+async def get_agent_orchestrator():
+    """Liefert den app-weiten AgentOrchestrator (baut ihn beim ersten Aufruf auf)"""
+    global agent_orchestrator
+    if agent_orchestrator is not None:
+        return agent_orchestrator
+    async with _agent_orchestrator_lock:
+        if agent_orchestrator is None:
+            from agents import AgentOrchestrator
+            orchestrator = AgentOrchestrator(db=db)
+            try:
+                await orchestrator.start()
+            except BaseException:
+                await orchestrator.close()
+                raise
+            agent_orchestrator = orchestrator
+    return agent_orchestrator
+
+# Review-Warteschlange: submit_expense_report reiht nur ein, Worker prüfen mit begrenzter Parallelität.
+# Worker laufen im API-Prozess (REVIEW_WORKER_IN_PROCESS=true) oder separat über review_worker.py.
+review_queue = ReviewQueue(
+    db,
+    orchestrator_factory=get_agent_orchestrator,
+    concurrency=int(os.getenv("REVIEW_WORKER_CONCURRENCY", "2")),
+    max_attempts=int(os.getenv("REVIEW_MAX_ATTEMPTS", "3")),
+    lease_seconds=float(os.getenv("REVIEW_LEASE_SECONDS", "300"))
+)
+
+async def _warm_agent_orchestrator():
+    try:
+        await get_agent_orchestrator()
+    except Exception as e:
+        logger.warning(f"Agent orchestrator could not be started: {e}")
+
 # Initialize admin user and compliance on startup
 @app.on_event("startup")
 async def startup_tasks():
-    """Startup tasks: create admin user and setup compliance"""
+    """Startup tasks: create indexes, admin user and setup compliance"""
+    await ensure_indexes()
     await create_admin_user()
     await ensure_test_announcement()
+    await migrate_announcement_images()
+    await cleanup_announcement_images()
+    await ensure_monthly_rollups()
+    await backfill_receipt_phash_blocks()
+    try:
+        from agents import llm_response_cache
+        llm_response_cache.attach_db(db)
+    except ImportError as e:
+        logger.warning(f"LLM response cache not available: {e}")
+    # Im Hintergrund, damit ein nicht erreichbarer Ollama-Server den Start nicht verzögert
+    app.state.agent_orchestrator_task = asyncio.create_task(_warm_agent_orchestrator())
+    mail_outbox.register_hook("timesheet_sent", _mark_timesheet_sent)
+    mail_outbox.start()
+    if os.getenv("REVIEW_WORKER_IN_PROCESS", "true").lower() == "true":
+        review_queue.start()
+    if os.getenv("ENCRYPTION_MIGRATION_ENABLED", "true").lower() == "true":
+        app.state.encryption_migration_task = asyncio.create_task(encryption_migrator.run())
+    # Aufbewahrungsfristen: expires_at nachtragen; automatisches Löschen nur wenn aktiviert
+    retention_manager.register_hook(_on_retention_expired)
+    sweep_interval = 0.0
+    if os.getenv("RETENTION_SWEEP_ENABLED", "false").lower() == "true":
+        sweep_interval = float(os.getenv("RETENTION_SWEEP_INTERVAL_HOURS", "24")) * 3600
+    app.state.retention_task = asyncio.create_task(retention_manager.run(sweep_interval))
     logger.info("DSGVO Compliance: Retention manager initialized")
     logger.info("EU-AI-Act Compliance: AI transparency logging enabled")
 
+async def _mark_timesheet_sent(hook_spec: Dict[str, Any]) -> None:
+    """on_sent-Aktion der Mail-Outbox: Stundenzettel nach erfolgreichem Versand auf "sent" setzen"""
+    timesheet_id = hook_spec["timesheet_id"]
+    await db.timesheets.update_one({"id": timesheet_id}, {"$set": {"status": "sent"}})
+    await refresh_timesheet_rollups(timesheet_id)
+    await retention_manager.refresh_expiry("timesheets", timesheet_id)
+
+RETENTION_REGISTRY_REFS = {
+    "timesheets": "timesheet_id",
+    "travel_expenses": "expense_id",
+    "travel_expense_reports": "report_id",
+}
+
+async def _on_retention_expired(collection: str, doc: Dict[str, Any]) -> None:
+    """Nach dem Löschen abgelaufener Dateien: Register-Einträge entfernen und protokollieren"""
+    await unregister_upload_hashes({RETENTION_REGISTRY_REFS[collection]: doc.get("id")})
+    audit_logger.log_access(
+        action="retention_delete",
+        user_id="system",
+        resource_type=collection,
+        resource_id=doc.get("id") or "",
+        details={"expires_at": doc["expires_at"].isoformat(), "status": doc.get("status")}
+    )
+
+async def ensure_monthly_rollups():
+    """Baut die Monats-Rollups beim ersten Start nach dem Update einmalig auf."""
+    if await db.monthly_user_rollups.find_one({}) is not None:
+        return False
+    if await db.timesheets.find_one({}) is None:
+        return False
+    count = await rebuild_monthly_rollups()
+    logger.info(f"Monthly rollups rebuilt on startup: {count} documents")
+    return True
+
 async def ensure_test_announcement():
     existing = await db.announcements.find_one({"title": TEST_ANNOUNCEMENT_TITLE})
     if existing:
@@ -3143,10 +3973,12 @@ async def create_admin_user(email: Optional[str] = None, reset_if_exists: bool =
                         "name": DEFAULT_ADMIN_NAME,
                         "role": "admin",
                         "is_admin": True
-                    }
+                    },
+                    "$inc": {"version": 1}
                 }
             )
             logger.info(f"Admin user reset: {target_email} / {DEFAULT_ADMIN_PASSWORD} (2FA pending)")
+            user_cache.invalidate(user_id=admin.get("id"), email=target_email)
             return True
         return False
     two_fa_secret = pyotp.random_base32()
@@ -3186,7 +4018,9 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
             "connect-src 'self' https:; "
             "frame-ancestors 'none';"
         )
-        response.headers["Content-Security-Policy"] = csp
+        # Eine vom Endpunkt gesetzte, strengere Policy (z.B. sandbox für Bilder) bleibt erhalten
+        if "content-security-policy" not in response.headers:
+            response.headers["Content-Security-Policy"] = csp
         
         # HTTPS Strict Transport Security (HSTS) - nur wenn HTTPS aktiv
         if request.url.scheme == "https":
@@ -3239,6 +4073,173 @@ async def get_audit_logs(
     )
     return {"logs": logs, "count": len(logs)}
 
+@api_router.get("/admin/index-report")
+async def get_index_report(
+    slow_ms: int = 100,
+    limit: int = 50,
+    current_user: User = Depends(get_admin_user)
+):
+    """Index-Nutzung ($indexStats) je Collection und langsame Queries mit Collection-Scan (admin only)
+
+    Langsame Queries stammen aus system.profile und sind nur verfügbar, wenn der MongoDB-Profiler
+    aktiv ist (z.B. db.setProfilingLevel(1, { slowms: 100 })).
+    """
+    collections = {}
+    for collection in INDEX_SPECS:
+        try:
+            stats = await db[collection].aggregate([{"$indexStats": {}}]).to_list(None)
+        except Exception as e:
+            collections[collection] = {"error": str(e)}
+            continue
+        indexes = [
+            {
+                "name": s.get("name"),
+                "key": s.get("key"),
+                "ops": int(s.get("accesses", {}).get("ops", 0)),
+                "since": s.get("accesses", {}).get("since")
+            }
+            for s in stats
+        ]
+        expected = {name for name, _, _ in INDEX_SPECS[collection]}
+        present = {i["name"] for i in indexes}
+        collections[collection] = {
+            "indexes": sorted(indexes, key=lambda i: i["name"]),
+            "missing": sorted(expected - present),
+            "unused": sorted(i["name"] for i in indexes if i["ops"] == 0 and i["name"] != "_id_")
+        }
+
+    profiling = {"enabled": False}
+    slow_queries = []
+    try:
+        status = await db.command("profile", -1)
+        profiling = {"enabled": status.get("was", 0) > 0, "level": status.get("was", 0), "slowms": status.get("slowms")}
+    except Exception as e:
+        profiling["error"] = str(e)
+    if profiling.get("enabled"):
+        async for op in db["system.profile"].find(
+            {"planSummary": {"$regex": "^COLLSCAN"}, "millis": {"$gte": slow_ms}}
+        ).sort("ts", -1).limit(limit):
+            slow_queries.append({
+                "ts": op.get("ts"),
+                "ns": op.get("ns"),
+                "op": op.get("op"),
+                "millis": op.get("millis"),
+                "docs_examined": op.get("docsExamined"),
+                "n_returned": op.get("nreturned"),
+                "plan_summary": op.get("planSummary"),
+                "command": json.loads(json.dumps(op.get("command", {}), default=str))
+            })
+
+    return {"collections": collections, "profiling": profiling, "slow_queries": slow_queries}
+
+@api_router.get("/admin/cache-stats")
+async def get_cache_stats(current_user: User = Depends(get_admin_user)):
+    """Trefferquoten der In-Process-Caches (admin only)"""
+    from agents import llm_response_cache
+    return {
+        "user_cache": user_cache.stats(),
+        "pdf_render_cache": pdf_render_cache.stats(),
+        "llm_response_cache": llm_response_cache.stats(),
+    }
+
+@api_router.get("/admin/agents")
+async def get_agent_status(current_user: User = Depends(get_admin_user)):
+    """Gecachter Ollama-Health-Status und Memory-Zustand des app-weiten Orchestrators (admin only)"""
+    if agent_orchestrator is None:
+        return {"started": False}
+    return {"started": True, **agent_orchestrator.health_status()}
+
+@api_router.get("/admin/encryption-migration")
+async def get_encryption_migration_status(current_user: User = Depends(get_admin_user)):
+    """Fortschritt der Neuverschlüsselung (Altdateien und rotierte Schlüssel) (admin only)"""
+    return {
+        **encryption_migrator.stats,
+        "active_key_id": data_encryption.key_id,
+        "key_ids": data_encryption.keyring.key_ids,
+        "state": await encryption_migrator.state(),
+    }
+
+@api_router.post("/admin/encryption-migration")
+async def start_encryption_migration(current_user: User = Depends(get_admin_user)):
+    """Startet die Neuverschlüsselung nach einer Schlüsselrotation im Hintergrund (admin only)"""
+    state = await encryption_migrator.state() or {}
+    lease_until = state.get("lease_until")
+    if encryption_migrator.running or (lease_until and lease_until > datetime.utcnow()):
+        raise HTTPException(status_code=409, detail="Neuverschlüsselung läuft bereits")
+    # Explizit gestartet: auch wenn für den aktiven Schlüssel schon ein vollständiger Lauf vermerkt ist
+    app.state.encryption_migration_task = asyncio.create_task(encryption_migrator.run(force=True))
+    audit_logger.log_access(
+        action="encryption_rotation_start",
+        user_id=current_user.id,
+        resource_type="encryption",
+        resource_id=data_encryption.key_id,
+    )
+    return {"message": "Neuverschlüsselung gestartet", "active_key_id": data_encryption.key_id}
+
+@api_router.get("/admin/retention")
+async def get_retention_report(current_user: User = Depends(get_admin_user)):
+    """Dry-Run: welche Dateien der Sweeper jetzt löschen würde (admin only)"""
+    return await retention_manager.sweep(dry_run=True)
+
+@api_router.post("/admin/retention/sweep")
+async def run_retention_sweep(dry_run: bool = True, current_user: User = Depends(get_admin_user)):
+    """Löscht Dateien mit abgelaufener Aufbewahrungsfrist; standardmäßig nur Dry-Run (admin only)"""
+    report = await retention_manager.sweep(dry_run=dry_run)
+    audit_logger.log_access(
+        action="retention_sweep_dry_run" if dry_run else "retention_sweep",
+        user_id=current_user.id,
+        resource_type="retention",
+        resource_id="",
+        details={"file_count": report["file_count"], "deleted_files": report["deleted_files"]}
+    )
+    return report
+
+@api_router.get("/admin/mail-outbox")
+async def get_mail_outbox(
+    status: Optional[str] = None,
+    limit: int = 100,
+    current_user: User = Depends(get_admin_user)
+):
+    """Zustellstatus der Mail-Outbox (admin only)"""
+    query = {"status": status} if status else {}
+    items = await db.mail_outbox.find(
+        query, {"_id": 0, "attachments": 0, "body": 0}
+    ).sort("created_at", -1).to_list(min(max(limit, 1), 1000))
+    return {
+        "counts": await mail_outbox.status_counts(),
+        "sender": mail_outbox.stats_counters,
+        "items": items
+    }
+
+@api_router.get("/admin/mail-outbox/{outbox_id}")
+async def get_mail_outbox_item(outbox_id: str, current_user: User = Depends(get_admin_user)):
+    item = await mail_outbox.get_status(outbox_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Outbox entry not found")
+    return item
+
+@api_router.get("/admin/review-queue")
+async def get_review_queue(
+    status: Optional[str] = None,
+    limit: int = 100,
+    current_user: User = Depends(get_admin_user)
+):
+    """Prüf-Jobs der Review-Warteschlange (admin only)"""
+    query = {"status": status} if status else {}
+    items = await db.review_jobs.find(
+        query, {"_id": 0, "progress_log": 0}
+    ).sort("created_at", -1).to_list(min(max(limit, 1), 1000))
+    return {
+        "counts": await review_queue.status_counts(),
+        "worker": review_queue.stats_counters,
+        "items": items
+    }
+
+@api_router.get("/admin/push-stats")
+async def get_push_stats(current_user: User = Depends(get_admin_user)):
+    """Zustellzahlen und Latenzen des Web-Push-Versands (admin only)"""
+    return push_dispatcher.stats()
+
 # Include router
 app.include_router(api_router)
 
@@ -3309,6 +4310,7 @@ async def create_travel_expense(expense_create: TravelExpenseCreate, current_use
     
     expense_dict = expense.model_dump()
     expense_dict["created_at"] = datetime.utcnow()
+    expense_dict["expires_at"] = compute_expires_at(expense.status, expense_dict["created_at"])
     result = await db.travel_expenses.insert_one(expense_dict)
     
     # Return the created expense with the correct id
@@ -3359,6 +4361,7 @@ async def delete_travel_expense(expense_id: str, current_user: User = Depends(ge
         raise HTTPException(status_code=400, detail="Can only delete draft expenses")
     
     await db.travel_expenses.delete_one({"id": expense_id})
+    await unregister_upload_hashes({"expense_id": expense_id})
     return {"message": "Travel expense deleted successfully"}
 
 @api_router.post("/travel-expenses/{expense_id}/approve")
@@ -3372,6 +4375,7 @@ async def approve_travel_expense(expense_id: str, current_user: User = Depends(g
         {"id": expense_id},
         {"$set": {"status": "approved"}}
     )
+    await retention_manager.refresh_expiry("travel_expenses", expense_id)
     
     return {"message": "Travel expense approved successfully"}
 
@@ -3389,6 +4393,7 @@ async def reject_travel_expense(expense_id: str, current_user: User = Depends(ge
         {"id": expense_id},
         {"$set": {"status": "sent"}}
     )
+    await retention_manager.refresh_expiry("travel_expenses", expense_id)
     
     return {"message": "Travel expense rejected successfully"}
 
@@ -3417,19 +4422,6 @@ async def upload_travel_expense_receipt(
     if expense.get("status") != "draft":
         raise HTTPException(status_code=400, detail="Can only upload receipts to draft expenses")
     
-    contents = await file.read()
-    if len(contents) > 10 * 1024 * 1024:
-        raise HTTPException(status_code=400, detail="File size must be less than 10MB")
-    
-    # DSGVO: Audit logging before upload
-    audit_logger.log_access(
-        action="upload",
-        user_id=current_user.id,
-        resource_type="receipt",
-        resource_id="",  # Will be set after creation
-        details={"filename": file.filename, "size": len(contents), "expense_id": expense_id}
-    )
-    
     receipt_id = str(uuid.uuid4())
     # Sanitize filename for security
     safe_filename = re.sub(r'[^\w\-_\.]', '_', file.filename)
@@ -3448,46 +4440,51 @@ async def upload_travel_expense_receipt(
     filename = f"{receipt_id}_{safe_filename}"
     local_file_path = expense_folder_path / filename
     
-    try:
-        # Save file to local storage (office computer only)
-        with open(local_file_path, 'wb') as f:
-            f.write(contents)
-        
-        # DSGVO Art. 32: Encrypt sensitive data
-        data_encryption.encrypt_file(local_file_path)
-        
-        # Verify file is encrypted (try to decrypt - should work)
-        try:
-            data_encryption.decrypt_file(local_file_path)
-        except Exception as e:
-            logging.error(f"File encryption verification failed: {e}")
-            local_file_path.unlink()  # Delete unencrypted file
-            raise HTTPException(status_code=500, detail="File encryption failed")
-        
-    except Exception as e:
-        if local_file_path.exists():
-            local_file_path.unlink()  # Clean up on error
-        raise HTTPException(status_code=500, detail=f"Failed to save file to local storage: {str(e)}")
-    
-    receipt = TravelExpenseReceipt(
-        id=receipt_id,
-        filename=file.filename,
-        local_path=str(local_file_path),
-        file_size=len(contents)
+    # Streaming-Upload (office computer only), DSGVO Art. 32: verschlüsselt gespeichert
+    upload = await ingest_encrypted_upload(file, local_file_path)
+    
+    existing = await register_upload_hash(
+        upload, "receipt", current_user.id, file.filename, expense_id=expense_id, receipt_id=receipt_id
     )
+    if existing:
+        await reject_duplicate_upload(upload, existing, current_user, "This receipt has already been uploaded")
+    # Fehler nach der Registrierung: Datei und Register-Eintrag entfernen, damit ein erneuter Upload möglich ist
+    try:
+        similar_receipts = await index_receipt_phash(upload)
     
-    expense_receipts = expense.get("receipts", [])
-    expense_receipts.append(receipt.model_dump())
+        # DSGVO: Audit logging
+        audit_logger.log_access(
+            action="upload",
+            user_id=current_user.id,
+            resource_type="receipt",
+            resource_id="",  # Will be set after creation
+            details={"filename": file.filename, "size": upload.size, "sha256": upload.sha256, "expense_id": expense_id}
+        )
     
-    await db.travel_expenses.update_one(
-        {"id": expense_id},
-        {
-            "$set": {
-                "receipts": expense_receipts,
-                "updated_at": datetime.utcnow()
+        receipt = TravelExpenseReceipt(
+            id=receipt_id,
+            filename=file.filename,
+            local_path=str(local_file_path),
+            file_size=upload.size,
+            file_hash=upload.sha256
+        )
+    
+        expense_receipts = expense.get("receipts", [])
+        expense_receipts.append(receipt.model_dump())
+    
+        await db.travel_expenses.update_one(
+            {"id": expense_id},
+            {
+                "$set": {
+                    "receipts": expense_receipts,
+                    "updated_at": datetime.utcnow()
+                }
             }
-        }
-    )
+        )
+    except Exception as e:
+        await discard_failed_upload(upload, "receipt")
+        logging.error(f"Receipt upload for travel expense {expense_id} failed: {e}")
+        raise HTTPException(status_code=500, detail="Receipt upload failed")
     
     # Update audit log with receipt_id
     audit_logger.log_access(
@@ -3500,7 +4497,8 @@ async def upload_travel_expense_receipt(
     
     return {
         "message": "Receipt uploaded successfully",
-        "receipt": receipt
+        "receipt": receipt,
+        "similar_receipts": similar_receipts
     }
 
 @api_router.delete("/travel-expenses/{expense_id}/receipts/{receipt_id}")
@@ -3543,6 +4541,7 @@ async def delete_travel_expense_receipt(
         except Exception as e:
             logging.warning(f"Failed to delete receipt file: {e}")
     
+    await unregister_upload_hashes({"receipt_id": receipt_id})
     await db.travel_expenses.update_one(
         {"id": expense_id},
         {
@@ -3565,6 +4564,98 @@ async def delete_travel_expense_receipt(
     return {"message": "Receipt deleted successfully"}
 
 # Announcements endpoints
+ANNOUNCEMENT_IMAGE_URL_PREFIX = "/api/announcements/images/"
+
+def announcement_image_url(blob_id: Optional[str]) -> Optional[str]:
+    return f"{ANNOUNCEMENT_IMAGE_URL_PREFIX}{blob_id}" if blob_id else None
+
+def announcement_from_doc(doc: Dict[str, Any]) -> Announcement:
+    """Dokument -> Antwort; Bild-URLs werden aus den Blob-IDs gebildet"""
+    doc.pop("_id", None)
+    if doc.get("image_id"):
+        doc["image_url"] = announcement_image_url(doc["image_id"])
+        doc["image_thumbnail_url"] = announcement_image_url(doc.get("image_thumbnail_id") or doc["image_id"])
+    return Announcement(**doc)
+
+async def store_data_url_image(image_url: str, filename: Optional[str]) -> Dict[str, Any]:
+    """Altes Format (data:-URL mit Base64) in den Blob-Speicher übernehmen"""
+    import base64
+    _, _, payload = image_url.partition(",")
+    try:
+        data = base64.b64decode(payload, validate=False)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid image data")
+    # Typ aus dem Inhalt, nicht aus der data:-URL (SVG wird abgelehnt)
+    content_type = sniff_image_type(data)
+    if not content_type:
+        raise HTTPException(status_code=400, detail="Unsupported image type (PNG, JPEG, GIF or WebP)")
+    return await announcement_images.put_image(data, content_type, filename)
+
+async def resolve_announcement_image(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """image_id/image_url aus Create/Update in Referenzfelder übersetzen (nur die ID wird gespeichert)"""
+    if "image_id" not in fields and "image_url" not in fields:
+        return fields
+    image_id = fields.pop("image_id", None)
+    image_url = fields.pop("image_url", None)
+    if not image_id and image_url and image_url.startswith(ANNOUNCEMENT_IMAGE_URL_PREFIX):
+        image_id = image_url[len(ANNOUNCEMENT_IMAGE_URL_PREFIX):]
+    if not image_id and image_url and image_url.startswith("data:"):
+        image_id = (await store_data_url_image(image_url, fields.get("image_filename")))["id"]
+    if image_id:
+        meta = await announcement_images.get_meta(image_id)
+        if not meta:
+            raise HTTPException(status_code=400, detail="Unknown image")
+        fields.update({"image_id": image_id, "image_thumbnail_id": meta.get("thumbnail_id") or image_id, "image_url": None})
+    else:
+        # Kein Bild oder externe URL
+        fields.update({"image_id": None, "image_thumbnail_id": None, "image_url": image_url})
+    return fields
+
+async def migrate_announcement_images() -> int:
+    """Base64-Bilder aus bestehenden Ankündigungen einmalig in den Blob-Speicher verschieben"""
+    migrated = 0
+    async for announcement in db.announcements.find(
+        {"image_url": {"$regex": "^data:"}}, {"_id": 0, "id": 1, "image_url": 1, "image_filename": 1}
+    ):
+        try:
+            fields = await resolve_announcement_image({
+                "image_url": announcement["image_url"],
+                "image_filename": announcement.get("image_filename"),
+            })
+        except HTTPException as e:
+            logger.warning(f"Announcement image {announcement['id']} could not be migrated: {e.detail}")
+            continue
+        await db.announcements.update_one({"id": announcement["id"]}, {"$set": fields})
+        migrated += 1
+    if migrated:
+        logger.info(f"Announcement images moved to blob store: {migrated}")
+    return migrated
+
+async def cleanup_announcement_images(blob_ids: Optional[Iterable[Optional[str]]] = None) -> int:
+    """Bild-Blobs (Eintrag in blobs und Datei) löschen, auf die keine Ankündigung mehr verweist.
+
+    Mit blob_ids werden nur diese geprüft (die bisherigen Bilder nach Ändern/Löschen), sonst der ganze
+    Bestand. Bilder, die in den letzten ANNOUNCEMENT_IMAGE_GRACE_SECONDS hochgeladen wurden, bleiben, damit
+    zwischen Upload und Speichern der Ankündigung nichts verschwindet; sie räumt der nächste Start auf.
+    """
+    if blob_ids is None:
+        candidates = set(await announcement_images.collection.distinct("id"))
+    else:
+        candidates = {blob_id for blob_id in blob_ids if blob_id}
+    if not candidates:
+        return 0
+    referenced = set()
+    for field in ("image_id", "image_thumbnail_id"):
+        referenced.update(await db.announcements.distinct(field, {field: {"$in": list(candidates)}}))
+    cutoff = datetime.utcnow() - timedelta(seconds=ANNOUNCEMENT_IMAGE_GRACE_SECONDS)
+    deleted = 0
+    for blob_id in candidates - referenced:
+        if await announcement_images.delete(blob_id, untouched_since=cutoff):
+            deleted += 1
+    if deleted:
+        logger.info(f"Announcement images removed: {deleted}")
+    return deleted
+
 @api_router.get("/announcements", response_model=List[Announcement])
 async def get_announcements(
     active_only: bool = False,
@@ -3574,8 +4665,7 @@ async def get_announcements(
     query = {"active": True} if active_only else {}
     announcements = []
     async for announcement in db.announcements.find(query).sort("created_at", -1):
-        announcement.pop("_id", None)
-        announcements.append(Announcement(**announcement))
+        announcements.append(announcement_from_doc(announcement))
     return announcements
 
 @api_router.post("/announcements", response_model=Announcement)
@@ -3584,21 +4674,28 @@ async def create_announcement(
     current_user: User = Depends(get_admin_user)
 ):
     """Create a new announcement (admin only)"""
+    image_fields = await resolve_announcement_image({
+        "image_url": announcement_create.image_url,
+        "image_id": announcement_create.image_id,
+        "image_filename": announcement_create.image_filename,
+    })
     announcement = Announcement(
         title=announcement_create.title,
         content=announcement_create.content,
-        image_url=announcement_create.image_url,
+        image_url=image_fields["image_url"],
+        image_id=image_fields["image_id"],
+        image_thumbnail_id=image_fields["image_thumbnail_id"],
         image_filename=announcement_create.image_filename,
         active=announcement_create.active,
         created_by=current_user.id
     )
     
-    announcement_dict = announcement.model_dump()
+    announcement_dict = announcement.model_dump(exclude={"image_thumbnail_url"})
     announcement_dict["created_at"] = datetime.utcnow()
     announcement_dict["updated_at"] = datetime.utcnow()
     await db.announcements.insert_one(announcement_dict)
     
-    return announcement
+    return announcement_from_doc(announcement_dict)
 
 @api_router.put("/announcements/{announcement_id}", response_model=Announcement)
 async def update_announcement(
@@ -3611,16 +4708,18 @@ async def update_announcement(
     if not announcement:
         raise HTTPException(status_code=404, detail="Announcement not found")
     
-    update_data = announcement_update.model_dump(exclude_unset=True)
+    update_data = await resolve_announcement_image(announcement_update.model_dump(exclude_unset=True))
     update_data["updated_at"] = datetime.utcnow()
     
     await db.announcements.update_one(
         {"id": announcement_id},
         {"$set": update_data}
     )
+    if "image_id" in update_data:
+        await cleanup_announcement_images([announcement.get("image_id"), announcement.get("image_thumbnail_id")])
     
     updated_announcement = await db.announcements.find_one({"id": announcement_id})
-    return Announcement(**updated_announcement)
+    return announcement_from_doc(updated_announcement)
 
 @api_router.delete("/announcements/{announcement_id}")
 async def delete_announcement(
@@ -3628,9 +4727,12 @@ async def delete_announcement(
     current_user: User = Depends(get_admin_user)
 ):
     """Delete an announcement (admin only)"""
-    result = await db.announcements.delete_one({"id": announcement_id})
-    if result.deleted_count == 0:
+    announcement = await db.announcements.find_one_and_delete(
+        {"id": announcement_id}, {"_id": 0, "image_id": 1, "image_thumbnail_id": 1}
+    )
+    if announcement is None:
         raise HTTPException(status_code=404, detail="Announcement not found")
+    await cleanup_announcement_images([announcement.get("image_id"), announcement.get("image_thumbnail_id")])
     return {"message": "Announcement deleted successfully"}
 
 @api_router.post("/announcements/upload-image")
@@ -3638,31 +4740,69 @@ async def upload_announcement_image(
     file: UploadFile = File(...),
     current_user: User = Depends(get_admin_user)
 ):
-    """Upload an image for announcements (admin only) - returns base64 encoded image"""
+    """Upload an image for announcements (admin only) - speichert das Bild im Blob-Speicher und gibt die Referenz zurück"""
     # Check file type
     if not file.content_type or not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="File must be an image")
     
-    # Read file content
-    contents = await file.read()
-    
-    # Check file size (max 5MB)
-    if len(contents) > 5 * 1024 * 1024:
-        raise HTTPException(status_code=400, detail="Image size must be less than 5MB")
-    
-    # Encode to base64
-    import base64
-    image_base64 = base64.b64encode(contents).decode('utf-8')
-    
-    # Create data URL
-    image_url = f"data:{file.content_type};base64,{image_base64}"
+    # Blockweise lesen, Größenbegrenzung (max 5MB) schon beim Lesen prüfen
+    chunks = []
+    size = 0
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > ANNOUNCEMENT_IMAGE_MAX_BYTES:
+            raise HTTPException(status_code=400, detail="Image size must be less than 5MB")
+        chunks.append(chunk)
+    if not size:
+        raise HTTPException(status_code=400, detail="Image is empty")
+    
+    data = b"".join(chunks)
+    # Der angegebene Content-Type wird nicht übernommen: Bilder werden ohne Login vom API-Origin
+    # ausgeliefert, ein als Bild deklariertes SVG/HTML könnte dort Skript ausführen
+    content_type = sniff_image_type(data)
+    if not content_type:
+        raise HTTPException(status_code=400, detail="Unsupported image type (PNG, JPEG, GIF or WebP)")
+    meta = await announcement_images.put_image(data, content_type, file.filename)
     
     return {
-        "image_url": image_url,
+        "image_id": meta["id"],
+        "image_url": announcement_image_url(meta["id"]),
+        "image_thumbnail_url": announcement_image_url(meta["thumbnail_id"]),
         "image_filename": file.filename,
-        "content_type": file.content_type,
-        "size": len(contents)
+        "content_type": content_type,
+        "size": size
+    }
+
+@api_router.get("/announcements/images/{blob_id}")
+async def get_announcement_image(blob_id: str, request: Request):
+    """Liefert ein Ankündigungsbild aus (ohne Login, da <img> keinen Bearer-Token sendet; die ID ist der SHA-256).
+    Inhalte sind unveränderlich: starkes ETag und langes Caching."""
+    meta = await announcement_images.get_meta(blob_id)
+    if not meta:
+        raise HTTPException(status_code=404, detail="Image not found")
+    etag = f'"{blob_id}"'
+    cache_headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+        # Auch wenn der Browser die Antwort doch als Dokument öffnet: kein Skript, kein Origin-Zugriff
+        "Content-Security-Policy": "sandbox; default-src 'none'",
     }
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=cache_headers)
+    path = announcement_images.path(blob_id)
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Image not found")
+    # Nur bekannte Rastergrafiken als Bild ausliefern, alles andere als Download
+    content_type = meta.get("content_type")
+    if content_type not in SAFE_IMAGE_TYPES:
+        content_type = "application/octet-stream"
+    response = FileResponse(path, media_type=content_type)
+    response.headers.update(cache_headers)
+    return response
 
 # Travel Expense Reports endpoints
 # NOTE: Ollama LLM integration for automatic review is pending
@@ -3725,31 +4865,31 @@ async def initialize_expense_report(
         "signed_pdf_verified": True
     }).to_list(1000)
     
-    entries_dict = {}
+    # Relevante Einträge des Monats sammeln, Arbeitsstunden vektorisiert berechnen
+    month_entries = []
     for ts in timesheets:
-        ts_entries = ts.get("entries", [])
-        for entry in ts_entries:
-            entry_date = entry.get("date", "")
-            if _date_in_year_month(entry_date, year, mon):
+        for entry in ts.get("entries", []):
+            if _date_in_year_month(entry.get("date", ""), year, mon):
                 if entry.get("travel_time_minutes", 0) > 0 or entry.get("location"):
-                    # Berechne Arbeitsstunden für diesen Eintrag
-                    entry_obj = TimeEntry(**entry) if isinstance(entry, dict) else entry
-                    working_hours = _entry_hours(entry_obj)
-                    
-                    date_key = entry_date
-                    if date_key not in entries_dict:
-                        entries_dict[date_key] = {
-                            "date": entry_date,
-                            "location": entry.get("location", ""),
-                            "customer_project": entry.get("customer_project", ""),
-                            "travel_time_minutes": entry.get("travel_time_minutes", 0),
-                            "days_count": 1,
-                            "working_hours": working_hours
-                        }
-                    else:
-                        existing = entries_dict[date_key]
-                        existing["travel_time_minutes"] += entry.get("travel_time_minutes", 0)
-                        existing["working_hours"] += working_hours
+                    month_entries.append(entry)
+    working_hours_per_entry = compute_hours(EntryColumns(month_entries))["total_hours"]
+
+    entries_dict = {}
+    for entry, working_hours in zip(month_entries, working_hours_per_entry.tolist()):
+        date_key = entry.get("date", "")
+        if date_key not in entries_dict:
+            entries_dict[date_key] = {
+                "date": date_key,
+                "location": entry.get("location", ""),
+                "customer_project": entry.get("customer_project", ""),
+                "travel_time_minutes": entry.get("travel_time_minutes", 0),
+                "days_count": 1,
+                "working_hours": working_hours
+            }
+        else:
+            existing = entries_dict[date_key]
+            existing["travel_time_minutes"] += entry.get("travel_time_minutes", 0)
+            existing["working_hours"] += working_hours
     
     report = TravelExpenseReport(
         user_id=current_user.id,
@@ -3762,6 +4902,7 @@ async def initialize_expense_report(
     report_dict = report.model_dump()
     report_dict["created_at"] = datetime.utcnow()
     report_dict["updated_at"] = datetime.utcnow()
+    report_dict["expires_at"] = compute_expires_at(report.status, report_dict["created_at"])
     await db.travel_expense_reports.insert_one(report_dict)
     
     return report
@@ -3814,7 +4955,11 @@ async def submit_expense_report(
     report_id: str,
     current_user: User = Depends(get_current_user)
 ):
-    """Submit expense report - sets status to 'in_review' and triggers review"""
+    """Submit expense report - sets status to 'in_review' and queues the review
+    
+    Idempotent: Erneutes Einreichen einer Abrechnung in Prüfung liefert den bestehenden Prüf-Job zurück
+    (ein endgültig fehlgeschlagener oder fehlender Job wird neu eingereiht).
+    """
     report = await db.travel_expense_reports.find_one({"id": report_id})
     if not report:
         raise HTTPException(status_code=404, detail="Report not found")
@@ -3822,6 +4967,10 @@ async def submit_expense_report(
     if not current_user.can_view_all_data() and report["user_id"] != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized")
     
+    if report.get("status") == "in_review":
+        job = await review_queue.enqueue(report_id, current_user.id, requeue_done=False)
+        return {"message": "Report already submitted", "job_id": job["id"], "job_status": job["status"]}
+    
     if report.get("status") != "draft":
         raise HTTPException(status_code=400, detail="Only draft reports can be submitted")
     
@@ -3868,7 +5017,7 @@ async def submit_expense_report(
           raise HTTPException(status_code=400, detail="Einreichen nicht möglich. Es liegt kein freigegebener, unterschriebener und verifizierter Stundenzettel vor.")
 
     await db.travel_expense_reports.update_one(
-        {"id": report_id},
+        {"id": report_id, "status": "draft"},
         {
             "$set": {
                 "status": "in_review",
@@ -3877,34 +5026,45 @@ async def submit_expense_report(
             }
         }
     )
+    await retention_manager.refresh_expiry("travel_expense_reports", report_id)
     
-    # Trigger automatic review with agent network (async, non-blocking)
-    # EU-AI-Act: Notify user about AI processing
-    try:
-        from agents import AgentOrchestrator
-        orchestrator = AgentOrchestrator(db=db)
-        # Ensure LLM is available before starting review
-        await orchestrator.ensure_llm_available()
-        # Run in background task
-        import asyncio
-        
-        # EU-AI-Act Compliance: Log AI processing start
-        audit_logger.log_access(
-            action="ai_processing_start",
-            user_id=current_user.id,
-            resource_type="report",
-            resource_id=report_id,
-            details={
-                "ai_model": os.getenv('OLLAMA_MODEL', 'llama3.2'),
-                "compliance_note": "EU-AI-Act Art. 13: Automatische Prüfung mit KI-Agenten"
-            }
-        )
-        
-        asyncio.create_task(orchestrator.review_expense_report(report_id, db))
-    except Exception as e:
-        logger.warning(f"Could not start agent review: {e}")
+    # Automatische Prüfung mit dem Agenten-Netzwerk: Job in die persistente Warteschlange,
+    # ein Worker übernimmt ihn (überlebt Neustarts, begrenzte Parallelität gegenüber Ollama)
+    job = await review_queue.enqueue(report_id, current_user.id)
+    
+    # EU-AI-Act Compliance: Log AI processing start
+    audit_logger.log_access(
+        action="ai_processing_start",
+        user_id=current_user.id,
+        resource_type="report",
+        resource_id=report_id,
+        details={
+            "ai_model": os.getenv('OLLAMA_MODEL', 'llama3.2'),
+            "review_job_id": job["id"],
+            "compliance_note": "EU-AI-Act Art. 13: Automatische Prüfung mit KI-Agenten"
+        }
+    )
+    
+    return {"message": "Report submitted and queued for review", "job_id": job["id"], "job_status": job["status"]}
+
+@api_router.get("/travel-expense-reports/{report_id}/review-status")
+async def get_review_status(
+    report_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Status und Fortschritt der KI-Prüfung (letzter Prüf-Job der Abrechnung)"""
+    report = await db.travel_expense_reports.find_one({"id": report_id}, {"user_id": 1})
+    if not report:
+        raise HTTPException(status_code=404, detail="Report not found")
+    
+    if not current_user.can_view_all_data() and report["user_id"] != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized")
     
-    return {"message": "Report submitted and queued for review"}
+    job = await review_queue.latest_job(report_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="No review job for this report")
+    job.pop("worker_id", None)
+    return job
 
 @limiter.limit("20/hour")  # Max 20 Belege-Uploads pro Stunde
 @api_router.post("/travel-expense-reports/{report_id}/upload-receipt")
@@ -3931,19 +5091,6 @@ async def upload_receipt(
     if report.get("status") != "draft":
         raise HTTPException(status_code=400, detail="Can only upload receipts to draft reports")
     
-    contents = await file.read()
-    if len(contents) > 10 * 1024 * 1024:
-        raise HTTPException(status_code=400, detail="File size must be less than 10MB")
-    
-    # DSGVO: Audit logging before upload
-    audit_logger.log_access(
-        action="upload",
-        user_id=current_user.id,
-        resource_type="receipt",
-        resource_id="",  # Will be set after creation
-        details={"filename": file.filename, "size": len(contents)}
-    )
-    
     receipt_id = str(uuid.uuid4())
     # Sanitize filename for security
     safe_filename = re.sub(r'[^\w\-_\.]', '_', file.filename)
@@ -3962,45 +5109,52 @@ async def upload_receipt(
     filename = f"{receipt_id}_{safe_filename}"
     local_file_path = report_folder_path / filename
     
-    try:
-        # Save file to local storage (office computer only)
-        with open(local_file_path, 'wb') as f:
-            f.write(contents)
-        
-        # DSGVO Art. 32: Encrypt sensitive data
-        data_encryption.encrypt_file(local_file_path)
-        
-        # Verify file is encrypted (try to decrypt - should work)
-        try:
-            data_encryption.decrypt_file(local_file_path)
-        except Exception as e:
-            logging.error(f"File encryption verification failed: {e}")
-            local_file_path.unlink()  # Delete unencrypted file
-            raise HTTPException(status_code=500, detail="File encryption failed")
-        
-    except Exception as e:
-        if local_file_path.exists():
-            local_file_path.unlink()  # Clean up on error
-        raise HTTPException(status_code=500, detail=f"Failed to save file to local storage: {str(e)}")
-    
-    receipt = TravelExpenseReceipt(
-        filename=file.filename,
-        local_path=str(local_file_path),
-        file_size=len(contents)
+    # Streaming-Upload (office computer only), DSGVO Art. 32: verschlüsselt gespeichert
+    upload = await ingest_encrypted_upload(file, local_file_path)
+    
+    # Duplikatsprüfung über das Beleg-Register (vor der LLM-Analyse)
+    existing = await register_upload_hash(
+        upload, "receipt", current_user.id, file.filename, report_id=report_id, receipt_id=receipt_id
     )
+    if existing:
+        await reject_duplicate_upload(upload, existing, current_user, "This receipt has already been uploaded")
+    # Fehler nach der Registrierung: Datei und Register-Eintrag entfernen, damit ein erneuter Upload möglich ist
+    try:
+        similar_receipts = await index_receipt_phash(upload)
     
-    report_receipts = report.get("receipts", [])
-    report_receipts.append(receipt.model_dump())
+        # DSGVO: Audit logging
+        audit_logger.log_access(
+            action="upload",
+            user_id=current_user.id,
+            resource_type="receipt",
+            resource_id="",  # Will be set after creation
+            details={"filename": file.filename, "size": upload.size, "sha256": upload.sha256}
+        )
     
-    await db.travel_expense_reports.update_one(
-        {"id": report_id},
-        {
-            "$set": {
-                "receipts": report_receipts,
-                "updated_at": datetime.utcnow()
+        receipt = TravelExpenseReceipt(
+            id=receipt_id,
+            filename=file.filename,
+            local_path=str(local_file_path),
+            file_size=upload.size,
+            file_hash=upload.sha256
+        )
+    
+        report_receipts = report.get("receipts", [])
+        report_receipts.append(receipt.model_dump())
+    
+        await db.travel_expense_reports.update_one(
+            {"id": report_id},
+            {
+                "$set": {
+                    "receipts": report_receipts,
+                    "updated_at": datetime.utcnow()
+                }
             }
-        }
-    )
+        )
+    except Exception as e:
+        await discard_failed_upload(upload, "receipt")
+        logging.error(f"Receipt upload for report {report_id} failed: {e}")
+        raise HTTPException(status_code=500, detail="Receipt upload failed")
     
     # Update audit log with receipt_id
     audit_logger.log_access(
@@ -4013,34 +5167,17 @@ async def upload_receipt(
 
     # Automatische Analyse des hochgeladenen Dokuments
     try:
-        from agents import DocumentAgent, AgentOrchestrator
-        from ollama_llm import OllamaLLM
-        
-        llm = OllamaLLM()
-        document_agent = DocumentAgent(llm, db=db)
-        await document_agent.initialize()
-        
-        # Entschlüssele Datei temporär für Analyse (wird danach wieder verschlüsselt)
-        from compliance import DataEncryption
-        data_encryption_temp = DataEncryption()
-        try:
-            data_encryption_temp.decrypt_file(local_file_path)
-        except Exception as e:
-            logging.warning(f"Datei konnte nicht entschlüsselt werden für Analyse: {e}")
+        orchestrator = await get_agent_orchestrator()
+        document_agent = orchestrator.document_agent
         
-        # Analysiere das Dokument
+        # Entschlüsselung nur im Speicher: die Analyse liest aus einem BytesIO, es entsteht
+        # keine Klartext-Datei auf der Platte (auch nicht bei einem Absturz während der Analyse)
+        document_bytes = await asyncio.to_thread(data_encryption.decrypt_file, local_file_path)
         analysis = await document_agent.analyze_document(
-            str(local_file_path),
-            file.filename,
-            encryption=None
+            io.BytesIO(document_bytes),
+            file.filename
         )
         
-        # Verschlüssele Datei wieder nach Analyse
-        try:
-            data_encryption_temp.encrypt_file(local_file_path)
-        except Exception as e:
-            logging.warning(f"Datei konnte nach Analyse nicht wieder verschlüsselt werden: {e}")
-        
         # Speichere Analyse im Report
         report_document_analyses = report.get("document_analyses", [])
         report_document_analyses.append({
@@ -4227,10 +5364,6 @@ async def upload_receipt(
         # Wenn Probleme gefunden, Chat-Agent benachrichtigen
         if analysis.validation_issues or logic_issues:
             try:
-                from agents import ChatAgent
-                chat_agent = ChatAgent(llm, db=db)
-                await chat_agent.initialize()
-                
                 # Erstelle Chat-Nachricht für User
                 issues_text = "\n".join(analysis.validation_issues + logic_issues)
                 chat_message = f"Beim Hochladen von '{file.filename}' wurden folgende Punkte festgestellt:\n\n{issues_text}\n\nBitte klären Sie diese Punkte."
@@ -4275,7 +5408,8 @@ async def upload_receipt(
         "message": "Receipt uploaded successfully and encrypted",
         "receipt_id": receipt.id,
         "analysis_completed": True,
-        "has_issues": len(analysis.validation_issues) > 0 if 'analysis' in locals() else False
+        "has_issues": len(analysis.validation_issues) > 0 if 'analysis' in locals() else False,
+        "similar_receipts": similar_receipts
     }
 
 @limiter.limit("20/hour")  # Max 20 Nachweis-Uploads pro Stunde
@@ -4314,19 +5448,6 @@ async def upload_exchange_proof(
     if not receipt.get("needs_exchange_proof") and not receipt.get("currency"):
         raise HTTPException(status_code=400, detail="This receipt does not require an exchange proof (not a foreign currency receipt)")
     
-    contents = await file.read()
-    if len(contents) > 10 * 1024 * 1024:
-        raise HTTPException(status_code=400, detail="File size must be less than 10MB")
-    
-    # DSGVO: Audit logging
-    audit_logger.log_access(
-        action="upload_exchange_proof",
-        user_id=current_user.id,
-        resource_type="receipt",
-        resource_id=receipt_id,
-        details={"filename": file.filename, "size": len(contents), "receipt_id": receipt_id}
-    )
-    
     # Erstelle eindeutigen Ordner pro Reisekosten-Abrechnung
     user_name_safe = re.sub(r'[^\w\-_]', '_', report.get("user_name", "Unknown"))
     month = report.get("month", "unknown")
@@ -4341,26 +5462,17 @@ async def upload_exchange_proof(
     proof_filename = f"exchange_proof_{receipt_id}_{safe_filename}"
     local_file_path = report_folder_path / proof_filename
     
-    try:
-        # Save file to local storage
-        with open(local_file_path, 'wb') as f:
-            f.write(contents)
-        
-        # DSGVO Art. 32: Encrypt sensitive data
-        data_encryption.encrypt_file(local_file_path)
-        
-        # Verify file is encrypted
-        try:
-            data_encryption.decrypt_file(local_file_path)
-        except Exception as e:
-            logging.error(f"File encryption verification failed: {e}")
-            local_file_path.unlink()
-            raise HTTPException(status_code=500, detail="File encryption failed")
-        
-    except Exception as e:
-        if local_file_path.exists():
-            local_file_path.unlink()
-        raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
+    # DSGVO Art. 32: verschlüsselt gespeichert (Streaming-Upload, max 10MB)
+    upload = await ingest_encrypted_upload(file, local_file_path)
+    
+    # DSGVO: Audit logging
+    audit_logger.log_access(
+        action="upload_exchange_proof",
+        user_id=current_user.id,
+        resource_type="receipt",
+        resource_id=receipt_id,
+        details={"filename": file.filename, "size": upload.size, "sha256": upload.sha256, "receipt_id": receipt_id}
+    )
     
     # Update Receipt mit Nachweis
     receipt["exchange_proof_path"] = str(local_file_path)
@@ -4428,6 +5540,7 @@ async def delete_receipt(
         logging.warning(f"Failed to delete local file: {e}")
     
     receipts = [r for r in receipts if r.get("id") != receipt_id]
+    await unregister_upload_hashes({"receipt_id": receipt_id})
     await db.travel_expense_reports.update_one(
         {"id": report_id},
         {
@@ -4482,6 +5595,7 @@ async def delete_expense_report(
         logging.warning(f"Failed to delete report folder: {e}")
     
     await db.travel_expense_reports.delete_one({"id": report_id})
+    await unregister_upload_hashes({"report_id": report_id})
     return {"message": "Report deleted successfully"}
 
 @api_router.get("/travel-expense-reports/{report_id}/chat", response_model=List[ChatMessage])
@@ -4503,13 +5617,38 @@ async def get_chat_messages(
     
     return messages
 
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Ein Server-Sent-Event (text/event-stream)"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+async def stream_agent_reply(report_id: str, message: str):
+    """SSE-Stream der Agent-Antwort: event token je Textstück, zum Schluss done mit der gespeicherten Nachricht"""
+    message_id = str(uuid.uuid4())
+    parts = []
+    try:
+        orchestrator = await get_agent_orchestrator()
+        await orchestrator.ensure_llm_available()
+        async for token in orchestrator.stream_user_message(report_id, message, db, message_id=message_id):
+            parts.append(token)
+            yield sse_event("token", {"content": token})
+        yield sse_event("done", {"id": message_id, "report_id": report_id, "sender": "agent", "message": "".join(parts)})
+    except Exception as e:
+        logger.warning(f"Could not stream agent response: {e}")
+        yield sse_event("error", {"detail": "Agent response failed"})
+
 @api_router.post("/travel-expense-reports/{report_id}/chat")
 async def send_chat_message(
     report_id: str,
+    request: Request,
     message: str = Form(...),
+    stream: bool = False,
     current_user: User = Depends(get_current_user)
 ):
-    """Send a chat message (user or agent)"""
+    """Send a chat message (user or agent)
+    
+    Mit ?stream=true oder Accept: text/event-stream wird die Agent-Antwort als Server-Sent Events geliefert,
+    sobald das LLM die ersten Tokens erzeugt; gespeichert wird sie wie bisher in chat_messages.
+    """
     report = await db.travel_expense_reports.find_one({"id": report_id})
     if not report:
         raise HTTPException(status_code=404, detail="Report not found")
@@ -4529,10 +5668,16 @@ async def send_chat_message(
     
     # If report is in_review, trigger agent response
     if report.get("status") == "in_review":
+        if stream or "text/event-stream" in request.headers.get("accept", ""):
+            return StreamingResponse(
+                stream_agent_reply(report_id, message),
+                media_type="text/event-stream",
+                # Kein Puffern durch Proxies (nginx), sonst kommen die Tokens erst am Ende an
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
         try:
-            from agents import AgentOrchestrator
-            orchestrator = AgentOrchestrator(db=db)
-            # Ensure LLM is available
+            orchestrator = await get_agent_orchestrator()
+            # Ensure LLM is available (gecacht)
             await orchestrator.ensure_llm_available()
             agent_response = await orchestrator.handle_user_message(report_id, message, db)
             
@@ -4687,16 +5832,13 @@ async def approve_vacation_request(
             }
         )
     
-    # Push-Benachrichtigung an den User
-    try:
-        await notify_user(
-            user_id=request["user_id"],
-            title="Urlaub genehmigt",
-            body=f"{request.get('user_name', 'Ihr')} Urlaub {request.get('start_date', '')} bis {request.get('end_date', '')} wurde genehmigt.",
-            data={"type": "vacation_approved", "request_id": request_id}
-        )
-    except Exception as e:
-        logging.warning(f"Push notify (vacation approved) failed: {e}")
+    # Push-Benachrichtigung an den User (im Hintergrund)
+    push_dispatcher.dispatch(notify_user(
+        user_id=request["user_id"],
+        title="Urlaub genehmigt",
+        body=f"{request.get('user_name', 'Ihr')} Urlaub {request.get('start_date', '')} bis {request.get('end_date', '')} wurde genehmigt.",
+        data={"type": "vacation_approved", "request_id": request_id}
+    ))
 
     return {"message": "Urlaubsantrag genehmigt"}
 
@@ -4828,39 +5970,18 @@ async def get_vacation_requirements(
 @api_router.get("/vacation/holidays/{year}")
 async def get_holidays(year: int):
     """Get German and Saxon holidays for a year (programmweit verfügbar)"""
-    try:
-        import holidays
-        # Deutsche Feiertage (bundesweit)
-        de_holidays = holidays.Germany(years=year, prov=None)
-        # Sächsische Feiertage (Bundesland: SN = Sachsen)
-        sn_holidays = holidays.Germany(years=year, prov='SN')
-        # Kombiniere beide Dictionaries (date -> name)
-        all_holidays_dict = {**de_holidays, **sn_holidays}
-        
-        # Sortiere und formatiere als Liste von Objekten mit Datum und Name
-        holidays_list = [
-            {
-                "date": date.strftime("%Y-%m-%d"),
-                "name": name
-            }
-            for date, name in sorted(all_holidays_dict.items())
-        ]
-        
-        return {
-            "year": year,
-            "holidays": holidays_list,
-            "count": len(holidays_list)
-        }
-    except Exception as e:
-        logger.warning(f"Fehler beim Laden der Feiertage: {e}")
-        # Fallback: Nur Datumsstrings ohne Namen
-        holidays_set = get_german_holidays(year)
-        holidays_list = sorted([date.strftime("%Y-%m-%d") for date in holidays_set])
-        return {
-            "year": year,
-            "holidays": [{"date": d, "name": f"Feiertag {d}"} for d in holidays_list],
-            "count": len(holidays_list)
+    holidays_list = [
+        {
+            "date": date.strftime("%Y-%m-%d"),
+            "name": name
         }
+        for date, name in sorted(german_calendar.holiday_items(year).items())
+    ]
+    return {
+        "year": year,
+        "holidays": holidays_list,
+        "count": len(holidays_list)
+    }
 
 @api_router.get("/vacation/check-holiday/{date}")
 async def check_holiday(date: str):
@@ -4898,12 +6019,7 @@ async def send_vacation_reminders(current_user: User = Depends(get_admin_user)):
             requirements = await check_vacation_requirements(current_year, user["id"], db)
             
             if requirements["needs_reminder"]:
-                # Send reminder email
-                msg = MIMEMultipart()
-                msg['From'] = smtp_config["smtp_username"]
-                msg['To'] = user["email"]
-                msg['Subject'] = f"Erinnerung: Urlaubsplanung für {current_year}"
-                
+                # Reminder in die Outbox legen
                 body = f"""Hallo {user.get('name', '')},
 
 diese E-Mail erinnert Sie daran, Ihre Urlaubsplanung für das Jahr {current_year} zu vervollständigen.
@@ -4921,27 +6037,39 @@ Mit freundlichen Grüßen
 {COMPANY_INFO["name"]}
                 """
                 
-                msg.attach(MIMEText(body, 'plain', 'utf-8'))
-                
-                server = smtplib.SMTP(smtp_config["smtp_server"], smtp_config["smtp_port"])
-                server.starttls()
-                server.login(smtp_config["smtp_username"], smtp_config["smtp_password"])
-                server.sendmail(smtp_config["smtp_username"], [user["email"]], msg.as_string().encode('utf-8'))
-                server.quit()
+                await mail_outbox.enqueue(
+                    to=[user["email"]],
+                    subject=f"Erinnerung: Urlaubsplanung für {current_year}",
+                    body=body,
+                    context={"type": "vacation_reminder", "user_id": user["id"]}
+                )
                 
                 reminders_sent += 1
-                logger.info(f"Urlaubserinnerung gesendet an {user['email']}")
+                logger.info(f"Urlaubserinnerung eingereiht für {user['email']}")
                 
         except Exception as e:
             errors.append(f"Fehler bei {user.get('email', 'unbekannt')}: {str(e)}")
             logger.error(f"Fehler beim Senden der Urlaubserinnerung: {e}")
     
     return {
-        "message": f"Erinnerungsmails versendet",
+        "message": f"Erinnerungsmails zum Versand eingereiht",
         "reminders_sent": reminders_sent,
         "errors": errors if errors else None
     }
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    encryption_migrator.stop()
+    retention_task = getattr(app.state, "retention_task", None)
+    if retention_task:
+        retention_task.cancel()
+    await review_queue.stop()
+    warm_task = getattr(app.state, "agent_orchestrator_task", None)
+    if warm_task and not warm_task.done():
+        warm_task.cancel()
+    if agent_orchestrator is not None:
+        await agent_orchestrator.close()
+    audit_logger.close()
+    await mail_outbox.stop()
+    await push_dispatcher.close()
     client.close()
\ No newline at end of file
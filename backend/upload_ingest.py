@@ -0,0 +1,70 @@
+"""
+Streaming-Upload für Belege und unterschriebene Stundenzettel
+Liest ein UploadFile in Blöcken, prüft die Größenbegrenzung schon beim Lesen,
+berechnet SHA-256 im selben Durchlauf und verschlüsselt segmentweise in eine temporäre
+Datei, die erst nach dem letzten Block atomar umbenannt wird.
+"""
+
+import asyncio
+import hashlib
+import logging
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = 256 * 1024
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Upload überschreitet die Größenbegrenzung (wird schon beim Lesen erkannt)"""
+
+
+class EmptyUpload(Exception):
+    """Upload enthält keine Daten"""
+
+
+class IngestedUpload:
+    """Ergebnis eines Uploads: Zielpfad, Klartextgröße und SHA-256 des Klartexts"""
+
+    def __init__(self, path: Path, size: int, sha256: str):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+
+
+async def ingest_upload(
+    file: Any,
+    dest_path: Path,
+    encryption: Any,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+) -> IngestedUpload:
+    """Upload blockweise lesen und über encryption.open_writer (DataEncryption) segmentweise
+    verschlüsselt nach dest_path schreiben; atomares Rename erst nach dem letzten Block.
+
+    Bricht ab, sobald mehr als max_bytes gelesen wurden. Im Speicher liegen nur der aktuelle
+    Block und ein Segment. Der Klartext wird nie auf die Platte geschrieben; Verschlüsselung und
+    Schreiben laufen im Thread-Pool, damit die Event-Loop bei parallelen Uploads frei bleibt.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    writer = await asyncio.to_thread(encryption.open_writer, Path(dest_path))
+    try:
+        while True:
+            chunk = await file.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+            digest.update(chunk)
+            await asyncio.to_thread(writer.write, chunk)
+        if not size:
+            raise EmptyUpload("Upload is empty")
+        await asyncio.to_thread(writer.commit)
+    except BaseException:
+        writer.abort()
+        raise
+    return IngestedUpload(path=Path(dest_path), size=size, sha256=digest.hexdigest())
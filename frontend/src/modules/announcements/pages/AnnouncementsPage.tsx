@@ -17,6 +17,7 @@ import {
 } from "../hooks/useAnnouncements";
 import { useCurrentUserQuery } from "../../auth/hooks/useCurrentUser";
 import type { Announcement } from "../../../services/api/announcements";
+import { resolveApiUrl } from "../../../services/api/client";
 
 export const AnnouncementsPage = () => {
   const { data: user } = useCurrentUserQuery();
@@ -199,7 +200,7 @@ export const AnnouncementsPage = () => {
                 <Input
                   id="image"
                   type="file"
-                  accept="image/*"
+                  accept="image/png,image/jpeg,image/gif,image/webp"
                   onChange={handleImageUpload}
                   disabled={uploadImageMutation.isPending}
                 />
@@ -249,7 +250,7 @@ export const AnnouncementsPage = () => {
                     </h2>
                     {announcement.image_url && (
                       <img
-                        src={announcement.image_url}
+                        src={resolveApiUrl(announcement.image_url)}
                         alt={announcement.image_filename ?? "Ankündigung"}
                         className="mt-2 max-h-64 rounded-lg object-contain"
                       />
@@ -11,6 +11,7 @@ import {
 } from "../../timesheets/hooks/useTimesheetStats";
 import { useAnnouncementsQuery } from "../../announcements/hooks/useAnnouncements";
 import { PushNotificationButton } from "../../push/components/PushNotificationButton";
+import { resolveApiUrl } from "../../../services/api/client";
 
 const getCurrentMonth = () => {
   const now = new Date();
@@ -75,7 +76,7 @@ export const DashboardPage = () => {
                   </h3>
                   {announcement.image_url && (
                     <img
-                      src={announcement.image_url}
+                      src={resolveApiUrl(announcement.image_thumbnail_url ?? announcement.image_url)}
                       alt={announcement.image_filename ?? "Ankündigung"}
                       className="mt-2 max-h-32 rounded-lg object-contain"
                     />
@@ -7,6 +7,7 @@ import type { AxiosError } from "axios";
 import {
   fetchAvailableExpenseReportMonths,
   fetchTravelExpenseReport,
+  fetchTravelExpenseReportReviewStatus,
   fetchTravelExpenseReports,
   initializeTravelExpenseReport,
   approveTravelExpenseReport,
@@ -18,11 +19,13 @@ import {
   deleteExpenseReportReceipt,
   sendTravelExpenseReportChatMessage,
   type TravelExpenseReportListParams,
+  type TravelExpenseReportSubmitResponse,
 } from "../../../services/api/travel-expense-reports";
 import type {
   ExpenseReportMonthOption,
   TravelExpenseReport,
   TravelExpenseReportUpdate,
+  TravelExpenseReviewJob,
 } from "../../../services/api/types";
 
 export const travelExpenseReportsKey = (
@@ -49,6 +52,25 @@ export const useTravelExpenseReportQuery = (id: string | undefined) =>
     enabled: Boolean(id),
   });
 
+export const travelExpenseReviewStatusKey = (id: string) =>
+  ["travel-expense-report-review-status", id] as const;
+
+// Fortschritt der KI-Prüfung; solange der Job wartet oder läuft, wird alle 3 s nachgeladen
+export const useTravelExpenseReviewStatusQuery = (
+  id: string | undefined,
+  enabled: boolean
+) =>
+  useQuery<TravelExpenseReviewJob, AxiosError>({
+    queryKey: travelExpenseReviewStatusKey(id ?? ""),
+    queryFn: () => fetchTravelExpenseReportReviewStatus(id ?? ""),
+    enabled: Boolean(id) && enabled,
+    retry: false,
+    refetchInterval: (query) => {
+      const status = query.state.data?.status;
+      return status === "queued" || status === "running" ? 3000 : false;
+    },
+  });
+
 export const useExpenseReportMonthsQuery = () =>
   useQuery<ExpenseReportMonthOption[], AxiosError>({
     queryKey: expenseReportMonthsKey,
@@ -79,11 +101,12 @@ export const useUpdateExpenseReportMutation = (id: string) => {
 
 export const useSubmitExpenseReportMutation = () => {
   const client = useQueryClient();
-  return useMutation<{ message: string }, AxiosError, string>({
+  return useMutation<TravelExpenseReportSubmitResponse, AxiosError, string>({
     mutationFn: submitTravelExpenseReport,
     onSuccess: (_, reportId) => {
       client.invalidateQueries({ queryKey: travelExpenseReportsKey() });
       client.invalidateQueries({ queryKey: travelExpenseReportKey(reportId) });
+      client.invalidateQueries({ queryKey: travelExpenseReviewStatusKey(reportId) });
     },
   });
 };
@@ -1,4 +1,4 @@
-import { useMemo, useState } from "react";
+import { useEffect, useMemo, useState } from "react";
 import { useNavigate, useParams } from "react-router-dom";
 import { Alert } from "../../../components/ui/alert";
 import { Button } from "../../../components/ui/button";
@@ -15,6 +15,7 @@ import {
   useSendExpenseReportChatMutation,
   useSubmitExpenseReportMutation,
   useTravelExpenseReportQuery,
+  useTravelExpenseReviewStatusQuery,
   useUploadExchangeProofMutation,
   useUploadExpenseReportReceiptMutation,
 } from "../hooks/useTravelExpenseReports";
@@ -28,6 +29,13 @@ const statusLabels: Record<string, string> = {
   submitted: "Übermittelt",
 };
 
+const reviewJobLabels: Record<string, string> = {
+  queued: "KI-Prüfung wartet in der Warteschlange",
+  running: "KI-Prüfung läuft",
+  done: "KI-Prüfung abgeschlossen",
+  failed: "KI-Prüfung fehlgeschlagen",
+};
+
 export const ExpenseReportDetailPage = () => {
   const { id } = useParams<{ id: string }>();
   const navigate = useNavigate();
@@ -38,6 +46,10 @@ export const ExpenseReportDetailPage = () => {
     error,
     refetch,
   } = useTravelExpenseReportQuery(id);
+  const { data: reviewJob } = useTravelExpenseReviewStatusQuery(
+    id,
+    data?.status === "in_review"
+  );
   const submitMutation = useSubmitExpenseReportMutation();
   const approveMutation = useApproveExpenseReportMutation();
   const rejectMutation = useRejectExpenseReportMutation();
@@ -63,6 +75,17 @@ export const ExpenseReportDetailPage = () => {
   const [chatDraft, setChatDraft] = useState("");
   const [rejectReason, setRejectReason] = useState("");
 
+  const reviewFailed =
+    data?.status === "in_review" && reviewJob?.status === "failed";
+
+  // Nach Abschluss der KI-Prüfung die Abrechnung mit den Prüfergebnissen neu laden
+  const reviewJobStatus = reviewJob?.status;
+  useEffect(() => {
+    if (reviewJobStatus === "done") {
+      void refetch();
+    }
+  }, [reviewJobStatus, refetch]);
+
   const receiptAnalyses = useMemo(() => {
     const map: Record<string, any> = {};
     data?.document_analyses?.forEach((entry) => {
@@ -288,6 +311,16 @@ export const ExpenseReportDetailPage = () => {
         </Button>
       </div>
 
+      {data.status === "in_review" && reviewJob && (
+        <Alert variant={reviewJob.status === "failed" ? "destructive" : "default"}>
+          {reviewJobLabels[reviewJob.status] ?? reviewJob.status}
+          {reviewJob.progress?.message &&
+            (reviewJob.status === "queued" || reviewJob.status === "running") &&
+            ` – ${reviewJob.progress.message}`}
+          {reviewJob.status === "failed" &&
+            " – erneutes Einreichen startet die Prüfung neu."}
+        </Alert>
+      )}
       {submitMessage && <Alert variant="success">{submitMessage}</Alert>}
       {submitError && <Alert variant="destructive">{submitError}</Alert>}
       {approvalMessage && <Alert variant="success">{approvalMessage}</Alert>}
@@ -500,11 +533,15 @@ export const ExpenseReportDetailPage = () => {
             onClick={handleSubmit}
             disabled={
               submitMutation.isPending ||
-              data.status !== "draft" ||
+              (data.status !== "draft" && !reviewFailed) ||
               data.entries.length === 0
             }
           >
-            {submitMutation.isPending ? "Reicht ein…" : "Bericht einreichen"}
+            {submitMutation.isPending
+              ? "Reicht ein…"
+              : reviewFailed
+                ? "Prüfung erneut starten"
+                : "Bericht einreichen"}
           </Button>
           {data.status !== "draft" && (
             <p className="text-xs text-gray-500">
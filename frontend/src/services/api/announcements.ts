@@ -5,6 +5,8 @@ export interface Announcement {
   title: string;
   content: string;
   image_url?: string | null;
+  image_thumbnail_url?: string | null;
+  image_id?: string | null;
   image_filename?: string | null;
   active: boolean;
   created_at: string;
@@ -29,7 +31,9 @@ export interface AnnouncementUpdate {
 }
 
 export interface ImageUploadResponse {
+  image_id: string;
   image_url: string;
+  image_thumbnail_url: string;
   image_filename: string;
 }
 
@@ -4,6 +4,12 @@ import { authStore } from "../../store/auth-store";
 const baseURL =
   import.meta.env.VITE_API_BASE_URL?.replace(/\/+$/, "") ?? "/api";
 
+// Vom Backend gelieferte Pfade wie "/api/announcements/images/<id>" gegen den API-Server auflösen:
+// Bei VITE_API_BASE_URL=http://<host>:8000/api läuft das Frontend auf einem anderen Origin.
+// Absolute URLs und data:-URLs bleiben unverändert.
+export const resolveApiUrl = (url: string): string =>
+  new URL(url, new URL(baseURL, window.location.origin)).toString();
+
 export const apiClient = axios.create({
   baseURL,
   withCredentials: false,
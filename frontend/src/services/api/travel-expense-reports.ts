@@ -4,6 +4,7 @@ import type {
   TravelExpenseReport,
   TravelExpenseReportChatMessage,
   TravelExpenseReportUpdate,
+  TravelExpenseReviewJob,
 } from "./types";
 
 export interface TravelExpenseReportListParams {
@@ -58,15 +59,30 @@ export const updateTravelExpenseReport = async (
   return data;
 };
 
+export interface TravelExpenseReportSubmitResponse {
+  message: string;
+  job_id?: string;
+  job_status?: TravelExpenseReviewJob["status"];
+}
+
 export const submitTravelExpenseReport = async (
   id: string
-): Promise<{ message: string }> => {
-  const { data } = await apiClient.post<{ message: string }>(
+): Promise<TravelExpenseReportSubmitResponse> => {
+  const { data } = await apiClient.post<TravelExpenseReportSubmitResponse>(
     `/travel-expense-reports/${id}/submit`
   );
   return data;
 };
 
+export const fetchTravelExpenseReportReviewStatus = async (
+  id: string
+): Promise<TravelExpenseReviewJob> => {
+  const { data } = await apiClient.get<TravelExpenseReviewJob>(
+    `/travel-expense-reports/${id}/review-status`
+  );
+  return data;
+};
+
 export const uploadExpenseReportReceipt = async (
   reportId: string,
   file: File
@@ -224,6 +224,33 @@ export interface TravelExpenseReportChatMessage {
   role?: string | null;
 }
 
+export type TravelExpenseReviewJobStatus = "queued" | "running" | "done" | "failed";
+
+export interface TravelExpenseReviewProgress {
+  step: number | null;
+  message: string | null;
+  updated_at: string;
+}
+
+export interface TravelExpenseReviewJob {
+  id: string;
+  report_id: string;
+  status: TravelExpenseReviewJobStatus;
+  attempts: number;
+  last_error?: string | null;
+  created_at: string;
+  next_attempt_at?: string | null;
+  started_at?: string | null;
+  finished_at?: string | null;
+  progress?: TravelExpenseReviewProgress | null;
+  progress_log?: TravelExpenseReviewProgress[];
+  result?: {
+    status?: string;
+    issues?: number;
+    requires_user_input?: boolean;
+  } | null;
+}
+
 export interface AdminUserSummary {
   id: string;
   email: string;
@@ -0,0 +1,123 @@
+"""
+Gemeinsame Test-Infrastruktur: backend/ im Importpfad, eine Event-Loop für die ganze Session,
+freie Ports, eine Test-Datenbank in MongoDB und ein konfigurierbarer Fake-Ollama-Server.
+
+Motor und aiohttp binden Clients und Server an eine Event-Loop. Alle Tests laufen deshalb über
+loop.run_until_complete auf derselben Loop, die am Ende der Session geschlossen wird. Sie ist schon beim
+Laden dieser Datei die Default-Loop, damit der Motor-Client von server.py (auch bei "import server" auf
+Modulebene einer Testdatei) an sie gebunden wird.
+"""
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+import uuid
+from pathlib import Path
+from typing import Awaitable, Callable, Dict
+
+import pytest
+
+try:
+    from pymongo.errors import ConnectionFailure
+except ImportError:  # ohne pymongo überspringen die Fixtures per importorskip
+    ConnectionFailure = OSError
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+# server.py liest Datenbank und Ablagepfade beim Import: Tests arbeiten nie auf echten Daten
+os.environ.setdefault("DB_NAME", f"stundenzettel_test_{uuid.uuid4().hex[:8]}")
+_DATA_DIR = Path(tempfile.mkdtemp(prefix="stundenzettel_test_"))
+os.environ.setdefault("LOCAL_RECEIPTS_PATH", str(_DATA_DIR / "receipts"))
+os.environ.setdefault("ANNOUNCEMENT_IMAGE_PATH", str(_DATA_DIR / "announcement_images"))
+os.environ.setdefault("AUDIT_LOG_FILE", str(_DATA_DIR / "logs" / "audit.log"))
+
+
+_LOOP = asyncio.new_event_loop()
+asyncio.set_event_loop(_LOOP)
+
+# Nur "keine MongoDB da" führt zum Überspringen, Verdrahtungsfehler (z.B. falsche Loop) schlagen fehl
+MONGO_UNAVAILABLE = (ConnectionFailure, asyncio.TimeoutError)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="session")
+def loop():
+    loop = _LOOP
+    yield loop
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
+
+
+@pytest.fixture
+def unused_port() -> int:
+    """Port, auf dem (noch) niemand lauscht, z.B. für 'Server nicht erreichbar'-Tests"""
+    return _free_port()
+
+
+@pytest.fixture(scope="module")
+def mongo_db(loop):
+    """Eigene Test-Datenbank je Modul (MONGO_URL, Default mongodb://localhost:27017), danach gelöscht.
+    Ohne erreichbare MongoDB werden die Tests übersprungen."""
+    motor_asyncio = pytest.importorskip("motor.motor_asyncio")
+    client = motor_asyncio.AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"), io_loop=loop)
+    try:
+        loop.run_until_complete(asyncio.wait_for(client.admin.command("ping"), timeout=3))
+    except MONGO_UNAVAILABLE as exc:
+        client.close()
+        pytest.skip(f"MongoDB nicht erreichbar: {exc!r}")
+    db_name = f"stundenzettel_test_{uuid.uuid4().hex[:8]}"
+    yield client[db_name]
+    loop.run_until_complete(client.drop_database(db_name))
+    client.close()
+
+
+@pytest.fixture(scope="session")
+def server_module(loop):
+    """backend/server.py mit Test-Datenbank (DB_NAME oben) und angelegten Indizes, am Ende gelöscht.
+    Ohne erreichbare MongoDB werden die Tests übersprungen."""
+    pytest.importorskip("fastapi")
+    pytest.importorskip("motor")
+    import server
+
+    try:
+        loop.run_until_complete(asyncio.wait_for(server.client.admin.command("ping"), timeout=3))
+    except MONGO_UNAVAILABLE as exc:
+        pytest.skip(f"MongoDB nicht erreichbar: {exc!r}")
+    loop.run_until_complete(server.ensure_indexes())
+    yield server
+    loop.run_until_complete(server.client.drop_database(server.db.name))
+
+
+@pytest.fixture(scope="module")
+def fake_ollama(loop):
+    """Startet Fake-Ollama-Server mit den übergebenen Routen und liefert deren Basis-URL:
+
+        base_url = fake_ollama({"/api/chat": handler})
+
+    handler ist ein aiohttp-Handler (async def handler(request) -> web.StreamResponse).
+    Alle gestarteten Server werden am Ende des Moduls beendet."""
+    web = pytest.importorskip("aiohttp.web")
+    runners = []
+
+    def start(routes: Dict[str, Callable[..., Awaitable]]) -> str:
+        app = web.Application()
+        for path, handler in routes.items():
+            app.router.add_post(path, handler)
+        runner = web.AppRunner(app)
+        port = _free_port()
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", port).start())
+        runners.append(runner)
+        return f"http://127.0.0.1:{port}"
+
+    yield start
+    for runner in runners:
+        loop.run_until_complete(runner.cleanup())
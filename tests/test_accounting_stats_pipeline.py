@@ -0,0 +1,251 @@
+"""
+Parität der Accounting-Monatsstatistik: MongoDB-Aggregation vs. bisherige Python-Implementierung.
+
+Benötigt eine laufende MongoDB (MONGO_URL, Default mongodb://localhost:27017).
+Es wird eine eigene Test-Datenbank angelegt und danach wieder gelöscht.
+"""
+import uuid
+
+import pytest
+
+pytest.importorskip("motor")
+pytest.importorskip("fastapi")
+
+from pydantic import ValidationError  # noqa: E402
+
+import server  # noqa: E402
+from hours_kernel import coerce_time_entry_values  # noqa: E402
+
+
+def _entry(date, start="08:00", end="16:30", break_minutes=30, **kwargs):
+    entry = {
+        "date": date,
+        "start_time": start,
+        "end_time": end,
+        "break_minutes": break_minutes,
+        "tasks": "Montage",
+        "customer_project": "Kunde A",
+        "location": "Dresden",
+        "absence_type": None,
+        "travel_time_minutes": 0,
+        "include_travel_time": False,
+    }
+    entry.update(kwargs)
+    return entry
+
+
+def _timesheet(user_id, user_name, week_start, week_end, entries, status="approved", signed=True):
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "user_name": user_name,
+        "week_start": week_start,
+        "week_end": week_end,
+        "entries": entries,
+        "status": status,
+        "signed_pdf_path": "/tmp/signed.pdf" if signed else None,
+    }
+
+
+USERS = [
+    {"id": "u-anna", "name": "Anna", "weekly_hours": 40.0},
+    {"id": "u-bernd", "name": "Bernd", "weekly_hours": 30.0},
+    {"id": "u-carla", "name": "carla", "weekly_hours": 20.0},
+    {"id": "u-dora", "name": "Dora"},
+]
+
+TIMESHEETS = [
+    # Woche über den Monatswechsel: nur die März-Einträge zählen
+    _timesheet("u-anna", "Anna", "2025-02-24", "2025-03-02", [
+        _entry("2025-02-27"),
+        _entry("2025-02-28", travel_time_minutes=45, include_travel_time=True),
+        _entry("2025-03-01", start="09:00", end="13:15", break_minutes=0, travel_time_minutes=90),
+    ]),
+    _timesheet("u-anna", "Anna", "2025-03-03", "2025-03-09", [
+        _entry("2025-03-03", travel_time_minutes=30, include_travel_time=True),
+        _entry("2025-03-04", absence_type="urlaub", start="", end=""),
+        _entry("2025-03-05", absence_type="krankheit"),
+        _entry("2025-03-06", start="22:00", end="06:00"),  # negatives Intervall -> 0 Stunden
+        _entry("2025-03-07", start="", end="", travel_time_minutes=120, include_travel_time=True),
+    ]),
+    # Nicht freigegeben bzw. nicht unterschrieben: zählt nur in timesheets_count
+    _timesheet("u-bernd", "Bernd", "2025-03-10", "2025-03-16", [_entry("2025-03-10")], status="sent"),
+    _timesheet("u-bernd", "Bernd", "2025-03-17", "2025-03-23", [_entry("2025-03-17")], signed=False),
+    _timesheet("u-bernd", "Bernd", "2025-03-24", "2025-03-30", [
+        _entry("2025-03-24", absence_type="feiertag"),
+        _entry("2025-03-25", start="7:05", end="15:50", break_minutes=45),
+    ]),
+    # Stundenzettel nur in anderen Monaten: User erscheint mit 0 Stunden
+    _timesheet("u-carla", "carla", "2025-04-07", "2025-04-13", [_entry("2025-04-07")]),
+    # User ohne weekly_hours-Feld (Default 40)
+    _timesheet("u-dora", "Dora", "2025-03-10", "2025-03-16", [
+        _entry("2025-03-11", absence_type="urlaub"),
+        _entry("2025-03-12", start="08:00", end="12:00", break_minutes=0),
+    ]),
+]
+
+TRAVEL_EXPENSES = [
+    {"id": "te-1", "user_id": "u-anna", "user_name": "Anna", "date": "2025-03-03", "kilometers": 123.4, "expenses": 45.67, "status": "approved"},
+    {"id": "te-2", "user_id": "u-anna", "user_name": "Anna", "date": "2025-03-20", "kilometers": 10.0, "expenses": 0.5, "status": "approved"},
+    {"id": "te-3", "user_id": "u-anna", "user_name": "Anna", "date": "2025-03-21", "kilometers": 999.0, "expenses": 999.0, "status": "draft"},
+    {"id": "te-4", "user_id": "u-anna", "user_name": "Anna", "date": "2025-04-01", "kilometers": 50.0, "expenses": 12.0, "status": "approved"},
+    # Reisekosten ohne Stundenzettel
+    {"id": "te-5", "user_id": "u-erik", "user_name": "Erik", "date": "2025-03-15", "kilometers": 80.0, "expenses": 20.0, "status": "approved"},
+    {"id": "te-6", "user_id": "u-erik", "user_name": "Erik", "date": "not-a-date", "kilometers": 80.0, "expenses": 20.0, "status": "approved"},
+]
+
+# Grenzfälle: Datumsformate, die datetime.strptime annimmt, Werte, die TimeEntry umwandelt oder ablehnt,
+# weekly_hours ohne Zahl, Namen bei Umbenennung
+EDGE_USERS = [
+    {"id": "u-edgar", "name": "Edgar", "weekly_hours": 40.0},
+    {"id": "u-gerd", "name": "Gerd", "weekly_hours": None},
+]
+
+EDGE_TIMESHEETS = [
+    # Älterer Stundenzettel mit altem Namen steht zuerst
+    _timesheet("u-edgar", "Edgar Alt", "2025-03-03", "2025-03-09", [
+        _entry("2025-3-3", start="08:00", end="16:00", break_minutes=0),  # ohne führende Nullen
+        _entry("2025-03-4", absence_type="urlaub"),
+        _entry("2025-3-32"),  # kein gültiger Tag
+        _entry("2025-02-30"),  # kein gültiger Tag, nicht im März
+        _entry("2025-03-05", break_minutes=" 30 "),  # TimeEntry wandelt um
+        _entry("2025-03-05", break_minutes="30.5"),  # TimeEntry lehnt ab: zählt keine Stunden
+        _entry("2025-03-05", include_travel_time=2),
+        {k: v for k, v in _entry("2025-03-06").items() if k != "tasks"},
+        _entry("2025-03-08", travel_time_minutes="6_0", include_travel_time="YES"),
+        _entry("2025-03-07", start=" 8:00", end="09:00", break_minutes=0, travel_time_minutes=30.0,
+               include_travel_time=1),
+    ]),
+    _timesheet("u-edgar", "Edgar", "2025-03-10", "2025-03-16", [
+        _entry("2025-3- 9", start="08:00", end="12:00", break_minutes=0),  # Tag mit führendem Leerzeichen
+        _entry("2025-03-10", start="08:00", end="12:00", break_minutes=0.0),
+        _entry("2025-03-11", start="08:00", end="12:01", break_minutes=True),
+    ]),
+    # Nur ungültige Einträge im Monat: zählt als Stundenzettel, aber ohne Stunden
+    _timesheet("u-edgar", "Edgar", "2025-03-17", "2025-03-23", [_entry("2025-03-17", travel_time_minutes=None)]),
+    # weekly_hours null: jeder Eintrag scheitert an der Division, der Stundenzettel zählt trotzdem
+    _timesheet("u-gerd", "Gerd", "2025-03-10", "2025-03-16", [
+        _entry("2025-03-11", absence_type="urlaub"),
+        _entry("2025-03-12"),
+    ]),
+]
+
+EDGE_TRAVEL_EXPENSES = [
+    {"id": "te-e1", "user_id": "u-edgar", "user_name": "Edgar", "date": "2025-3-9", "kilometers": 10.0, "expenses": 1.0, "status": "approved"},
+    {"id": "te-e2", "user_id": "u-edgar", "user_name": "Edgar", "date": "2025-02-30", "kilometers": 99.0, "expenses": 9.0, "status": "approved"},
+    # Nur Reisekosten: Name der ersten Abrechnung
+    {"id": "te-f2", "user_id": "u-fritz", "user_name": "Fritz", "date": "2025-03-20", "kilometers": 5.0, "expenses": 2.0, "status": "approved"},
+    {"id": "te-f1", "user_id": "u-fritz", "user_name": "Fritz Alt", "date": "2025-03-01", "kilometers": 5.0, "expenses": 2.0, "status": "approved"},
+]
+
+
+async def _run(months, users=USERS, timesheets=TIMESHEETS, travel_expenses=TRAVEL_EXPENSES):
+    await server.db.users.insert_many([dict(u) for u in users])
+    await server.db.timesheets.insert_many([dict(t) for t in timesheets])
+    await server.db.travel_expenses.insert_many([dict(e) for e in travel_expenses])
+    try:
+        results = []
+        for year, month in months:
+            month_str = f"{year:04d}-{month:02d}"
+            rows = await server.aggregate_accounting_stats(year, month)
+            reference = server.compute_accounting_stats_reference(timesheets, travel_expenses, users, year, month)
+            results.append((
+                server._accounting_stats_response(month_str, rows),
+                server._accounting_stats_response(month_str, reference),
+            ))
+        return results
+    finally:
+        for collection in ("users", "timesheets", "travel_expenses"):
+            await server.db[collection].delete_many({})
+
+
+def test_pipeline_matches_reference(server_module, loop):
+    months = [(2025, 2), (2025, 3), (2025, 4), (2025, 5)]
+    for pipeline_result, reference_result in loop.run_until_complete(_run(months)):
+        assert pipeline_result.model_dump() == reference_result.model_dump()
+
+
+def test_pipeline_matches_reference_on_edge_rows(server_module, loop):
+    months = [(2025, 2), (2025, 3)]
+    results = loop.run_until_complete(_run(months, EDGE_USERS, EDGE_TIMESHEETS, EDGE_TRAVEL_EXPENSES))
+    for pipeline_result, reference_result in results:
+        pipeline_stats = {s.user_id: s.model_dump() for s in pipeline_result.stats}
+        reference_stats = {s.user_id: s.model_dump() for s in reference_result.stats}
+        # Einzige beabsichtigte Abweichung: nach einer Umbenennung gilt der Name der neuesten Woche
+        assert pipeline_stats["u-edgar"].pop("user_name") == "Edgar"
+        assert reference_stats["u-edgar"].pop("user_name") == "Edgar Alt"
+        assert pipeline_stats == reference_stats
+
+
+def test_reference_values_on_edge_rows():
+    stats = {
+        s.user_id: s
+        for s in server._accounting_stats_response(
+            "2025-03",
+            server.compute_accounting_stats_reference(EDGE_TIMESHEETS, EDGE_TRAVEL_EXPENSES, EDGE_USERS, 2025, 3)
+        ).stats
+    }
+    edgar = stats["u-edgar"]
+    # 8h + 1 Urlaubstag + 8h + (8h + 1h Fahrzeit) + (1h + 0.5h Fahrzeit) + 4h + 4h + 4h
+    assert edgar.total_hours == 8.0 + 8.0 + 8.0 + 9.0 + 1.5 + 4.0 + 4.0 + 4.0
+    assert edgar.hours_on_timesheets == 8.0 + 8.0 + 9.0 + 1.5 + 4.0 + 4.0 + 4.0
+    assert edgar.travel_hours == 1.5
+    assert edgar.travel_hours_on_timesheets == 1.5
+    assert edgar.timesheets_count == 3
+    assert edgar.travel_kilometers == 10.0
+    assert (stats["u-gerd"].total_hours, stats["u-gerd"].timesheets_count) == (0.0, 1)
+    assert stats["u-fritz"].user_name == "Fritz"
+    assert stats["u-fritz"].travel_kilometers == 10.0
+
+
+_MISSING = object()
+_INT_VALUES = [30, 30.0, 30.5, True, "30", " 30 ", "\xa030", "1_000", "30.00", "-5", "+5", "30.", "3e1", "_3", "",
+               None, float("nan"), [30]]
+
+
+@pytest.mark.parametrize("field,values", [
+    ("break_minutes", _INT_VALUES + [_MISSING]),
+    ("travel_time_minutes", _INT_VALUES + [_MISSING]),
+    ("include_travel_time", [True, False, 0, 1, 2, 1.0, 0.5, "yes", "YES", "Off", "t", " yes", "2", "", None, _MISSING]),
+    ("absence_type", ["urlaub", None, 5, _MISSING]),
+    ("tasks", ["Montage", 5, None, _MISSING]),
+])
+def test_time_entry_values_match_model(field, values):
+    for value in values:
+        entry = _entry("2025-03-03")
+        if value is _MISSING:
+            del entry[field]
+        else:
+            entry[field] = value
+        try:
+            dumped = server.TimeEntry(**entry).model_dump()
+            expected = {k: dumped[k] for k in ("break_minutes", "travel_time_minutes", "include_travel_time")}
+        except ValidationError:
+            expected = None
+        assert coerce_time_entry_values(entry) == expected, (field, value)
+
+
+def test_reference_values():
+    stats = {
+        s.user_id: s
+        for s in server._accounting_stats_response(
+            "2025-03",
+            server.compute_accounting_stats_reference(TIMESHEETS, TRAVEL_EXPENSES, USERS, 2025, 3)
+        ).stats
+    }
+    anna = stats["u-anna"]
+    # 4.25h + 1.5h Fahrzeit, 8h + 0.5h, 2 Abwesenheitstage * 8h, 0h, 2h Fahrzeit
+    assert anna.total_hours == 5.75 + 8.5 + 16.0 + 2.0
+    assert anna.hours_on_timesheets == 4.25 + 8.5 + 2.0
+    assert anna.travel_hours == 1.5 + 0.5 + 2.0
+    assert anna.travel_hours_on_timesheets == 2.5
+    assert anna.travel_kilometers == 133.4
+    assert anna.travel_expenses == 46.17
+    assert anna.timesheets_count == 2
+    assert stats["u-bernd"].timesheets_count == 3
+    assert stats["u-bernd"].total_hours == 6.0 + 8.0
+    assert stats["u-carla"].total_hours == 0.0
+    assert stats["u-carla"].timesheets_count == 0
+    assert stats["u-dora"].total_hours == 8.0 + 4.0
+    assert stats["u-erik"].user_name == "Erik"
+    assert stats["u-erik"].travel_kilometers == 80.0
@@ -0,0 +1,129 @@
+"""
+Ankündigungsbilder: Der Typ wird aus dem Inhalt bestimmt (SVG und als Bild getarnte Dateien werden
+abgelehnt), ausgeliefert wird nur mit bekanntem Rastertyp und Content-Security-Policy sandbox.
+Bilder (samt Vorschau-Variante) werden gelöscht, sobald keine Ankündigung mehr auf sie verweist.
+
+Die Endpunkt-Tests benötigen eine laufende MongoDB (MONGO_URL, Default mongodb://localhost:27017).
+"""
+import io
+
+import pytest
+
+from blob_store import sniff_image_type
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 32
+SVG = b'<svg xmlns="http://www.w3.org/2000/svg"><script>alert(document.domain)</script></svg>'
+
+
+def test_sniff_image_type():
+    assert sniff_image_type(PNG) == "image/png"
+    assert sniff_image_type(b"\xff\xd8\xff\xe0" + b"\x00" * 16) == "image/jpeg"
+    assert sniff_image_type(b"GIF89a" + b"\x00" * 16) == "image/gif"
+    assert sniff_image_type(b"RIFF\x10\x00\x00\x00WEBPVP8 ") == "image/webp"
+    assert sniff_image_type(SVG) is None
+    assert sniff_image_type(b"<html><body>") is None
+    assert sniff_image_type(b"") is None
+
+
+def _admin(server):
+    return server.User(email="admin@example.com", name="Admin", role="admin", hashed_password="x")
+
+
+def _upload(server, data: bytes, content_type: str):
+    from fastapi import UploadFile
+    from starlette.datastructures import Headers
+
+    file = UploadFile(file=io.BytesIO(data), filename="bild", headers=Headers({"content-type": content_type}))
+    return server.upload_announcement_image(file=file, current_user=_admin(server))
+
+
+def _request(headers=None):
+    from starlette.requests import Request
+
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers or []})
+
+
+def test_svg_declared_as_image_is_rejected(server_module, loop):
+    from fastapi import HTTPException
+
+    with pytest.raises(HTTPException) as rejected:
+        loop.run_until_complete(_upload(server_module, SVG, "image/svg+xml"))
+    assert rejected.value.status_code == 400
+    with pytest.raises(HTTPException):
+        loop.run_until_complete(_upload(server_module, SVG, "image/png"))
+
+
+def test_image_is_served_with_sniffed_type_and_sandbox(server_module, loop):
+    server = server_module
+    # Vom Client falsch angegebener Typ wird durch den erkannten ersetzt
+    result = loop.run_until_complete(_upload(server, PNG, "image/jpeg"))
+    assert result["content_type"] == "image/png"
+    assert result["image_url"] == f"/api/announcements/images/{result['image_id']}"
+
+    response = loop.run_until_complete(server.get_announcement_image(result["image_id"], _request()))
+    assert response.media_type == "image/png"
+    assert response.headers["content-security-policy"].startswith("sandbox")
+
+    # Blob mit unsicherem Typ (direkt über den BlobStore abgelegt): nur als Download
+    meta = loop.run_until_complete(server.announcement_images.put(SVG, "image/svg+xml", "alt.svg"))
+    response = loop.run_until_complete(server.get_announcement_image(meta["id"], _request()))
+    assert response.media_type == "application/octet-stream"
+
+
+def _large_png(color) -> bytes:
+    image_module = pytest.importorskip("PIL.Image")
+    out = io.BytesIO()
+    image_module.new("RGB", (800, 600), color).save(out, format="PNG")
+    return out.getvalue()
+
+
+def test_images_are_removed_when_no_announcement_references_them(server_module, loop, monkeypatch):
+    server = server_module
+    admin = _admin(server)
+    monkeypatch.setattr(server, "ANNOUNCEMENT_IMAGE_GRACE_SECONDS", 0)
+
+    def stored(blob_id):
+        meta = loop.run_until_complete(server.announcement_images.get_meta(blob_id))
+        return meta is not None and server.announcement_images.path(blob_id).exists()
+
+    def create(image_id):
+        created = server.AnnouncementCreate(title="Info", content="<p>Text</p>", image_id=image_id)
+        return loop.run_until_complete(server.create_announcement(created, current_user=admin))
+
+    first = loop.run_until_complete(_upload(server, _large_png("red"), "image/png"))
+    second = loop.run_until_complete(_upload(server, _large_png("blue"), "image/png"))
+    first_ids = [first["image_id"], first["image_thumbnail_url"].rsplit("/", 1)[1]]
+    assert first_ids[0] != first_ids[1]  # eigene Vorschau-Variante
+
+    shared, other = create(first["image_id"]), create(first["image_id"])
+    # Noch referenziert: bleibt
+    loop.run_until_complete(server.delete_announcement(shared.id, current_user=admin))
+    assert all(stored(blob_id) for blob_id in first_ids)
+
+    # Letzte Referenz wechselt auf ein anderes Bild: Original und Vorschau verschwinden
+    update = server.AnnouncementUpdate(image_id=second["image_id"])
+    loop.run_until_complete(server.update_announcement(other.id, update, current_user=admin))
+    assert not any(stored(blob_id) for blob_id in first_ids)
+    assert stored(second["image_id"])
+
+    # Andere Felder ändern lässt das Bild unberührt, Löschen der Ankündigung nicht
+    loop.run_until_complete(server.update_announcement(other.id, server.AnnouncementUpdate(title="Neu"), current_user=admin))
+    assert stored(second["image_id"])
+    loop.run_until_complete(server.delete_announcement(other.id, current_user=admin))
+    assert not stored(second["image_id"])
+
+
+def test_fresh_uploads_survive_the_cleanup(server_module, loop, monkeypatch):
+    server = server_module
+    uploaded = loop.run_until_complete(_upload(server, _large_png("green"), "image/png"))
+    image_id = uploaded["image_id"]
+
+    # Hochgeladen, aber die Ankündigung ist noch nicht gespeichert
+    loop.run_until_complete(server.cleanup_announcement_images())
+    assert loop.run_until_complete(server.announcement_images.get_meta(image_id))
+
+    # Nach der Schonfrist räumt der Gesamtlauf (beim Start) verwaiste Bilder ab
+    monkeypatch.setattr(server, "ANNOUNCEMENT_IMAGE_GRACE_SECONDS", 0)
+    assert loop.run_until_complete(server.cleanup_announcement_images()) >= 2
+    assert loop.run_until_complete(server.announcement_images.get_meta(image_id)) is None
+    assert not server.announcement_images.path(image_id).exists()
@@ -0,0 +1,124 @@
+"""
+AuditLogger mit mehreren Schreibern auf denselben Segmenten (gunicorn -w N).
+
+Mehrere Prozesse und mehrere Instanzen im selben Prozess hängen abwechselnd an dasselbe Segment an.
+Jeder Schreiber und ein frisch gestarteter Leser müssen danach alle Einträge vollständig und
+unverfälscht liefern, auch gefiltert über den Sidecar-Index.
+"""
+import json
+import multiprocessing
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("cryptography")
+pytest.importorskip("pymongo")
+
+from compliance import AuditLogger  # noqa: E402
+
+WRITERS = 4
+ENTRIES_PER_WRITER = 60
+
+
+def _write_entries(log_file: str, writer: int, start: multiprocessing.Event) -> None:
+    audit = AuditLogger(log_file=Path(log_file), flush_interval_seconds=60)
+    start.wait(5)
+    for i in range(ENTRIES_PER_WRITER):
+        audit.log_access(
+            action="view" if i % 2 else "download", user_id=f"u{writer}", resource_type="receipt",
+            resource_id=f"{writer}-{i}", details={"padding": "x" * (writer * 7 + i % 5)}
+        )
+        if i % 3 == 0:
+            audit.flush()  # viele kleine Schreibvorgänge, damit sich die Prozesse abwechseln
+    audit.close()
+
+
+def _expected_ids(writers=range(WRITERS)):
+    return {f"{writer}-{i}" for writer in writers for i in range(ENTRIES_PER_WRITER)}
+
+
+def test_processes_appending_to_one_segment(tmp_path):
+    log_file = tmp_path / "audit.log"
+    context = multiprocessing.get_context("fork")
+    start = context.Event()
+    processes = [context.Process(target=_write_entries, args=(str(log_file), w, start)) for w in range(WRITERS)]
+    for process in processes:
+        process.start()
+    start.set()
+    for process in processes:
+        process.join(30)
+        assert process.exitcode == 0
+
+    reader = AuditLogger(log_file=log_file)
+    try:
+        logs = reader.get_logs(limit=10_000)
+        assert {entry["resource_id"] for entry in logs} == _expected_ids()
+        assert len(logs) == WRITERS * ENTRIES_PER_WRITER
+        filtered = reader.get_logs(limit=10_000, user_id="u2", action="view")
+        assert {entry["resource_id"] for entry in filtered} == {f"2-{i}" for i in range(1, ENTRIES_PER_WRITER, 2)}
+        assert all(entry["user_id"] == "u2" and entry["action"] == "view" for entry in filtered)
+    finally:
+        reader.close()
+
+    # Jede Sidecar-Zeile zeigt genau auf eine vollständige Zeile des Segments
+    segments = list((tmp_path / "audit").glob("audit-*.log"))
+    assert len(segments) == 1
+    data = segments[0].read_bytes()
+    offsets = [json.loads(line)[:2] for line in segments[0].with_suffix(".idx").read_text().splitlines()]
+    assert len(offsets) == WRITERS * ENTRIES_PER_WRITER
+    for offset, length in offsets:
+        json.loads(data[offset:offset + length])
+
+
+def test_writer_sees_entries_of_other_writers(tmp_path):
+    log_file = tmp_path / "audit.log"
+    first = AuditLogger(log_file=log_file, flush_interval_seconds=60)
+    second = AuditLogger(log_file=log_file, flush_interval_seconds=60)
+    try:
+        for i in range(10):
+            writer = first if i % 2 else second
+            writer.log_access("view", f"u{i % 2}", "receipt", f"r{i}")
+            writer.flush()
+        for audit in (first, second):
+            logs = audit.get_logs(limit=100)
+            assert [entry["resource_id"] for entry in logs] == [f"r{i}" for i in reversed(range(10))]
+            assert [entry["resource_id"] for entry in audit.get_logs(limit=100, user_id="u1")] == ["r9", "r7", "r5", "r3", "r1"]
+    finally:
+        first.close()
+        second.close()
+
+
+def test_indexes_are_loaded_lazily_and_bounded(tmp_path):
+    log_file = tmp_path / "audit.log"
+    writer = AuditLogger(log_file=log_file, flush_interval_seconds=60)
+    try:
+        # Fünf Tagessegmente mit je vier Einträgen, älteste zuerst geschrieben
+        for day in range(1, 6):
+            writer._append([
+                {"timestamp": f"2025-03-0{day}T10:00:0{i}", "action": "view", "user_id": f"u{i % 2}",
+                 "resource_type": "receipt", "resource_id": f"{day}-{i}", "details": {}}
+                for i in range(4)
+            ])
+    finally:
+        writer.close()
+    segments = sorted((tmp_path / "audit").glob("audit-*.log"))
+    assert len(segments) == 5
+
+    reader = AuditLogger(log_file=log_file, max_cached_indexes=2)
+    try:
+        # limit aus dem neuesten Segment: nur dessen Index wird geladen
+        assert [e["resource_id"] for e in reader.get_logs(limit=3)] == ["5-3", "5-2", "5-1"]
+        assert list(reader._indexes) == [segments[-1]]
+        assert [e["resource_id"] for e in reader.get_logs(limit=6)] == ["5-3", "5-2", "5-1", "5-0", "4-3", "4-2"]
+        assert list(reader._indexes) == segments[-1:-3:-1]
+
+        # Alles lesen: weiterhin höchstens zwei Indizes im Speicher
+        logs = reader.get_logs(limit=100)
+        assert [e["resource_id"] for e in logs] == [f"{day}-{i}" for day in range(5, 0, -1) for i in range(3, -1, -1)]
+        assert len(reader._indexes) == 2
+        assert [e["resource_id"] for e in reader.get_logs(limit=100, user_id="u1")] == [
+            f"{day}-{i}" for day in range(5, 0, -1) for i in (3, 1)
+        ]
+        assert len(reader._indexes) == 2
+    finally:
+        reader.close()
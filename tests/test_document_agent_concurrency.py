@@ -0,0 +1,182 @@
+"""
+DocumentAgent.process: nebenläufige Belegprüfung gegen einen Fake-Ollama-Server mit fester Latenz.
+
+Der Fake-Server antwortet auf /api/chat nach LATENCY Sekunden mit einer gültigen Analyse, in der der
+Dateiname aus dem Prompt steht. So lassen sich Laufzeit (sequenziell vs. parallel), Reihenfolge der
+Ergebnisse, Timeouts und die Message-Bus-Benachrichtigungen prüfen. Keine MongoDB nötig.
+"""
+import asyncio
+import json
+import re
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("pydantic")
+
+from aiohttp import web  # noqa: E402
+
+from agents import (  # noqa: E402
+    AgentMessageBus, DocumentAgent, LLMResponseCache, OllamaLLM, get_model_semaphore, model_concurrency
+)
+
+LATENCY = 0.2
+RECEIPTS = 8
+
+
+class FakeOllama:
+    """Minimaler Ollama-Ersatz: feste Latenz, zählt gleichzeitige Anfragen"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.active = 0
+        self.max_active = 0
+        self.requests = 0
+
+    async def chat(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        self.requests += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.active -= 1
+        prompt = body["messages"][-1]["content"]
+        filename = re.search(r"Dateiname: (\S+)", prompt).group(1)
+        analysis = {
+            "document_type": "other",
+            "language": "de",
+            "extracted_data": {"filename": filename, "amount": 10.0, "currency": "EUR"},
+            "validation_issues": [],
+            "completeness_check": {"has_amount": True},
+            "confidence": 0.5,
+        }
+        return web.json_response({"message": {"role": "assistant", "content": json.dumps(analysis)}})
+
+
+@pytest.fixture(scope="module")
+def ollama(fake_ollama):
+    server = FakeOllama(LATENCY)
+    server.base_url = fake_ollama({"/api/chat": server.chat})
+    return server
+
+
+def _agent(base_url: str, message_bus=None, model: str = "fake-model") -> DocumentAgent:
+    # Eigener, abgeschalteter Cache: jede Analyse soll den Fake-Server erreichen
+    llm = OllamaLLM(base_url=base_url, model=model, cache=LLMResponseCache(enabled=False))
+    # Die Tool-Registry wird für die Analyse nicht gebraucht
+    return DocumentAgent(llm, message_bus=message_bus, tools=SimpleNamespace())
+
+
+def _receipts(tmp_path: Path, count: int):
+    receipts = []
+    for index in range(count):
+        path = tmp_path / f"beleg_{index}.pdf"
+        path.write_bytes(b"kein echtes PDF")
+        receipts.append({"id": f"r{index}", "filename": path.name, "local_path": str(path)})
+    return receipts
+
+
+def test_concurrent_analysis_is_faster_and_keeps_order(ollama, loop, tmp_path):
+    receipts = _receipts(tmp_path, RECEIPTS)
+    agent = _agent(ollama.base_url)
+    stats = {}
+
+    async def run(concurrency: int):
+        started = time.perf_counter()
+        analyses = await agent.process(receipts, max_concurrency=concurrency, stats=stats)
+        return analyses, time.perf_counter() - started
+
+    try:
+        sequential, sequential_seconds = loop.run_until_complete(run(1))
+        ollama.max_active = 0
+        concurrent, concurrent_seconds = loop.run_until_complete(run(4))
+    finally:
+        loop.run_until_complete(agent.llm.close())
+
+    assert sequential_seconds >= RECEIPTS * LATENCY
+    # Vier gleichzeitig: mindestens RECEIPTS / 4 Wellen, deutlich schneller als sequenziell
+    assert RECEIPTS / 4 * LATENCY <= concurrent_seconds < sequential_seconds / 2
+    assert ollama.max_active <= 4
+    assert stats["concurrency"] == 4
+    assert stats["sequential_seconds"] > stats["wall_seconds"]
+    # Reihenfolge der Ergebnisse entspricht der Eingabe
+    for analyses in (sequential, concurrent):
+        assert [a.extracted_data["filename"] for a in analyses] == [r["filename"] for r in receipts]
+
+
+def test_timeout_per_receipt_and_bus_notifications(ollama, loop, tmp_path):
+    receipts = _receipts(tmp_path, 3)
+    bus = AgentMessageBus()
+    received = []
+    bus.subscribe("AccountingAgent", received.append)
+    agent = _agent(ollama.base_url, message_bus=bus)
+
+    stats = {}
+    try:
+        analyses = loop.run_until_complete(
+            agent.process(receipts, max_concurrency=3, timeout_seconds=LATENCY / 4, stats=stats)
+        )
+    finally:
+        loop.run_until_complete(agent.llm.close())
+
+    assert stats["timeouts"] == 3
+    assert all("Zeitüberschreitung" in a.validation_issues[0] for a in analyses)
+    assert sorted(m["content"]["receipt_id"] for m in received) == ["r0", "r1", "r2"]
+
+
+def test_timeout_starts_when_model_slot_is_acquired(ollama, loop, tmp_path):
+    # Andere Aufrufer belegen alle Slots des Modells länger als der Timeout; gewartet wird trotzdem
+    model = "busy-model"
+    receipts = _receipts(tmp_path, 2)
+    agent = _agent(ollama.base_url, model=model)
+    stats = {}
+
+    async def run():
+        semaphore = get_model_semaphore(model)
+        for _ in range(model_concurrency(model)):
+            await semaphore.acquire()
+
+        async def release_later():
+            await asyncio.sleep(LATENCY * 3)
+            for _ in range(model_concurrency(model)):
+                semaphore.release()
+
+        releaser = asyncio.ensure_future(release_later())
+        analyses = await agent.process(receipts, max_concurrency=2, timeout_seconds=LATENCY * 2, stats=stats)
+        await releaser
+        return analyses
+
+    try:
+        analyses = loop.run_until_complete(run())
+    finally:
+        loop.run_until_complete(agent.llm.close())
+
+    assert stats["timeouts"] == 0
+    assert [a.extracted_data["filename"] for a in analyses] == [r["filename"] for r in receipts]
+
+
+def test_concurrent_runs_keep_their_own_stats(ollama, loop, tmp_path):
+    # Zwei Prüfläufe teilen sich den Agenten (wie im Orchestrator), jeder erhält seine eigenen Laufzeiten
+    small, large = _receipts(tmp_path, 1), _receipts(tmp_path, 5)
+    agent = _agent(ollama.base_url)
+    small_stats, large_stats = {}, {}
+
+    async def run():
+        await asyncio.gather(
+            agent.process(small, max_concurrency=1, stats=small_stats),
+            agent.process(large, max_concurrency=5, stats=large_stats),
+        )
+
+    try:
+        loop.run_until_complete(run())
+    finally:
+        loop.run_until_complete(agent.llm.close())
+
+    assert (small_stats["receipts"], small_stats["concurrency"]) == (1, 1)
+    assert (large_stats["receipts"], large_stats["concurrency"]) == (5, 5)
+    assert small_stats["wall_seconds"] < large_stats["sequential_seconds"]
@@ -0,0 +1,145 @@
+"""
+Segmentiertes Dateiformat (AES-256-GCM): Roundtrip, Bereichslesen an Segmentgrenzen und Ablehnung
+manipulierter Dateien (gekürzt, vertauschte Segmente, veränderter Header).
+
+Version-1-Dateien (ohne Salt, Schlüssel der Key-ID direkt) und Fernet-Altdateien müssen lesbar bleiben.
+"""
+import os
+import struct
+
+import pytest
+
+pytest.importorskip("cryptography")
+
+from cryptography.exceptions import InvalidTag  # noqa: E402
+from cryptography.fernet import Fernet  # noqa: E402
+
+from compliance import SEGMENT_SIZE, SEGMENTED_MAGIC, DataEncryption, KeyRing  # noqa: E402
+
+SECRET = Fernet.generate_key()
+DATA = os.urandom(3 * SEGMENT_SIZE + 123)
+
+
+@pytest.fixture
+def encryption():
+    return DataEncryption(keyring=KeyRing(SECRET))
+
+
+@pytest.fixture
+def encrypted(encryption, tmp_path):
+    path = tmp_path / "beleg.enc"
+    assert encryption.encrypt_to_path(DATA, path) == len(DATA)
+    return path
+
+
+def _segments(path):
+    """Header und Segmente (jeweils Chiffretext + Tag) einer Datei der Standard-Segmentgröße"""
+    raw = path.read_bytes()
+    header_size = len(raw) - (len(DATA) + 4 * 16)
+    body = raw[header_size:]
+    step = SEGMENT_SIZE + 16
+    return raw[:header_size], [body[i:i + step] for i in range(0, len(body), step)]
+
+
+def test_roundtrip(encryption, encrypted, tmp_path):
+    assert encryption.decrypt_file(encrypted) == DATA
+    assert encryption.plaintext_size(encrypted) == len(DATA)
+    assert DATA[:64] not in encrypted.read_bytes()
+    assert encryption.file_key_id(encrypted) == encryption.key_id
+    assert not encryption.needs_reencryption(encrypted)
+
+    streamed = tmp_path / "stream.enc"
+    streamed.write_bytes(b"".join(encryption.encrypt_stream([DATA[:1000], DATA[1000:]])))
+    assert encryption.decrypt_file(streamed) == DATA
+
+    empty = tmp_path / "leer.enc"
+    encryption.encrypt_to_path(b"", empty)
+    assert encryption.decrypt_file(empty) == b""
+
+
+def test_same_plaintext_gives_unrelated_files(encryption, encrypted, tmp_path):
+    # Eigener Salt und damit eigener Dateischlüssel je Datei
+    other = tmp_path / "kopie.enc"
+    encryption.encrypt_to_path(DATA, other)
+    first_header, first_segments = _segments(encrypted)
+    second_header, second_segments = _segments(other)
+    assert first_header[5:] != second_header[5:]
+    assert first_segments[0] != second_segments[0]
+
+
+@pytest.mark.parametrize("start,length", [
+    (0, 10),
+    (SEGMENT_SIZE - 5, 10),
+    (SEGMENT_SIZE, SEGMENT_SIZE),
+    (2 * SEGMENT_SIZE - 1, SEGMENT_SIZE + 2),
+    (3 * SEGMENT_SIZE, 123),
+    (3 * SEGMENT_SIZE + 100, 1000),
+    (len(DATA), 10),
+    (len(DATA) + 10, 10),
+    (5, 0),
+])
+def test_decrypt_range_at_segment_edges(encryption, encrypted, start, length):
+    assert encryption.decrypt_range(encrypted, start, length) == DATA[start:start + length]
+
+
+def test_truncated_file_is_rejected(encryption, encrypted):
+    header, segments = _segments(encrypted)
+    # Letztes Segment entfernt: das neue letzte trägt nicht das Letztes-Segment-Flag
+    encrypted.write_bytes(header + b"".join(segments[:-1]))
+    with pytest.raises(InvalidTag):
+        encryption.decrypt_file(encrypted)
+    # Mitten im Segment abgeschnitten
+    encrypted.write_bytes(header + b"".join(segments)[:-40])
+    with pytest.raises(InvalidTag):
+        encryption.decrypt_file(encrypted)
+    encrypted.write_bytes(header[:10])
+    with pytest.raises(ValueError):
+        encryption.decrypt_file(encrypted)
+
+
+def test_reordered_segments_are_rejected(encryption, encrypted):
+    header, segments = _segments(encrypted)
+    segments[0], segments[1] = segments[1], segments[0]
+    encrypted.write_bytes(header + b"".join(segments))
+    with pytest.raises(InvalidTag):
+        encryption.decrypt_file(encrypted)
+    with pytest.raises(InvalidTag):
+        encryption.decrypt_range(encrypted, 0, 10)
+
+
+@pytest.mark.parametrize("offset", [4, 7, 12, 40])  # Version, Segmentgröße, Nonce-Präfix, Salt
+def test_tampered_header_is_rejected(encryption, encrypted, offset):
+    raw = bytearray(encrypted.read_bytes())
+    raw[offset] ^= 0x01
+    encrypted.write_bytes(bytes(raw))
+    with pytest.raises((InvalidTag, ValueError)):
+        encryption.decrypt_file(encrypted)
+
+
+def test_version_1_and_fernet_files_are_still_read(encryption, tmp_path):
+    key = encryption.keyring.primary
+    key_id = key.key_id.encode("ascii")
+    nonce_prefix = os.urandom(7)
+    header = SEGMENTED_MAGIC + struct.pack(">BI7sB", 1, SEGMENT_SIZE, nonce_prefix, len(key_id)) + key_id
+    segments = [DATA[i:i + SEGMENT_SIZE] for i in range(0, len(DATA), SEGMENT_SIZE)]
+    body = b"".join(
+        key.aead.encrypt(nonce_prefix + struct.pack(">I", index) + (b"\x01" if index == len(segments) - 1 else b"\x00"),
+                         segment, header)
+        for index, segment in enumerate(segments)
+    )
+    version_1 = tmp_path / "v1.enc"
+    version_1.write_bytes(header + body)
+    assert encryption.decrypt_file(version_1) == DATA
+    assert encryption.decrypt_range(version_1, SEGMENT_SIZE - 3, 6) == DATA[SEGMENT_SIZE - 3:SEGMENT_SIZE + 3]
+    # Version 1 wird trotz passender Key-ID ins Format mit Dateischlüssel umgeschrieben
+    assert encryption.needs_reencryption(version_1)
+    assert encryption.migrate_file(version_1)
+    assert version_1.read_bytes()[4] == 2
+    assert encryption.decrypt_file(version_1) == DATA
+
+    legacy = tmp_path / "alt.enc"
+    legacy.write_bytes(Fernet(SECRET).encrypt(DATA[:1000]))
+    assert encryption.decrypt_file(legacy) == DATA[:1000]
+    assert encryption.migrate_file(legacy)
+    assert encryption.decrypt_file(legacy) == DATA[:1000]
+    assert legacy.read_bytes()[4] == 2
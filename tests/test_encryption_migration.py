@@ -0,0 +1,72 @@
+"""
+EncryptionMigrator: Pause nur nach umgeschriebenen Dateien, ein Lauf je Schlüssel und nur in einem Worker.
+
+Die Koordination über MongoDB benötigt eine laufende MongoDB (MONGO_URL, Default mongodb://localhost:27017).
+"""
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("cryptography")
+pytest.importorskip("pymongo")
+
+from cryptography.fernet import Fernet  # noqa: E402
+
+from compliance import DataEncryption, EncryptionMigrator, KeyRing  # noqa: E402
+
+SECRET = Fernet.generate_key()
+
+
+def _files(root, legacy: int, current: int, encryption: DataEncryption):
+    root.mkdir()
+    for i in range(legacy):
+        (root / f"alt_{i}.pdf").write_bytes(Fernet(SECRET).encrypt(b"%%PDF alt %d" % i))
+    for i in range(current):
+        encryption.encrypt_to_path(b"%%PDF neu %d" % i, root / f"neu_{i}.pdf")
+
+
+def test_pause_only_after_migrated_files(tmp_path, loop):
+    encryption = DataEncryption(keyring=KeyRing(SECRET))
+    _files(tmp_path / "belege", legacy=1, current=20, encryption=encryption)
+    migrator = EncryptionMigrator(encryption, tmp_path / "belege", pause_seconds=0.5)
+
+    started = time.perf_counter()
+    stats = loop.run_until_complete(migrator.run())
+    elapsed = time.perf_counter() - started
+
+    assert stats["scanned"] == 21 and stats["migrated"] == 1 and stats["finished"]
+    # Eine Pause für die eine umgeschriebene Datei, nicht 21
+    assert 0.5 <= elapsed < 2.0
+    assert encryption.decrypt_file(tmp_path / "belege" / "alt_0.pdf") == b"%PDF alt 0"
+
+
+def test_runs_once_per_key_and_in_one_worker(tmp_path, mongo_db, loop):
+    encryption = DataEncryption(keyring=KeyRing(SECRET))
+    _files(tmp_path / "belege", legacy=3, current=2, encryption=encryption)
+    workers = [EncryptionMigrator(encryption, tmp_path / "belege", pause_seconds=0.05, db=mongo_db) for _ in range(2)]
+
+    async def _both():
+        return await asyncio.gather(*(worker.run() for worker in workers))
+
+    results = loop.run_until_complete(_both())
+    assert sorted(r.get("skipped", "ran") for r in results) == ["ran", "running_elsewhere"]
+    assert sum(r["migrated"] for r in results) == 3
+    state = loop.run_until_complete(workers[0].state())
+    assert state["finished_key_id"] == encryption.key_id
+    assert state["lease_until"] is None
+
+    # Neustart mit demselben Schlüssel: kein erneuter Scan
+    restarted = EncryptionMigrator(encryption, tmp_path / "belege", db=mongo_db)
+    stats = loop.run_until_complete(restarted.run())
+    assert stats["skipped"] == "already_finished" and stats["scanned"] == 0
+
+    # Explizit erzwungen (Admin-Endpunkt) läuft er trotzdem, findet aber nichts mehr
+    stats = loop.run_until_complete(restarted.run(force=True))
+    assert stats["scanned"] == 5 and stats["migrated"] == 0
+
+    # Nach einer Rotation ist der Vermerk veraltet
+    rotated = DataEncryption(keyring=KeyRing(Fernet.generate_key(), [SECRET]))
+    stats = loop.run_until_complete(EncryptionMigrator(rotated, tmp_path / "belege", pause_seconds=0, db=mongo_db).run())
+    assert stats["migrated"] == 5
+    assert loop.run_until_complete(restarted.state())["finished_key_id"] == rotated.key_id
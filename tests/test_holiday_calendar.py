@@ -0,0 +1,91 @@
+"""
+Feiertags- und Arbeitstagskalender: is_busday / busday_count gegen numpy.busday_count mit denselben Feiertagen,
+über Jahresgrenzen hinweg und mit den sächsischen Feiertagen (Reformationstag, Buß- und Bettag).
+Keine MongoDB nötig.
+"""
+from datetime import date, timedelta
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("holidays")
+
+from holiday_calendar import HolidayCalendar  # noqa: E402
+
+YEARS = range(2023, 2027)
+
+
+@pytest.fixture
+def calendar():
+    # Eigene Instanz: der Test soll nicht vom Cache der prozessweiten abhängen
+    return HolidayCalendar()
+
+
+def _expected_counts(calendar, starts, ends):
+    holidays = sorted(d for year in YEARS for d in calendar.holiday_items(year))
+    begin = np.array(starts, dtype="datetime64[D]")
+    # numpy zählt das Ende exklusiv, busday_count inklusive
+    end = np.array(ends, dtype="datetime64[D]") + 1
+    return np.where(end > begin, np.busday_count(begin, np.maximum(begin, end), holidays=holidays), 0)
+
+
+def test_saxon_holidays_are_not_busdays(calendar):
+    days = [
+        "2024-10-31",  # Reformationstag (Do)
+        "2024-11-20",  # Buß- und Bettag (Mi)
+        "2025-11-19",  # Buß- und Bettag (Mi)
+        "2024-10-03",  # Tag der Deutschen Einheit (Do)
+        "2024-12-25", "2024-12-26", "2025-01-01",
+        "2024-11-21",  # Do nach Buß- und Bettag
+        "2024-12-31",  # Silvester ist kein Feiertag (Di)
+        "2025-01-02",
+        "2024-12-28",  # Samstag
+    ]
+    assert calendar.is_busday(days).tolist() == [False] * 7 + [True, True, True, False]
+    assert calendar.holiday_items(2024)[date(2024, 11, 20)] == "Buß- und Bettag"
+    # Bundesweiter Kalender ohne Sachsen kennt den Buß- und Bettag nicht
+    assert HolidayCalendar(subdivisions=(None,)).is_busday(["2024-11-20", "2024-10-31"]).tolist() == [True, True]
+
+
+def test_busday_count_across_year_boundaries(calendar):
+    starts = ["2024-12-20", "2024-12-23", "2023-12-30", "2024-01-01", "2023-06-01", "2025-11-17", "2025-01-10"]
+    ends = ["2025-01-10", "2025-01-01", "2026-01-02", "2024-12-31", "2026-03-31", "2025-11-21", "2025-01-09"]
+    counts = calendar.busday_count(starts, ends)
+    assert counts.tolist() == _expected_counts(calendar, starts, ends).tolist()
+    # 23.12.2024 - 01.01.2025: Mo, Di, Fr, Mo, Di sind Werktage, 25./26.12. und Neujahr nicht
+    assert counts[1] == 5
+    # Woche mit Buß- und Bettag
+    assert counts[5] == 4
+    # start > end
+    assert counts[6] == 0
+    # Skalare API zählt genauso
+    assert [calendar.count_working_days(s, e) for s, e in zip(starts, ends)] == counts.tolist()
+
+
+def test_bulk_api_matches_numpy_for_all_days(calendar):
+    first, last = date(2023, 1, 1), date(2026, 12, 31)
+    days = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+    holidays = sorted(d for year in YEARS for d in calendar.holiday_items(year))
+    expected = np.is_busday(np.array(days, dtype="datetime64[D]"), holidays=holidays)
+    assert calendar.is_busday(days).tolist() == expected.tolist()
+
+    rng = np.random.default_rng(5)
+    offsets = np.sort(rng.integers(0, len(days), size=(200, 2)), axis=1)
+    starts = [days[i] for i in offsets[:, 0]]
+    ends = [days[i] for i in offsets[:, 1]]
+    assert calendar.busday_count(starts, ends).tolist() == _expected_counts(calendar, starts, ends).tolist()
+    assert calendar.working_days_between(first, last) == [d for d, busy in zip(days, expected) if busy]
+
+
+def test_holiday_items_cannot_change_the_cache(calendar):
+    items = calendar.holiday_items(2024)
+    with pytest.raises(TypeError):
+        items[date(2024, 12, 31)] = "Silvester"
+    with pytest.raises(TypeError):
+        del items[date(2024, 11, 20)]
+    # Kopie des Aufrufers ist frei veränderbar, der Kalender bleibt unberührt
+    copy = dict(items)
+    copy.pop(date(2024, 11, 20))
+    assert calendar.is_holiday("2024-11-20")
+    assert not calendar.is_busday(["2024-11-20"])[0]
+    assert calendar.holiday_items(2024) is items
@@ -0,0 +1,146 @@
+"""
+Spaltenbasierte Stundenberechnung (hours_kernel) gegen die skalare Berechnung in server.py:
+TimeEntry(**entry) und _entry_hours je Eintrag, auch für gemischte, fehlerhafte und Grenzfall-Einträge.
+Einträge, die TimeEntry ablehnt, tragen keine Stunden bei, ihr Datum zählt weiter für den Monat.
+"""
+from collections import defaultdict
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("fastapi")
+
+from pydantic import ValidationError  # noqa: E402
+
+import server  # noqa: E402
+from hours_kernel import EntryColumns, compute_hours, coerce_time_entry_values, month_contributions  # noqa: E402
+
+
+def _entry(date="2025-03-03", start="08:00", end="16:30", break_minutes=30, **kwargs):
+    entry = {
+        "date": date,
+        "start_time": start,
+        "end_time": end,
+        "break_minutes": break_minutes,
+        "tasks": "Montage",
+        "customer_project": "Kunde A",
+        "location": "Dresden",
+    }
+    entry.update(kwargs)
+    return entry
+
+
+ENTRIES = [
+    _entry(),
+    _entry(travel_time_minutes=45, include_travel_time=True),
+    _entry(travel_time_minutes=90),
+    _entry(start="22:00", end="06:00"),  # negatives Intervall -> 0 Stunden
+    _entry(start="", end="", travel_time_minutes=120, include_travel_time=True),
+    _entry(start=" 8:00", end="9:05 ", break_minutes=0),
+    _entry(start="08:00:00", end="16:00"),  # drei Teile: Arbeitszeit 0
+    _entry(start="ab:cd", end="16:00"),
+    _entry(break_minutes="30"),  # TimeEntry wandelt um
+    _entry(break_minutes=" 1_0 ", travel_time_minutes="60.0", include_travel_time="YES"),
+    _entry(break_minutes=30.0, travel_time_minutes=-30, include_travel_time=1),  # negative Fahrzeit
+    _entry(break_minutes=True),
+    _entry(break_minutes=30.5),  # TimeEntry lehnt ab
+    _entry(break_minutes=None),
+    _entry(travel_time_minutes=None),
+    _entry(include_travel_time=2),
+    _entry(absence_type=5),
+    {k: v for k, v in _entry().items() if k != "tasks"},
+    _entry(absence_type="urlaub", start="", end=""),
+    _entry(absence_type="urlaub", break_minutes="x"),  # ungültig: kein Abwesenheitstag
+    _entry(date="2025-04-01", absence_type="krankheit"),
+    _entry(date="2025-4-2", start="07:00", end="12:00", break_minutes=0),
+    _entry(date="2025-02-30"),  # kein gültiger Tag
+    _entry(date=20250303),
+    "kaputt",
+    server.TimeEntry(**_entry(date="2025-04-03", travel_time_minutes=15, include_travel_time=True)),
+]
+
+
+def _time_entry(entry):
+    """Skalarer Weg wie in compute_accounting_stats_reference: None, wenn TimeEntry ablehnt"""
+    if isinstance(entry, server.TimeEntry):
+        return entry
+    try:
+        return server.TimeEntry(**entry)
+    except (TypeError, ValidationError):
+        return None
+
+
+def _scalar_hours(te):
+    if te is None:
+        return {"total_hours": 0.0, "hours_on_timesheets": 0.0, "travel_hours": 0.0, "travel_hours_on_timesheets": 0.0}
+    total = server._entry_hours(te)
+    travel = (te.travel_time_minutes or 0) / 60.0
+    worked = total - travel if travel > 0 else total
+    travel_on_timesheets = travel if te.include_travel_time and travel > 0 else 0.0
+    return {
+        "total_hours": total,
+        "hours_on_timesheets": worked + travel_on_timesheets,
+        "travel_hours": travel,
+        "travel_hours_on_timesheets": travel_on_timesheets,
+    }
+
+
+def test_compute_hours_matches_entry_hours():
+    columns = EntryColumns(ENTRIES)
+    hours = compute_hours(columns)
+    for index, entry in enumerate(ENTRIES):
+        expected = _scalar_hours(_time_entry(entry))
+        for key, value in expected.items():
+            assert hours[key][index] == pytest.approx(value), (index, key, entry)
+    assert columns.valid.tolist() == [_time_entry(e) is not None for e in ENTRIES]
+
+
+def test_month_contributions_match_scalar_loop():
+    expected = defaultdict(lambda: {"work_hours": 0.0, "absence_days": 0, "hours_on_timesheets": 0.0,
+                                    "travel_hours": 0.0, "travel_hours_on_timesheets": 0.0})
+    for entry in ENTRIES:
+        row = entry.model_dump() if isinstance(entry, server.TimeEntry) else entry
+        date = row.get("date") if isinstance(row, dict) else None
+        if not isinstance(date, str):
+            continue
+        try:
+            parsed = datetime.strptime(date, "%Y-%m-%d")
+        except ValueError:
+            continue
+        key = f"{parsed.year:04d}-{parsed.month:02d}"
+        contrib = expected[key]
+        te = _time_entry(entry)
+        if te is not None and te.absence_type in server.ABSENCE_TYPES:
+            contrib["absence_days"] += 1
+            continue
+        scalar = _scalar_hours(te)
+        contrib["work_hours"] += scalar["total_hours"]
+        for field in ("hours_on_timesheets", "travel_hours", "travel_hours_on_timesheets"):
+            contrib[field] += scalar[field]
+
+    actual = month_contributions(EntryColumns(ENTRIES))
+    assert sorted(actual) == sorted(expected) == ["2025-03", "2025-04"]
+    for month, contrib in expected.items():
+        assert actual[month]["absence_days"] == contrib["absence_days"]
+        for field in ("work_hours", "hours_on_timesheets", "travel_hours", "travel_hours_on_timesheets"):
+            assert actual[month][field] == pytest.approx(contrib[field]), (month, field)
+
+
+def test_rule_matches_time_entry():
+    for entry in ENTRIES:
+        if isinstance(entry, server.TimeEntry):
+            continue
+        te = _time_entry(entry)
+        values = coerce_time_entry_values(entry)
+        if te is None:
+            assert values is None, entry
+        else:
+            assert values == {"break_minutes": te.break_minutes, "travel_time_minutes": te.travel_time_minutes,
+                              "include_travel_time": te.include_travel_time}, entry
+
+
+def test_empty_batch():
+    columns = EntryColumns([])
+    assert columns.size == 0
+    assert month_contributions(columns) == {}
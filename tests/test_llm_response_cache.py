@@ -0,0 +1,185 @@
+"""
+LLM-Antwort-Cache: LRU und TTL im Prozess, gemeinsame MongoDB-Stufe, Zähler je Agent und Umgehen des Caches.
+OllamaLLM.chat läuft gegen einen Fake-Ollama-Server, der die Anfragen zählt.
+
+Die Tests der MongoDB-Stufe benötigen eine laufende MongoDB (MONGO_URL, Default mongodb://localhost:27017).
+"""
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("pydantic")
+
+from aiohttp import web  # noqa: E402
+
+from agents import LLMResponseCache, OllamaLLM  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "Prüfe den Beleg"}]
+
+
+class FakeOllama:
+    """Antwortet mit einer fortlaufenden Nummer; die ersten fail_times Anfragen schlagen fehl"""
+
+    def __init__(self):
+        self.requests = 0
+        self.fail_times = 0
+
+    async def chat(self, request: web.Request) -> web.Response:
+        await request.json()
+        self.requests += 1
+        if self.requests <= self.fail_times:
+            return web.Response(status=500, text="kaputt")
+        return web.json_response({"message": {"role": "assistant", "content": f"Antwort {self.requests}"}})
+
+
+@pytest.fixture(scope="module")
+def ollama(fake_ollama):
+    server = FakeOllama()
+    server.base_url = fake_ollama({"/api/chat": server.chat})
+    return server
+
+
+def _key(text: str) -> str:
+    return LLMResponseCache.make_key("fake-model", {}, [{"role": "user", "content": text}])
+
+
+def test_lru_evicts_least_recently_used(loop):
+    cache = LLMResponseCache(maxsize=2, ttl_seconds=60, enabled=True)
+
+    async def run():
+        await cache.set(_key("a"), "A", "fake-model")
+        await cache.set(_key("b"), "B", "fake-model")
+        assert await cache.get(_key("a")) == "A"  # a ist jetzt zuletzt benutzt
+        await cache.set(_key("c"), "C", "fake-model")
+        return [await cache.get(_key(k)) for k in "abc"]
+
+    assert loop.run_until_complete(run()) == ["A", None, "C"]
+    assert cache.stats()["size"] == 2
+
+
+def test_entries_expire_after_ttl(loop):
+    cache = LLMResponseCache(maxsize=10, ttl_seconds=0.05, enabled=True)
+    loop.run_until_complete(cache.set(_key("a"), "A", "fake-model"))
+    assert loop.run_until_complete(cache.get(_key("a"))) == "A"
+    time.sleep(0.1)
+    assert loop.run_until_complete(cache.get(_key("a"))) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_key_covers_model_options_and_messages():
+    base = LLMResponseCache.make_key("m", {"temperature": 0.7}, MESSAGES)
+    assert base == LLMResponseCache.make_key("m", {"temperature": 0.7}, [dict(MESSAGES[0])])
+    assert base != LLMResponseCache.make_key("n", {"temperature": 0.7}, MESSAGES)
+    assert base != LLMResponseCache.make_key("m", {"temperature": 0.2}, MESSAGES)
+    assert base != LLMResponseCache.make_key("m", {"temperature": 0.7}, [{"role": "user", "content": "Anders"}])
+
+
+def test_db_tier_is_shared_between_processes(mongo_db, loop):
+    # Zwei Caches an derselben Collection stehen für zwei Worker
+    writer = LLMResponseCache(maxsize=10, ttl_seconds=60, enabled=True)
+    reader = LLMResponseCache(maxsize=10, ttl_seconds=60, enabled=True)
+    writer.attach_db(mongo_db)
+    reader.attach_db(mongo_db)
+
+    async def run():
+        await mongo_db[LLMResponseCache.COLLECTION].delete_many({})
+        await writer.set(_key("a"), "A", "fake-model", agent="DocumentAgent")
+        # Abgelaufene Einträge (vor dem Lauf des TTL-Index) zählen nicht
+        await mongo_db[LLMResponseCache.COLLECTION].insert_one({
+            "key": _key("alt"), "response": "alt", "expires_at": datetime.utcnow() - timedelta(seconds=1)
+        })
+        return [
+            await reader.get(_key("a"), agent="DocumentAgent"),
+            await reader.get(_key("a"), agent="DocumentAgent"),
+            await reader.get(_key("alt"), agent="DocumentAgent"),
+        ]
+
+    assert loop.run_until_complete(run()) == ["A", "A", None]
+    stored = loop.run_until_complete(mongo_db[LLMResponseCache.COLLECTION].find_one({"key": _key("a")}))
+    assert (stored["agent"], stored["model"]) == ("DocumentAgent", "fake-model")
+    assert stored["expires_at"] > datetime.utcnow()
+    counters = reader.stats()["agents"]["DocumentAgent"]
+    assert (counters["db_hits"], counters["memory_hits"], counters["misses"]) == (1, 1, 1)
+    assert reader.stats()["persistent"] is True
+
+
+def test_chat_counts_per_agent_and_honours_opt_out(ollama, loop):
+    cache = LLMResponseCache(maxsize=10, ttl_seconds=60, enabled=True)
+    llm = OllamaLLM(base_url=ollama.base_url, model="fake-model", cache=cache)
+    llm.retry_delay = 0
+
+    async def run():
+        requests = ollama.requests
+        first = await llm.chat(MESSAGES, "System", agent="DocumentAgent")
+        second = await llm.chat(MESSAGES, "System", agent="DocumentAgent")
+        # Anderer Agent, gleicher Prompt: Treffer, aber eigener Zähler
+        third = await llm.chat(MESSAGES, "System", agent="AccountingAgent")
+        # Dialoge umgehen den Cache und landen nicht darin
+        bypassed = await llm.chat(MESSAGES, "Dialog", use_cache=False, agent="ChatAgent")
+        assert await llm.chat(MESSAGES, "Dialog", agent="ChatAgent") != bypassed
+        return first, second, third, ollama.requests - requests
+
+    try:
+        first, second, third, requests = loop.run_until_complete(run())
+    finally:
+        loop.run_until_complete(llm.close())
+
+    assert first == second == third
+    assert requests == 3
+    agents = cache.stats()["agents"]
+    assert agents["DocumentAgent"] == {"memory_hits": 1, "db_hits": 0, "misses": 1, "bypassed": 0, "hit_rate": 0.5}
+    assert agents["AccountingAgent"]["memory_hits"] == 1
+    assert agents["AccountingAgent"]["hit_rate"] == 1.0
+    assert (agents["ChatAgent"]["bypassed"], agents["ChatAgent"]["misses"]) == (1, 1)
+
+
+def test_failed_and_disabled_calls_are_not_cached(ollama, loop):
+    cache = LLMResponseCache(maxsize=10, ttl_seconds=60, enabled=True)
+    llm = OllamaLLM(base_url=ollama.base_url, model="fake-model", cache=cache)
+    llm.retry_delay = 0
+    llm.max_retries = 1
+    disabled = OllamaLLM(base_url=ollama.base_url, model="fake-model", cache=LLMResponseCache(enabled=False))
+
+    async def run():
+        ollama.fail_times = ollama.requests + 1
+        failed = await llm.chat(MESSAGES, "Fehler", agent="DocumentAgent")
+        retried = await llm.chat(MESSAGES, "Fehler", agent="DocumentAgent")
+        requests = ollama.requests
+        await disabled.chat(MESSAGES, "Aus", agent="DocumentAgent")
+        await disabled.chat(MESSAGES, "Aus", agent="DocumentAgent")
+        return failed, retried, ollama.requests - requests
+
+    try:
+        failed, retried, disabled_requests = loop.run_until_complete(run())
+    finally:
+        loop.run_until_complete(llm.close())
+        loop.run_until_complete(disabled.close())
+
+    assert "API error 500" in failed
+    assert retried.startswith("Antwort")
+    assert disabled_requests == 2
+    assert disabled.cache.stats()["agents"]["DocumentAgent"]["bypassed"] == 2
+    assert cache.stats()["agents"]["DocumentAgent"]["misses"] == 2
+
+
+def test_memory_context_is_not_part_of_the_key(ollama, loop):
+    # Dokumentierter Kompromiss: gleicher Beleg mit neuerem Gedächtnis trifft den alten Eintrag
+    cache = LLMResponseCache(maxsize=10, ttl_seconds=60, enabled=True)
+    llm = OllamaLLM(base_url=ollama.base_url, model="fake-model", cache=cache)
+
+    async def run():
+        base = "Du prüfst Belege."
+        first = await llm.chat(MESSAGES, base + "\nGedächtnis: A", cache_system_prompt=base)
+        second = await llm.chat(MESSAGES, base + "\nGedächtnis: A, B", cache_system_prompt=base)
+        other = await llm.chat(MESSAGES, "Du ordnest Belege zu.\nGedächtnis: A", cache_system_prompt="Du ordnest")
+        return first, second, other
+
+    try:
+        first, second, other = loop.run_until_complete(run())
+    finally:
+        loop.run_until_complete(llm.close())
+
+    assert first == second
+    assert other != first
@@ -0,0 +1,168 @@
+"""
+Mail-Outbox: Zustellung über einen lokalen SMTP-Server (aiosmtpd) und Retry mit Backoff.
+
+Benötigt eine laufende MongoDB (MONGO_URL, Default mongodb://localhost:27017).
+Es wird eine eigene Test-Datenbank angelegt und danach wieder gelöscht.
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("motor")
+controller_module = pytest.importorskip("aiosmtpd.controller")
+
+from mail_outbox import MailOutbox  # noqa: E402
+
+
+class _RecordingHandler:
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        return "250 OK"
+
+
+async def _configure_smtp(db, port):
+    await db.smtp_config.delete_many({})
+    await db.smtp_config.insert_one({
+        "smtp_server": "127.0.0.1",
+        "smtp_port": port,
+        "smtp_username": "stundenzettel@example.com",
+        "smtp_password": "",
+        "admin_email": "admin@example.com",
+    })
+    await db.mail_outbox.delete_many({})
+
+
+def test_batch_is_delivered_over_one_connection(mongo_db, loop, unused_port):
+    handler = _RecordingHandler()
+    controller = controller_module.Controller(handler, hostname="127.0.0.1", port=unused_port)
+    controller.start()
+    hook_calls = []
+
+    async def _hook(spec):
+        hook_calls.append(spec["timesheet_id"])
+
+    async def _run():
+        await _configure_smtp(mongo_db, controller.port)
+        outbox = MailOutbox(mongo_db, require_tls=False)
+        outbox.register_hook("timesheet_sent", _hook)
+        ids = [
+            await outbox.enqueue(
+                [f"user{i}@example.com"], f"Stundenzettel {i}", "Hallo",
+                cc=["admin@example.com"],
+                attachments=[(f"stundenzettel_{i}.pdf", b"%PDF-1.4 test")],
+                on_sent={"hook": "timesheet_sent", "timesheet_id": f"ts-{i}"},
+            )
+            for i in range(3)
+        ]
+        processed = await outbox.process_once()
+        await outbox.stop()
+        return outbox, ids, processed
+
+    try:
+        outbox, ids, processed = loop.run_until_complete(_run())
+    finally:
+        controller.stop()
+
+    assert processed == 3
+    assert len(handler.messages) == 3
+    assert outbox.stats_counters["connections"] == 1
+    assert sorted(hook_calls) == ["ts-0", "ts-1", "ts-2"]
+    assert set(handler.messages[0].rcpt_tos) == {"user0@example.com", "admin@example.com"}
+
+    async def _statuses():
+        return await asyncio.gather(*(outbox.get_status(i) for i in ids))
+
+    statuses = loop.run_until_complete(_statuses())
+    assert all(s["status"] == "sent" and s["attempts"] == 1 and s["sent_at"] for s in statuses)
+    # Nach dem Versand bleiben nur die Metadaten
+    stored = loop.run_until_complete(mongo_db.mail_outbox.find_one({"id": ids[0]}))
+    assert "attachments" not in stored and "body" not in stored
+    assert stored["subject"] == "Stundenzettel 0"
+
+
+def test_failed_delivery_is_retried_with_backoff(mongo_db, loop, unused_port):
+    async def _run():
+        # Kein Server auf diesem Port -> Verbindungsfehler
+        await _configure_smtp(mongo_db, unused_port)
+        outbox = MailOutbox(mongo_db, require_tls=False, smtp_timeout_seconds=2)
+        outbox_id = await outbox.enqueue(["user@example.com"], "Test", "Hallo")
+        await outbox.process_once()
+        # Noch nicht fällig -> nichts zu tun
+        processed_again = await outbox.process_once()
+        return await outbox.get_status(outbox_id), processed_again
+
+    status, processed_again = loop.run_until_complete(_run())
+    assert status["status"] == "queued"
+    assert status["attempts"] == 1
+    assert status["last_error"]
+    assert status["next_attempt_at"] > datetime.utcnow()
+    assert processed_again == 0
+
+
+def test_each_mail_is_sent_within_its_own_lease(mongo_db, loop, unused_port):
+    # Langsamer Server: ein gemeinsamer Batch-Lease wäre für die letzten Mails abgelaufen, bevor sie dran sind
+    class _SlowHandler(_RecordingHandler):
+        async def handle_DATA(self, server, session, envelope):
+            await asyncio.sleep(0.1)
+            self.messages.append((envelope.rcpt_tos[0], datetime.utcnow()))
+            return "250 OK"
+
+    class _RecordingOutbox(MailOutbox):
+        async def _claim_next(self):
+            claimed_at = datetime.utcnow()
+            doc = await super()._claim_next()
+            if doc is not None:
+                claimed = await self.collection.count_documents({"status": "sending"})
+                leases[doc["to"][0]] = (claimed, claimed_at + timedelta(seconds=self.lease_seconds))
+            return doc
+
+    handler = _SlowHandler()
+    controller = controller_module.Controller(handler, hostname="127.0.0.1", port=unused_port)
+    controller.start()
+    leases = {}
+
+    async def _run():
+        await _configure_smtp(mongo_db, controller.port)
+        outbox = _RecordingOutbox(mongo_db, require_tls=False, lease_seconds=0.25)
+        for i in range(4):
+            await outbox.enqueue([f"user{i}@example.com"], f"Stundenzettel {i}", "Hallo")
+        processed = await outbox.process_once()
+        await outbox.stop()
+        return processed
+
+    try:
+        processed = loop.run_until_complete(_run())
+    finally:
+        controller.stop()
+
+    assert processed == 4
+    # Immer nur die gerade versendete Mail ist reserviert
+    assert [claimed for claimed, _ in leases.values()] == [1, 1, 1, 1]
+    # Jede Mail wurde zugestellt, bevor ihre eigene Lease ablief
+    for recipient, delivered_at in handler.messages:
+        assert delivered_at < leases[recipient][1], recipient
+
+
+def test_final_failure_drops_content_and_expires(mongo_db, loop, unused_port):
+    async def _run():
+        await _configure_smtp(mongo_db, unused_port)
+        outbox = MailOutbox(mongo_db, require_tls=False, smtp_timeout_seconds=2, max_attempts=1)
+        outbox_id = await outbox.enqueue(
+            ["user@example.com"], "Test", "Hallo", attachments=[("stundenzettel.pdf", b"%PDF-1.4 test")]
+        )
+        await outbox.process_once()
+        return outbox, outbox_id
+
+    outbox, outbox_id = loop.run_until_complete(_run())
+    stored = loop.run_until_complete(mongo_db.mail_outbox.find_one({"id": outbox_id}))
+    assert stored["status"] == "failed"
+    assert stored["last_error"]
+    assert stored["failed_at"] <= datetime.utcnow()
+    # Wie nach dem Versand: Metadaten bleiben, Inhalt und Anhänge nicht (failed_at_ttl räumt den Rest ab)
+    assert "attachments" not in stored and "body" not in stored
+    assert stored["subject"] == "Test"
+    assert outbox.stats_counters["failed"] == 1
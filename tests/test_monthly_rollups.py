@@ -0,0 +1,111 @@
+"""
+Monats-Rollups (monthly_user_rollups): Nach Anlegen, Ändern, Zurückweisen und Löschen von Stundenzetteln
+liefern die inkrementell gepflegten Rollups dieselben Summen wie ein vollständiger Neuaufbau
+(rebuild_monthly_rollups), auch für eine Woche über die Monatsgrenze.
+
+Benötigt eine laufende MongoDB (MONGO_URL, Default mongodb://localhost:27017).
+"""
+import uuid
+
+import pytest
+
+MONTHS = [(2025, 3), (2025, 4)]
+
+
+def _entry(date, start="08:00", end="16:30", **kwargs):
+    return {"date": date, "start_time": start, "end_time": end, "break_minutes": 30, "tasks": "Montage",
+            "customer_project": "Kunde A", "location": "Dresden", **kwargs}
+
+
+def _timesheet(user_id, week_start, entries, status="approved", **kwargs):
+    return {"id": str(uuid.uuid4()), "user_id": user_id, "user_name": f"Name {user_id}", "week_start": week_start,
+            "entries": entries, "status": status, "signed_pdf_path": "signed.pdf" if status == "approved" else None,
+            **kwargs}
+
+
+async def _totals(server):
+    """Summen je (Monat, User) so, wie Statistik-, Rang- und Accounting-Endpunkte sie lesen"""
+    result = {}
+    for year, month in MONTHS:
+        for total in await server.load_monthly_rollups(year, month):
+            result[(f"{year:04d}-{month:02d}", total["user_id"])] = {
+                key: round(value, 6) if isinstance(value, float) else value for key, value in total.items()
+            }
+    return result
+
+
+async def _contributions(server):
+    """Beiträge je (User, Monat) ohne leere Dokumente, die ein inkrementelles $unset zurücklassen darf"""
+    docs = await server.db.monthly_user_rollups.find({}, {"_id": 0, "updated_at": 0}).to_list(None)
+    return {(d["user_id"], d["month"]): d["timesheets"] for d in docs if d.get("timesheets")}
+
+
+@pytest.fixture
+def users(server_module, loop):
+    server = server_module
+    ids = [f"u-roll-{uuid.uuid4().hex[:8]}" for _ in range(2)]
+    loop.run_until_complete(server.db.users.insert_many([
+        {"id": ids[0], "email": f"{ids[0]}@example.com", "weekly_hours": 30.0},
+        {"id": ids[1], "email": f"{ids[1]}@example.com"},
+    ]))
+    yield ids
+    loop.run_until_complete(server.db.users.delete_many({"id": {"$in": ids}}))
+    loop.run_until_complete(server.db.timesheets.delete_many({"user_id": {"$in": ids}}))
+    loop.run_until_complete(server.db.monthly_user_rollups.delete_many({}))
+
+
+def test_incremental_rollups_match_rebuild(server_module, users, loop):
+    server = server_module
+    anna, bernd = users
+    admin = server.User(email="rollups@example.com", name="Admin", role="admin", hashed_password="x")
+    # Woche über die Monatsgrenze: 8 h im März, 8 h + ein Urlaubstag (30 h / 5 = 6 h) im April
+    boundary = _timesheet(anna, "2025-03-31", [
+        _entry("2025-03-31"), _entry("2025-04-01"), _entry("2025-04-02", start="", end="", absence_type="urlaub"),
+    ])
+    april = _timesheet(anna, "2025-04-07", [_entry("2025-04-07", travel_time_minutes=60, include_travel_time=True)])
+    draft = _timesheet(bernd, "2025-03-24", [_entry("2025-03-24")], status="draft")
+
+    async def refresh(*timesheets):
+        for timesheet in timesheets:
+            await server.refresh_timesheet_rollups(timesheet["id"])
+
+    async def incremental_equals_rebuild():
+        incremental = (await _totals(server), await _contributions(server))
+        await server.rebuild_monthly_rollups()
+        rebuilt = (await _totals(server), await _contributions(server))
+        assert incremental == rebuilt
+        return incremental[0]
+
+    async def run():
+        # Anlegen
+        await server.db.timesheets.insert_many([boundary, april, draft])
+        await refresh(boundary, april, draft)
+        totals = await incremental_equals_rebuild()
+        assert totals[("2025-03", anna)]["total_hours"] == pytest.approx(8.0)
+        assert totals[("2025-04", anna)]["total_hours"] == pytest.approx(8.0 + 6.0 + 9.0)
+        assert totals[("2025-04", anna)]["travel_hours_on_timesheets"] == pytest.approx(1.0)
+        # Entwürfe zählen als Stundenzettel, aber nicht zu den Stunden
+        assert totals[("2025-03", bernd)]["total_hours"] == 0.0
+        assert totals[("2025-03", bernd)]["timesheets_count"] == 1
+
+        # Ändern: die Grenzwoche berührt den März nicht mehr
+        await server.db.timesheets.update_one(
+            {"id": boundary["id"]}, {"$set": {"entries": [_entry("2025-04-01", end="12:30")]}}
+        )
+        await refresh(boundary)
+        totals = await incremental_equals_rebuild()
+        assert ("2025-03", anna) not in totals
+        assert totals[("2025-04", anna)]["total_hours"] == pytest.approx(4.0 + 9.0)
+
+        # Zurückweisen über den Endpunkt: der Stundenzettel zählt nicht mehr
+        await server.reject_timesheet(april["id"], current_user=admin)
+        totals = await incremental_equals_rebuild()
+        assert totals[("2025-04", anna)]["total_hours"] == pytest.approx(4.0)
+        assert totals[("2025-04", anna)]["timesheets_count"] == 2
+
+        # Löschen über den Endpunkt
+        await server.delete_timesheet(draft["id"], current_user=admin)
+        totals = await incremental_equals_rebuild()
+        assert ("2025-03", bernd) not in totals
+
+    loop.run_until_complete(run())
@@ -0,0 +1,110 @@
+"""
+OllamaLLM.chat_stream und ChatAgent.process_stream gegen einen Fake-Ollama-Server, der NDJSON streamt.
+
+Der Fake-Server sendet TOKENS Textstücke im Abstand von TOKEN_DELAY Sekunden. Geprüft wird, dass das erste
+Stück ankommt, lange bevor die Antwort fertig ist, dass die Stücke zusammen die vollständige Antwort ergeben
+und dass das Gedächtnis des ChatAgent erst die vollständige Antwort erhält. Keine MongoDB nötig.
+"""
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("pydantic")
+
+from aiohttp import web  # noqa: E402
+
+from agents import ChatAgent, LLMResponseCache, OllamaLLM  # noqa: E402
+
+TOKENS = ["Die ", "Angaben ", "sind ", "jetzt ", "vollständig", "."] * 2
+TOKEN_DELAY = 0.1
+
+
+async def _stream_chat(request: web.Request) -> web.StreamResponse:
+    body = await request.json()
+    assert body["stream"] is True
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await response.prepare(request)
+    for token in TOKENS:
+        await asyncio.sleep(TOKEN_DELAY)
+        line = {"message": {"role": "assistant", "content": token}, "done": False}
+        await response.write((json.dumps(line) + "\n").encode())
+    await response.write((json.dumps({"message": {"role": "assistant", "content": ""}, "done": True}) + "\n").encode())
+    await response.write_eof()
+    return response
+
+
+@pytest.fixture(scope="module")
+def base_url(fake_ollama):
+    return fake_ollama({"/api/chat": _stream_chat})
+
+
+def _llm(base_url: str) -> OllamaLLM:
+    return OllamaLLM(base_url=base_url, model="fake-model", cache=LLMResponseCache(enabled=False))
+
+
+def test_first_token_arrives_before_generation_ends(base_url, loop):
+    llm = _llm(base_url)
+
+    async def run():
+        started = time.perf_counter()
+        first_token_at = None
+        parts = []
+        async for token in llm.chat_stream([{"role": "user", "content": "Hallo"}], "System"):
+            if first_token_at is None:
+                first_token_at = time.perf_counter() - started
+            parts.append(token)
+        return first_token_at, time.perf_counter() - started, parts
+
+    try:
+        first_token_at, total, parts = loop.run_until_complete(run())
+    finally:
+        loop.run_until_complete(llm.close())
+
+    assert parts == TOKENS
+    assert total >= len(TOKENS) * TOKEN_DELAY
+    # Das erste Stück kommt nach einer Token-Verzögerung, nicht erst mit der vollständigen Antwort
+    assert TOKEN_DELAY <= first_token_at < total / 3
+
+
+def test_unreachable_server_yields_error_message(loop, unused_port):
+    llm = OllamaLLM(base_url=f"http://127.0.0.1:{unused_port}", model="fake-model",
+                    cache=LLMResponseCache(enabled=False))
+    llm.max_retries = 1
+
+    async def run():
+        return [token async for token in llm.chat_stream([{"role": "user", "content": "Hallo"}])]
+
+    try:
+        parts = loop.run_until_complete(run())
+    finally:
+        loop.run_until_complete(llm.close())
+
+    assert len(parts) == 1
+    assert parts[0].startswith("Fehler bei Kommunikation mit LLM")
+
+
+def test_chat_agent_stream_writes_memory_after_completion(base_url, loop):
+    agent = ChatAgent(_llm(base_url), tools=SimpleNamespace())
+    context = {"report": {"id": "r1", "created_at": time.time()}, "issues": [], "missing_info": []}
+
+    async def run():
+        parts = []
+        async for token in agent.process_stream(context, "Das Hotel war in Wien"):
+            # Während des Streams ist noch nichts im Gedächtnis
+            assert not await agent.memory.get_recent(entry_type="conversation")
+            parts.append(token)
+        return parts
+
+    try:
+        parts = loop.run_until_complete(run())
+        conversations = loop.run_until_complete(agent.memory.get_recent(entry_type="conversation"))
+    finally:
+        loop.run_until_complete(agent.llm.close())
+
+    assert "".join(parts) == "".join(TOKENS)
+    assert len(conversations) == 1
+    assert conversations[0]["content"].endswith("Agent: " + "".join(TOKENS))
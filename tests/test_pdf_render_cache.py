@@ -0,0 +1,48 @@
+"""
+PdfRenderCache: Der Festplatten-Tier speichert nur verschlüsselt und liest nach einem Neustart wieder,
+unverschlüsselte Altdateien werden entfernt, unlesbare Einträge gelten als Fehlschlag.
+"""
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("reportlab")
+
+from cryptography.fernet import Fernet  # noqa: E402
+
+import server  # noqa: E402
+from compliance import DataEncryption, KeyRing  # noqa: E402
+
+PDF = b"%PDF-1.4\n% Stundenzettel Max Mustermann KW 10\n" + b"0" * 2048
+
+
+def _cache(disk_dir, secret):
+    return server.PdfRenderCache(disk_dir=str(disk_dir), encryption=DataEncryption(keyring=KeyRing(secret)))
+
+
+def test_disk_tier_is_encrypted(tmp_path):
+    secret = Fernet.generate_key()
+    (tmp_path / "alt.pdf").write_bytes(PDF)
+    cache = _cache(tmp_path, secret)
+    assert not (tmp_path / "alt.pdf").exists()
+
+    key = server.PdfRenderCache.make_key({"week_start": "2025-03-03"})
+    cache.put(key, PDF)
+    stored = list(tmp_path.iterdir())
+    assert [p.name for p in stored] == [f"{key}.pdf.enc"]
+    assert b"Mustermann" not in stored[0].read_bytes()
+
+    # Neuer Prozess: Treffer aus dem Festplatten-Tier
+    restarted = _cache(tmp_path, secret)
+    assert restarted.get(key) == PDF
+    assert restarted.disk_hits == 1
+
+    # Anderer Schlüssel (z.B. nach Rotation ohne alten Schlüssel): Fehlschlag, Datei wird verworfen
+    rotated = _cache(tmp_path, Fernet.generate_key())
+    assert rotated.get(key) is None
+    assert rotated.misses == 1
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_disk_tier_requires_encryption(tmp_path):
+    with pytest.raises(ValueError):
+        server.PdfRenderCache(disk_dir=str(tmp_path))
@@ -0,0 +1,40 @@
+"""
+Fortlaufende Nummer im PDF-Dateinamen: Ein neuer Zähler setzt auf vorhandenen Stundenzetteln der Woche auf
+(gespeicherte pdf_sequence und Altbestand ohne Nummer), statt bei 1 zu beginnen und Dateinamen doppelt zu vergeben.
+
+Benötigt eine laufende MongoDB (MONGO_URL, Default mongodb://localhost:27017).
+"""
+import uuid
+
+
+def _timesheet(user_id, week_start, **kwargs):
+    return {"id": str(uuid.uuid4()), "user_id": user_id, "user_name": "Paula", "week_start": week_start,
+            "entries": [], "status": "draft", **kwargs}
+
+
+def test_counter_is_seeded_from_existing_timesheets(server_module, loop):
+    server = server_module
+    user_id = f"u-seq-{uuid.uuid4().hex[:8]}"
+
+    async def run():
+        await server.db.timesheets.insert_many([
+            # KW 10: zwei Stundenzettel aus der Zeit vor dem Zähler (Dateinamen _001 und _002)
+            _timesheet(user_id, "2025-03-03"),
+            _timesheet(user_id, "2025-03-03"),
+            # KW 11: höchste gespeicherte Nummer 4
+            _timesheet(user_id, "2025-03-10", pdf_sequence=4),
+            # Anderer User in KW 12 zählt nicht mit
+            _timesheet("u-other", "2025-03-17", pdf_sequence=7),
+        ])
+        return [
+            await server.allocate_pdf_sequence(user_id, "2025-03-03"),
+            await server.allocate_pdf_sequence(user_id, "2025-03-03"),
+            await server.allocate_pdf_sequence(user_id, "2025-03-10"),
+            await server.allocate_pdf_sequence(user_id, "2025-03-17"),
+            await server.allocate_pdf_sequence(user_id, "2025-03-17"),
+        ]
+
+    try:
+        assert loop.run_until_complete(run()) == [3, 4, 5, 1, 2]
+    finally:
+        loop.run_until_complete(server.db.timesheets.delete_many({"user_id": {"$in": [user_id, "u-other"]}}))
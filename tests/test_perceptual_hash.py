@@ -0,0 +1,118 @@
+"""
+Hamming-Suche über 64-Bit-pHashes mit Multi-Index-Hashing (MongoHammingIndex).
+
+Geprüft wird gegen eine lineare Suche: Jeder Treffer bis zum Radius liegt in einem der abgefragten
+Blockwerte, auch wenn die abweichenden Bits gleichmäßig auf alle vier Blöcke verteilt sind (Grenzfall des
+Schubfachprinzips); große Radien werden linear geprüft statt zehntausende Blockwerte abzufragen. Die Suche in
+MongoDB benötigt eine laufende MongoDB und wird sonst übersprungen.
+"""
+import random
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from perceptual_hash import (  # noqa: E402
+    HASH_BITS, MAX_PROBES, MongoHammingIndex, hamming_distance, max_distance_for_threshold, phash_to_hex
+)
+
+BASE = 0x0123_4567_89AB_CDEF
+
+
+def _flip(value: int, positions) -> int:
+    for position in positions:
+        value ^= 1 << position
+    return value
+
+
+def _spread(distance: int) -> list:
+    """distance Bitpositionen reihum auf die vier 16-Bit-Blöcke verteilt"""
+    return [(i % 4) * 16 + i // 4 for i in range(distance)]
+
+
+def _dataset(seed: int = 7):
+    rng = random.Random(seed)
+    items = {f"spread-{d:02d}": _flip(BASE, _spread(d)) for d in range(0, 13)}
+    # Alle Abweichungen in einem Block
+    items.update({f"block-{d:02d}": _flip(BASE, range(d)) for d in range(1, 9)})
+    items.update({f"random-{i:03d}": rng.getrandbits(HASH_BITS) for i in range(300)})
+    return items
+
+
+def _brute_force(items, value, max_distance):
+    results = [(key, hamming_distance(value, stored)) for key, stored in items.items()]
+    return sorted(((k, d) for k, d in results if d <= max_distance), key=lambda item: (item[1], item[0]))
+
+
+def _candidates(index, items, value, max_distance):
+    """Einträge, die die Kandidatensuche über die abgefragten Blockwerte fände"""
+    probes = {(i << index.block_bits) | block for i, block in index._probe_blocks(value, max_distance)}
+    return {key for key, stored in items.items() if probes.intersection(index.block_keys(stored))}
+
+
+def test_threshold_to_distance():
+    assert max_distance_for_threshold(0.95) == 3
+    assert max_distance_for_threshold(1.0) == 0
+    assert max_distance_for_threshold(0.0) == HASH_BITS
+
+
+@pytest.mark.parametrize("radius", [0, 3, 4, 7, 8, 11])
+def test_probes_cover_all_matches(radius):
+    items = _dataset()
+    index = MongoHammingIndex(None)
+    expected = {key for key, _ in _brute_force(items, BASE, radius)}
+    assert expected <= _candidates(index, items, BASE, radius)
+
+
+def test_radius_is_inclusive_when_bits_are_spread_over_all_blocks():
+    # 7 Bits auf 4 Blöcke: kein Block stimmt exakt, aber einer weicht nur um 7 // 4 = 1 Bit ab
+    index = MongoHammingIndex(None)
+    items = {"seven": _flip(BASE, _spread(7)), "eight": _flip(BASE, _spread(8))}
+    assert _candidates(index, items, BASE, 3) == set()
+    assert _candidates(index, items, BASE, 7) == {"seven"}
+    assert _candidates(index, items, BASE, 8) == {"seven", "eight"}
+
+
+def test_large_radius_is_searched_linearly():
+    index = MongoHammingIndex(None)
+    # Bis r = 11 höchstens zwei Bits je Block (4 * 137 Blockwerte), ab r = 12 wären es 4 * 697
+    assert not index._is_linear(11)
+    assert len(index._probe_blocks(BASE, 11)) == 548 <= MAX_PROBES
+    for radius in (12, 31, HASH_BITS):
+        assert index._is_linear(radius)
+        with pytest.raises(ValueError):
+            index._probe_blocks(BASE, radius)
+
+
+@pytest.fixture(scope="module")
+def receipts(mongo_db, loop):
+    items = _dataset()
+    index = MongoHammingIndex(mongo_db.receipts, query={"kind": "receipt"})
+
+    async def _fill():
+        await mongo_db.receipts.create_index("phash_blocks", sparse=True)
+        await mongo_db.receipts.insert_many([
+            {"file_hash": key, "kind": "receipt", **index.fields(value)} for key, value in items.items()
+        ])
+        # Gleicher Hash, aber anderer Eintragstyp: wird nicht gefunden
+        await mongo_db.receipts.insert_one({"file_hash": "signed", "kind": "signed_timesheet", **index.fields(BASE)})
+        # Bestand ohne Blöcke: erst nach backfill() auffindbar
+        await mongo_db.receipts.insert_one({"file_hash": "legacy", "kind": "receipt", "phash": phash_to_hex(BASE)})
+
+    loop.run_until_complete(_fill())
+    return index, items
+
+
+def test_mongo_index_backfills_and_matches_linear_scan(receipts, loop):
+    index, items = receipts
+    assert [key for key, _ in loop.run_until_complete(index.search(BASE, 0))] == ["spread-00"]
+    assert loop.run_until_complete(index.backfill()) == 1
+    items = {**items, "legacy": BASE}
+    for radius in (0, 3, 7, 11, 12, 32):
+        assert loop.run_until_complete(index.search(BASE, radius)) == _brute_force(items, BASE, radius)
+    assert loop.run_until_complete(index.nearest(BASE, k=4)) == _brute_force(items, BASE, HASH_BITS)[:4]
+    expected = _brute_force(items, BASE, HASH_BITS)[:5]
+    assert [key for key, _ in expected] == ["legacy", "spread-00", "block-01", "spread-01", "block-02"]
+    assert loop.run_until_complete(index.nearest(BASE, k=5)) == expected
+    # Radius begrenzt: weniger als k Treffer
+    assert loop.run_until_complete(index.nearest(BASE, k=50, max_distance=2)) == _brute_force(items, BASE, 2)
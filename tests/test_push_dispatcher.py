@@ -0,0 +1,135 @@
+"""
+Web-Push-Dispatcher: Fan-out über den Thread-Pool, Entfernen abgelaufener Subscriptions (404/410) und
+Latenz-Metriken. pywebpush.webpush wird durch einen Fake mit fester Latenz ersetzt, der je Endpoint
+Erfolg oder einen HTTP-Fehler liefert.
+
+Benötigt eine laufende MongoDB (MONGO_URL, Default mongodb://localhost:27017).
+Es wird eine eigene Test-Datenbank angelegt und danach wieder gelöscht.
+"""
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("motor")
+pywebpush = pytest.importorskip("pywebpush")
+
+import push_dispatcher  # noqa: E402
+from push_dispatcher import PushDispatcher  # noqa: E402
+
+LATENCY = 0.1
+WORKERS = 4
+
+
+class FakeWebPush:
+    """Blockiert LATENCY Sekunden wie ein echter HTTP-Aufruf; "status-<code>" im Endpoint erzeugt den Fehler"""
+
+    def __init__(self):
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, subscription_info, data, vapid_private_key, vapid_claims, timeout):
+        with self._lock:
+            self.calls.append(subscription_info["endpoint"])
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(LATENCY)
+        finally:
+            with self._lock:
+                self.active -= 1
+        endpoint = subscription_info["endpoint"]
+        if "status-" in endpoint:
+            status_code = int(endpoint.rsplit("status-", 1)[1])
+            raise pywebpush.WebPushException("Push failed", response=SimpleNamespace(status_code=status_code))
+
+
+@pytest.fixture
+def fake_webpush(monkeypatch):
+    fake = FakeWebPush()
+    monkeypatch.setattr(push_dispatcher, "webpush", fake)
+    return fake
+
+
+def _subscription(user_id, endpoint):
+    return {"user_id": user_id, "role": "user", "endpoint": f"https://push.example.com/{endpoint}",
+            "keys": {"p256dh": "key", "auth": "auth"}}
+
+
+@pytest.fixture
+def subscriptions(mongo_db, loop):
+    docs = [_subscription("u1", f"ok-{i}") for i in range(6)]
+    docs += [_subscription("u1", "gone-status-404"), _subscription("u1", "gone-status-410"),
+             _subscription("u1", "busy-status-500"), _subscription("u2", "other-status-410")]
+    loop.run_until_complete(mongo_db.push_subscriptions.delete_many({}))
+    loop.run_until_complete(mongo_db.push_subscriptions.insert_many(docs))
+    return docs
+
+
+def _dispatcher(db, **kwargs) -> PushDispatcher:
+    return PushDispatcher(db, "public", "private", "admin@example.com", max_workers=WORKERS, **kwargs)
+
+
+def test_fan_out_uses_pool_and_prunes_gone_subscriptions(mongo_db, loop, fake_webpush, subscriptions):
+    dispatcher = _dispatcher(mongo_db)
+
+    async def run():
+        started = time.perf_counter()
+        delivered = await dispatcher.fan_out({"user_id": "u1"}, {"title": "Hallo", "body": "Test"})
+        elapsed = time.perf_counter() - started
+        await dispatcher.close()
+        return delivered, elapsed
+
+    delivered, elapsed = loop.run_until_complete(run())
+    remaining = loop.run_until_complete(mongo_db.push_subscriptions.distinct("endpoint"))
+
+    assert delivered == 6
+    assert len(fake_webpush.calls) == 9
+    # Parallel, aber nie mehr gleichzeitige Aufrufe als Threads im Pool
+    assert 1 < fake_webpush.max_active <= WORKERS
+    assert elapsed < 9 * LATENCY / 2
+    # Nur 404/410 des angeschriebenen Users werden entfernt, 500 bleibt für den nächsten Versuch
+    assert sorted(e.rsplit("/", 1)[1] for e in remaining) == (
+        ["busy-status-500"] + [f"ok-{i}" for i in range(6)] + ["other-status-410"]
+    )
+    stats = dispatcher.stats()
+    assert (stats["sent"], stats["failed"], stats["pruned"]) == (6, 3, 2)
+    assert stats["samples"] == 9
+    latency = stats["latency"]
+    assert LATENCY * 1000 <= latency["p50_ms"] <= latency["p95_ms"] <= latency["max_ms"]
+    assert latency["avg_ms"] >= LATENCY * 1000
+
+
+def test_dispatch_runs_in_background_until_close(mongo_db, loop, fake_webpush, subscriptions):
+    dispatcher = _dispatcher(mongo_db)
+
+    async def run():
+        dispatcher.dispatch(dispatcher.fan_out({"user_id": "u1", "endpoint": {"$regex": "ok-"}}, {"title": "Hallo"}))
+        # Der Aufrufer wartet nicht auf die Zustellung
+        pending = dispatcher.stats()["pending"]
+        calls_before_close = len(fake_webpush.calls)
+        await dispatcher.close()
+        return pending, calls_before_close
+
+    pending, calls_before_close = loop.run_until_complete(run())
+    assert pending == 1
+    assert calls_before_close == 0
+    assert dispatcher.stats()["pending"] == 0
+    assert dispatcher.stats()["sent"] == 6
+
+
+def test_without_vapid_keys_nothing_is_sent(mongo_db, loop, fake_webpush, subscriptions):
+    dispatcher = PushDispatcher(mongo_db, "", "", "admin@example.com")
+
+    async def run():
+        delivered = await dispatcher.fan_out({"user_id": "u1"}, {"title": "Hallo"})
+        sent = await dispatcher.send(subscriptions[0], {"title": "Hallo"})
+        await dispatcher.close()
+        return delivered, sent
+
+    assert loop.run_until_complete(run()) == (0, False)
+    assert fake_webpush.calls == []
+    assert dispatcher.stats()["samples"] == 0
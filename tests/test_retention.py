@@ -0,0 +1,187 @@
+"""
+Aufbewahrungsfristen (RetentionManager): expires_at beim Anlegen und bei Statuswechseln, Nachtragen für
+Bestandsdokumente, Dry-Run-Bericht ohne Löschen, Sweep mit Dateilöschung und Aktionen nach dem Löschen
+(Register-Einträge des Upload-Registers verschwinden).
+
+Benötigt eine laufende MongoDB (MONGO_URL, Default mongodb://localhost:27017).
+"""
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("motor")
+pytest.importorskip("cryptography")
+
+from compliance import (  # noqa: E402
+    RETENTION_PERIOD_APPROVED_DAYS, RETENTION_PERIOD_DRAFT_DAYS, RETENTION_PERIOD_RECEIPTS_DAYS, RetentionManager
+)
+
+EXPIRED = datetime.utcnow() - timedelta(days=1)
+
+
+def _close_to(value, expected):
+    # MongoDB speichert Millisekunden
+    return abs((value - expected).total_seconds()) < 1
+
+
+def _file(tmp_path, name):
+    path = tmp_path / name
+    path.write_bytes(b"%PDF-1.4 test")
+    return path
+
+
+def _expense(expires_at, *paths, status="approved"):
+    return {"id": str(uuid.uuid4()), "user_id": "u1", "status": status, "created_at": datetime.utcnow(),
+            "expires_at": expires_at, "receipts": [{"local_path": str(p)} for p in paths]}
+
+
+@pytest.fixture
+def db(mongo_db, loop):
+    for collection in ("travel_expenses", "travel_expense_reports", "timesheets"):
+        loop.run_until_complete(mongo_db[collection].delete_many({}))
+    return mongo_db
+
+
+def test_dry_run_reports_and_sweep_deletes(db, loop, tmp_path):
+    first, second, missing = _file(tmp_path, "a.pdf"), _file(tmp_path, "b.pdf"), tmp_path / "fehlt.pdf"
+    signed, kept = _file(tmp_path, "signed.pdf"), _file(tmp_path, "kept.pdf")
+    expired = _expense(EXPIRED, first, second)
+    expired_missing = _expense(EXPIRED - timedelta(days=1), missing)
+    current = _expense(datetime.utcnow() + timedelta(days=30), kept)
+    timesheet = {"id": str(uuid.uuid4()), "user_id": "u1", "status": "approved", "created_at": datetime.utcnow(),
+                 "expires_at": EXPIRED, "signed_pdf_path": str(signed)}
+    hook_calls = []
+
+    async def hook(collection, doc):
+        hook_calls.append((collection, doc["id"]))
+        raise RuntimeError("Aktion fehlgeschlagen")  # bricht den Sweep nicht ab
+
+    manager = RetentionManager(db, batch_size=1)
+    manager.register_hook(hook)
+
+    async def run():
+        await db.travel_expenses.insert_many([expired, expired_missing, current])
+        await db.timesheets.insert_one(timesheet)
+        return await manager.sweep(dry_run=True), await manager.sweep()
+
+    report, result = loop.run_until_complete(run())
+
+    assert report["dry_run"] is True
+    assert report["documents"] == {"travel_expense_reports": 0, "travel_expenses": 2, "timesheets": 1}
+    assert report["file_count"] == 4
+    assert report["deleted_files"] == 0
+    # Älteste zuerst
+    assert [f["local_path"] for f in report["files"]] == [str(missing), str(first), str(second), str(signed)]
+    assert report["files"][0]["document_id"] == expired_missing["id"]
+
+    assert result["dry_run"] is False
+    assert (result["deleted_files"], result["missing_files"], result["errors"]) == (3, 1, 0)
+    assert not first.exists() and not second.exists() and not signed.exists()
+    assert kept.exists()
+    assert sorted(hook_calls) == sorted([
+        ("travel_expenses", expired["id"]), ("travel_expenses", expired_missing["id"]), ("timesheets", timesheet["id"])
+    ])
+
+    stored = loop.run_until_complete(db.travel_expenses.find_one({"id": expired["id"]}))
+    assert stored["expires_at"] is None
+    assert stored["retention_deleted_at"]
+    # Gelöschte Dokumente werden weder erneut gesweept noch durch einen Statuswechsel wieder fällig
+    assert loop.run_until_complete(manager.refresh_expiry("travel_expenses", expired["id"])) is None
+    again = loop.run_until_complete(manager.sweep(dry_run=True))
+    assert again["file_count"] == 0
+
+
+def test_failed_deletion_is_retried(db, loop, tmp_path):
+    # Ein Verzeichnis lässt sich nicht per unlink löschen
+    directory = tmp_path / "kein_pdf"
+    directory.mkdir()
+    expense = _expense(EXPIRED, directory)
+    hook_calls = []
+
+    async def hook(collection, doc):
+        hook_calls.append(doc["id"])
+
+    manager = RetentionManager(db)
+    manager.register_hook(hook)
+    loop.run_until_complete(db.travel_expenses.insert_one(expense))
+    result = loop.run_until_complete(manager.sweep())
+
+    assert result["errors"] == 1
+    assert hook_calls == []
+    stored = loop.run_until_complete(db.travel_expenses.find_one({"id": expense["id"]}))
+    assert _close_to(stored["expires_at"], EXPIRED)
+    assert "retention_deleted_at" not in stored
+
+
+def test_refresh_and_backfill_expiry(db, loop):
+    created_at = datetime.utcnow() - timedelta(days=400)
+    legacy = {"id": str(uuid.uuid4()), "user_id": "u1", "status": "draft", "created_at": created_at.isoformat() + "Z"}
+    approved = {"id": str(uuid.uuid4()), "user_id": "u1", "status": "approved", "created_at": created_at}
+    undated = {"id": str(uuid.uuid4()), "user_id": "u1", "status": "draft"}
+    manager = RetentionManager(db, batch_size=2)
+
+    async def run():
+        await db.travel_expense_reports.insert_many([legacy, approved, undated])
+        counts = await manager.backfill_expiry()
+        # Zweiter Lauf findet nichts mehr
+        return counts, await manager.backfill_expiry()
+
+    counts, second = loop.run_until_complete(run())
+    assert counts == {"travel_expense_reports": 3, "travel_expenses": 0, "timesheets": 0}
+    assert not any(second.values())
+
+    stored = {d["id"]: d for d in loop.run_until_complete(db.travel_expense_reports.find({}).to_list(None))}
+    assert _close_to(stored[legacy["id"]]["expires_at"], created_at + timedelta(days=RETENTION_PERIOD_DRAFT_DAYS))
+    assert _close_to(stored[approved["id"]]["expires_at"], created_at + timedelta(days=RETENTION_PERIOD_APPROVED_DAYS))
+    assert stored[undated["id"]]["expires_at"] is None
+    # Der Entwurf ist damit abgelaufen
+    report = loop.run_until_complete(manager.sweep(dry_run=True))
+    assert report["documents"]["travel_expense_reports"] == 1
+
+    # Statuswechsel verschiebt die Frist
+    loop.run_until_complete(db.travel_expense_reports.update_one({"id": legacy["id"]}, {"$set": {"status": "sent"}}))
+    expires_at = loop.run_until_complete(manager.refresh_expiry("travel_expense_reports", legacy["id"]))
+    assert _close_to(expires_at, created_at + timedelta(days=RETENTION_PERIOD_RECEIPTS_DAYS))
+
+
+def test_endpoints_set_expiry_and_hook_clears_registry(server_module, loop, tmp_path):
+    server = server_module
+    user = server.User(email="retention@example.com", name="Rita", role="admin", hashed_password="x")
+
+    async def run():
+        expense = await server.create_travel_expense(
+            server.TravelExpenseCreate(date="2025-03-03", description="Fahrt"), current_user=user
+        )
+        created = await server.db.travel_expenses.find_one({"id": expense.id})
+        await server.approve_travel_expense(expense.id, current_user=user)
+        approved = await server.db.travel_expenses.find_one({"id": expense.id})
+        return created, approved
+
+    created, approved = loop.run_until_complete(run())
+    assert _close_to(created["expires_at"], created["created_at"] + timedelta(days=RETENTION_PERIOD_DRAFT_DAYS))
+    assert _close_to(approved["expires_at"], created["created_at"] + timedelta(days=RETENTION_PERIOD_APPROVED_DAYS))
+
+    # Abgelaufen: Datei, Register-Eintrag des Belegs und ein fremder Register-Eintrag
+    receipt = _file(tmp_path, "beleg.pdf")
+    manager = RetentionManager(server.db)
+    manager.register_hook(server._on_retention_expired)
+
+    async def sweep():
+        await server.db.travel_expenses.update_one(
+            {"id": created["id"]},
+            {"$set": {"expires_at": EXPIRED, "receipts": [{"local_path": str(receipt)}]}}
+        )
+        await server.db.receipts.insert_many([
+            {"id": str(uuid.uuid4()), "file_hash": "a", "expense_id": created["id"]},
+            {"id": str(uuid.uuid4()), "file_hash": "b", "expense_id": "andere"},
+        ])
+        await manager.sweep()
+        return await server.db.receipts.distinct("file_hash", {"file_hash": {"$in": ["a", "b"]}})
+
+    try:
+        assert loop.run_until_complete(sweep()) == ["b"]
+        assert not receipt.exists()
+    finally:
+        loop.run_until_complete(server.db.travel_expenses.delete_many({"id": created["id"]}))
+        loop.run_until_complete(server.db.receipts.delete_many({"file_hash": {"$in": ["a", "b"]}}))
@@ -0,0 +1,145 @@
+"""
+Review-Warteschlange: idempotentes Einreichen, Retry mit Backoff, Fortschritt aus dem Message-Bus,
+Freigabe laufender Jobs beim Stoppen und endgültiges Fehlschlagen. Statt Ollama ein Fake-Orchestrator.
+
+Benötigt eine laufende MongoDB (MONGO_URL, Default mongodb://localhost:27017).
+Es wird eine eigene Test-Datenbank angelegt und danach wieder gelöscht.
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("motor")
+pytest.importorskip("aiohttp")
+pytest.importorskip("pydantic")
+
+from agents import AgentMessageBus  # noqa: E402
+from review_queue import ReviewQueue  # noqa: E402
+
+
+class FakeOrchestrator:
+    """Meldet drei Schritte über den Message-Bus; die ersten fail_times Prüfungen schlagen fehl"""
+
+    def __init__(self, fail_times: int = 0, step_seconds: float = 0.05, error: Exception = None):
+        self.message_bus = AgentMessageBus()
+        self.fail_times = fail_times
+        self.step_seconds = step_seconds
+        self.error = error
+        self.calls = 0
+
+    async def ensure_llm_available(self):
+        return True
+
+    async def review_expense_report(self, report_id, db):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        for step in (1, 2, 3):
+            self.message_bus.broadcast("Orchestrator", {
+                "type": "status_update", "message": f"Schritt {step}", "step": step, "report_id": report_id
+            })
+            await asyncio.sleep(self.step_seconds)
+        if self.calls <= self.fail_times:
+            raise RuntimeError("Ollama nicht erreichbar")
+        return {"status": "review_complete", "issues": [], "requires_user_input": False, "timings": {}}
+
+
+@pytest.fixture(scope="module")
+def db(mongo_db, loop):
+    loop.run_until_complete(mongo_db.review_jobs.create_index(
+        "report_id", name="report_active_unique", unique=True, partialFilterExpression={"active": True}
+    ))
+    return mongo_db
+
+
+def _queue(db, loop, orchestrator, **kwargs) -> ReviewQueue:
+    # Jeder Test beginnt mit leerer Warteschlange, sonst übernehmen Worker die Jobs früherer Tests
+    loop.run_until_complete(db.review_jobs.delete_many({}))
+
+    async def factory():
+        return orchestrator
+    options = {"concurrency": 2, "base_backoff_seconds": 0.1, "poll_interval_seconds": 0.05, "lease_seconds": 5}
+    options.update(kwargs)
+    return ReviewQueue(db, factory, **options)
+
+
+async def _wait_for(queue: ReviewQueue, report_id: str, statuses, timeout: float = 5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        job = await queue.latest_job(report_id)
+        if job["status"] in statuses or asyncio.get_running_loop().time() > deadline:
+            return job
+        await asyncio.sleep(0.05)
+
+
+def test_resubmit_is_idempotent(db, loop):
+    queue = _queue(db, loop, FakeOrchestrator())
+
+    async def run():
+        first = await queue.enqueue("report-idem", "u1")
+        concurrent = await asyncio.gather(*(queue.enqueue("report-idem", "u1") for _ in range(5)))
+        return first, concurrent
+
+    first, concurrent = loop.run_until_complete(run())
+    assert {job["id"] for job in concurrent} == {first["id"]}
+    assert loop.run_until_complete(db.review_jobs.count_documents({"report_id": "report-idem"})) == 1
+
+
+def test_retry_with_backoff_and_progress(db, loop):
+    orchestrator = FakeOrchestrator(fail_times=1)
+    queue = _queue(db, loop, orchestrator)
+
+    async def run():
+        await queue.enqueue("report-retry", "u1")
+        queue.start()
+        try:
+            job = await _wait_for(queue, "report-retry", ("done", "failed"))
+            # Abgeschlossen: erneutes Einreichen ohne requeue_done liefert denselben Job
+            again = await queue.enqueue("report-retry", "u1", requeue_done=False)
+        finally:
+            await queue.stop()
+        return job, again
+
+    job, again = loop.run_until_complete(run())
+    assert job["status"] == "done"
+    assert job["attempts"] == 2
+    assert orchestrator.calls == 2
+    assert [entry["step"] for entry in job["progress_log"]] == [1, 2, 3, 1, 2, 3]
+    assert job["result"]["status"] == "review_complete"
+    assert again["id"] == job["id"]
+    assert queue.stats_counters["retried"] == 1
+
+
+def test_stop_releases_running_job(db, loop):
+    queue = _queue(db, loop, FakeOrchestrator(step_seconds=1.0), concurrency=1)
+
+    async def run():
+        await queue.enqueue("report-stop", "u1")
+        queue.start()
+        await _wait_for(queue, "report-stop", ("running",))
+        await asyncio.sleep(0.1)
+        await queue.stop()
+        return await queue.latest_job("report-stop")
+
+    job = loop.run_until_complete(run())
+    assert job["status"] == "queued"
+    assert job["attempts"] == 0
+    assert job["worker_id"] is None
+
+
+def test_missing_report_fails_without_retry(db, loop):
+    orchestrator = FakeOrchestrator(error=ValueError("Report report-missing not found"))
+    queue = _queue(db, loop, orchestrator)
+
+    async def run():
+        await queue.enqueue("report-missing", "u1")
+        queue.start()
+        try:
+            return await _wait_for(queue, "report-missing", ("failed",))
+        finally:
+            await queue.stop()
+
+    job = loop.run_until_complete(run())
+    assert job["status"] == "failed"
+    assert job["active"] is False
+    assert orchestrator.calls == 1
@@ -0,0 +1,69 @@
+"""
+Beleg-Register: Schlägt ein Upload nach der Registrierung fehl, werden Datei und Register-Eintrag entfernt,
+sodass der erneute Upload derselben Datei gelingt statt mit 409 abgelehnt zu werden.
+
+Benötigt eine laufende MongoDB (MONGO_URL, Default mongodb://localhost:27017).
+Es wird eine eigene Test-Datenbank angelegt und danach wieder gelöscht.
+"""
+import io
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from fastapi import HTTPException, UploadFile  # noqa: E402
+
+PDF_BYTES = b"%PDF-1.4\n% Testbeleg\n" + b"0" * 4096
+
+
+def _user(server_module):
+    return server_module.User(
+        id="u-upload", email="uwe@example.com", name="Uwe", role="user", hashed_password="x"
+    )
+
+
+def _upload_file() -> UploadFile:
+    return UploadFile(file=io.BytesIO(PDF_BYTES), filename="hotel.pdf")
+
+
+def test_failed_upload_can_be_retried(server_module, loop, monkeypatch):
+    server = server_module
+    monkeypatch.setattr(server.limiter, "enabled", False)
+    user = _user(server)
+    loop.run_until_complete(server.db.travel_expenses.insert_one({
+        "id": "te-upload", "user_id": user.id, "user_name": "Uwe", "date": "2025-03-03",
+        "status": "draft", "receipts": []
+    }))
+
+    original_log_access = server.audit_logger.log_access
+
+    def failing_log_access(action, *args, **kwargs):
+        if action == "upload":
+            raise OSError("No space left on device")
+        return original_log_access(action, *args, **kwargs)
+
+    async def upload():
+        return await server.upload_travel_expense_receipt(
+            request=None, expense_id="te-upload", file=_upload_file(), current_user=user
+        )
+
+    monkeypatch.setattr(server.audit_logger, "log_access", failing_log_access)
+    with pytest.raises(HTTPException) as failed:
+        loop.run_until_complete(upload())
+    assert failed.value.status_code == 500
+    assert loop.run_until_complete(server.db.receipts.count_documents({"kind": "receipt"})) == 0
+    expense_folder = next(Path(server.LOCAL_RECEIPTS_PATH, "reisekosten_einzel").glob("*_te-upload"))
+    assert list(expense_folder.iterdir()) == []
+
+    # Erneuter Versuch mit derselben Datei: kein 409, Register zeigt auf die neue Datei
+    monkeypatch.setattr(server.audit_logger, "log_access", original_log_access)
+    result = loop.run_until_complete(upload())
+    entry = loop.run_until_complete(server.db.receipts.find_one({"kind": "receipt"}, {"_id": 0}))
+    assert entry["receipt_id"] == result["receipt"].id
+    assert Path(entry["local_path"]).exists()
+
+    # Danach ist dieselbe Datei ein echtes Duplikat
+    with pytest.raises(HTTPException) as duplicate:
+        loop.run_until_complete(upload())
+    assert duplicate.value.status_code == 409
@@ -0,0 +1,71 @@
+"""
+User-Cache über mehrere Worker: Treffer kosten keine Datenbankabfrage. Ändert ein anderer Prozess den User
+(Rolle, Löschung), übernimmt get_current_user das beim nächsten Abgleich (höchstens alle sync_seconds)
+statt erst nach Ablauf der TTL.
+
+Benötigt eine laufende MongoDB (MONGO_URL, Default mongodb://localhost:27017).
+"""
+import pytest
+
+pytest.importorskip("fastapi")
+
+from fastapi import HTTPException  # noqa: E402
+from fastapi.security import HTTPAuthorizationCredentials  # noqa: E402
+
+EMAIL = "cache@example.com"
+
+
+def _credentials(server):
+    token = server.create_access_token({"sub": EMAIL})
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+@pytest.fixture
+def user_cache(server_module):
+    cache = server_module.user_cache
+    sync_seconds = cache.sync_seconds
+    cache.clear()
+    yield cache
+    cache.sync_seconds = sync_seconds
+    cache.clear()
+
+
+def test_changes_from_other_workers_are_seen_after_sync(server_module, user_cache, loop):
+    server = server_module
+    user = server.User(email=EMAIL, name="Cache", role="admin", hashed_password="x")
+    loop.run_until_complete(server.db.users.insert_one(user.model_dump()))
+    # Der Abgleich soll nur dort laufen, wo der Test ihn erzwingt
+    user_cache.sync_seconds = 3600
+
+    def current_user():
+        return loop.run_until_complete(server.get_current_user(_credentials(server)))
+
+    try:
+        assert current_user().role == "admin"
+        hits, syncs = user_cache.hits, user_cache.syncs
+        assert current_user().role == "admin"
+        assert user_cache.hits == hits + 1
+
+        # Ein anderer Worker entzieht die Admin-Rolle: sein Cache-Invalidate erreicht diesen Prozess nicht.
+        # Bis zum nächsten Abgleich bleibt der Treffer bestehen (kein Datenbankzugriff je Request) ...
+        loop.run_until_complete(server.db.users.update_one(
+            {"id": user.id}, {"$set": {"role": "user"}, "$inc": {"version": 1}}
+        ))
+        assert current_user().role == "admin"
+        assert user_cache.syncs == syncs
+
+        # ... danach gilt die neue Version
+        loop.run_until_complete(user_cache.sync(server.db.users, force=True))
+        assert current_user().role == "user"
+        assert current_user().role == "user"
+        assert user_cache.hits == hits + 3
+
+        # Fälliger Abgleich aus get_current_user heraus erkennt die Löschung
+        loop.run_until_complete(server.db.users.delete_one({"id": user.id}))
+        user_cache.sync_seconds = 0
+        with pytest.raises(HTTPException) as deleted:
+            current_user()
+        assert deleted.value.status_code == 401
+        assert user_cache.syncs > syncs + 1
+    finally:
+        loop.run_until_complete(server.db.users.delete_many({"email": EMAIL}))